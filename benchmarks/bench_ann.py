@@ -0,0 +1,81 @@
+"""
+Benchmark dos tipos de índice do VectorDB sobre vetores sintéticos.
+
+Para cada configuração, reporta o tempo de construção, o recall@k em relação à busca
+exata, as latências p50/p99 de uma consulta e a memória por vetor.
+
+Uso:
+    PYTHONPATH=./ python benchmarks/bench_ann.py --n 100000 --dimension 128 --queries 500 --k 10
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from src.index_factory import build_index, set_search_params
+
+# Configurações avaliadas: (rótulo, tipo, parâmetros do índice, parâmetros de busca)
+CONFIGURATIONS = [
+    ("flat", "flat", {}, {}),
+    ("ivf_flat nprobe=8", "ivf_flat", {}, {"nprobe": 8}),
+    ("ivf_flat nprobe=32", "ivf_flat", {}, {"nprobe": 32}),
+    ("ivf_pq m=16 nprobe=16", "ivf_pq", {"m": 16}, {"nprobe": 16}),
+    ("ivf_pq m=32 nprobe=32", "ivf_pq", {"m": 32}, {"nprobe": 32}),
+    ("hnsw M=32 ef=64", "hnsw", {"M": 32}, {"ef_search": 64}),
+    ("hnsw M=32 ef=128", "hnsw", {"M": 32}, {"ef_search": 128}),
+]
+
+
+def synthetic_vectors(n, dimension, clusters, rng):
+    """Gera vetores agrupados em clusters gaussianos, mais próximos de embeddings reais que ruído uniforme."""
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return (centers[labels] + 0.3 * rng.normal(size=(n, dimension))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_vectors(args.n, args.dimension, 200, rng)
+    queries = synthetic_vectors(args.queries, args.dimension, 200, rng)
+
+    exact = faiss.IndexFlatL2(args.dimension)
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, args.k)
+
+    print(f"{'configuração':<24} {'build (s)':>10} {'recall@' + str(args.k):>10} "
+          f"{'p50 (ms)':>9} {'p99 (ms)':>9} {'bytes/vetor':>12}")
+    built = {}
+    for label, index_type, index_params, search_params in CONFIGURATIONS:
+        key = (index_type, tuple(sorted(index_params.items())))
+        start = time.perf_counter()
+        if key not in built:
+            index = faiss.IndexFlatL2(args.dimension) if index_type == "flat" else build_index(index_type, vectors, index_params)
+            index.add(vectors)
+            built[key] = (index, time.perf_counter() - start)
+        index, build_seconds = built[key]
+        set_search_params(index, **search_params)
+
+        latencies = []
+        found = np.empty_like(ground_truth)
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            _, ids = index.search(query.reshape(1, -1), args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found[i] = ids[0]
+
+        recall = np.mean([len(set(e) & set(f)) / args.k for e, f in zip(ground_truth, found)])
+        bytes_per_vector = faiss.serialize_index(index).nbytes / index.ntotal
+        print(f"{label:<24} {build_seconds:>10.2f} {recall:>10.3f} "
+              f"{np.percentile(latencies, 50):>9.3f} {np.percentile(latencies, 99):>9.3f} {bytes_per_vector:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
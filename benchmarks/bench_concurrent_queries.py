@@ -0,0 +1,82 @@
+"""
+Teste de carga do endpoint /query com backends simulados.
+
+Substitui o motor RAG por um stub com latência fixa e dispara consultas concorrentes
+pela aplicação ASGI. Compara um stub bloqueante (como as chamadas síncronas antigas
+dentro do handler async) com um stub assíncrono (ainvoke), reportando a vazão.
+
+Uso:
+    PYTHONPATH=./ python benchmarks/bench_concurrent_queries.py --requests 50 --concurrency 10 --latency 0.2
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+class BlockingStubRAGEngine:
+    """Simula a chamada síncrona ao LLM dentro do handler: bloqueia o event loop."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def aquery(self, question):
+        time.sleep(self.latency)
+        return {"answer": "stub", "sources": []}
+
+
+class AsyncStubRAGEngine:
+    """Simula a chamada assíncrona ao LLM: libera o event loop durante a espera."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def aquery(self, question):
+        await asyncio.sleep(self.latency)
+        return {"answer": "stub", "sources": []}
+
+
+async def run_load(app, requests, concurrency):
+    """Dispara as consultas com concorrência limitada e retorna a vazão em consultas por segundo."""
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i):
+            async with semaphore:
+                response = await client.post("/query", json={"question": f"pergunta {i}"})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="latência simulada do LLM (s)")
+    args = parser.parse_args()
+
+    # Isola o estado em disco da aplicação em um diretório temporário
+    workdir = tempfile.mkdtemp()
+    sys.path.insert(0, os.getcwd())
+    os.chdir(workdir)
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    import main as service
+    logging.disable(logging.INFO)
+
+    for label, engine in (("bloqueante", BlockingStubRAGEngine(args.latency)),
+                          ("assíncrono", AsyncStubRAGEngine(args.latency))):
+        service.rag_engine = engine
+        throughput = asyncio.run(run_load(service.app, args.requests, args.concurrency))
+        print(f"{label:<12} {throughput:>8.1f} consultas/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark da extração de documentos serial vs. no pool de processos.
+
+Gera um corpus sintético de arquivos DOCX, XLSX e HTML e mede o tempo de extração e
+segmentação com o DocumentProcessor (um núcleo) e com o ParallelExtractor para cada
+número de processos, reportando o speedup em relação à execução serial.
+
+Uso:
+    PYTHONPATH=./ python benchmarks/bench_extraction.py --files 48 --paragraphs 2000
+"""
+import argparse
+import io
+import os
+import random
+import time
+
+from docx import Document as DocxDocument
+from openpyxl import Workbook
+
+from src.document_processor import DocumentProcessor
+from src.parallel_extractor import ParallelExtractor
+
+WORDS = ("contrato prazo entrega cliente fornecedor pagamento multa rescisão cláusula "
+         "documento relatório análise resultado período valor parcela vencimento").split()
+
+
+def sentence(rng, length=20):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+
+def make_docx(rng, paragraphs):
+    document = DocxDocument()
+    for _ in range(paragraphs):
+        document.add_paragraph(sentence(rng))
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_xlsx(rng, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["id", "cliente", "descrição", "valor"])
+    for i in range(rows):
+        sheet.append([i, rng.choice(WORDS), sentence(rng, 8), round(rng.random() * 1000, 2)])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def make_html(rng, paragraphs):
+    body = "".join(f"<p>{sentence(rng)}</p>" for _ in range(paragraphs))
+    return f"<html><body>{body}</body></html>".encode("utf-8")
+
+
+def generate_corpus(count, paragraphs, seed=0):
+    """Gera `count` arquivos alternando entre DOCX, XLSX e HTML."""
+    rng = random.Random(seed)
+    makers = [("docx", make_docx), ("xlsx", make_xlsx), ("html", make_html)]
+    corpus = []
+    for i in range(count):
+        extension, make = makers[i % len(makers)]
+        corpus.append((make(rng, paragraphs), f"doc{i}.{extension}"))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=48)
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="números de processos avaliados (padrão: potências de 2 até o número de CPUs)")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.files, args.paragraphs)
+    megabytes = sum(len(content) for content, _ in corpus) / 1e6
+    print(f"corpus: {args.files} arquivos, {megabytes:.1f} MB")
+
+    processor = DocumentProcessor()
+    start = time.perf_counter()
+    serial_segments = sum(len(processor.process_file(content, filename)) for content, filename in corpus)
+    serial = time.perf_counter() - start
+    print(f"{'modo':<14} {'tempo (s)':>10} {'segmentos':>10} {'speedup':>8}")
+    print(f"{'serial':<14} {serial:>10.2f} {serial_segments:>10} {1.0:>8.2f}")
+
+    cpus = os.cpu_count() or 1
+    workers = args.workers or sorted({2 ** i for i in range(cpus.bit_length()) if 2 ** i <= cpus} | {cpus})
+    for count in workers:
+        extractor = ParallelExtractor(max_workers=count, memory_limit_mb=0)
+        # Aquece o pool para não medir a criação dos processos
+        extractor.extract_many([(b"aquecimento", "a.txt")] * count)
+        start = time.perf_counter()
+        results = extractor.extract_many(corpus)
+        elapsed = time.perf_counter() - start
+        extractor.close()
+        segments = sum(len(result) for result in results)
+        print(f"{f'{count} processos':<14} {elapsed:>10.2f} {segments:>10} {serial / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
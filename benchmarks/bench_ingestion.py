@@ -0,0 +1,86 @@
+"""
+Benchmark da ingestão no VectorDB.
+
+Compara a ingestão antiga (uma chamada de embeddings e uma persistência por segmento)
+com a ingestão em lote (`VectorDB.add_documents`), usando um embedding local falso
+que simula a latência de ida e volta da API.
+
+Uso:
+    PYTHONPATH=./ python benchmarks/bench_ingestion.py --sizes 100 500 1000 --latency 0.02
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.vector_db import VectorDB
+
+
+class LatencyFakeEmbedding(DeterministicFakeEmbedding):
+    """Embedding determinístico local que simula a latência de cada chamada à API."""
+    latency: float = 0.0
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+def build_segments(n):
+    """
+    Gera segmentos sintéticos no formato produzido pelo DocumentProcessor.
+
+    Parâmetros:
+        n (int): Número de segmentos.
+
+    Retorna:
+        list: Lista de dicionários com as chaves 'content' e 'metadata'.
+    """
+    return [
+        {"content": f"Segmento {i} do documento de teste sobre o produto {i % 97}. " * 12,
+         "metadata": {"source": f"doc_{i // 50}.txt"}}
+        for i in range(n)
+    ]
+
+
+def run(size, latency, dimension, per_chunk):
+    """
+    Executa uma rodada de ingestão e retorna a vazão em segmentos por segundo.
+    """
+    segments = build_segments(size)
+    with tempfile.TemporaryDirectory() as directory:
+        db = VectorDB(persist_directory=directory,
+                      embeddings=LatencyFakeEmbedding(size=dimension, latency=latency))
+        start = time.perf_counter()
+        if per_chunk:
+            for segment in segments:
+                db.add([segment["content"]], [segment["metadata"]])
+        else:
+            db.add_documents(segments)
+        elapsed = time.perf_counter() - start
+    return size / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2000])
+    parser.add_argument("--latency", type=float, default=0.02, help="latência simulada por chamada (s)")
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--skip-per-chunk", action="store_true", help="não mede a ingestão por segmento")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    print(f"{'segmentos':>10} {'por segmento (seg/s)':>22} {'em lote (seg/s)':>16}")
+    for size in args.sizes:
+        per_chunk = "-" if args.skip_per_chunk else f"{run(size, args.latency, args.dimension, True):.1f}"
+        bulk = run(size, args.latency, args.dimension, False)
+        print(f"{size:>10} {per_chunk:>22} {bulk:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
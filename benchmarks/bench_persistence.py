@@ -0,0 +1,75 @@
+"""
+Benchmark do custo de persistência à medida que o índice cresce.
+
+Compara, a cada lote adicionado, a gravação completa com FAISS.save_local (formato antigo)
+com o acréscimo de um segmento no SegmentStore (formato incremental).
+
+Uso:
+    PYTHONPATH=./ python benchmarks/bench_persistence.py --batches 20 --batch-size 1000 --dimension 1536
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.segment_store import SegmentStore
+
+
+def directory_size(path):
+    """Retorna o tamanho total, em bytes, dos arquivos de um diretório."""
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(0)
+    embeddings = DeterministicFakeEmbedding(size=args.dimension)
+    text = "segmento de teste " * 50
+
+    with tempfile.TemporaryDirectory() as legacy_dir, tempfile.TemporaryDirectory() as segment_dir:
+        store = SegmentStore(segment_dir)
+        vector_store = None
+        print(f"{'vetores':>10} {'save_local (ms)':>16} {'segmento (ms)':>14} {'disco antigo (MB)':>18} {'disco novo (MB)':>16}")
+        for _ in range(args.batches):
+            vectors = rng.random((args.batch_size, args.dimension), dtype=np.float32)
+            ids = [str(uuid.uuid4()) for _ in range(args.batch_size)]
+            texts = [text] * args.batch_size
+            metadatas = [{"source": "bench.txt"}] * args.batch_size
+            text_embeddings = list(zip(texts, vectors.tolist()))
+
+            if vector_store is None:
+                vector_store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+            else:
+                vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+            start = time.perf_counter()
+            vector_store.save_local(legacy_dir)
+            legacy_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            store.append(ids, vectors, texts, metadatas)
+            segment_ms = (time.perf_counter() - start) * 1000
+
+            print(f"{vector_store.index.ntotal:>10} {legacy_ms:>16.1f} {segment_ms:>14.1f} "
+                  f"{directory_size(legacy_dir) / 2**20:>18.1f} {directory_size(segment_dir) / 2**20:>16.1f}")
+
+        store.wait_for_compaction()
+        start = time.perf_counter()
+        store.compact()
+        print(f"compactação final: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
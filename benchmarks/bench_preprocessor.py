@@ -0,0 +1,63 @@
+"""
+Benchmark do pré-processamento de texto: word_tokenize do NLTK vs. tokenizador compilado.
+
+Mede a vazão (textos por segundo) do pré-processamento de um corpus sintético com a
+implementação anterior (word_tokenize, um texto por vez), com preprocess_many usando o
+tokenizador compilado e, opcionalmente, com preprocess_many dividido entre processos.
+Também verifica se as duas implementações produzem o mesmo resultado no corpus.
+
+Uso:
+    PYTHONPATH=./ python benchmarks/bench_preprocessor.py --texts 20000 --processes 4
+"""
+import argparse
+import random
+import time
+
+from src.text_preprocessor import TextPreprocessor
+
+WORDS = ("o contrato prevê prazo de entrega ao cliente e ao fornecedor , com pagamento "
+         "da multa de 10 % em caso de rescisão ; a cláusula 3.2 vale a partir de 12/03/2024 "
+         "às 12:30 para o valor de r$ 1.000,50 ( ver anexo ) e-mail contato@empresa.com.br").split()
+
+
+def generate_corpus(count, words=150, seed=0):
+    """Gera `count` textos de `words` palavras, terminados em ponto final."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "." for _ in range(count)]
+
+
+def measure(label, function, corpus):
+    start = time.perf_counter()
+    result = function(corpus)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:>10.2f} {len(corpus) / elapsed:>12.0f}")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=150)
+    parser.add_argument("--processes", type=int, default=0,
+                        help="número de processos para preprocess_many (0 desativa)")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.texts, args.words)
+    baseline = TextPreprocessor(tokenizer="nltk")
+    compiled = TextPreprocessor()
+    # Carrega as stopwords antes de medir
+    baseline.preprocess("aquecimento")
+    compiled.preprocess("aquecimento")
+
+    print(f"{'implementação':<28} {'tempo (s)':>10} {'textos/s':>12}")
+    expected, reference = measure("word_tokenize (atual)", lambda texts: [baseline.preprocess(t) for t in texts], corpus)
+    result, elapsed = measure("preprocess_many (regex)", compiled.preprocess_many, corpus)
+    print(f"speedup: {reference / elapsed:.1f}x, resultados idênticos: {result == expected}")
+    if args.processes > 1:
+        result, elapsed = measure(f"preprocess_many ({args.processes} proc.)",
+                                  lambda texts: compiled.preprocess_many(texts, processes=args.processes), corpus)
+        print(f"speedup: {reference / elapsed:.1f}x, resultados idênticos: {result == expected}")
+
+
+if __name__ == "__main__":
+    main()
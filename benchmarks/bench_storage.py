@@ -0,0 +1,97 @@
+"""
+Benchmark dos formatos de armazenamento dos vetores do VectorDB sobre vetores sintéticos.
+
+Para cada formato (float32, float16, int8 e PQ), com e sem o re-ranking exato a partir dos
+vetores completos em disco, reporta a memória do índice por vetor, o recall@k em relação ao
+índice flat float32 e as latências p50/p99 de uma consulta.
+
+Uso:
+    PYTHONPATH=./ python benchmarks/bench_storage.py --n 100000 --dimension 1536 --queries 200 --k 10
+"""
+import argparse
+import tempfile
+import time
+import os
+
+import faiss
+import numpy as np
+
+from src.index_factory import build_index
+from src.vector_file import VectorFile
+
+# Configurações avaliadas: (rótulo, formato, parâmetros do índice, fator de re-ranking)
+CONFIGURATIONS = [
+    ("float32", "float32", {}, 0),
+    ("float16", "float16", {}, 0),
+    ("float16 rerank=4", "float16", {}, 4),
+    ("int8", "int8", {}, 0),
+    ("int8 rerank=4", "int8", {}, 4),
+    ("pq m=64", "pq", {"m": 64}, 0),
+    ("pq m=64 rerank=10", "pq", {"m": 64}, 10),
+    ("pq m=128 rerank=10", "pq", {"m": 128}, 10),
+]
+
+
+def synthetic_vectors(n, dimension, clusters, rng):
+    """Gera vetores agrupados em clusters gaussianos, mais próximos de embeddings reais que ruído uniforme."""
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return (centers[labels] + 0.3 * rng.normal(size=(n, dimension))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_vectors(args.n, args.dimension, 200, rng)
+    queries = synthetic_vectors(args.queries, args.dimension, 200, rng)
+
+    exact = faiss.IndexFlatL2(args.dimension)
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, args.k)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Vetores completos em disco, lidos via mmap apenas no re-ranking
+        vector_file = VectorFile(os.path.join(directory, "vectors.f32"))
+        vector_file.add(vectors)
+        vector_file.save()
+
+        print(f"{'configuração':<22} {'bytes/vetor':>12} {'recall@' + str(args.k):>10} "
+              f"{'p50 (ms)':>9} {'p99 (ms)':>9}")
+        built = {}
+        for label, storage, index_params, rerank_factor in CONFIGURATIONS:
+            key = (storage, tuple(sorted(index_params.items())))
+            if key not in built:
+                index = exact if storage == "float32" else build_index("flat", vectors, index_params, storage)
+                if index is not exact:
+                    index.add(vectors)
+                built[key] = index
+            index = built[key]
+
+            latencies = []
+            found = np.empty_like(ground_truth)
+            for i, query in enumerate(queries):
+                query = query.reshape(1, -1)
+                start = time.perf_counter()
+                if rerank_factor > 1:
+                    _, candidates = index.search(query, args.k * rerank_factor)
+                    _, ids = vector_file.rerank(query, candidates, args.k)
+                else:
+                    _, ids = index.search(query, args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found[i] = ids[0]
+
+            recall = np.mean([len(set(e) & set(f)) / args.k for e, f in zip(ground_truth, found)])
+            # Memória do índice na RAM de cada worker; os vetores do re-ranking ficam em disco
+            bytes_per_vector = faiss.serialize_index(index).nbytes / index.ntotal
+            print(f"{label:<22} {bytes_per_vector:>12.1f} {recall:>10.3f} "
+                  f"{np.percentile(latencies, 50):>9.3f} {np.percentile(latencies, 99):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
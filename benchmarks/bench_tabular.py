@@ -0,0 +1,62 @@
+"""
+Benchmark da extração de CSVs grandes: modo tabular vs. texto.
+
+Gera um CSV sintético e mede o tempo, o pico de memória alocada (tracemalloc) e o volume
+de texto produzido pela segmentação em grupos de linhas (modo tabular) e pela renderização
+do arquivo como texto seguida do text splitter.
+
+Uso:
+    PYTHONPATH=./ python benchmarks/bench_tabular.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from src.document_processor import DocumentProcessor
+
+
+def write_csv(path, rows, seed=0):
+    """Grava um CSV com `rows` linhas de dados e um cabeçalho."""
+    rng = random.Random(seed)
+    cities = ["Recife", "São Paulo", "Porto Alegre", "Manaus", "Curitiba"]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("id,cliente,cidade,valor,data\n")
+        for i in range(rows):
+            f.write(f"{i},cliente {rng.randint(1, 50000)},{rng.choice(cities)},"
+                    f"{rng.random() * 1000:.2f},2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}\n")
+
+
+def measure(processor, path):
+    """Consome os segmentos do arquivo e retorna (segundos, pico de memória em MB, segmentos, caracteres)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    segments = characters = 0
+    for segment in processor.process_path(path, "dados.csv"):
+        segments += 1
+        characters += len(segment["content"])
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6, segments, characters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "dados.csv")
+        write_csv(path, args.rows)
+        print(f"CSV: {args.rows} linhas, {os.path.getsize(path) / 1e6:.1f} MB")
+        print(f"{'modo':<8} {'tempo (s)':>10} {'pico (MB)':>10} {'segmentos':>10} {'caracteres':>12}")
+        for label, processor in (("tabular", DocumentProcessor()), ("texto", DocumentProcessor(tabular_mode=False))):
+            elapsed, peak, segments, characters = measure(processor, path)
+            print(f"{label:<8} {elapsed:>10.2f} {peak:>10.1f} {segments:>10} {characters:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,593 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import Depends, FastAPI, HTTPException, UploadFile, File, Form, Header, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
-from src.document_processor import DocumentProcessor, DocumentProcessingError
-from src.vector_db import VectorDB
-from src.rag_engine import RAGEngine
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from src.document_processor import DocumentProcessor
+from src.parallel_extractor import ParallelExtractor
+from src.ingest_queue import IngestQueue
+from src.collection_manager import DEFAULT_COLLECTION, Collection, CollectionManager, validate_collection_name
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import datetime
+import hashlib
+import itertools
+import json
 import logging
 import os
-
-app = FastAPI()
+import shutil
+import threading
 
 # Configura o logging para monitorar a execução do aplicativo
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Inicializa os componentes principais do sistema
+# Inicializa os componentes leves do sistema. Os que importam LangChain, FAISS e NLTK ou carregam
+# o índice (despachante e cache de embeddings, VectorDB, cache de respostas e RAGEngine) são
+# criados por init_components, no lifespan da aplicação ou no primeiro uso.
 document_processor = DocumentProcessor()
-vector_db = VectorDB(persist_directory="./persistent_vector_db")
-rag_engine = RAGEngine(vector_db)
+embedding_dispatcher = None
+embedding_cache = None
+vector_db = None
+answer_cache = None
+rag_engine = None
+# Re-ranker entre a recuperação e a geração (RERANKER), compartilhado por todas as coleções
+reranker = None
+# Erro da inicialização dos componentes, reportado por /ready
+components_error = None
+_components_lock = threading.Lock()
+# Executor limitado para a extração de documentos, que é CPU-bound e bloqueante
+extraction_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EXTRACTION_WORKERS", "4")),
+    thread_name_prefix="extraction",
+)
+# Número máximo de segmentos mantidos em memória e inseridos por vez durante a ingestão
+ingest_batch_segments = int(os.getenv("INGEST_BATCH_SEGMENTS", "1000"))
+# No modo "process", a extração roda em um pool de processos, usando todos os núcleos
+extraction_mode = os.getenv("EXTRACTION_MODE", "thread")
+parallel_extractor = ParallelExtractor(
+    max_workers=int(os.getenv("EXTRACTION_PROCESSES", "0")) or None,
+    timeout=float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "120")),
+    memory_limit_mb=int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", "2048")),
+) if extraction_mode == "process" else None
+# Inicialização dos componentes pesados: "background" (padrão) cria-os em segundo plano logo
+# após o startup, "eager" aguarda a criação antes de aceitar requisições e "lazy" cria-os
+# apenas na primeira requisição que os utiliza
+startup_warmup = os.getenv("STARTUP_WARMUP", "background")
+# Número máximo de perguntas aceitas por /query_batch
+query_batch_max_questions = int(os.getenv("QUERY_BATCH_MAX_QUESTIONS", "1000"))
+
+def components_ready():
+    """Indica se os componentes pesados já foram criados."""
+    return None not in (embedding_dispatcher, embedding_cache, vector_db, answer_cache, rag_engine)
+
+def init_components():
+    """
+    Cria os componentes pesados que ainda não existem: o despachante e o cache de embeddings,
+    o VectorDB (carregando o índice do disco), o cache de respostas e o RAGEngine.
+
+    É seguro chamá-la de várias threads: os componentes são criados uma única vez.
+
+    Lança:
+        Exception: Se a criação de algum componente falhar.
+    """
+    global embedding_dispatcher, embedding_cache, vector_db, answer_cache, rag_engine, reranker
+    with _components_lock:
+        if components_ready():
+            return
+        from src.embedding_dispatcher import EmbeddingDispatcher
+        from src.embedding_cache import EmbeddingCache
+
+        logger.info("Inicializando os componentes do sistema")
+        if embedding_dispatcher is None:
+            # O despachante de embeddings é compartilhado pela ingestão e pelas consultas
+            embedding_dispatcher = EmbeddingDispatcher(
+                max_concurrency=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+            )
+        if embedding_cache is None:
+            # O cache de embeddings evita reembedar conteúdo já visto em uploads anteriores
+            embedding_cache = EmbeddingCache(
+                path=os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3"),
+                max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1000000")),
+            )
+        if vector_db is None:
+            vector_db = create_vector_db("./persistent_vector_db")
+        if answer_cache is None:
+            answer_cache = create_answer_cache(vector_db)
+        if reranker is None and os.getenv("RERANKER"):
+            from src.reranker import DEFAULT_CROSS_ENCODER_MODEL, create_reranker
+
+            # O modelo do cross-encoder é carregado uma única vez; os embeddings e o pré-processador
+            # da combinação BM25 + embeddings são os mesmos em todas as coleções
+            reranker = create_reranker(
+                os.getenv("RERANKER"), vector_db.embeddings, vector_db.preprocessor,
+                model_name=os.getenv("RERANKER_MODEL", DEFAULT_CROSS_ENCODER_MODEL),
+                lexical_weight=float(os.getenv("RERANKER_LEXICAL_WEIGHT", "0.3")),
+            )
+        if rag_engine is None:
+            rag_engine = create_rag_engine(vector_db, answer_cache)
+        logger.info("Componentes do sistema inicializados")
+
+def create_vector_db(persist_directory):
+    """
+    Cria o VectorDB de uma coleção, carregando o seu índice do disco. Com VECTOR_DB_SHARDS > 0,
+    o índice é particionado nesse número de shards, em threads ou em processos locais
+    (VECTOR_DB_SHARD_MODE), e rebalanceado se o número mudar.
+    """
+    from src.vector_db import VectorDB
+    from src.sharded_vector_db import ShardedVectorDB
+
+    options = dict(
+        embeddings=embedding_dispatcher, embedding_cache=embedding_cache,
+        mmap=os.getenv("VECTOR_DB_MMAP", "0") == "1",
+        lexical_confidence=float(os.getenv("LEXICAL_CONFIDENCE", "0.9")),
+        deduplicate=os.getenv("DEDUPLICATE", "1") == "1",
+        near_duplicate_threshold=float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9")),
+        purge_ratio=float(os.getenv("PURGE_DELETED_RATIO", "0.2")),
+        storage=os.getenv("VECTOR_STORAGE", "float32"),
+        rerank_factor=int(os.getenv("RERANK_FACTOR", "0")),
+        tokenizer=os.getenv("TEXT_TOKENIZER", "regex"),
+    )
+    shards = int(os.getenv("VECTOR_DB_SHARDS", "0"))
+    if shards > 0:
+        return ShardedVectorDB(persist_directory=persist_directory, shards=shards,
+                               mode=os.getenv("VECTOR_DB_SHARD_MODE", "thread"), **options)
+    return VectorDB(persist_directory=persist_directory, **options)
+
+def create_answer_cache(vector_db):
+    """Cria o cache de respostas de uma coleção, para perguntas repetidas ou semanticamente equivalentes."""
+    from src.answer_cache import AnswerCache
+
+    return AnswerCache(
+        embeddings=vector_db.embeddings,
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000")),
+    )
+
+def create_rag_engine(vector_db, answer_cache):
+    """
+    Cria o motor RAG de uma coleção. O cliente do LLM do motor da coleção padrão é
+    compartilhado pelos motores das coleções nomeadas.
+    """
+    from src.rag_engine import RAGEngine
+
+    return RAGEngine(vector_db, answer_cache=answer_cache,
+                     retrieval_mode=os.getenv("RETRIEVAL_MODE", "hybrid"),
+                     batch_concurrency=int(os.getenv("QUERY_BATCH_CONCURRENCY", "8")),
+                     reranker=reranker, rerank_candidates=int(os.getenv("RERANK_CANDIDATES", "20")),
+                     llm=rag_engine.llm if rag_engine is not None else None)
+
+def create_collection(name, directory):
+    """
+    Cria os componentes de uma coleção nomeada, com o índice no seu diretório. O despachante
+    e o cache de embeddings são compartilhados por todas as coleções.
+    """
+    init_components()
+    collection_vector_db = create_vector_db(directory)
+    collection_answer_cache = create_answer_cache(collection_vector_db)
+    return Collection(collection_vector_db, collection_answer_cache,
+                      create_rag_engine(collection_vector_db, collection_answer_cache))
+
+# Coleções nomeadas, cada uma com o seu índice em COLLECTIONS_PATH/<nome>, carregadas sob demanda e
+# descarregadas, das usadas há mais tempo, quando excedem COLLECTIONS_MEMORY_BUDGET_MB (0: sem limite).
+# A coleção padrão usa ./persistent_vector_db e os componentes globais, e permanece sempre carregada.
+collection_manager = CollectionManager(
+    directory=os.getenv("COLLECTIONS_PATH", "./collections"),
+    factory=create_collection,
+    memory_budget=int(os.getenv("COLLECTIONS_MEMORY_BUDGET_MB", "0")) * 1024 * 1024,
+)
+
+async def ensure_components():
+    """Garante que os componentes pesados existam, criando-os fora do event loop se preciso."""
+    if not components_ready():
+        await asyncio.to_thread(init_components)
+
+async def warm_up():
+    """Cria os componentes em segundo plano, registrando a falha para /ready."""
+    global components_error
+    try:
+        await ensure_components()
+        components_error = None
+    except Exception as e:
+        components_error = str(e)
+        logger.error(f"Erro ao inicializar os componentes: {str(e)}")
+
+def collection_name(request: Request, x_collection: Optional[str] = Header(None)):
+    """
+    Dependência que resolve a coleção de uma requisição: o segmento {collection} do caminho
+    (/collections/{collection}/...), o cabeçalho X-Collection ou, sem nenhum, a coleção padrão.
+
+    Lança:
+        HTTPException: 400 se o nome da coleção for inválido.
+    """
+    name = request.path_params.get("collection") or x_collection or DEFAULT_COLLECTION
+    try:
+        validate_collection_name(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return name
+
+async def open_collection(name, create=False):
+    """
+    Retorna os componentes de uma coleção, carregando-a fora do event loop se preciso. Cada
+    chamada deve ser seguida de release_collection, que a libera para o descarregamento.
+
+    Parâmetros:
+        name (str): O nome da coleção.
+        create (bool): Se True, cria a coleção caso ela não exista.
+
+    Retorna:
+        Collection: Os componentes da coleção.
+
+    Lança:
+        HTTPException: 404 se a coleção não existir e create for False.
+    """
+    await ensure_components()
+    if name == DEFAULT_COLLECTION:
+        return Collection(vector_db, answer_cache, rag_engine)
+    collection = await asyncio.to_thread(collection_manager.acquire, name, create)
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"Coleção não encontrada: {name}")
+    return collection
+
+async def release_collection(name):
+    """Libera uma coleção obtida por open_collection, fora do event loop: o release pode descarregar coleções."""
+    if name != DEFAULT_COLLECTION:
+        await asyncio.to_thread(collection_manager.release, name)
+
+@asynccontextmanager
+async def use_collection(name, create=False):
+    """Context manager que obtém uma coleção por open_collection e a libera ao final."""
+    collection = await open_collection(name, create)
+    try:
+        yield collection
+    finally:
+        await release_collection(name)
 
 class Query(BaseModel):
     question: str
+    # Filtro de metadados, por exemplo {"source": {"$in": ["a.pdf"]}} ou {"tags": "rh"}
+    filter: Optional[dict] = None
+
+class QueryBatch(BaseModel):
+    questions: List[str]
+    filter: Optional[dict] = None
+
+def validate_query_filter(filter):
+    """
+    Valida o filtro de metadados de uma consulta.
+
+    Lança:
+        HTTPException: 400 se o filtro usar um campo não indexado ou um operador não suportado.
+    """
+    if filter is None:
+        return
+    from src.metadata_index import validate_filter
+    try:
+        validate_filter(filter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def ingest_file(path, filename, collection=None, tenant=None, tags=None, uploaded_at=None):
+    """
+    Processa um arquivo gravado em disco e armazena os seus segmentos no banco de dados vetorial
+    da coleção, criando-a se preciso. Executado pelos workers da fila de ingestão.
+
+    O arquivo é extraído e segmentado de forma incremental, e os segmentos são enviados ao
+    banco de dados vetorial em lotes de até INGEST_BATCH_SEGMENTS. A memória usada depende do
+    tamanho do lote, e não do tamanho do arquivo.
+
+    Parâmetros:
+        path (str): O caminho do arquivo em disco.
+        filename (str): O nome original do arquivo.
+        collection (str, opcional): A coleção de destino. O padrão é a coleção padrão.
+        tenant (str, opcional): O tenant do upload, registrado nos metadados de cada segmento.
+        tags (list, opcional): As tags do upload, registradas nos metadados de cada segmento.
+        uploaded_at (str, opcional): O horário do upload (ISO 8601, UTC). O padrão é o horário atual.
+
+    Um arquivo com o mesmo conteúdo de outro já ingerido na coleção não é processado novamente,
+    e os segmentos duplicados de outros já indexados são descartados antes dos embeddings.
+
+    Um arquivo com o nome de um documento já indexado o substitui: os segmentos da versão
+    anterior continuam nas buscas até que a nova versão seja indexada, e são removidos em seguida.
+
+    Retorna:
+        dict: O número de segmentos armazenados, na chave 'chunks', as contagens de segmentos
+            descartados, nas chaves 'duplicates' e 'near_duplicates', e o número de segmentos da
+            versão anterior removidos, em 'replaced'; ou 'duplicate_file' se o arquivo já tiver
+            sido ingerido.
+    """
+    # Metadados do upload, indexados junto com os do DocumentProcessor e usados nos filtros
+    upload_metadata = {
+        "uploaded_at": uploaded_at or datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+    if tenant is not None:
+        upload_metadata["tenant"] = tenant
+    if tags:
+        upload_metadata["tags"] = list(tags)
+    # A coleção fica marcada como em uso, e não é descarregada, durante toda a ingestão
+    async with use_collection(collection or DEFAULT_COLLECTION, create=True) as components:
+        return await ingest_into(components.vector_db, path, filename, upload_metadata)
+
+async def ingest_into(vector_db, path, filename, upload_metadata):
+    """
+    Extrai um arquivo e o indexa em um banco de dados vetorial, como descrito em ingest_file.
+
+    Parâmetros:
+        vector_db (VectorDB): O banco de dados vetorial da coleção.
+        path (str): O caminho do arquivo em disco.
+        filename (str): O nome original do arquivo.
+        upload_metadata (dict): Os metadados do upload, acrescentados aos de cada segmento.
+
+    Retorna:
+        dict: O resultado, como em ingest_file.
+    """
+    from src.deduplicator import file_hash
+
+    loop = asyncio.get_running_loop()
+    logger.info(f"Processando arquivo: {filename}")
+    digest = await loop.run_in_executor(extraction_executor, file_hash, path)
+    if vector_db.file_record(digest) is not None:
+        logger.info(f"Arquivo já ingerido com o mesmo conteúdo: {filename}")
+        return {"chunks": 0, "duplicate_file": True}
+    if parallel_extractor is not None:
+        # Extrai o arquivo no pool de processos (PDFs grandes em intervalos de páginas paralelos),
+        # recebendo os segmentos de cada intervalo assim que ele e os anteriores terminam
+        segments = parallel_extractor.iter_extract(path, filename)
+    else:
+        segments = document_processor.process_path(path, filename)
+    # Segmentos da versão anterior do documento, substituídos ao final
+    previous = await asyncio.to_thread(vector_db.source_chunks, filename)
+    total = 0
+    stats = {}
+    try:
+        while True:
+            # Extrai o próximo lote no executor de extração, fora do event loop
+            batch = await loop.run_in_executor(
+                extraction_executor, lambda: list(itertools.islice(segments, ingest_batch_segments))
+            )
+            if not batch:
+                break
+            for segment in batch:
+                segment["metadata"].update(upload_metadata)
+            # Os novos segmentos ficam visíveis ao RAGEngine na próxima consulta, sem reinicializá-lo
+            total += await vector_db.aadd_documents(batch, stats=stats, replaces=previous)
+    finally:
+        if hasattr(segments, "close"):
+            segments.close()
+    replaced = await asyncio.to_thread(vector_db.delete_chunks, previous) if previous else 0
+    # Registrado apenas após a ingestão completa: um arquivo interrompido é processado de novo
+    await asyncio.to_thread(vector_db.record_file, digest, filename, total)
+    logger.info(f"Segmentos processados: {total}")
+    return {
+        "chunks": total,
+        "duplicates": stats.get("duplicates", 0),
+        "near_duplicates": stats.get("near_duplicates", 0),
+        "replaced": replaced,
+    }
+
+# Fila persistente de ingestão: os uploads são processados em segundo plano por um pool limitado de workers
+ingest_queue = IngestQueue(
+    ingest_file,
+    directory=os.getenv("INGEST_JOBS_PATH", "./ingest_jobs"),
+    workers=int(os.getenv("INGEST_WORKERS", "2")),
+    # Com o pool de processos, os arquivos de um mesmo upload são extraídos em paralelo
+    file_concurrency=parallel_extractor.max_workers if parallel_extractor is not None else 1,
+)
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Ciclo de vida da aplicação: inicia os workers de ingestão (retomando os jobs interrompidos
+    por um restart) e inicializa os componentes conforme STARTUP_WARMUP; no encerramento, para
+    os workers, descarrega as coleções e encerra o pool de extração.
+    """
+    await ingest_queue.start()
+    warm_up_task = None
+    if startup_warmup == "eager":
+        await warm_up()
+    elif startup_warmup == "background":
+        warm_up_task = asyncio.create_task(warm_up())
+    try:
+        yield
+    finally:
+        if warm_up_task is not None:
+            # A criação roda em uma thread, que não pode ser interrompida: aguarda o seu término
+            await warm_up_task
+        await ingest_queue.stop()
+        await asyncio.to_thread(collection_manager.close)
+        if parallel_extractor is not None:
+            parallel_extractor.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/health")
+async def health():
+    """
+    Sonda de liveness: indica apenas que o processo está atendendo requisições.
+
+    Retorna:
+        dict: {"status": "ok"}.
+    """
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """
+    Sonda de readiness: indica se os componentes foram inicializados e o índice carregado.
+
+    Retorna:
+        dict | JSONResponse: {"status": "ready"} com status 200, ou status 503 com "starting"
+            (inicialização em andamento ou ainda não iniciada) ou "failed" e o erro.
+    """
+    if components_ready():
+        return {"status": "ready"}
+    if components_error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": components_error})
+    return JSONResponse(status_code=503, content={"status": "starting"})
 
 @app.post("/upload_documents")
-async def upload_documents(files: List[UploadFile] = File(...)):
+@app.post("/collections/{collection}/upload_documents")
+async def upload_documents(files: List[UploadFile] = File(...), tenant: Optional[str] = Form(None),
+                           tags: Optional[str] = Form(None), collection: str = Depends(collection_name)):
     """
     Upload de documentos para processamento e armazenamento no banco de dados vetorial.
 
+    Os arquivos são gravados em disco e enfileirados; o processamento ocorre em segundo plano
+    e o seu progresso pode ser acompanhado em /jobs/{job_id}. Arquivos com o mesmo conteúdo de
+    outro já ingerido, ou de outro do mesmo upload, não são enfileirados.
+
+    O horário do upload, o tenant e as tags são registrados nos metadados de cada segmento e
+    podem ser usados nos filtros de /query.
+
+    Os documentos são indexados na coleção selecionada pelo caminho
+    (/collections/{collection}/upload_documents) ou pelo cabeçalho X-Collection, que é criada
+    se ainda não existir; sem nenhum dos dois, na coleção padrão.
+
     Parâmetros:
         files (List[UploadFile]): Lista de arquivos a serem carregados e processados.
+        tenant (str, opcional): O tenant dos documentos.
+        tags (str, opcional): Tags dos documentos, separadas por vírgula.
+        collection (str): A coleção de destino.
 
     Retorno:
-        dict: Mensagem de sucesso com o número de documentos carregados e processados.
+        dict: Mensagem de sucesso com o número de documentos carregados, o id do job de ingestão
+            (None se nenhum arquivo for enfileirado) e, em 'deduplication', os arquivos duplicados.
 
     Exceções:
-        DocumentProcessingError: Erro ao processar os documentos.
-        Exception: Erro ao fazer upload e processar os documentos.
+        HTTPException: 400 se algum arquivo tiver formato não suportado ou o nome da coleção for
+            inválido, 500 em caso de erro ao gravar os arquivos.
+    """
+    unsupported = [file.filename for file in files if not document_processor.is_supported(file.filename)]
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Formato de arquivo não suportado: {', '.join(unsupported)}")
+
+    async with use_collection(collection, create=True) as components:
+        return await spool_upload(components.vector_db, files, tenant, tags, collection)
+
+async def spool_upload(vector_db, files, tenant, tags, collection):
     """
+    Grava os arquivos de um upload em disco e enfileira o job de ingestão, como descrito em
+    upload_documents, descartando os arquivos já ingeridos no banco de dados vetorial da coleção.
+    """
+    job_id = ingest_queue.new_job_id()
+    job_directory = ingest_queue.job_directory(job_id)
     try:
-        processed_documents = []
-        for file in files:
-            content = await file.read()
-            logger.info(f"Processando arquivo: {file.filename}")
-            # Processa cada arquivo e extrai seu conteúdo
-            processed_segments = document_processor.process_file(content, file.filename)
-            logger.info(f"Segmentos processados: {len(processed_segments)}")
-            # Adiciona os segmentos processados ao dicionário de documentos
-            processed_documents.extend(processed_segments)
-        
-        logger.info(f"Total de segmentos processados: {len(processed_documents)}")
-        # Adiciona os segmentos processados ao banco de dados vetorial
-        for segment in processed_documents:
-            vector_db.add([segment["content"]], [segment["metadata"]])
-        
-        # Reinicializa o motor RAG com o banco de dados atualizado
-        global rag_engine
-        rag_engine = RAGEngine(vector_db)
-        logger.info("RAGEngine reinicializado com novos documentos")
-        # Retorna uma mensagem de sucesso
-        return {"message": f"{len(files)} documentos carregados, processados e armazenados com sucesso"}
-    # Trata erros de processamento de documentos
-    except DocumentProcessingError as e:
-        logger.error(f"Erro ao processar documentos: {str(e)}")
-        raise HTTPException(status_code=400, detail=str(e))
+        spooled = []
+        duplicate_files = []
+        seen = set()
+        for position, file in enumerate(files):
+            # Grava o arquivo em disco em blocos, sem manter o upload inteiro em memória,
+            # calculando o hash do conteúdo durante a gravação
+            path = os.path.join(job_directory, f"{position:04d}-{os.path.basename(file.filename)}")
+            digest = hashlib.sha256()
+            with open(path, "wb") as out:
+                while chunk := await file.read(1024 * 1024):
+                    digest.update(chunk)
+                    out.write(chunk)
+            digest = digest.hexdigest()
+            if digest in seen or vector_db.file_record(digest) is not None:
+                # Conteúdo já ingerido ou repetido neste upload: não é processado de novo
+                os.remove(path)
+                duplicate_files.append(file.filename)
+                continue
+            seen.add(digest)
+            spooled.append((file.filename, path))
+        if spooled:
+            metadata = {"uploaded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")}
+            if tenant:
+                metadata["tenant"] = tenant
+            tag_list = [tag.strip() for tag in (tags or "").split(",") if tag.strip()]
+            if tag_list:
+                metadata["tags"] = tag_list
+            if collection != DEFAULT_COLLECTION:
+                metadata["collection"] = collection
+            ingest_queue.submit(job_id, spooled, metadata)
+        else:
+            shutil.rmtree(job_directory, ignore_errors=True)
+            job_id = None
+        # Retorna o id do job imediatamente, sem aguardar o processamento
+        return {
+            "message": f"{len(files)} documentos carregados e {len(spooled)} enfileirados para processamento",
+            "job_id": job_id,
+            "deduplication": {"duplicate_files": duplicate_files, "enqueued": len(spooled)},
+        }
     except Exception as e:
-        logger.error(f"Erro ao fazer upload e processar documentos: {str(e)}")
+        shutil.rmtree(job_directory, ignore_errors=True)
+        logger.error(f"Erro ao fazer upload dos documentos: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """
+    Retorna o estado de um job de ingestão.
+
+    Parâmetros:
+        job_id (str): O id retornado por /upload_documents.
+
+    Retorna:
+        dict: O estado do job e, para cada arquivo, o estado, o número de segmentos e o erro, se houver.
+
+    Lança:
+        HTTPException: 404 se o job não existir.
+    """
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job não encontrado: {job_id}")
+    return job
+
+@app.get("/documents")
+@app.get("/collections/{collection}/documents")
+async def list_documents(collection: str = Depends(collection_name)):
+    """
+    Lista os documentos indexados na coleção, selecionada como em /query.
+
+    Retorna:
+        dict: Em 'documents', o número de segmentos ativos de cada documento.
+
+    Lança:
+        HTTPException: 404 se a coleção não existir.
+    """
+    async with use_collection(collection) as components:
+        return {"documents": await asyncio.to_thread(components.vector_db.sources)}
+
+@app.delete("/documents/{source:path}")
+@app.delete("/collections/{collection}/documents/{source:path}")
+async def delete_document(source: str, collection: str = Depends(collection_name)):
+    """
+    Remove um documento do banco de dados vetorial da coleção, sem reconstruir o índice.
+
+    Parâmetros:
+        source (str): O nome do documento, como enviado em /upload_documents.
+        collection (str): A coleção, selecionada como em /query.
+
+    Retorna:
+        dict: O documento e o número de segmentos removidos.
+
+    Lança:
+        HTTPException: 404 se a coleção não existir ou o documento não estiver indexado.
+    """
+    async with use_collection(collection) as components:
+        deleted = await asyncio.to_thread(components.vector_db.delete_source, source)
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Documento não encontrado: {source}")
+    return {"source": source, "deleted_chunks": deleted}
+
 @app.post("/query")
-async def query(query: Query):
+@app.post("/collections/{collection}/query")
+async def query(query: Query, collection: str = Depends(collection_name)):
     """
     Processa uma consulta utilizando o motor RAG.
 
+    A coleção é selecionada pelo caminho (/collections/{collection}/...) ou pelo cabeçalho
+    X-Collection; sem nenhum dos dois, é usada a coleção padrão.
+
     Parâmetros:
-        query (Query): Objeto contendo a pergunta a ser processada.
+        query (Query): Objeto contendo a pergunta a ser processada e, opcionalmente, um filtro
+            de metadados que restringe os documentos recuperados (por exemplo,
+            {"source": {"$in": ["a.pdf", "b.pdf"]}}, {"tags": "rh"} ou
+            {"uploaded_at": {"$gte": "2024-01-01"}}).
 
     Retorna:
         dict: Um dicionário contendo a pergunta, a resposta processada e as fontes utilizadas.
@@ -81,36 +596,203 @@ async def query(query: Query):
             - sources (list): Uma lista de dicionários contendo as fontes utilizadas.
 
     Lança:
-        HTTPException: Se ocorrer um erro durante o processamento da consulta.
+        HTTPException: 400 se o filtro ou o nome da coleção forem inválidos; 404 se a coleção
+            não existir; 500 se ocorrer um erro durante o processamento da consulta.
     """
-    try:
-        logger.info(f"Recebida consulta: {query.question}")
-        # Processa a consulta usando o motor RAG
-        response = rag_engine.query(query.question)
-        logger.info(f"Resposta gerada: {response}")
-        # Retorna a resposta processada
-        return {
-            "question": query.question,
-            "answer": response["answer"],
-            "sources": response["sources"]
-        }
-    except Exception as e:
-        logger.error(f"Erro ao processar consulta: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    validate_query_filter(query.filter)
+    async with use_collection(collection) as components:
+        try:
+            logger.info(f"Recebida consulta: {query.question}")
+            # Processa a consulta usando o motor RAG da coleção
+            response = await components.rag_engine.aquery(query.question, filter=query.filter)
+            logger.info(f"Resposta gerada: {response}")
+            # Retorna a resposta processada
+            return {
+                "question": query.question,
+                "answer": response["answer"],
+                "sources": response["sources"]
+            }
+        except Exception as e:
+            logger.error(f"Erro ao processar consulta: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query_batch")
+@app.post("/collections/{collection}/query_batch")
+async def query_batch(batch: QueryBatch, collection: str = Depends(collection_name)):
+    """
+    Processa várias consultas em uma única requisição.
+
+    As perguntas são embedadas em lote e buscadas no índice em uma única chamada; as
+    respostas são geradas pelo LLM em paralelo, até QUERY_BATCH_CONCURRENCY de cada vez.
+    Uma falha em uma pergunta é retornada no seu resultado, sem afetar as demais. A coleção é
+    selecionada como em /query.
 
+    Parâmetros:
+        batch (QueryBatch): Objeto contendo as perguntas a serem processadas e, opcionalmente,
+            um filtro de metadados aplicado a todas elas, como em /query.
+
+    Retorna:
+        dict: Um dicionário com a chave 'results': um resultado por pergunta, na ordem recebida,
+            com 'question' e 'answer' e 'sources' (como em /query) ou 'error'.
+
+    Lança:
+        HTTPException: 400 se a lista de perguntas estiver vazia ou exceder
+            QUERY_BATCH_MAX_QUESTIONS, ou se o filtro ou o nome da coleção forem inválidos;
+            404 se a coleção não existir; 500 se ocorrer um erro fora das perguntas individuais.
+    """
+    if not batch.questions:
+        raise HTTPException(status_code=400, detail="Nenhuma pergunta enviada")
+    if len(batch.questions) > query_batch_max_questions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {query_batch_max_questions} perguntas por requisição",
+        )
+    validate_query_filter(batch.filter)
+    async with use_collection(collection) as components:
+        try:
+            logger.info(f"Recebido lote de {len(batch.questions)} consultas")
+            return {"results": await components.rag_engine.aquery_many(batch.questions, filter=batch.filter)}
+        except Exception as e:
+            logger.error(f"Erro ao processar lote de consultas: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+def encode_event(event, ndjson):
+    """
+    Serializa um evento do streaming como Server-Sent Event ou como uma linha NDJSON.
+
+    Parâmetros:
+        event (dict): O evento, com as chaves 'event' e 'data'.
+        ndjson (bool): Se True, usa NDJSON; caso contrário, SSE.
+
+    Retorna:
+        str: O evento serializado.
+    """
+    if ndjson:
+        return json.dumps(event, ensure_ascii=False) + "\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+@app.post("/query/stream")
+@app.post("/collections/{collection}/query/stream")
+async def query_stream(query: Query, request: Request, collection: str = Depends(collection_name)):
+    """
+    Processa uma consulta em streaming: primeiro as fontes recuperadas, depois os tokens
+    da resposta à medida que o LLM os gera, e por fim a resposta completa.
+
+    O formato é Server-Sent Events (text/event-stream), ou NDJSON se o cabeçalho Accept
+    contiver application/x-ndjson. Se o cliente desconectar, a geração é cancelada. A coleção
+    é selecionada como em /query e fica em uso até o fim do streaming.
+
+    Parâmetros:
+        query (Query): Objeto contendo a pergunta a ser processada.
+        request (Request): A requisição, usada para detectar a desconexão do cliente.
+
+    Retorna:
+        StreamingResponse: Eventos 'sources', 'token' (um por trecho), 'done' e, em caso de falha, 'error'.
+    """
+    validate_query_filter(query.filter)
+    ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+    logger.info(f"Recebida consulta em streaming: {query.question}")
+    # A coleção inexistente responde 404 antes do streaming; ela só é obtida (e fica em uso)
+    # quando o corpo começa a ser enviado, de forma que uma resposta nunca iterada não a prende
+    if collection != DEFAULT_COLLECTION and not await asyncio.to_thread(collection_manager.exists, collection):
+        raise HTTPException(status_code=404, detail=f"Coleção não encontrada: {collection}")
+
+    async def events():
+        try:
+            async with use_collection(collection) as components:
+                stream = components.rag_engine.astream(query.question, filter=query.filter)
+                try:
+                    async for event in stream:
+                        if await request.is_disconnected():
+                            logger.info("Cliente desconectado; cancelando a geração da resposta")
+                            break
+                        yield encode_event(event, ndjson)
+                finally:
+                    # Fecha o stream do LLM, cancelando a geração no provedor
+                    await stream.aclose()
+        except Exception as e:
+            logger.error(f"Erro ao processar consulta em streaming: {str(e)}")
+            yield encode_event({"event": "error", "data": getattr(e, "detail", str(e))}, ndjson)
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson" if ndjson else "text/event-stream",
+        # Evita que proxies acumulem a resposta antes de repassá-la ao cliente
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/vector_db_status")
-async def vector_db_status():
+@app.get("/collections/{collection}/vector_db_status")
+async def vector_db_status(collection: str = Depends(collection_name)):
     """
-    Retorna o status atual do banco de dados vetorial.
+    Retorna o status atual do banco de dados vetorial da coleção.
     
     Parâmetros:
-        None
+        collection (str): A coleção, selecionada como em /query.
     
     Retorna:
-        dict: Um dicionário contendo o total de documentos no banco de dados vetorial e um booleano indicando se o banco de dados está vazio.
+        dict: Um dicionário contendo o total de documentos no banco de dados vetorial, um booleano indicando se o banco de dados está vazio,
+            a versão do snapshot publicado e o número de documentos removidos que aguardam a compactação.
+            Com o índice particionado, inclui também o estado de cada shard em 'shards'.
+    """
+    async with use_collection(collection) as components:
+        return await asyncio.to_thread(components.vector_db.status)
+
+@app.get("/embedding_status")
+async def embedding_status():
+    """
+    Retorna as métricas do despachante e do cache de embeddings.
+
+    Retorna:
+        dict: Requisições, repetições, vazão e profundidade da fila do despachante,
+            além dos acertos e faltas do cache de embeddings.
+    """
+    await ensure_components()
+    return {
+        "dispatcher": embedding_dispatcher.stats(),
+        "cache": embedding_cache.stats(),
+    }
+
+@app.get("/answer_cache_status")
+@app.get("/collections/{collection}/answer_cache_status")
+async def answer_cache_status(collection: str = Depends(collection_name)):
+    """
+    Retorna as métricas do cache de respostas da coleção, selecionada como em /query.
+
+    Retorna:
+        dict: Acertos exatos e semânticos, faltas, taxa de acerto, latência economizada em segundos
+            e número de respostas em cache.
+    """
+    async with use_collection(collection) as components:
+        return components.answer_cache.stats()
+
+@app.get("/rag_status")
+@app.get("/collections/{collection}/rag_status")
+async def rag_status(collection: str = Depends(collection_name)):
+    """
+    Retorna a configuração da recuperação e os tempos de cada etapa das consultas da coleção,
+    selecionada como em /query, para calibrar o número de candidatos do re-ranking.
+
+    Retorna:
+        dict: O modo de recuperação, o re-ranker, o número de candidatos recuperados e de
+            documentos enviados ao LLM, e o número de consultas e os tempos total, médio e
+            máximo, em milissegundos, da recuperação, do re-ranking e da geração.
+    """
+    async with use_collection(collection) as components:
+        return components.rag_engine.stats()
+
+@app.get("/collections")
+async def list_collections():
+    """
+    Lista as coleções e o estado da sua residência em memória.
+
+    Retorna:
+        dict: Em 'collections', os nomes das coleções (incluindo a padrão); em 'residency', as
+            coleções nomeadas carregadas, da usada há mais tempo para a mais recente, a memória
+            estimada e o orçamento, em bytes, e os contadores de carregamentos e descarregamentos.
     """
+    names = await asyncio.to_thread(collection_manager.names)
     return {
-        "total_documents": vector_db.vector_store.index.ntotal if vector_db.vector_store else 0,
-        "is_empty": vector_db.vector_store is None or vector_db.vector_store.index.ntotal == 0
-    }
\ No newline at end of file
+        "collections": [DEFAULT_COLLECTION] + [name for name in names if name != DEFAULT_COLLECTION],
+        "residency": collection_manager.stats(),
+    }
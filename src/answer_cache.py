@@ -0,0 +1,303 @@
+from collections import OrderedDict
+import copy
+import re
+import threading
+import time
+import faiss
+import numpy as np
+import logging
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+class AnswerCache:
+    """
+    Cache de respostas do RAGEngine para perguntas repetidas ou quase idênticas.
+
+    Possui dois níveis: uma correspondência exata pela pergunta normalizada e uma
+    correspondência semântica por um pequeno índice FAISS com os embeddings das perguntas
+    já respondidas, aceita quando a similaridade de cosseno atinge o limiar configurado.
+    As entradas expiram por TTL e todo o cache é invalidado quando a versão do índice de
+    documentos muda, já que as respostas dependem dos documentos recuperados.
+
+    A busca semântica embeda a pergunta exatamente como recebida, o mesmo texto embedado na
+    recuperação: com o modelo de embeddings do VectorDB (e o seu cache de embeddings), uma
+    falta gera um único embedding da pergunta, reaproveitado pela recuperação e pelo put.
+    """
+
+    def __init__(self, embeddings=None, similarity_threshold=0.95, ttl_seconds=3600, max_entries=10_000):
+        """
+        Parâmetros:
+            embeddings (Embeddings, opcional): Modelo usado para embedar as perguntas. Se omitido,
+                                     apenas a correspondência exata é utilizada.
+            similarity_threshold (float): Similaridade de cosseno mínima para a correspondência semântica.
+            ttl_seconds (float): Tempo de vida de cada entrada, em segundos.
+            max_entries (int): Número máximo de respostas mantidas; as mais antigas são removidas.
+        """
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version = None
+        self._next_id = 0
+        # id da entrada -> (pergunta normalizada, resposta, horário de criação, latência original)
+        self._entries = OrderedDict()
+        self._exact = {}
+        self._index = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def normalize(question):
+        """
+        Normaliza uma pergunta para a correspondência exata: caixa baixa, espaços colapsados
+        e sem pontuação final.
+
+        Parâmetros:
+            question (str): A pergunta.
+
+        Retorna:
+            str: A pergunta normalizada.
+        """
+        return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+    def get(self, question, version):
+        """
+        Busca a resposta de uma pergunta no cache.
+
+        Parâmetros:
+            question (str): A pergunta.
+            version: A versão atual do índice de documentos.
+
+        Retorna:
+            dict | None: Uma cópia da resposta em cache, ou None em caso de falta.
+        """
+        key = self.normalize(question)
+        response = self._get_exact(key, version)
+        if response is None and self._semantic_enabled():
+            response = self._get_semantic(self.embeddings.embed_query(question))
+        return self._record(response)
+
+    async def aget(self, question, version):
+        """
+        Versão assíncrona de get, que usa o cliente assíncrono do modelo de embeddings.
+        """
+        key = self.normalize(question)
+        response = self._get_exact(key, version)
+        if response is None and self._semantic_enabled():
+            response = self._get_semantic(await self.embeddings.aembed_query(question))
+        return self._record(response)
+
+    def get_many(self, questions, version):
+        """
+        Busca as respostas de várias perguntas, embedando em uma única chamada as que não
+        tiverem correspondência exata.
+
+        Parâmetros:
+            questions (list): As perguntas.
+            version: A versão atual do índice de documentos.
+
+        Retorna:
+            list: Para cada pergunta, uma cópia da resposta em cache ou None.
+        """
+        keys, responses, misses = self._get_exact_many(questions, version)
+        if misses:
+            vectors = self.embeddings.embed_documents([questions[i] for i in misses])
+            for i, vector in zip(misses, vectors):
+                responses[i] = self._get_semantic(vector)
+        return [self._record(response) for response in responses]
+
+    async def aget_many(self, questions, version):
+        """
+        Versão assíncrona de get_many.
+        """
+        keys, responses, misses = self._get_exact_many(questions, version)
+        if misses:
+            vectors = await self.embeddings.aembed_documents([questions[i] for i in misses])
+            for i, vector in zip(misses, vectors):
+                responses[i] = self._get_semantic(vector)
+        return [self._record(response) for response in responses]
+
+    def _get_exact_many(self, questions, version):
+        """
+        Busca as correspondências exatas de várias perguntas.
+
+        Retorna:
+            tuple: (perguntas normalizadas, respostas ou None, índices das faltas que devem
+                passar pela busca semântica).
+        """
+        keys = [self.normalize(question) for question in questions]
+        responses = [self._get_exact(key, version) for key in keys]
+        misses = [i for i, response in enumerate(responses) if response is None] if self._semantic_enabled() else []
+        return keys, responses, misses
+
+    def put(self, question, version, response, latency):
+        """
+        Armazena a resposta de uma pergunta.
+
+        Parâmetros:
+            question (str): A pergunta.
+            version: A versão do índice de documentos usada para gerar a resposta.
+            response (dict): A resposta do RAGEngine.
+            latency (float): O tempo gasto para gerar a resposta, em segundos.
+        """
+        key = self.normalize(question)
+        vector = self.embeddings.embed_query(question) if self.embeddings is not None else None
+        self._store(key, version, response, latency, vector)
+
+    async def aput(self, question, version, response, latency):
+        """
+        Versão assíncrona de put.
+        """
+        key = self.normalize(question)
+        vector = await self.embeddings.aembed_query(question) if self.embeddings is not None else None
+        self._store(key, version, response, latency, vector)
+
+    def put_many(self, items, version):
+        """
+        Armazena as respostas de várias perguntas, embedando-as em uma única chamada.
+
+        Parâmetros:
+            items (list): Tuplas (pergunta, resposta, latência).
+            version: A versão do índice de documentos usada para gerar as respostas.
+        """
+        keys = [self.normalize(question) for question, _, _ in items]
+        questions = [question for question, _, _ in items]
+        vectors = self.embeddings.embed_documents(questions) if self.embeddings is not None and keys else [None] * len(keys)
+        for key, (_, response, latency), vector in zip(keys, items, vectors):
+            self._store(key, version, response, latency, vector)
+
+    async def aput_many(self, items, version):
+        """
+        Versão assíncrona de put_many.
+        """
+        keys = [self.normalize(question) for question, _, _ in items]
+        if self.embeddings is not None and keys:
+            vectors = await self.embeddings.aembed_documents([question for question, _, _ in items])
+        else:
+            vectors = [None] * len(keys)
+        for key, (_, response, latency), vector in zip(keys, items, vectors):
+            self._store(key, version, response, latency, vector)
+
+    def clear(self):
+        """Remove todas as entradas do cache."""
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        """
+        Retorna as métricas do cache.
+
+        Retorna:
+            dict: Acertos exatos e semânticos, faltas, taxa de acerto, latência economizada
+                (soma das latências originais das respostas servidas do cache) e número de entradas.
+        """
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "latency_saved_seconds": self.latency_saved,
+                "entries": len(self._entries),
+            }
+
+    def _semantic_enabled(self):
+        return self.embeddings is not None and self._index is not None and self._index.ntotal > 0
+
+    def _clear(self):
+        self._entries.clear()
+        self._exact.clear()
+        if self._index is not None:
+            self._index.reset()
+
+    def _check_version(self, version):
+        """Invalida o cache se a versão do índice de documentos mudou. Deve ser chamado com o lock."""
+        if version != self._version:
+            if self._entries:
+                logger.info(f"Índice de documentos na versão {version}: invalidando {len(self._entries)} respostas em cache")
+            self._clear()
+            self._version = version
+
+    def _expired(self, entry):
+        return time.monotonic() - entry[2] > self.ttl_seconds
+
+    def _remove(self, entry_id):
+        """Remove uma entrada dos dois níveis. Deve ser chamado com o lock."""
+        key = self._entries.pop(entry_id)[0]
+        if self._exact.get(key) == entry_id:
+            del self._exact[key]
+        if self._index is not None:
+            self._index.remove_ids(np.array([entry_id], dtype=np.int64))
+
+    def _get_exact(self, key, version):
+        with self._lock:
+            self._check_version(version)
+            entry_id = self._exact.get(key)
+            if entry_id is None:
+                return None
+            entry = self._entries[entry_id]
+            if self._expired(entry):
+                self._remove(entry_id)
+                return None
+            self.exact_hits += 1
+            self.latency_saved += entry[3]
+            return entry[1]
+
+    def _get_semantic(self, vector):
+        query = self._normalize_vector(vector)
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0 or query.shape[1] != self._index.d:
+                return None
+            similarities, ids = self._index.search(query, min(4, self._index.ntotal))
+            for similarity, entry_id in zip(similarities[0], ids[0]):
+                if entry_id == -1 or similarity < self.similarity_threshold:
+                    break
+                entry = self._entries[int(entry_id)]
+                if self._expired(entry):
+                    self._remove(int(entry_id))
+                    continue
+                self.semantic_hits += 1
+                self.latency_saved += entry[3]
+                return entry[1]
+        return None
+
+    def _record(self, response):
+        if response is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        return copy.deepcopy(response)
+
+    def _store(self, key, version, response, latency, vector):
+        with self._lock:
+            # Respostas geradas com uma versão já substituída do índice não são armazenadas;
+            # uma versão mais nova invalida o cache e a resposta é armazenada
+            if self._version is not None and version < self._version:
+                return
+            self._check_version(version)
+            if key in self._exact:
+                self._remove(self._exact[key])
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, copy.deepcopy(response), time.monotonic(), latency)
+            self._exact[key] = entry_id
+            if vector is not None:
+                vector = self._normalize_vector(vector)
+                if self._index is None:
+                    self._index = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+                self._index.add_with_ids(vector, np.array([entry_id], dtype=np.int64))
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    @staticmethod
+    def _normalize_vector(vector):
+        # Vetores unitários fazem o produto interno equivaler à similaridade de cosseno
+        vector = np.asarray([vector], dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector
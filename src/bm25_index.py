@@ -0,0 +1,242 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+import json
+import math
+import os
+import re
+import threading
+import numpy as np
+import logging
+from src.segment_store import atomic_write
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# Tokens indexados: os que contêm ao menos uma letra ou dígito (a pontuação é ignorada)
+_INDEXABLE = re.compile(r"\w")
+
+def lexical_tokens(preprocessed_text):
+    """
+    Extrai os termos indexáveis de um texto já pré-processado pelo TextPreprocessor.
+
+    Parâmetros:
+        preprocessed_text (str): Tokens em minúsculas, sem stopwords, separados por espaço.
+
+    Retorna:
+        List[str]: Os termos, sem os sinais de pontuação isolados.
+    """
+    return [token for token in preprocessed_text.split() if _INDEXABLE.search(token)]
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Combina rankings com a Reciprocal Rank Fusion: cada item soma 1 / (k + posição) em cada
+    ranking em que aparece.
+
+    Parâmetros:
+        rankings (list): Listas de ids, cada uma em ordem decrescente de relevância.
+        k (int): Constante de suavização; valores maiores reduzem o peso das primeiras posições.
+
+    Retorna:
+        list: Os ids em ordem decrescente de pontuação combinada.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+class BM25Index:
+    """
+    Índice invertido BM25 em memória, apenas de acréscimo.
+
+    Cada documento recebe a próxima posição, a mesma do vetor correspondente no índice FAISS.
+    As listas de postings crescem apenas no fim, de forma que uma busca limitada às primeiras
+    `limit` posições (o tamanho do snapshot do FAISS que ela usa) vê exatamente os documentos
+    daquele snapshot, sem aguardar as escritas concorrentes.
+
+    A persistência é um arquivo `.jsonl` com as frequências dos termos de cada documento,
+    na ordem das posições, ao qual cada gravação apenas acrescenta os documentos novos.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        """
+        Parâmetros:
+            k1 (float): Saturação da frequência dos termos.
+            b (float): Peso da normalização pelo tamanho do documento.
+        """
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # termo -> (posições dos documentos, frequências do termo), em ordem crescente de posição
+        self._postings = {}
+        # Tamanho de cada documento e soma acumulada dos tamanhos, em buffers que crescem por cópia
+        self._lengths = np.zeros(0, dtype=np.uint32)
+        self._cumulative = np.zeros(0, dtype=np.uint64)
+        self._size = 0
+        # Frequências dos documentos ainda não gravados em disco
+        self._unsaved = []
+
+    @property
+    def size(self):
+        """O número de documentos indexados."""
+        return self._size
+
+    def add(self, token_lists):
+        """
+        Indexa documentos nas próximas posições.
+
+        Parâmetros:
+            token_lists (list): Os termos de cada documento.
+
+        Retorna:
+            int: A posição do primeiro documento adicionado.
+        """
+        return self._add_frequencies([Counter(tokens) for tokens in token_lists])
+
+    def _add_frequencies(self, counts):
+        """Indexa documentos a partir das frequências dos seus termos."""
+        with self._lock:
+            start = self._size
+            end = start + len(counts)
+            lengths = np.asarray([sum(frequencies.values()) for frequencies in counts], dtype=np.uint64)
+            if end > len(self._lengths):
+                # Novos buffers: as buscas em andamento continuam lendo os anteriores
+                capacity = max(end, 2 * len(self._lengths), 1024)
+                self._lengths = np.concatenate([self._lengths[:start], np.zeros(capacity - start, dtype=np.uint32)])
+                self._cumulative = np.concatenate([self._cumulative[:start], np.zeros(capacity - start, dtype=np.uint64)])
+            previous = self._cumulative[start - 1] if start else 0
+            self._lengths[start:end] = lengths
+            self._cumulative[start:end] = previous + np.cumsum(lengths)
+            for position, frequencies in enumerate(counts, start=start):
+                for term, frequency in frequencies.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array("I"), array("I"))
+                    postings[0].append(position)
+                    postings[1].append(frequency)
+            self._unsaved.extend(dict(frequencies) for frequencies in counts)
+            # Publica os documentos por último, depois de todos os postings
+            self._size = end
+            return start
+
+    def search(self, tokens, k=10, limit=None, exclude=None, include=None):
+        """
+        Busca os documentos mais relevantes para os termos da consulta.
+
+        Parâmetros:
+            tokens (list): Os termos da consulta.
+            k (int): O número máximo de resultados.
+            limit (int, opcional): Considera apenas as primeiras `limit` posições. O padrão é todo o índice.
+            exclude (np.ndarray, opcional): Posições ignoradas (documentos removidos). Elas continuam
+                contando nas estatísticas do BM25 até a compactação do índice.
+            include (np.ndarray, opcional): Se informado, apenas estas posições são consideradas
+                (por exemplo, as aceitas por um filtro de metadados).
+
+        Retorna:
+            tuple: (lista de (posição, pontuação) em ordem decrescente, confiança). A confiança é a
+                pontuação do primeiro resultado dividida pela soma dos IDFs dos termos da consulta:
+                1.0 equivale a um documento de tamanho médio que contém cada termo uma vez, e termos
+                ausentes do documento a reduzem.
+        """
+        n = self._size if limit is None else min(limit, self._size)
+        terms = list(dict.fromkeys(tokens))
+        if n == 0 or not terms:
+            return [], 0.0
+        lengths = self._lengths
+        average_length = max(float(self._cumulative[n - 1]) / n, 1.0)
+
+        idf_total = 0.0
+        all_positions, all_scores = [], []
+        for term in terms:
+            postings = self._postings.get(term)
+            df = bisect_left(postings[0], n) if postings is not None else 0
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            idf_total += idf
+            if df == 0:
+                continue
+            positions = np.frombuffer(postings[0][:df], dtype=np.uint32).astype(np.int64)
+            frequencies = np.frombuffer(postings[1][:df], dtype=np.uint32).astype(np.float64)
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[positions] / average_length)
+            all_positions.append(positions)
+            all_scores.append(idf * frequencies * (self.k1 + 1.0) / (frequencies + norm))
+        if not all_positions:
+            return [], 0.0
+
+        positions, inverse = np.unique(np.concatenate(all_positions), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if exclude is not None and len(exclude):
+            kept = ~np.isin(positions, exclude)
+            positions, scores = positions[kept], scores[kept]
+            if not len(positions):
+                return [], 0.0
+        if include is not None:
+            kept = np.isin(positions, include)
+            positions, scores = positions[kept], scores[kept]
+            if not len(positions):
+                return [], 0.0
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results = [(int(positions[i]), float(scores[i])) for i in top]
+        return results, results[0][1] / idf_total
+
+    def save(self, path):
+        """
+        Acrescenta ao arquivo os documentos indexados desde a última gravação.
+
+        Parâmetros:
+            path (str): O caminho do arquivo `.jsonl`.
+        """
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, []
+        if not unsaved:
+            return
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(frequencies, ensure_ascii=False) + "\n" for frequencies in unsaved))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @classmethod
+    def load(cls, path, limit=None, **kwargs):
+        """
+        Carrega um índice gravado por save.
+
+        Uma linha final incompleta (de uma gravação interrompida) é ignorada. Se o arquivo tiver
+        mais documentos que `limit`, ou uma linha inválida, ele é regravado com os documentos válidos.
+
+        Parâmetros:
+            path (str): O caminho do arquivo `.jsonl`.
+            limit (int, opcional): Número máximo de documentos carregados.
+            **kwargs: Parâmetros do BM25Index (k1, b).
+
+        Retorna:
+            BM25Index: O índice carregado, vazio se o arquivo não existir.
+        """
+        index = cls(**kwargs)
+        if not os.path.exists(path):
+            return index
+        documents = []
+        rewrite = False
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if limit is not None and len(documents) >= limit:
+                    rewrite = True
+                    break
+                try:
+                    documents.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Linha inválida no índice léxico {path}; descartando o restante do arquivo")
+                    rewrite = True
+                    break
+        index._add_frequencies(documents)
+        index._unsaved = []
+        if rewrite:
+            atomic_write(
+                path,
+                lambda f: f.write("".join(json.dumps(frequencies, ensure_ascii=False) + "\n" for frequencies in documents)),
+                mode="w",
+            )
+        return index
@@ -0,0 +1,264 @@
+from collections import OrderedDict
+import os
+import re
+import threading
+import logging
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# Coleção usada quando a requisição não seleciona nenhuma
+DEFAULT_COLLECTION = "default"
+# Nomes aceitos: letras, dígitos, "_", "-" e ".", começando por letra ou dígito, o que impede
+# que um nome aponte para fora do diretório das coleções
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+def validate_collection_name(name):
+    """
+    Valida o nome de uma coleção.
+
+    Parâmetros:
+        name (str): O nome da coleção.
+
+    Lança:
+        ValueError: Se o nome for vazio, longo demais ou tiver caracteres não permitidos.
+    """
+    if not isinstance(name, str) or not COLLECTION_NAME_PATTERN.match(name):
+        raise ValueError(
+            f"Nome de coleção inválido: {name!r}. Use até 64 letras, dígitos, '_', '-' ou '.', "
+            "começando por letra ou dígito"
+        )
+
+class Collection:
+    """
+    Os componentes de uma coleção: o banco de dados vetorial, com o índice no diretório da
+    coleção, o cache de respostas e o motor RAG que os utiliza.
+    """
+
+    def __init__(self, vector_db, answer_cache=None, rag_engine=None):
+        """
+        Parâmetros:
+            vector_db (VectorDB): O banco de dados vetorial da coleção.
+            answer_cache (AnswerCache, opcional): O cache de respostas da coleção.
+            rag_engine (RAGEngine, opcional): O motor RAG da coleção.
+        """
+        self.vector_db = vector_db
+        self.answer_cache = answer_cache
+        self.rag_engine = rag_engine
+
+    def memory_usage(self):
+        """A memória estimada da coleção, em bytes."""
+        return self.vector_db.memory_usage()
+
+    def close(self):
+        """Aguarda as gravações e compactações em segundo plano da coleção."""
+        self.vector_db.close()
+
+class _Entry:
+    """Uma coleção carregada, com o número de requisições em andamento e a memória estimada."""
+
+    __slots__ = ("collection", "pins", "memory")
+
+    def __init__(self, collection, memory):
+        self.collection = collection
+        self.pins = 1
+        self.memory = memory
+
+class CollectionManager:
+    """
+    Coleções nomeadas, cada uma com o seu índice em um subdiretório, carregadas sob demanda.
+
+    Uma coleção é carregada do disco no primeiro acquire e permanece em memória enquanto couber
+    no orçamento. Quando a memória estimada das coleções carregadas o excede, as usadas há mais
+    tempo são descarregadas (LRU), exceto as que têm requisições ou ingestões em andamento; o
+    próximo acquire de uma coleção descarregada a carrega novamente do disco. Assim, uma única
+    instância atende muitas coleções pequenas sem mantê-las todas em memória.
+
+    A memória de cada coleção é estimada pelo tamanho dos seus arquivos em disco (índice,
+    documentos e índices auxiliares), atualizado a cada release.
+    """
+
+    def __init__(self, directory, factory, memory_budget=0):
+        """
+        Parâmetros:
+            directory (str): O diretório com um subdiretório por coleção.
+            factory (callable): Função `factory(name, directory) -> Collection` que cria (e
+                carrega do disco) os componentes de uma coleção.
+            memory_budget (int): A memória máxima estimada, em bytes, das coleções carregadas.
+                0 desativa o limite.
+        """
+        self.directory = directory
+        self.factory = factory
+        self.memory_budget = memory_budget
+        # Protege o LRU e os contadores; nunca é mantido durante um carregamento
+        self._lock = threading.Lock()
+        # Nome -> _Entry, da usada há mais tempo para a mais recente
+        self._resident = OrderedDict()
+        # Um lock por coleção: serializa o carregamento e o descarregamento de cada uma
+        self._name_locks = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def path(self, name):
+        """
+        Retorna o diretório do índice de uma coleção.
+
+        Lança:
+            ValueError: Se o nome da coleção for inválido.
+        """
+        validate_collection_name(name)
+        return os.path.join(self.directory, name)
+
+    def exists(self, name):
+        """Indica se a coleção está carregada ou tem um índice em disco."""
+        with self._lock:
+            if name in self._resident:
+                return True
+        return os.path.isdir(self.path(name))
+
+    def names(self):
+        """Os nomes das coleções em disco ou carregadas, em ordem alfabética."""
+        on_disk = set()
+        if os.path.isdir(self.directory):
+            on_disk = {
+                entry.name for entry in os.scandir(self.directory)
+                if entry.is_dir() and COLLECTION_NAME_PATTERN.match(entry.name)
+            }
+        with self._lock:
+            return sorted(on_disk | set(self._resident))
+
+    def acquire(self, name, create=False):
+        """
+        Retorna os componentes de uma coleção, carregando-a do disco se preciso, e a marca como
+        em uso até o release correspondente: ela não é descarregada enquanto isso.
+
+        Bloqueante: deve ser chamado fora do event loop.
+
+        Parâmetros:
+            name (str): O nome da coleção.
+            create (bool): Se True, cria a coleção caso ela não exista.
+
+        Retorna:
+            Collection: Os componentes da coleção, ou None se ela não existir e create for False.
+
+        Lança:
+            ValueError: Se o nome da coleção for inválido.
+        """
+        directory = self.path(name)
+        if (collection := self._pin(name)) is not None:
+            return collection
+        with self._name_lock(name):
+            # Outra thread pode ter carregado a coleção enquanto esta aguardava o lock
+            if (collection := self._pin(name)) is not None:
+                return collection
+            if not create and not os.path.isdir(directory):
+                return None
+            logger.info(f"Carregando a coleção {name}")
+            collection = self.factory(name, directory)
+            memory = collection.memory_usage()
+            with self._lock:
+                self._resident[name] = _Entry(collection, memory)
+                self.loads += 1
+        self._enforce_budget()
+        return collection
+
+    def release(self, name):
+        """
+        Encerra um uso de uma coleção iniciado por acquire, atualizando a sua memória estimada
+        e descarregando coleções se o orçamento for excedido.
+
+        Parâmetros:
+            name (str): O nome da coleção.
+        """
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is None:
+                return
+            entry.pins -= 1
+            collection = entry.collection
+        memory = collection.memory_usage()
+        with self._lock:
+            entry.memory = memory
+        self._enforce_budget()
+
+    def memory_usage(self):
+        """A memória estimada das coleções carregadas, em bytes."""
+        with self._lock:
+            return sum(entry.memory for entry in self._resident.values())
+
+    def stats(self):
+        """
+        Retorna o estado das coleções.
+
+        Retorna:
+            dict: As coleções carregadas, da usada há mais tempo para a mais recente, com a
+                memória estimada e o número de usos em andamento, o orçamento e a memória total,
+                em bytes, e os contadores de carregamentos e descarregamentos.
+        """
+        with self._lock:
+            return {
+                "resident": [
+                    {"name": name, "memory_bytes": entry.memory, "in_use": entry.pins}
+                    for name, entry in self._resident.items()
+                ],
+                "memory_bytes": sum(entry.memory for entry in self._resident.values()),
+                "memory_budget_bytes": self.memory_budget,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def close(self):
+        """Descarrega todas as coleções, aguardando as suas tarefas em segundo plano."""
+        with self._lock:
+            entries = list(self._resident.values())
+            self._resident.clear()
+        for entry in entries:
+            entry.collection.close()
+
+    def _name_lock(self, name):
+        with self._lock:
+            return self._name_locks.setdefault(name, threading.Lock())
+
+    def _pin(self, name):
+        """Marca uma coleção carregada como em uso e a move para o fim do LRU."""
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is None:
+                return None
+            entry.pins += 1
+            self._resident.move_to_end(name)
+            return entry.collection
+
+    def _enforce_budget(self):
+        """Descarrega as coleções sem uso em andamento, da usada há mais tempo, até caber no orçamento."""
+        if not self.memory_budget:
+            return
+        while True:
+            with self._lock:
+                total = sum(entry.memory for entry in self._resident.values())
+                if total <= self.memory_budget:
+                    return
+                victim = None
+                for name, entry in self._resident.items():
+                    if entry.pins:
+                        continue
+                    # O lock da coleção é obtido sem bloquear, já que o carregador o obtém antes deste
+                    name_lock = self._name_locks.setdefault(name, threading.Lock())
+                    if name_lock.acquire(blocking=False):
+                        victim = name, entry, name_lock
+                        break
+                if victim is None:
+                    # Todas as coleções estão em uso: o orçamento é excedido temporariamente
+                    logger.warning(f"Coleções em uso excedem o orçamento de memória ({total} > {self.memory_budget} bytes)")
+                    return
+                name, entry, name_lock = victim
+                del self._resident[name]
+                self.evictions += 1
+            try:
+                logger.info(f"Descarregando a coleção {name} ({entry.memory} bytes)")
+                # Com o lock da coleção, um novo carregamento aguarda as gravações desta instância
+                entry.collection.close()
+            except Exception as e:
+                logger.error(f"Erro ao descarregar a coleção {name}: {str(e)}")
+            finally:
+                name_lock.release()
@@ -0,0 +1,413 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+import logging
+from src.bm25_index import lexical_tokens
+from src.segment_store import atomic_write
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# Palavras por shingle na assinatura MinHash
+SHINGLE_SIZE = 3
+# Número de permutações da assinatura MinHash e sua divisão em bandas para o LSH
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 8
+
+_MASK_32 = np.uint64(0xFFFFFFFF)
+
+def content_hash(text):
+    """
+    Calcula o hash de conteúdo de um segmento já pré-processado.
+
+    Parâmetros:
+        text (str): O texto pré-processado.
+
+    Retorna:
+        str: O hash hexadecimal.
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def dedup_scope(metadata):
+    """
+    Calcula o escopo da deduplicação de um segmento: o documento e o tenant de origem.
+
+    Segmentos só são duplicatas de outros do mesmo escopo. Assim, um trecho comum a dois
+    documentos é indexado em cada um, com os seus metadados, e remover um deles não o
+    remove do outro.
+
+    Parâmetros:
+        metadata (dict): Os metadados do segmento.
+
+    Retorna:
+        str: O escopo.
+    """
+    return json.dumps([metadata.get("source"), metadata.get("tenant")], ensure_ascii=False)
+
+def scoped_hash(text, scope=""):
+    """
+    Calcula o hash de conteúdo de um segmento dentro de um escopo (veja dedup_scope).
+
+    Parâmetros:
+        text (str): O texto pré-processado.
+        scope (str): O escopo; vazio para comparar com todos os segmentos.
+
+    Retorna:
+        str: O hash hexadecimal.
+    """
+    return content_hash(f"{scope}\x00{text}" if scope else text)
+
+def file_hash(path):
+    """
+    Calcula o hash SHA-256 de um arquivo, lendo-o em blocos.
+
+    Parâmetros:
+        path (str): O caminho do arquivo.
+
+    Retorna:
+        str: O hash hexadecimal.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Reservation:
+    """
+    Segmentos aceitos por Deduplicator.reserve, ainda não indexados.
+
+    Atributos:
+        keep (list): Índices, nos textos recebidos, dos segmentos a serem indexados.
+        hashes (list): Hash de conteúdo de cada segmento aceito.
+        signatures (list): Assinatura MinHash de cada segmento aceito, ou None se ele for curto demais.
+        scopes (list): Escopo de cada segmento aceito.
+        duplicates (int): Segmentos descartados por conteúdo idêntico.
+        near_duplicates (int): Segmentos descartados por serem quase idênticos a outro.
+    """
+
+    def __init__(self):
+        self.keep = []
+        self.hashes = []
+        self.signatures = []
+        self.scopes = []
+        self.duplicates = 0
+        self.near_duplicates = 0
+
+class Deduplicator:
+    """
+    Detecta segmentos duplicados antes que sejam embedados e indexados.
+
+    Conteúdo idêntico é detectado pelo hash do texto pré-processado, e conteúdo quase idêntico
+    (por exemplo, o mesmo aviso legal com uma data diferente) por assinaturas MinHash dos
+    shingles de palavras, comparadas por LSH (locality-sensitive hashing) em bandas. As
+    comparações são restritas ao escopo de cada segmento (veja dedup_scope).
+
+    Assim como o BM25Index, cada segmento indexado ocupa a mesma posição que no índice FAISS,
+    e a persistência é um `.jsonl` ao qual cada gravação acrescenta apenas os segmentos novos.
+    """
+
+    def __init__(self, near_duplicate_threshold=0.9, min_tokens=8, num_permutations=NUM_PERMUTATIONS,
+                 bands=LSH_BANDS, seed=1):
+        """
+        Parâmetros:
+            near_duplicate_threshold (float): Similaridade de Jaccard estimada a partir da qual um
+                                     segmento é considerado quase idêntico. Use 1.0 ou mais para
+                                     desativar a detecção de quase duplicatas.
+            min_tokens (int): Número mínimo de termos para que um segmento passe pela detecção de
+                                     quase duplicatas; segmentos curtos só são comparados por hash.
+            num_permutations (int): Tamanho da assinatura MinHash.
+            bands (int): Número de bandas do LSH; deve dividir num_permutations.
+            seed (int): Semente das funções de hash da assinatura.
+        """
+        if num_permutations % bands:
+            raise ValueError("O número de bandas deve dividir o número de permutações")
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.min_tokens = min_tokens
+        self.num_permutations = num_permutations
+        self.bands = bands
+        rng = np.random.default_rng(seed)
+        # Hashing multiplicativo: (a * x + b) mod 2^64, com os 32 bits mais altos como resultado
+        self._a = rng.integers(1, 2 ** 63, num_permutations, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_permutations, dtype=np.uint64)
+        self._lock = threading.Lock()
+        # Hash de conteúdo de cada posição, inclusive das removidas
+        self._digests = []
+        # hash de conteúdo -> posições ativas com esse conteúdo
+        self._hashes = {}
+        # Hashes aceitos por reservas ainda não indexadas
+        self._reserved = set()
+        # (banda, escopo, valores da banda) -> posições ativas com essa banda
+        self._buckets = {}
+        # posição ativa -> assinatura MinHash
+        self._signatures = {}
+        # posição -> escopo, das posições com assinatura
+        self._scopes = {}
+        self._unsaved = []
+
+    @property
+    def size(self):
+        """O número de segmentos indexados, inclusive os removidos."""
+        return len(self._digests)
+
+    def signature(self, text):
+        """
+        Calcula a assinatura MinHash de um texto pré-processado.
+
+        Parâmetros:
+            text (str): O texto pré-processado.
+
+        Retorna:
+            np.ndarray | None: A assinatura (uint32), ou None se o texto tiver menos de min_tokens termos.
+        """
+        tokens = lexical_tokens(text)
+        if len(tokens) < self.min_tokens:
+            return None
+        shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+        values = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+             for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        with np.errstate(over="ignore"):
+            hashed = (values[:, None] * self._a[None, :] + self._b[None, :]) >> np.uint64(32)
+        return (hashed & _MASK_32).min(axis=0).astype(np.uint32)
+
+    def reserve(self, texts, ignore=frozenset(), scopes=None):
+        """
+        Seleciona os segmentos que não são duplicatas do que já foi indexado, reservado por
+        outra ingestão em andamento ou aceito antes no mesmo lote.
+
+        Os hashes aceitos ficam reservados até release, para que ingestões concorrentes do mesmo
+        conteúdo não o indexem duas vezes.
+
+        Parâmetros:
+            texts (list): Os textos pré-processados.
+            ignore (set): Posições desconsideradas na comparação, como as da versão anterior de
+                um documento que está sendo substituído.
+            scopes (list, opcional): O escopo de cada texto (veja dedup_scope). Sem escopos, os
+                textos são comparados com todos os segmentos sem escopo.
+
+        Retorna:
+            Reservation: Os segmentos aceitos e as contagens de duplicatas.
+        """
+        scopes = scopes if scopes is not None else [""] * len(texts)
+        reservation = Reservation()
+        near_enabled = self.near_duplicate_threshold < 1.0
+        # Bandas dos segmentos aceitos neste lote, para detectar quase duplicatas entre eles
+        batch_buckets = {}
+        with self._lock:
+            for i, (text, scope) in enumerate(zip(texts, scopes)):
+                digest = scoped_hash(text, scope)
+                positions = self._hashes.get(digest, ())
+                if digest in self._reserved or any(position not in ignore for position in positions):
+                    reservation.duplicates += 1
+                    continue
+                signature = self.signature(text) if near_enabled else None
+                if signature is not None and self._is_near_duplicate(signature, scope, reservation, batch_buckets, ignore):
+                    reservation.near_duplicates += 1
+                    continue
+                self._reserved.add(digest)
+                reservation.keep.append(i)
+                reservation.hashes.append(digest)
+                reservation.signatures.append(signature)
+                reservation.scopes.append(scope)
+                if signature is not None:
+                    for key in self._band_keys(signature, scope):
+                        batch_buckets.setdefault(key, []).append(len(reservation.signatures) - 1)
+        return reservation
+
+    def release(self, reservation):
+        """
+        Libera os hashes de uma reserva, indexada ou abandonada (por exemplo, após um erro).
+
+        Parâmetros:
+            reservation (Reservation): A reserva retornada por reserve.
+        """
+        with self._lock:
+            self._reserved.difference_update(reservation.hashes)
+
+    def add(self, hashes, signatures, scopes=None):
+        """
+        Registra segmentos indexados, nas próximas posições.
+
+        Parâmetros:
+            hashes (list): O hash de conteúdo de cada segmento, no seu escopo (veja scoped_hash).
+            signatures (list): A assinatura MinHash de cada segmento, ou None.
+            scopes (list, opcional): O escopo de cada segmento. O padrão é sem escopo.
+        """
+        with self._lock:
+            self._add(hashes, signatures, scopes if scopes is not None else [""] * len(hashes))
+
+    def _add(self, hashes, signatures, scopes):
+        for digest, signature, scope in zip(hashes, signatures, scopes):
+            position = len(self._digests)
+            self._digests.append(digest)
+            self._hashes.setdefault(digest, []).append(position)
+            if signature is not None:
+                self._signatures[position] = signature
+                self._scopes[position] = scope
+                for key in self._band_keys(signature, scope):
+                    self._buckets.setdefault(key, []).append(position)
+            self._unsaved.append({
+                "hash": digest,
+                "minhash": signature.tobytes().hex() if signature is not None else None,
+                "scope": scope,
+            })
+
+    def add_texts(self, texts, scopes=None):
+        """
+        Registra segmentos indexados a partir dos seus textos pré-processados.
+
+        Parâmetros:
+            texts (list): Os textos pré-processados, na ordem do índice.
+            scopes (list, opcional): O escopo de cada texto. O padrão é sem escopo.
+        """
+        near_enabled = self.near_duplicate_threshold < 1.0
+        scopes = scopes if scopes is not None else [""] * len(texts)
+        self.add(
+            [scoped_hash(text, scope) for text, scope in zip(texts, scopes)],
+            [self.signature(text) if near_enabled else None for text in texts],
+            scopes,
+        )
+
+    def remove(self, positions):
+        """
+        Remove segmentos da comparação, mantendo as suas posições, para que o mesmo conteúdo
+        possa ser indexado de novo.
+
+        Parâmetros:
+            positions (Iterable[int]): As posições removidas.
+        """
+        with self._lock:
+            for position in positions:
+                live = self._hashes.get(self._digests[position])
+                if live and position in live:
+                    live.remove(position)
+                    if not live:
+                        del self._hashes[self._digests[position]]
+                signature = self._signatures.pop(position, None)
+                if signature is not None:
+                    for key in self._band_keys(signature, self._scopes.pop(position)):
+                        bucket = self._buckets[key]
+                        bucket.remove(position)
+                        if not bucket:
+                            del self._buckets[key]
+
+    def compact(self, keep):
+        """
+        Renumera os segmentos após a compactação do índice: as posições em `keep` passam a
+        ocupar as posições 0, 1, 2... e as demais são descartadas.
+
+        Todos os registros ficam pendentes de gravação, para que o arquivo seja regravado
+        do início. As reservas em andamento são mantidas.
+
+        Parâmetros:
+            keep (list): As posições mantidas, na nova ordem.
+        """
+        with self._lock:
+            records = [
+                (self._digests[position], self._signatures.get(position), self._scopes.get(position, ""))
+                for position in keep
+            ]
+            self._digests = []
+            self._hashes = {}
+            self._buckets = {}
+            self._signatures = {}
+            self._scopes = {}
+            self._unsaved = []
+            self._add(
+                [digest for digest, _, _ in records],
+                [signature for _, signature, _ in records],
+                [scope for _, _, scope in records],
+            )
+
+    def _band_keys(self, signature, scope):
+        rows = self.num_permutations // self.bands
+        return [(band, scope, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def _similarity(self, first, second):
+        """Estimativa da similaridade de Jaccard: a fração de posições iguais das assinaturas."""
+        return float(np.count_nonzero(first == second)) / self.num_permutations
+
+    def _is_near_duplicate(self, signature, scope, reservation, batch_buckets, ignore):
+        for key in self._band_keys(signature, scope):
+            for position in self._buckets.get(key, ()):
+                if position in ignore:
+                    continue
+                if self._similarity(signature, self._signatures[position]) >= self.near_duplicate_threshold:
+                    return True
+            for index in batch_buckets.get(key, ()):
+                if self._similarity(signature, reservation.signatures[index]) >= self.near_duplicate_threshold:
+                    return True
+        return False
+
+    def save(self, path):
+        """
+        Acrescenta ao arquivo os segmentos registrados desde a última gravação.
+
+        Parâmetros:
+            path (str): O caminho do arquivo `.jsonl`.
+        """
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, []
+        if not unsaved:
+            return
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in unsaved))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @classmethod
+    def load(cls, path, limit=None, **kwargs):
+        """
+        Carrega os registros gravados por save.
+
+        Uma linha final incompleta é ignorada. Se o arquivo tiver mais registros que `limit`,
+        ou uma linha inválida, ele é regravado com os registros válidos. Um arquivo anterior
+        aos escopos (sem o campo "scope"), com hashes globais, é descartado, para que o
+        VectorDB refaça o registro a partir do docstore.
+
+        Parâmetros:
+            path (str): O caminho do arquivo `.jsonl`.
+            limit (int, opcional): Número máximo de registros carregados.
+            **kwargs: Parâmetros do Deduplicator.
+
+        Retorna:
+            Deduplicator: O deduplicador carregado, vazio se o arquivo não existir.
+        """
+        deduplicator = cls(**kwargs)
+        if not os.path.exists(path):
+            return deduplicator
+        records = []
+        rewrite = False
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if limit is not None and len(records) >= limit:
+                    rewrite = True
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Linha inválida no registro de deduplicação {path}; descartando o restante do arquivo")
+                    rewrite = True
+                    break
+                if "scope" not in record:
+                    logger.warning(f"Registro de deduplicação {path} sem escopos; descartando-o para reconstrução")
+                    records = []
+                    rewrite = True
+                    break
+                records.append(record)
+        deduplicator.add(
+            [record["hash"] for record in records],
+            [np.frombuffer(bytes.fromhex(record["minhash"]), dtype=np.uint32) if record["minhash"] else None
+             for record in records],
+            [record["scope"] for record in records],
+        )
+        deduplicator._unsaved = []
+        if rewrite:
+            atomic_write(path, lambda f: f.write("".join(json.dumps(record) + "\n" for record in records)), mode="w")
+        return deduplicator
@@ -1,37 +1,79 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List, Dict
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
 import logging
-from pypdf import PdfReader
-from docx import Document as DocxDocument
-from openpyxl import load_workbook
-from bs4 import BeautifulSoup
-import pandas as pd
+import codecs
+import datetime
 import io
-import chardet
+
+# As bibliotecas de extração (pypdf, python-docx, openpyxl, xlrd, BeautifulSoup, pandas, chardet)
+# e o splitter do LangChain são importados no primeiro uso de cada formato, para que importar
+# este módulo não atrase a inicialização dos workers.
 
 logger = logging.getLogger(__name__)
 
+# Tamanho do buffer de segmentação incremental, em número de segmentos
+SPLIT_WINDOW_CHUNKS = 8
+# Linhas de CSV lidas por vez
+CSV_CHUNK_ROWS = 10_000
+# Bytes usados para detectar a codificação e tamanho dos blocos lidos de arquivos de texto
+ENCODING_SAMPLE_BYTES = 64 * 1024
+READ_BLOCK_BYTES = 1024 * 1024
+
+# Formatos tabulares, segmentados em grupos de linhas no modo tabular
+TABULAR_EXTENSIONS = {'xlsx', 'xls', 'csv'}
+# Separador entre as células de uma linha nos segmentos tabulares
+CELL_SEPARATOR = " | "
+
+# Extensões de arquivo aceitas pelo processador
+SUPPORTED_EXTENSIONS = {'pdf', 'doc', 'docx', 'xlsx', 'xls', 'htm', 'html', 'csv', 'txt', 'json', 'md'}
+
 class DocumentProcessingError(Exception):
     """Exceção customizada para erro de processamento de documento."""
     pass
 
 class DocumentProcessor:
     # Inicializa o splitter de texto para segmentar documento longo
-    def __init__(self, chunk_size=1000, chunk_overlap=200):
+    def __init__(self, chunk_size=1000, chunk_overlap=200, tabular_mode=True):
         """
         Inicializa o RecursiveCharacterTextSplitter com o tamanho de chunk e sobreposição de chunk fornecidos.
 
         Parâmetros:
             chunk_size (int): O tamanho máximo de cada bloco. Padrão é 1000.
             chunk_overlap (int): O número de caracteres para sobrepor entre blocos. Padrão é 200.
+            tabular_mode (bool): Se True, planilhas e CSVs são segmentados em grupos de linhas que
+                repetem o cabeçalho e registram a aba e o intervalo de linhas nos metadados. Se False,
+                o seu texto é segmentado como o dos demais formatos.
 
         Retorna:
             None
         """
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap
-        )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.tabular_mode = tabular_mode
+        self._text_splitter = None
+
+    @property
+    def text_splitter(self):
+        """O RecursiveCharacterTextSplitter, criado no primeiro uso."""
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap
+            )
+        return self._text_splitter
+
+    @staticmethod
+    def is_supported(filename: str) -> bool:
+        """
+        Verifica se o formato do arquivo é suportado, a partir da sua extensão.
+
+        Parâmetros:
+            filename (str): O nome do arquivo.
+
+        Retorna:
+            bool: True se a extensão estiver em SUPPORTED_EXTENSIONS.
+        """
+        return filename.split('.')[-1].lower() in SUPPORTED_EXTENSIONS
 
     def process_file(self, file_content: bytes, filename: str) -> List[Dict]:
         """
@@ -44,126 +86,363 @@ class DocumentProcessor:
         Retorna:
             List[Dict]: Uma lista de dicionários, onde cada dicionário contém o conteúdo de um segmento do arquivo e metadados sobre o arquivo original.
         """
+        return list(self.iter_segments(io.BytesIO(file_content), filename))
+
+    def process_path(self, path: str, filename: str) -> Iterator[Dict]:
+        """
+        Processa um arquivo em disco de forma incremental, sem carregá-lo inteiro na memória.
+
+        Parâmetros:
+            path (str): O caminho do arquivo em disco.
+            filename (str): O nome original do arquivo, utilizado para determinar o tipo e nos metadados.
+
+        Retorna:
+            Iterator[Dict]: Os segmentos do arquivo, gerados à medida que o arquivo é lido.
+        """
+        with open(path, "rb") as source:
+            yield from self.iter_segments(source, filename)
+
+    def iter_segments(self, source: BinaryIO, filename: str, pages: Optional[Tuple[int, int]] = None) -> Iterator[Dict]:
+        """
+        Extrai e segmenta o conteúdo de um arquivo de forma incremental.
+
+        O texto é extraído página a página (PDF), linha a linha (planilhas e CSV) ou em blocos
+        (texto), e segmentado à medida que chega. A memória usada depende do tamanho de cada
+        página ou bloco, e não do tamanho do arquivo.
+
+        Os metadados de cada segmento registram o arquivo ('source') e o seu formato
+        ('file_type'); nos PDFs, cada página é segmentada separadamente e o segmento registra
+        a página ('page', a partir de 1), e nos formatos tabulares, a aba e as linhas.
+
+        Parâmetros:
+            source (BinaryIO): O conteúdo do arquivo, como um arquivo binário com suporte a seek.
+            filename (str): O nome do arquivo, utilizado para determinar o tipo de arquivo e armazenar metadados.
+            pages (Tuple[int, int], opcional): Intervalo [início, fim) de páginas a extrair de um PDF.
+                Ignorado nos demais formatos.
+
+        Retorna:
+            Iterator[Dict]: Dicionários com o conteúdo de cada segmento e metadados sobre o arquivo original.
+
+        Lança:
+            DocumentProcessingError: Se o formato não for suportado ou a extração falhar.
+        """
         try:
             # Determina o tipo de arquivo e extrai o texto apropriadamente
             file_extension = filename.split('.')[-1].lower()
+            if self.tabular_mode and file_extension in TABULAR_EXTENSIONS:
+                yield from self._iter_table_segments(self._iter_rows(source, file_extension), filename)
+                return
+            metadata = {"source": filename, "file_type": file_extension}
             if file_extension == 'pdf':
-                text = self._extract_text_from_pdf(file_content)
-            elif file_extension in ['doc','docx']:
-                text = self._extract_text_from_docx(file_content)
+                # Páginas segmentadas separadamente, para que cada segmento pertença a uma página
+                first_page = pages[0] if pages else 0
+                for number, text in enumerate(self._extract_text_from_pdf(source, pages), start=first_page + 1):
+                    for seg in self.text_splitter.split_text(text):
+                        yield {"content": seg, "metadata": {**metadata, "page": number}}
+                return
+            # Separador entre trechos consecutivos: páginas e linhas são unidas por espaço,
+            # blocos de um arquivo de texto são contíguos
+            separator = " "
+            if file_extension in ['doc','docx']:
+                pieces = self._extract_text_from_docx(source)
             elif file_extension in ['xlsx', 'xls']:
-                text = self._extract_text_from_excel(file_content)
+                pieces = self._extract_text_from_excel(source, file_extension)
             elif file_extension in ['htm', 'html']:
-                text = self._extract_text_from_html(file_content)
+                pieces = self._extract_text_from_html(source)
             elif file_extension == 'csv':
-                text = self._extract_text_from_csv(file_content)
+                pieces = self._extract_text_from_csv(source)
             elif file_extension in ['txt', 'json', 'md']:
-                text = self._extract_text_from_generic(file_content)
+                pieces = self._extract_text_from_generic(source)
+                separator = ""
             else:
                 raise DocumentProcessingError(f"Formato de arquivo não suportado: {file_extension}")
 
-            # Divide o texto em segmentos menores
-            segments = self.text_splitter.split_text(text)
-            # Retorna o conteúdo de cada segmento e metadados sobre o arquivo original
-            return [{"content": seg, "metadata": {"source": filename}} for seg in segments]
+            # Divide o texto em segmentos menores à medida que é extraído
+            for seg in self._split_incrementally(pieces, separator):
+                # Gera o conteúdo de cada segmento e metadados sobre o arquivo original
+                yield {"content": seg, "metadata": dict(metadata)}
         except Exception as e:
             logger.error(f"Erro ao processar arquivo {filename}: {str(e)}")
             raise DocumentProcessingError(f"Falha ao processar arquivo {filename}: {str(e)}")
 
-    def _extract_text_from_pdf(self, file_content: bytes) -> str:
+    def _split_incrementally(self, pieces: Iterable[str], separator: str = " ") -> Iterator[str]:
         """
-        Extrai texto de um arquivo PDF.
+        Segmenta um fluxo de trechos de texto sem concatenar o documento inteiro.
+
+        Os trechos são acumulados em um buffer; quando ele ultrapassa alguns segmentos, todos
+        os segmentos exceto o último são emitidos, e o último continua no buffer para preservar
+        a sobreposição com o texto seguinte.
 
         Parâmetros:
-            file_content (bytes): O conteúdo do arquivo PDF a ser processado.
+            pieces (Iterable[str]): Os trechos de texto, na ordem do documento.
+            separator (str): O texto inserido entre trechos consecutivos.
 
         Retorna:
-            str: O texto extraído do arquivo PDF.
+            Iterator[str]: Os segmentos de texto.
         """
-        pdf = PdfReader(io.BytesIO(file_content))
-        return " ".join(page.extract_text() for page in pdf.pages)
+        window = self.chunk_size * SPLIT_WINDOW_CHUNKS
+        buffer = ""
+        for piece in pieces:
+            buffer = f"{buffer}{separator}{piece}" if buffer else piece
+            if len(buffer) >= window:
+                segments = self.text_splitter.split_text(buffer)
+                yield from segments[:-1]
+                buffer = segments[-1] if segments else ""
+        if buffer:
+            yield from self.text_splitter.split_text(buffer)
 
-    def _extract_text_from_docx(self, file_content: bytes) -> str:
+    def _extract_text_from_pdf(self, source: BinaryIO, pages: Optional[Tuple[int, int]] = None) -> Iterator[str]:
         """
-        Extrai texto de um arquivo Word.
+        Extrai texto de um arquivo PDF, página a página.
 
         Parâmetros:
-            file_content (bytes): O conteúdo do arquivo Word a ser processado.
+            source (BinaryIO): O arquivo PDF a ser processado.
+            pages (Tuple[int, int], opcional): Intervalo [início, fim) de páginas. O padrão é o documento inteiro.
 
         Retorna:
-            str: O texto extraído do arquivo Word.
+            Iterator[str]: O texto de cada página.
         """
-        doc = DocxDocument(io.BytesIO(file_content))
-        return " ".join(paragraph.text for paragraph in doc.paragraphs)
+        from pypdf import PdfReader
+        pdf = PdfReader(source)
+        start, end = pages or (0, len(pdf.pages))
+        for number in range(start, min(end, len(pdf.pages))):
+            yield pdf.pages[number].extract_text()
 
-    def _extract_text_from_excel(self, file_content: bytes) -> str:
+    @staticmethod
+    def count_pages(source: BinaryIO) -> int:
         """
-        Extrai texto de um arquivo Excel.
+        Conta as páginas de um arquivo PDF, sem extrair o seu texto.
 
         Parâmetros:
-            file_content (bytes): O conteúdo do arquivo Excel a ser processado.
+            source (BinaryIO): O arquivo PDF.
 
         Retorna:
-            str: O texto extraído do arquivo Excel.
+            int: O número de páginas.
         """
-        workbook = load_workbook(filename=io.BytesIO(file_content))
-        text = []
-        for sheet in workbook.sheetnames:
-            for row in workbook[sheet].iter_rows(values_only=True):
-                text.append(" ".join(str(cell) for cell in row if cell))
-        return " ".join(text)
+        from pypdf import PdfReader
+        return len(PdfReader(source).pages)
 
-    def _extract_text_from_html(self, file_content: bytes) -> str:
+    def _extract_text_from_docx(self, source: BinaryIO) -> Iterator[str]:
+        """
+        Extrai texto de um arquivo Word, parágrafo a parágrafo.
+
+        Parâmetros:
+            source (BinaryIO): O arquivo Word a ser processado.
+
+        Retorna:
+            Iterator[str]: O texto de cada parágrafo.
+        """
+        from docx import Document as DocxDocument
+        doc = DocxDocument(source)
+        for paragraph in doc.paragraphs:
+            yield paragraph.text
+
+    def _extract_text_from_excel(self, source: BinaryIO, file_extension: str = 'xlsx') -> Iterator[str]:
+        """
+        Extrai texto de um arquivo Excel, linha a linha.
+
+        Parâmetros:
+            source (BinaryIO): O arquivo Excel a ser processado.
+            file_extension (str): 'xlsx' ou 'xls'.
+
+        Retorna:
+            Iterator[str]: O texto de cada linha.
+        """
+        for _, _, row in self._iter_rows(source, file_extension):
+            yield " ".join(str(cell) for cell in row if cell)
+
+    def _iter_rows(self, source: BinaryIO, file_extension: str) -> Iterator[Tuple[Optional[str], int, tuple]]:
+        """
+        Lê as linhas de uma planilha ou CSV uma a uma, sem carregar o arquivo inteiro.
+
+        Parâmetros:
+            source (BinaryIO): O arquivo a ser lido.
+            file_extension (str): 'xlsx', 'xls' ou 'csv'.
+
+        Retorna:
+            Iterator[Tuple[Optional[str], int, tuple]]: A aba (None em CSVs), o número da linha
+                no arquivo (a partir de 1) e os valores das células.
+        """
+        if file_extension == 'xlsx':
+            from openpyxl import load_workbook
+            # O modo somente leitura lê as linhas sob demanda, sem montar o modelo da planilha
+            workbook = load_workbook(filename=source, read_only=True, data_only=True)
+            try:
+                for sheet in workbook.sheetnames:
+                    for number, row in enumerate(workbook[sheet].iter_rows(values_only=True), start=1):
+                        yield sheet, number, row
+            finally:
+                workbook.close()
+        elif file_extension == 'xls':
+            import xlrd
+            # O formato binário antigo é lido pelo xlrd, carregando uma aba por vez
+            workbook = xlrd.open_workbook(file_contents=source.read(), on_demand=True)
+            try:
+                for sheet in workbook.sheet_names():
+                    worksheet = workbook.sheet_by_name(sheet)
+                    for number in range(worksheet.nrows):
+                        yield sheet, number + 1, tuple(
+                            self._xls_cell_value(cell, workbook.datemode) for cell in worksheet.row(number)
+                        )
+                    workbook.unload_sheet(sheet)
+            finally:
+                workbook.release_resources()
+        else:
+            import pandas as pd
+            number = 0
+            reader = pd.read_csv(source, chunksize=CSV_CHUNK_ROWS, header=None, dtype=str,
+                                 keep_default_na=False, skip_blank_lines=False)
+            for chunk in reader:
+                for row in chunk.itertuples(index=False, name=None):
+                    number += 1
+                    yield None, number, row
+
+    @staticmethod
+    def _xls_cell_value(cell, datemode):
+        """Converte uma célula do xlrd no valor Python correspondente."""
+        import xlrd
+        if cell.ctype == xlrd.XL_CELL_DATE:
+            return xlrd.xldate.xldate_as_datetime(cell.value, datemode)
+        if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+            return None
+        return cell.value
+
+    @staticmethod
+    def _format_cell(value) -> str:
+        """Formata o valor de uma célula sem preenchimento: inteiros sem casas decimais e datas em ISO."""
+        if value is None:
+            return ""
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        return str(value).strip()
+
+    def _iter_table_segments(self, rows: Iterable[Tuple[Optional[str], int, tuple]], filename: str) -> Iterator[Dict]:
+        """
+        Agrupa as linhas de uma tabela em segmentos que repetem o cabeçalho.
+
+        A primeira linha não vazia de cada aba é tratada como cabeçalho. As linhas seguintes são
+        acumuladas até o tamanho do segmento, e cada segmento registra a aba e o intervalo de
+        linhas nos metadados. Uma linha maior que o segmento é dividida pelo text splitter.
+
+        Parâmetros:
+            rows (Iterable): Tuplas (aba, número da linha, valores), como geradas por _iter_rows.
+            filename (str): O nome do arquivo, armazenado nos metadados.
+
+        Retorna:
+            Iterator[Dict]: Os segmentos, com as chaves 'content' e 'metadata'.
+        """
+        file_type = filename.split('.')[-1].lower()
+
+        def segment(content, sheet, first, last):
+            metadata = {"source": filename, "file_type": file_type, "row_start": first, "row_end": last}
+            if sheet is not None:
+                metadata["sheet"] = sheet
+            return {"content": content, "metadata": metadata}
+
+        current_sheet = object()
+        header = None
+        lines, size, first = [], 0, None
+        for sheet, number, values in rows:
+            cells = [self._format_cell(value) for value in values]
+            if not any(cells):
+                continue
+            line = CELL_SEPARATOR.join(cells)
+            if sheet != current_sheet:
+                # Nova aba: emite o grupo pendente e usa a primeira linha como cabeçalho
+                if lines:
+                    yield segment("\n".join([header] + lines), current_sheet, first, last)
+                current_sheet, header = sheet, line
+                lines, size, first = [], len(line), None
+                continue
+            if lines and size + len(line) + 1 > self.chunk_size:
+                yield segment("\n".join([header] + lines), sheet, first, last)
+                lines, size, first = [], len(header), None
+            if len(header) + len(line) + 1 > self.chunk_size:
+                # Linha maior que o segmento: dividida, com o cabeçalho em cada parte
+                for piece in self.text_splitter.split_text(line):
+                    yield segment(f"{header}\n{piece}", sheet, number, number)
+                continue
+            lines.append(line)
+            size += len(line) + 1
+            first = number if first is None else first
+            last = number
+        if lines:
+            yield segment("\n".join([header] + lines), current_sheet, first, last)
+
+    def _extract_text_from_html(self, source: BinaryIO) -> Iterator[str]:
         """
         Extrai texto de um arquivo HTML.
 
         Parâmetros:
-            file_content (bytes): O conteúdo do arquivo HTML a ser processado.
+            source (BinaryIO): O arquivo HTML a ser processado.
 
         Retorna:
-            str: O texto extraído do arquivo HTML.
+            Iterator[str]: O texto do documento.
         """
-        soup = BeautifulSoup(file_content, 'html.parser')
-        return soup.get_text()
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(source, 'html.parser')
+        yield soup.get_text()
 
-    def _extract_text_from_csv(self, file_content: bytes) -> str:
+    def _extract_text_from_csv(self, source: BinaryIO) -> Iterator[str]:
         """
-        Extrai texto de um arquivo CSV.
+        Extrai texto de um arquivo CSV, em blocos de linhas.
 
         Parâmetros:
-            file_content (bytes): O conteúdo do arquivo CSV a ser processado.
+            source (BinaryIO): O arquivo CSV a ser processado.
 
         Retorna:
-            str: O texto extraído do arquivo CSV.
+            Iterator[str]: O texto de cada bloco de linhas; o cabeçalho aparece apenas no primeiro.
         """
-        df = pd.read_csv(io.BytesIO(file_content))
-        return df.to_string(index=False)
+        import pandas as pd
+        for i, df in enumerate(pd.read_csv(source, chunksize=CSV_CHUNK_ROWS)):
+            yield df.to_string(index=False, header=(i == 0))
 
-    def _extract_text_from_generic(self, file_content: bytes) -> str:
+    def _extract_text_from_generic(self, source: BinaryIO) -> Iterator[str]:
         """
-        Tenta detectar a codificação e extrair texto de um arquivo genérico.
+        Detecta a codificação e extrai texto de um arquivo genérico, em blocos.
 
         Parâmetros:
-            file_content (bytes): O conteúdo do arquivo genérico a ser processado.
+            source (BinaryIO): O arquivo genérico a ser processado.
 
         Retorna:
-            str: O texto extraído do arquivo genérico.
+            Iterator[str]: O texto de cada bloco.
         """
-        encoding = chardet.detect(file_content)['encoding']
-        return file_content.decode(encoding)
+        # Detecta a codificação por uma amostra do início do arquivo
+        import chardet
+        sample = source.read(ENCODING_SAMPLE_BYTES)
+        encoding = chardet.detect(sample)['encoding'] or 'utf-8'
+        decoder = codecs.getincrementaldecoder(encoding)()
+        block = sample
+        while block:
+            yield decoder.decode(block)
+            block = source.read(READ_BLOCK_BYTES)
+        yield decoder.decode(b"", final=True)
 
-    def process_multiple_documents(self, documents: List[Dict]) -> List[Dict]:
+    def process_multiple_documents(self, documents: List[Dict], extractor=None) -> List[Dict]:
         """
         Processa documentos em lote.
 
         Parâmetros:
             documents (List[Dict]): Uma lista de dicionários, onde cada dicionário representa um documento.
                 Cada dicionário deve conter as chaves 'content' e 'filename'.
+            extractor (ParallelExtractor, opcional): Se informado, os documentos são processados em
+                paralelo no pool de processos do extrator, mantendo a ordem dos documentos.
 
         Retorna:
             List[Dict]: Uma lista de dicionários, onde cada dicionário representa um documento processado.
         """
         processed_documents = []
+        if extractor is not None:
+            results = extractor.extract_many([(doc['content'], doc['filename']) for doc in documents])
+            for doc, result in zip(documents, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Erro ao processar documento {doc['filename']}: {str(result)}")
+                else:
+                    processed_documents.extend(result)
+            return processed_documents
+
         for doc in documents:
             try:
                 processed_documents.extend(self.process_file(doc['content'], doc['filename']))
@@ -0,0 +1,239 @@
+from langchain_core.embeddings import Embeddings
+from array import array
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import logging
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """
+    Cache de embeddings em disco, endereçado pelo conteúdo.
+
+    Cada entrada é identificada pelo hash SHA-256 do nome do modelo mais o texto
+    (já pré-processado) e guarda o vetor como float32 em um banco SQLite. Quando o número
+    de entradas ultrapassa o limite, as entradas usadas há mais tempo são removidas (LRU).
+    """
+
+    def __init__(self, path="./embedding_cache.sqlite3", max_entries=1_000_000):
+        """
+        Inicializa o cache, criando o banco SQLite se necessário.
+
+        Parâmetros:
+            path (str): Caminho do arquivo SQLite. O padrão é "./embedding_cache.sqlite3".
+            max_entries (int): Número máximo de vetores mantidos no cache.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+
+        # Contador monotônico usado como relógio do LRU
+        row = self._conn.execute("SELECT COALESCE(MAX(last_access), 0), COUNT(*) FROM embeddings").fetchone()
+        self._clock, self._entries = row
+
+    @staticmethod
+    def make_key(model, text):
+        """
+        Gera a chave do cache a partir do nome do modelo e do texto.
+
+        Parâmetros:
+            model (str): Nome do modelo de embeddings.
+            text (str): O texto embedado.
+
+        Retorna:
+            str: O hash SHA-256 hexadecimal.
+        """
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model, texts):
+        """
+        Busca os vetores de uma lista de textos.
+
+        Parâmetros:
+            model (str): Nome do modelo de embeddings.
+            texts (list): Lista de textos.
+
+        Retorna:
+            list: Uma lista alinhada com os textos, contendo o vetor ou None quando ausente.
+        """
+        keys = [self.make_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            # Consulta em blocos para respeitar o limite de parâmetros do SQLite
+            for start in range(0, len(unique_keys), 500):
+                block = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(block))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", block
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                self._clock += 1
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(self._clock, key) for key in found],
+                )
+                self._conn.commit()
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for vector in results if vector is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model, texts, vectors):
+        """
+        Armazena os vetores de uma lista de textos, removendo entradas antigas se necessário.
+
+        Parâmetros:
+            model (str): Nome do modelo de embeddings.
+            texts (list): Lista de textos.
+            vectors (list): Lista de vetores alinhada com os textos.
+        """
+        if not texts:
+            return
+        with self._lock:
+            self._clock += 1
+            rows = [
+                (self.make_key(model, text), array("f", vector).tobytes(), self._clock)
+                for text, vector in zip(texts, vectors)
+            ]
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings(key, vector, last_access) VALUES (?, ?, ?)", rows)
+            self._entries += self._conn.total_changes - before
+            if self._entries > self.max_entries:
+                excess = self._entries - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (excess,),
+                )
+                self._entries -= excess
+                logger.info(f"Cache de embeddings: {excess} entradas antigas removidas")
+            self._conn.commit()
+
+    def stats(self):
+        """
+        Retorna as métricas do cache.
+
+        Retorna:
+            dict: Acertos, faltas, taxa de acerto e número de entradas armazenadas.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": self._entries,
+            }
+
+    def close(self):
+        """Fecha a conexão com o banco SQLite."""
+        with self._lock:
+            self._conn.close()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envolve um modelo de embeddings, consultando o EmbeddingCache antes de cada chamada.
+
+    Apenas os textos ausentes do cache (sem repetição) são enviados ao modelo subjacente.
+    """
+
+    def __init__(self, embeddings, cache, model=None):
+        """
+        Parâmetros:
+            embeddings (Embeddings): O modelo de embeddings subjacente.
+            cache (EmbeddingCache): O cache a ser consultado.
+            model (str, opcional): Nome do modelo usado na chave. O padrão é o atributo `model`
+                                   do modelo subjacente ou o nome da sua classe.
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or getattr(embeddings, "model", None) or type(embeddings).__name__
+
+    def _split(self, texts):
+        """Separa os vetores já em cache e os textos únicos que ainda precisam ser embedados."""
+        cached = self.cache.get_many(self.model, texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        return cached, missing
+
+    def _merge(self, texts, cached, missing, vectors):
+        """Armazena os novos vetores e remonta a lista na ordem original."""
+        self.cache.put_many(self.model, missing, vectors)
+        computed = dict(zip(missing, vectors))
+        return [vector if vector is not None else computed[text] for text, vector in zip(texts, cached)]
+
+    def embed_documents(self, texts):
+        """
+        Gera os embeddings de uma lista de textos, usando o cache quando possível.
+
+        Parâmetros:
+            texts (list): Lista de textos.
+
+        Retorna:
+            list: Lista de vetores na mesma ordem dos textos.
+        """
+        texts = list(texts)
+        cached, missing = self._split(texts)
+        vectors = self.embeddings.embed_documents(missing) if missing else []
+        return self._merge(texts, cached, missing, vectors)
+
+    def embed_query(self, text):
+        """
+        Gera o embedding de uma consulta, usando o cache quando possível.
+
+        Parâmetros:
+            text (str): O texto da consulta.
+
+        Retorna:
+            list: O vetor da consulta.
+        """
+        cached = self.cache.get_many(self.model, [text])[0]
+        if cached is not None:
+            return cached
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(self.model, [text], [vector])
+        return vector
+
+    async def aembed_documents(self, texts):
+        """
+        Versão assíncrona de embed_documents. As leituras e gravações no SQLite rodam em
+        threads, sem bloquear o event loop.
+        """
+        texts = list(texts)
+        cached, missing = await asyncio.to_thread(self._split, texts)
+        vectors = await self.embeddings.aembed_documents(missing) if missing else []
+        return await asyncio.to_thread(self._merge, texts, cached, missing, vectors)
+
+    async def aembed_query(self, text):
+        """
+        Versão assíncrona de embed_query. As leituras e gravações no SQLite rodam em threads,
+        sem bloquear o event loop.
+        """
+        cached = (await asyncio.to_thread(self.cache.get_many, self.model, [text]))[0]
+        if cached is not None:
+            return cached
+        vector = await self.embeddings.aembed_query(text)
+        await asyncio.to_thread(self.cache.put_many, self.model, [text], [vector])
+        return vector
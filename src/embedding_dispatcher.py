@@ -0,0 +1,302 @@
+from langchain_core.embeddings import Embeddings
+import asyncio
+import os
+import random
+import threading
+import time
+import logging
+import httpx
+from dotenv import load_dotenv
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Status HTTP que indicam falha temporária e devem ser repetidos
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class EmbeddingDispatcherError(Exception):
+    """Exceção customizada para falhas definitivas na geração de embeddings."""
+    pass
+
+class EmbeddingDispatcher(Embeddings):
+    """
+    Despachante de embeddings compartilhável entre vários jobs de ingestão.
+
+    Divide os textos em lotes limitados por tokens, mantém um número configurável de
+    requisições simultâneas em um event loop próprio, repete respostas 429/5xx com backoff
+    exponencial e jitter, e devolve os vetores na ordem original dos textos.
+    """
+
+    def __init__(self, api_key=None, model="text-embedding-ada-002", base_url=None,
+                 max_concurrency=4, max_batch_tokens=8000, max_batch_size=2048,
+                 max_retries=6, backoff_base=0.5, backoff_max=30.0, timeout=60.0):
+        """
+        Inicializa o despachante de embeddings.
+
+        Parâmetros:
+            api_key (str, opcional): Chave da API. O padrão é a variável OPENAI_API_KEY.
+            model (str): Nome do modelo de embeddings.
+            base_url (str, opcional): URL base da API. O padrão é OPENAI_BASE_URL ou a API da OpenAI.
+            max_concurrency (int): Número máximo de requisições em andamento.
+            max_batch_tokens (int): Número máximo estimado de tokens por requisição.
+            max_batch_size (int): Número máximo de textos por requisição.
+            max_retries (int): Número máximo de repetições de uma requisição com falha temporária.
+            backoff_base (float): Espera base, em segundos, do backoff exponencial.
+            backoff_max (float): Espera máxima, em segundos, entre repetições.
+            timeout (float): Timeout, em segundos, de cada requisição HTTP.
+
+        Lança:
+            ValueError: Se a chave da API não for encontrada.
+        """
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
+
+        self.model = model
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._api_key = api_key
+        self._timeout = timeout
+        self._encoding = None
+
+        # Métricas de vazão e de fila
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._texts = 0
+        self._tokens = 0
+        self._busy_seconds = 0.0
+        self._queued = 0
+        self._in_flight = 0
+        self._busy_since = None
+
+        # Event loop dedicado, compartilhado por todos os chamadores
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="embedding-dispatcher", daemon=True)
+        self._thread.start()
+        self._semaphore = None
+        self._client = None
+        asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    async def _setup(self):
+        """Cria o semáforo e o cliente HTTP dentro do event loop do despachante."""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {self._api_key}"},
+            timeout=self._timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency),
+        )
+
+    def embed_documents(self, texts):
+        """
+        Gera os embeddings de uma lista de textos de forma síncrona.
+
+        Parâmetros:
+            texts (list): Lista de textos.
+
+        Retorna:
+            list: Lista de vetores na mesma ordem dos textos.
+        """
+        return asyncio.run_coroutine_threadsafe(self._embed(list(texts)), self._loop).result()
+
+    def embed_query(self, text):
+        """
+        Gera o embedding de uma consulta de forma síncrona.
+
+        Parâmetros:
+            text (str): O texto da consulta.
+
+        Retorna:
+            list: O vetor da consulta.
+        """
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        """
+        Gera os embeddings de uma lista de textos sem bloquear o event loop do chamador.
+
+        Parâmetros:
+            texts (list): Lista de textos.
+
+        Retorna:
+            list: Lista de vetores na mesma ordem dos textos.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._embed(list(texts)), self._loop)
+        return await asyncio.wrap_future(future)
+
+    async def aembed_query(self, text):
+        """
+        Gera o embedding de uma consulta sem bloquear o event loop do chamador.
+
+        Parâmetros:
+            text (str): O texto da consulta.
+
+        Retorna:
+            list: O vetor da consulta.
+        """
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self):
+        """
+        Retorna as métricas do despachante.
+
+        Retorna:
+            dict: Requisições, repetições, textos e tokens processados, vazão em textos
+                por segundo e tokens por segundo, além da profundidade da fila
+                (lotes aguardando vaga) e das requisições em andamento.
+        """
+        with self._lock:
+            busy = self._busy_seconds
+            if self._busy_since is not None:
+                busy += time.perf_counter() - self._busy_since
+            return {
+                "requests": self._requests,
+                "retries": self._retries,
+                "texts": self._texts,
+                "tokens": self._tokens,
+                "texts_per_second": self._texts / busy if busy else 0.0,
+                "tokens_per_second": self._tokens / busy if busy else 0.0,
+                "queue_depth": self._queued,
+                "in_flight": self._in_flight,
+            }
+
+    def close(self):
+        """Fecha o cliente HTTP e encerra o event loop do despachante."""
+        if self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _count_tokens(self, text):
+        """
+        Estima o número de tokens de um texto.
+
+        Usa o tiktoken quando disponível e, caso contrário, aproxima por quatro caracteres por token.
+        """
+        if self._encoding is None:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                self._encoding = False
+        if self._encoding:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return max(1, len(text) // 4)
+
+    def _make_batches(self, texts):
+        """
+        Divide os textos em lotes limitados por tokens e por quantidade.
+
+        Retorna:
+            list: Lista de tuplas (posição inicial, textos do lote, tokens do lote).
+        """
+        batches = []
+        start = 0
+        batch = []
+        batch_tokens = 0
+        for position, text in enumerate(texts):
+            tokens = self._count_tokens(text)
+            if batch and (len(batch) >= self.max_batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                batches.append((start, batch, batch_tokens))
+                start = position
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append((start, batch, batch_tokens))
+        return batches
+
+    async def _embed(self, texts):
+        """Despacha todos os lotes concorrentemente e remonta os vetores na ordem original."""
+        if not texts:
+            return []
+        batches = self._make_batches(texts)
+        results = await asyncio.gather(*(self._dispatch(batch, tokens) for _, batch, tokens in batches))
+        vectors = [None] * len(texts)
+        for (start, batch, _), batch_vectors in zip(batches, results):
+            vectors[start:start + len(batch)] = batch_vectors
+        return vectors
+
+    async def _dispatch(self, batch, tokens):
+        """Aguarda uma vaga no semáforo e envia o lote, contabilizando a fila."""
+        with self._lock:
+            self._queued += 1
+        acquired = False
+        try:
+            async with self._semaphore:
+                acquired = True
+                with self._lock:
+                    self._queued -= 1
+                    self._in_flight += 1
+                    if self._in_flight == 1:
+                        self._busy_since = time.perf_counter()
+                try:
+                    vectors = await self._post_with_retry(batch)
+                finally:
+                    with self._lock:
+                        self._in_flight -= 1
+                        if self._in_flight == 0:
+                            self._busy_seconds += time.perf_counter() - self._busy_since
+                            self._busy_since = None
+        finally:
+            if not acquired:
+                with self._lock:
+                    self._queued -= 1
+        with self._lock:
+            self._texts += len(batch)
+            self._tokens += tokens
+        return vectors
+
+    async def _post_with_retry(self, batch):
+        """
+        Envia um lote ao endpoint de embeddings, repetindo falhas temporárias com backoff e jitter.
+
+        Lança:
+            EmbeddingDispatcherError: Se a resposta for um erro definitivo ou as repetições se esgotarem.
+        """
+        attempt = 0
+        while True:
+            with self._lock:
+                self._requests += 1
+            try:
+                response = await self._client.post("/embeddings", json={"model": self.model, "input": batch})
+            except httpx.TransportError as e:
+                error = f"erro de transporte: {str(e)}"
+                retry_after = None
+            else:
+                if response.status_code == 200:
+                    data = sorted(response.json()["data"], key=lambda item: item["index"])
+                    return [item["embedding"] for item in data]
+                if response.status_code not in RETRYABLE_STATUS:
+                    raise EmbeddingDispatcherError(
+                        f"Falha ao gerar embeddings: HTTP {response.status_code} - {response.text}"
+                    )
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("retry-after")
+
+            if attempt >= self.max_retries:
+                raise EmbeddingDispatcherError(f"Falha ao gerar embeddings após {attempt + 1} tentativas: {error}")
+
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            logger.warning(f"Repetindo lote de embeddings em {delay:.2f}s ({error})")
+            with self._lock:
+                self._retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
@@ -0,0 +1,263 @@
+import faiss
+import numpy as np
+import math
+import logging
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# Tipos de índice suportados pelo VectorDB
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# Formatos de armazenamento dos vetores no índice: float32 (exato), float16 e int8
+# (quantização escalar) ou pq (quantização por produto)
+STORAGE_TYPES = ("float32", "float16", "int8", "pq")
+
+# O FAISS recomenda ao menos 39 pontos de treino por centróide do IVF
+MIN_POINTS_PER_CENTROID = 39
+
+def _nlist(params, n_train):
+    """
+    Calcula o número de listas do IVF: o valor configurado ou 4 * sqrt(n), limitado pelos pontos de treino.
+    """
+    nlist = params.get("nlist") or int(4 * math.sqrt(max(n_train, 1)))
+    return max(1, min(nlist, n_train // MIN_POINTS_PER_CENTROID))
+
+def min_training_points(index_type, params, storage="float32"):
+    """
+    Retorna o número mínimo de vetores para treinar um índice do tipo informado.
+
+    Parâmetros:
+        index_type (str): Um dos tipos de INDEX_TYPES.
+        params (dict): Parâmetros do índice.
+        storage (str): Um dos formatos de STORAGE_TYPES.
+
+    Retorna:
+        int: O número mínimo de vetores de treino (0 se o índice não precisa de treino).
+    """
+    required = 0
+    if index_type == "ivf_flat":
+        required = MIN_POINTS_PER_CENTROID
+    if index_type == "ivf_pq" or storage == "pq":
+        # Cada subquantizador do PQ precisa de ao menos 2^nbits pontos
+        required = max(MIN_POINTS_PER_CENTROID, 2 ** params.get("nbits", 8))
+    if storage == "int8":
+        # Os intervalos do quantizador escalar são estimados com os vetores de treino
+        required = max(required, MIN_POINTS_PER_CENTROID)
+    return required
+
+def _pq(dimension, params):
+    """
+    Monta o código PQ do index_factory, validando a divisão da dimensão entre os subquantizadores.
+    """
+    m = params.get("m", 16)
+    if dimension % m != 0:
+        raise ValueError(f"A dimensão {dimension} deve ser divisível pelo número de subquantizadores m={m}")
+    return f"PQ{m}x{params.get('nbits', 8)}"
+
+def _encoding(storage, dimension, params):
+    """
+    Monta a codificação dos vetores no index_factory para o formato de armazenamento.
+    """
+    if storage == "float32":
+        return "Flat"
+    if storage == "float16":
+        return "SQfp16"
+    if storage == "int8":
+        return "SQ8"
+    if storage == "pq":
+        return _pq(dimension, params)
+    raise ValueError(f"Formato de armazenamento não suportado: {storage}. Use um de {STORAGE_TYPES}")
+
+def factory_string(index_type, dimension, n_train, params=None, storage="float32"):
+    """
+    Monta a string do faiss.index_factory para o tipo de índice.
+
+    Parâmetros:
+        index_type (str): Um dos tipos de INDEX_TYPES.
+        dimension (int): Dimensão dos vetores.
+        n_train (int): Número de vetores disponíveis para treino.
+        params (dict, opcional): nlist, m e nbits (IVF/PQ) ou M (HNSW).
+        storage (str): Um dos formatos de STORAGE_TYPES. O ivf_pq sempre usa PQ.
+
+    Retorna:
+        str: A descrição do índice no formato do index_factory.
+
+    Lança:
+        ValueError: Se o tipo ou o formato forem desconhecidos ou os parâmetros forem
+            incompatíveis com a dimensão.
+    """
+    params = params or {}
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice não suportado: {index_type}. Use um de {INDEX_TYPES}")
+    if index_type == "ivf_pq":
+        if storage not in ("float32", "pq"):
+            raise ValueError(f"O índice ivf_pq já armazena os vetores com PQ e não aceita o formato {storage}")
+        return f"IVF{_nlist(params, n_train)},{_pq(dimension, params)}"
+    encoding = _encoding(storage, dimension, params)
+    if index_type == "flat":
+        return encoding
+    if index_type == "ivf_flat":
+        return f"IVF{_nlist(params, n_train)},{encoding}"
+    if storage == "float32":
+        return f"HNSW{params.get('M', 32)}"
+    return f"HNSW{params.get('M', 32)},{encoding}"
+
+def build_index(index_type, vectors, params=None, storage="float32"):
+    """
+    Cria e treina um índice FAISS com os vetores informados, sem adicioná-los.
+
+    Parâmetros:
+        index_type (str): Um dos tipos de INDEX_TYPES.
+        vectors (np.ndarray): Matriz float32 usada no treino.
+        params (dict, opcional): Parâmetros do índice, incluindo efConstruction para o HNSW.
+        storage (str): Um dos formatos de STORAGE_TYPES.
+
+    Retorna:
+        faiss.Index: O índice treinado e vazio.
+
+    Lança:
+        ValueError: Se não houver vetores suficientes para o treino.
+    """
+    params = params or {}
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_train, dimension = vectors.shape
+    required = min_training_points(index_type, params, storage)
+    if n_train < required:
+        raise ValueError(f"O índice {index_type} requer ao menos {required} vetores de treino, recebidos {n_train}")
+
+    description = factory_string(index_type, dimension, n_train, params, storage)
+    index = faiss.index_factory(dimension, description)
+    if index_type == "hnsw" and "efConstruction" in params:
+        faiss.downcast_index(index).hnsw.efConstruction = params["efConstruction"]
+    if not index.is_trained:
+        logger.info(f"Treinando índice {description} com {n_train} vetores")
+        index.train(vectors)
+    return index
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """
+    Ajusta os parâmetros de busca do índice.
+
+    Parâmetros:
+        index (faiss.Index): O índice.
+        nprobe (int, opcional): Número de listas visitadas pelos índices IVF.
+        ef_search (int, opcional): Tamanho da lista de candidatos dos índices HNSW.
+    """
+    parameter_space = faiss.ParameterSpace()
+    if nprobe is not None and index_kind(index).startswith("ivf"):
+        parameter_space.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search is not None and index_kind(index) == "hnsw":
+        parameter_space.set_index_parameter(index, "efSearch", ef_search)
+
+def search_parameters(index, nprobe=None, ef_search=None, selector=None):
+    """
+    Cria os parâmetros de uma única busca, sem alterar o índice compartilhado.
+
+    Parâmetros:
+        index (faiss.Index): O índice.
+        nprobe (int, opcional): Número de listas visitadas pelos índices IVF.
+        ef_search (int, opcional): Tamanho da lista de candidatos dos índices HNSW.
+        selector (faiss.IDSelector, opcional): Restringe a busca às posições aceitas pelo seletor.
+            Com um seletor, os parâmetros omitidos assumem os valores atuais do índice.
+
+    Retorna:
+        faiss.SearchParameters | None: Os parâmetros a passar para index.search, ou None
+            se nenhum parâmetro se aplicar ao tipo do índice.
+    """
+    kind = index_kind(index)
+    if selector is not None:
+        current = get_search_params(index)
+        if kind.startswith("ivf"):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe if nprobe is not None else current["nprobe"])
+        if kind == "hnsw":
+            return faiss.SearchParametersHNSW(
+                sel=selector, efSearch=ef_search if ef_search is not None else current["ef_search"]
+            )
+        return faiss.SearchParameters(sel=selector)
+    if nprobe is not None and kind.startswith("ivf"):
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search is not None and kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+def get_search_params(index):
+    """
+    Lê os parâmetros de busca atuais do índice.
+
+    Parâmetros:
+        index (faiss.Index): O índice.
+
+    Retorna:
+        dict: nprobe (índices IVF) e/ou ef_search (índices HNSW).
+    """
+    kind = index_kind(index)
+    if kind.startswith("ivf"):
+        return {"nprobe": faiss.extract_index_ivf(index).nprobe}
+    if kind == "hnsw":
+        return {"ef_search": faiss.downcast_index(index).hnsw.efSearch}
+    return {}
+
+def index_kind(index):
+    """
+    Identifica o tipo de um índice FAISS.
+
+    Parâmetros:
+        index (faiss.Index): O índice.
+
+    Retorna:
+        str: Um dos tipos de INDEX_TYPES, ou o nome da classe do índice se não for reconhecido.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        # IVF com vetores completos ou com quantização escalar
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexFlatCodes):
+        # Busca exaustiva com vetores completos, quantização escalar ou PQ
+        return "flat"
+    return type(index).__name__
+
+def storage_kind(index):
+    """
+    Identifica o formato de armazenamento dos vetores de um índice FAISS.
+
+    Parâmetros:
+        index (faiss.Index): O índice.
+
+    Retorna:
+        str: Um dos formatos de STORAGE_TYPES, ou o nome da classe do índice se não for reconhecido.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        qtypes = {faiss.ScalarQuantizer.QT_fp16: "float16", faiss.ScalarQuantizer.QT_8bit: "int8"}
+        return qtypes.get(index.sq.qtype, type(index).__name__)
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexIVFFlat)):
+        return "float32"
+    return type(index).__name__
+
+def reconstruct_all(index):
+    """
+    Recupera todos os vetores armazenados em um índice, na ordem do índice.
+
+    Para índices com quantização (float16, int8 ou PQ), os vetores recuperados são aproximados.
+
+    Parâmetros:
+        index (faiss.Index): O índice.
+
+    Retorna:
+        np.ndarray: Matriz float32 de formato (ntotal, dimensão).
+    """
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
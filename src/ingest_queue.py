@@ -0,0 +1,260 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# Estados de um job e de cada arquivo
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+COMPLETED_WITH_ERRORS = "completed_with_errors"
+FAILED = "failed"
+
+class IngestQueue:
+    """
+    Fila persistente de jobs de ingestão, drenada por um pool de workers assíncronos.
+
+    Os arquivos de cada upload são gravados em disco e o estado dos jobs fica em um banco
+    SQLite, de forma que jobs pendentes ou interrompidos são retomados após um restart.
+    Cada arquivo é processado pela função `process_file`, que recebe o caminho e o nome do
+    arquivo, além dos metadados do job como argumentos nomeados, e retorna um dicionário com
+    o resultado (ao menos a chave 'chunks').
+    """
+
+    def __init__(self, process_file, directory="./ingest_jobs", workers=2, file_concurrency=1):
+        """
+        Parâmetros:
+            process_file (callable): Corrotina `process_file(path, filename, **metadata) -> dict`.
+            directory (str): Diretório dos arquivos recebidos e do banco de jobs.
+            workers (int): Número máximo de jobs processados simultaneamente.
+            file_concurrency (int): Número máximo de arquivos de um mesmo job processados simultaneamente.
+        """
+        self.process_file = process_file
+        self.directory = directory
+        self.workers = workers
+        self.file_concurrency = file_concurrency
+        self._lock = threading.Lock()
+        self._queue = None
+        self._tasks = []
+
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "jobs.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL, error TEXT);"
+            "CREATE TABLE IF NOT EXISTS job_files ("
+            " job_id TEXT NOT NULL, position INTEGER NOT NULL, filename TEXT NOT NULL,"
+            " path TEXT NOT NULL, status TEXT NOT NULL, chunks INTEGER NOT NULL DEFAULT 0,"
+            " result TEXT, error TEXT, PRIMARY KEY (job_id, position));"
+        )
+        # Bancos anteriores aos metadados dos jobs recebem a coluna
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)").fetchall()]
+        if "metadata" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN metadata TEXT")
+        self._conn.commit()
+
+    def job_directory(self, job_id):
+        """
+        Retorna o diretório onde os arquivos de um job são gravados.
+        """
+        return os.path.join(self.directory, job_id)
+
+    def new_job_id(self):
+        """
+        Gera um id de job e cria o seu diretório de arquivos.
+
+        Retorna:
+            str: O id do job.
+        """
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_directory(job_id), exist_ok=True)
+        return job_id
+
+    def submit(self, job_id, files, metadata=None):
+        """
+        Registra um job com os arquivos já gravados em disco e o coloca na fila.
+
+        Parâmetros:
+            job_id (str): O id gerado por new_job_id.
+            files (list): Lista de tuplas (nome do arquivo, caminho em disco).
+            metadata (dict, opcional): Argumentos nomeados passados a process_file para cada
+                arquivo do job, persistidos com ele (por exemplo, os metadados do upload).
+
+        Retorna:
+            str: O id do job.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs(id, status, created_at, updated_at, metadata) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, now, now, json.dumps(metadata) if metadata else None),
+            )
+            self._conn.executemany(
+                "INSERT INTO job_files(job_id, position, filename, path, status) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, position, filename, path, QUEUED) for position, (filename, path) in enumerate(files)],
+            )
+            self._conn.commit()
+        logger.info(f"Job {job_id} enfileirado com {len(files)} arquivos")
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return job_id
+
+    def get(self, job_id):
+        """
+        Retorna o estado de um job e o progresso de cada arquivo.
+
+        Parâmetros:
+            job_id (str): O id do job.
+
+        Retorna:
+            dict | None: O estado do job, ou None se ele não existir.
+        """
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT id, status, created_at, updated_at, error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            files = self._conn.execute(
+                "SELECT filename, status, chunks, result, error FROM job_files WHERE job_id = ? ORDER BY position",
+                (job_id,),
+            ).fetchall()
+        file_states = [
+            {
+                "filename": filename,
+                "status": status,
+                "chunks": chunks,
+                **(json.loads(result) if result else {}),
+                "error": error,
+            }
+            for filename, status, chunks, result, error in files
+        ]
+        return {
+            "job_id": job[0],
+            "status": job[1],
+            "created_at": job[2],
+            "updated_at": job[3],
+            "error": job[4],
+            "files_total": len(file_states),
+            "files_done": sum(1 for f in file_states if f["status"] in (COMPLETED, FAILED)),
+            "chunks": sum(f["chunks"] for f in file_states),
+            "files": file_states,
+        }
+
+    async def start(self):
+        """
+        Inicia os workers e reenfileira os jobs pendentes ou interrompidos por um restart.
+        """
+        self._queue = asyncio.Queue()
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        for (job_id,) in pending:
+            logger.info(f"Retomando job {job_id}")
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        """
+        Interrompe os workers. Jobs em andamento são retomados no próximo start.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def join(self):
+        """
+        Aguarda até que todos os jobs enfileirados tenham sido processados.
+        """
+        await self._queue.join()
+
+    def close(self):
+        """Fecha a conexão com o banco de jobs."""
+        with self._lock:
+            self._conn.close()
+
+    def _update(self, sql, params):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    async def _worker(self, number):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro inesperado no job {job_id}: {str(e)}")
+                self._update("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                             (FAILED, str(e), time.time(), job_id))
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id):
+        self._update("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (RUNNING, time.time(), job_id))
+        with self._lock:
+            files = self._conn.execute(
+                "SELECT position, filename, path, status FROM job_files WHERE job_id = ? ORDER BY position",
+                (job_id,),
+            ).fetchall()
+            (metadata,) = self._conn.execute("SELECT metadata FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        metadata = json.loads(metadata) if metadata else {}
+
+        # Arquivos concluídos antes de um restart não são reprocessados
+        semaphore = asyncio.Semaphore(self.file_concurrency)
+        await asyncio.gather(*(
+            self._run_file(semaphore, job_id, position, filename, path, metadata)
+            for position, filename, path, status in files
+            if status not in (COMPLETED, FAILED)
+        ))
+
+        with self._lock:
+            statuses = [row[0] for row in self._conn.execute(
+                "SELECT status FROM job_files WHERE job_id = ?", (job_id,)
+            ).fetchall()]
+        if all(status == COMPLETED for status in statuses):
+            final = COMPLETED
+        elif all(status == FAILED for status in statuses):
+            final = FAILED
+        else:
+            final = COMPLETED_WITH_ERRORS
+        self._update("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (final, time.time(), job_id))
+        # Remove os arquivos recebidos após o processamento
+        shutil.rmtree(self.job_directory(job_id), ignore_errors=True)
+        logger.info(f"Job {job_id} finalizado com status {final}")
+
+    async def _run_file(self, semaphore, job_id, position, filename, path, metadata):
+        async with semaphore:
+            self._update("UPDATE job_files SET status = ? WHERE job_id = ? AND position = ?",
+                         (RUNNING, job_id, position))
+            try:
+                result = await self.process_file(path, filename, **metadata)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro ao processar {filename} no job {job_id}: {str(e)}")
+                self._update("UPDATE job_files SET status = ?, error = ? WHERE job_id = ? AND position = ?",
+                             (FAILED, str(e), job_id, position))
+            else:
+                result = dict(result or {})
+                chunks = result.pop("chunks", 0)
+                self._update(
+                    "UPDATE job_files SET status = ?, chunks = ?, result = ? WHERE job_id = ? AND position = ?",
+                    (COMPLETED, chunks, json.dumps(result), job_id, position),
+                )
+            self._update("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
@@ -0,0 +1,279 @@
+from array import array
+from bisect import bisect_left
+import json
+import operator
+import os
+import threading
+import numpy as np
+import logging
+from src.segment_store import atomic_write
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# Campos dos metadados indexados, que podem ser usados nos filtros
+DEFAULT_METADATA_FIELDS = ("source", "file_type", "page", "sheet", "tenant", "tags", "uploaded_at")
+# Operadores de comparação e lógicos dos filtros, com os mesmos nomes do filtro do FAISS VectorStore
+FILTER_OPERATORS = ("$eq", "$neq", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+LOGICAL_OPERATORS = ("$and", "$or", "$not")
+# Comparações dos operadores de intervalo, avaliadas sobre os valores distintos de um campo
+_RANGE_OPERATORS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+# Tipos de valor indexados; listas (por exemplo, tags) indexam cada elemento
+_SCALAR_TYPES = (str, int, float, bool)
+
+def validate_filter(filter, fields=DEFAULT_METADATA_FIELDS):
+    """
+    Valida um filtro de metadados sem avaliá-lo sobre nenhum documento.
+
+    Parâmetros:
+        filter (dict): O filtro, no formato de MetadataIndex.
+        fields (Iterable[str]): Os campos indexados.
+
+    Lança:
+        ValueError: Se o filtro usar um campo não indexado ou um operador não suportado.
+    """
+    MetadataIndex(fields).positions(filter)
+
+class MetadataIndex:
+    """
+    Índice invertido dos metadados dos documentos, em memória e apenas de acréscimo.
+
+    Para cada campo indexado, mapeia cada valor às posições dos documentos que o possuem, as
+    mesmas do índice FAISS. Um filtro é convertido, por operações de conjunto sobre essas
+    listas, nas posições aceitas, que restringem a busca antes de ela ser executada, em vez
+    de filtrar em Python os resultados de uma busca ampliada. Como no BM25Index, as listas
+    crescem apenas no fim, e um filtro limitado às primeiras `limit` posições vê exatamente
+    os documentos do snapshot que o usa.
+
+    A persistência é um arquivo `.jsonl` com os campos indexados de cada documento, na ordem
+    das posições, ao qual cada gravação apenas acrescenta os documentos novos.
+
+    Os filtros são dicionários campo -> condição, combinados por E. A condição é um valor
+    (igualdade; em campos com listas, o documento deve conter o valor), uma lista de valores
+    (qualquer um deles) ou um dicionário de operadores ($eq, $neq, $gt, $gte, $lt, $lte,
+    $in, $nin). As chaves $and e $or recebem listas de filtros, e $not, um filtro.
+    """
+
+    def __init__(self, fields=DEFAULT_METADATA_FIELDS):
+        """
+        Parâmetros:
+            fields (Iterable[str]): Os campos dos metadados indexados.
+        """
+        self.fields = tuple(fields)
+        self._lock = threading.Lock()
+        # campo -> valor -> posições dos documentos, em ordem crescente
+        self._postings = {field: {} for field in self.fields}
+        self._size = 0
+        # Campos indexados dos documentos ainda não gravados em disco
+        self._unsaved = []
+
+    @property
+    def size(self):
+        """O número de documentos indexados."""
+        return self._size
+
+    def add(self, metadatas):
+        """
+        Indexa os metadados de documentos nas próximas posições.
+
+        Parâmetros:
+            metadatas (list): Os metadados de cada documento.
+
+        Retorna:
+            int: A posição do primeiro documento adicionado.
+        """
+        return self._add_entries([self._indexed(metadata) for metadata in metadatas])
+
+    def _indexed(self, metadata):
+        """Seleciona os campos indexados de um documento, com valores escalares ou listas deles."""
+        entry = {}
+        for field in self.fields:
+            value = metadata.get(field)
+            if isinstance(value, _SCALAR_TYPES):
+                entry[field] = value
+            elif isinstance(value, (list, tuple)):
+                entry[field] = [item for item in value if isinstance(item, _SCALAR_TYPES)]
+        return entry
+
+    def _add_entries(self, entries):
+        """Indexa documentos a partir dos seus campos indexados."""
+        with self._lock:
+            start = self._size
+            for position, entry in enumerate(entries, start=start):
+                for field, value in entry.items():
+                    postings = self._postings.get(field)
+                    if postings is None:
+                        continue
+                    for item in (value if isinstance(value, list) else [value]):
+                        positions = postings.get(item)
+                        if positions is None:
+                            positions = postings[item] = array("I")
+                        if not positions or positions[-1] != position:
+                            positions.append(position)
+            self._unsaved.extend(entries)
+            # Publica os documentos por último, depois de todas as posições
+            self._size = start + len(entries)
+            return start
+
+    def positions(self, filter, limit=None):
+        """
+        Retorna as posições dos documentos que atendem a um filtro.
+
+        Parâmetros:
+            filter (dict): O filtro, no formato descrito na classe.
+            limit (int, opcional): Considera apenas as primeiras `limit` posições. O padrão é todo o índice.
+
+        Retorna:
+            np.ndarray: As posições, em ordem crescente (int64).
+
+        Lança:
+            ValueError: Se o filtro usar um campo não indexado ou um operador não suportado.
+        """
+        n = self._size if limit is None else min(limit, self._size)
+        return self._evaluate(filter, n)
+
+    def _evaluate(self, filter, n):
+        if not isinstance(filter, dict):
+            raise ValueError(f"Filtro inválido: {filter!r}. Use um dicionário campo -> condição")
+        matches = []
+        for key, condition in filter.items():
+            if key in ("$and", "$or"):
+                if not isinstance(condition, list):
+                    raise ValueError(f"{key} deve receber uma lista de filtros")
+                parts = [self._evaluate(part, n) for part in condition]
+                if key == "$and":
+                    matches.append(self._intersect(parts, n))
+                else:
+                    matches.append(np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64))
+            elif key == "$not":
+                matches.append(self._complement(self._evaluate(condition, n), n))
+            elif key in self._postings:
+                matches.append(self._field(key, condition, n))
+            elif key.startswith("$"):
+                raise ValueError(f"Operador não suportado: {key}. Use um de {LOGICAL_OPERATORS} ou um campo")
+            else:
+                raise ValueError(f"Campo não indexado: {key}. Use um de {self.fields}")
+        return self._intersect(matches, n)
+
+    def _field(self, field, condition, n):
+        """Posições que atendem à condição sobre um campo."""
+        if isinstance(condition, list):
+            return self._lookup(field, condition, n)
+        if not isinstance(condition, dict):
+            return self._lookup(field, [condition], n)
+        parts = []
+        for op, operand in condition.items():
+            if op in ("$eq", "$neq"):
+                matches = self._lookup(field, [operand], n)
+            elif op in ("$in", "$nin"):
+                if not isinstance(operand, list):
+                    raise ValueError(f"{op} deve receber uma lista de valores")
+                matches = self._lookup(field, operand, n)
+            elif op in _RANGE_OPERATORS:
+                matches = self._lookup(field, self._values_in_range(field, _RANGE_OPERATORS[op], operand), n)
+            else:
+                raise ValueError(f"Operador não suportado: {op}. Use um de {FILTER_OPERATORS}")
+            parts.append(self._complement(matches, n) if op in ("$neq", "$nin") else matches)
+        return self._intersect(parts, n)
+
+    def _values_in_range(self, field, compare, operand):
+        """Valores distintos de um campo que atendem a uma comparação; valores de outro tipo são ignorados."""
+        values = []
+        # A cópia da lista de valores não é afetada por escritas concorrentes
+        for value in list(self._postings[field]):
+            try:
+                if compare(value, operand):
+                    values.append(value)
+            except TypeError:
+                continue
+        return values
+
+    def _lookup(self, field, values, n):
+        """Posições, menores que n, dos documentos com algum dos valores."""
+        postings = self._postings[field]
+        found = []
+        for value in values:
+            positions = postings.get(value) if isinstance(value, _SCALAR_TYPES) else None
+            if positions is None:
+                continue
+            count = bisect_left(positions, n)
+            if count:
+                found.append(np.frombuffer(positions[:count], dtype=np.uint32))
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        if len(found) == 1:
+            return found[0].astype(np.int64)
+        return np.unique(np.concatenate(found)).astype(np.int64)
+
+    @staticmethod
+    def _intersect(parts, n):
+        """Interseção de listas de posições; sem nenhuma, todas as posições."""
+        if not parts:
+            return np.arange(n, dtype=np.int64)
+        result = parts[0]
+        for part in parts[1:]:
+            result = np.intersect1d(result, part, assume_unique=True)
+        return result
+
+    @staticmethod
+    def _complement(positions, n):
+        """Posições menores que n ausentes da lista."""
+        return np.setdiff1d(np.arange(n, dtype=np.int64), positions, assume_unique=True)
+
+    def save(self, path):
+        """
+        Acrescenta ao arquivo os documentos indexados desde a última gravação.
+
+        Parâmetros:
+            path (str): O caminho do arquivo `.jsonl`.
+        """
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, []
+        if not unsaved:
+            return
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in unsaved))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @classmethod
+    def load(cls, path, limit=None, **kwargs):
+        """
+        Carrega um índice gravado por save.
+
+        Uma linha final incompleta (de uma gravação interrompida) é ignorada. Se o arquivo tiver
+        mais documentos que `limit`, ou uma linha inválida, ele é regravado com os documentos válidos.
+
+        Parâmetros:
+            path (str): O caminho do arquivo `.jsonl`.
+            limit (int, opcional): Número máximo de documentos carregados.
+            **kwargs: Parâmetros do MetadataIndex (fields).
+
+        Retorna:
+            MetadataIndex: O índice carregado, vazio se o arquivo não existir.
+        """
+        index = cls(**kwargs)
+        if not os.path.exists(path):
+            return index
+        entries = []
+        rewrite = False
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if limit is not None and len(entries) >= limit:
+                    rewrite = True
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Linha inválida no índice de metadados {path}; descartando o restante do arquivo")
+                    rewrite = True
+                    break
+        index._add_entries(entries)
+        index._unsaved = []
+        if rewrite:
+            atomic_write(
+                path,
+                lambda f: f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)),
+                mode="w",
+            )
+        return index
@@ -0,0 +1,302 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import io
+import os
+import threading
+import time
+import logging
+from src.document_processor import DocumentProcessor, DocumentProcessingError
+
+try:
+    import resource
+except ImportError:  # Windows não possui limites de recursos por processo
+    resource = None
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# Processador de cada worker, criado uma única vez por processo
+_worker_processor = None
+
+def _init_worker(memory_limit_bytes, chunk_size, chunk_overlap):
+    """Inicializa um worker: aplica o limite de memória e cria o seu DocumentProcessor."""
+    global _worker_processor
+    if memory_limit_bytes and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+    _worker_processor = DocumentProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+def _extract_part(source, filename, pages):
+    """Extrai e segmenta uma parte de um arquivo (o arquivo inteiro ou um intervalo de páginas)."""
+    if isinstance(source, bytes):
+        return list(_worker_processor.iter_segments(io.BytesIO(source), filename, pages))
+    with open(source, "rb") as stream:
+        return list(_worker_processor.iter_segments(stream, filename, pages))
+
+class ParallelExtractor:
+    """
+    Extrai documentos em paralelo em um pool de processos.
+
+    Cada arquivo vira uma ou mais tarefas: PDFs grandes são divididos em intervalos de
+    páginas, e os demais formatos são processados inteiros. Os resultados são montados
+    na ordem dos arquivos e das páginas, independentemente da ordem de conclusão.
+
+    Cada worker tem um limite de memória, e uma tarefa que ultrapassa o tempo limite tem
+    o seu pool encerrado e recriado, para que um arquivo malformado não bloqueie os demais.
+    """
+
+    def __init__(self, max_workers=None, timeout=120, memory_limit_mb=2048, pdf_pages_per_task=50,
+                 chunk_size=1000, chunk_overlap=200, mp_context=None):
+        """
+        Parâmetros:
+            max_workers (int, opcional): Número de processos. O padrão é o número de CPUs.
+            timeout (float): Tempo máximo de cada tarefa, em segundos.
+            memory_limit_mb (int): Limite de memória (espaço de endereçamento) de cada worker, em MB.
+                                   Use 0 para não limitar.
+            pdf_pages_per_task (int): Número de páginas de PDF por tarefa.
+            chunk_size (int): Tamanho máximo de cada segmento.
+            chunk_overlap (int): Sobreposição entre segmentos consecutivos.
+            mp_context (multiprocessing.context.BaseContext, opcional): Contexto de criação dos processos.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit_bytes = memory_limit_mb * 1024 * 1024 if memory_limit_mb else 0
+        self.pdf_pages_per_task = pdf_pages_per_task
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.mp_context = mp_context
+        self._executor = None
+        self._lock = threading.Lock()
+        # Limita as tarefas em andamento ao número de workers, de forma que o tempo limite
+        # de cada tarefa seja contado a partir do seu início, mesmo com chamadas concorrentes
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+
+    def extract(self, source, filename):
+        """
+        Extrai e segmenta um único arquivo, dividindo PDFs grandes entre os workers.
+
+        Parâmetros:
+            source (str | bytes): O caminho do arquivo em disco ou o seu conteúdo.
+            filename (str): O nome do arquivo.
+
+        Retorna:
+            List[Dict]: Os segmentos do arquivo, na ordem do documento.
+
+        Lança:
+            DocumentProcessingError: Se a extração falhar, exceder o tempo limite ou o limite de memória.
+        """
+        result = self.extract_many([(source, filename)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def iter_extract(self, source, filename):
+        """
+        Extrai e segmenta um único arquivo, como extract, produzindo os segmentos de cada parte
+        assim que ela e as anteriores terminam. No máximo max_workers partes são extraídas à
+        frente da que está sendo consumida, de forma que a memória não cresce com o arquivo.
+
+        Parâmetros:
+            source (str | bytes): O caminho do arquivo em disco ou o seu conteúdo.
+            filename (str): O nome do arquivo.
+
+        Retorna:
+            Iterator[Dict]: Os segmentos do arquivo, na ordem do documento.
+
+        Lança:
+            DocumentProcessingError: Se a extração de uma parte falhar, exceder o tempo limite ou o
+                limite de memória, ao alcançar essa parte.
+        """
+        outcomes = self._iter_outcomes(self.plan([(source, filename)]), window=self.max_workers)
+        try:
+            for _, outcome in outcomes:
+                if isinstance(outcome, Exception):
+                    raise self._processing_error(outcome, filename)
+                yield from outcome
+        finally:
+            outcomes.close()
+
+    def extract_many(self, files):
+        """
+        Extrai e segmenta vários arquivos em paralelo.
+
+        Parâmetros:
+            files (list): Lista de tuplas (caminho ou conteúdo em bytes, nome do arquivo).
+
+        Retorna:
+            list: Uma lista alinhada com os arquivos, contendo os segmentos de cada arquivo ou a
+                DocumentProcessingError que impediu a sua extração.
+        """
+        tasks = self.plan(files)
+        outcomes = self._run(tasks)
+        results = [[] for _ in files]
+        for (file_index, _, _, filename, _), outcome in zip(tasks, outcomes):
+            if isinstance(results[file_index], Exception):
+                continue
+            if isinstance(outcome, Exception):
+                results[file_index] = self._processing_error(outcome, filename)
+            else:
+                results[file_index].extend(outcome)
+        return results
+
+    def plan(self, files):
+        """
+        Divide os arquivos em tarefas, na ordem em que os resultados devem ser montados.
+
+        Parâmetros:
+            files (list): Lista de tuplas (caminho ou conteúdo em bytes, nome do arquivo).
+
+        Retorna:
+            list: Tuplas (índice do arquivo, índice da parte, origem, nome do arquivo, intervalo de páginas ou None).
+        """
+        tasks = []
+        for file_index, (source, filename) in enumerate(files):
+            ranges = [None]
+            if filename.lower().endswith(".pdf"):
+                try:
+                    pages = self._count_pages(source)
+                except Exception as e:
+                    # O erro é reportado pela própria tarefa, ao extrair o arquivo inteiro
+                    logger.warning(f"Não foi possível contar as páginas de {filename}: {str(e)}")
+                    pages = 0
+                if pages > self.pdf_pages_per_task:
+                    ranges = [(start, min(start + self.pdf_pages_per_task, pages))
+                              for start in range(0, pages, self.pdf_pages_per_task)]
+            for part_index, pages_range in enumerate(ranges):
+                tasks.append((file_index, part_index, source, filename, pages_range))
+        return tasks
+
+    def close(self):
+        """Encerra o pool de processos."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+    @staticmethod
+    def _processing_error(error, filename):
+        if isinstance(error, DocumentProcessingError):
+            return error
+        return DocumentProcessingError(f"Falha ao processar arquivo {filename}: {str(error)}")
+
+    def _count_pages(self, source):
+        if isinstance(source, bytes):
+            return DocumentProcessor.count_pages(io.BytesIO(source))
+        with open(source, "rb") as stream:
+            return DocumentProcessor.count_pages(stream)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=self.mp_context,
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_bytes, self.chunk_size, self.chunk_overlap),
+                )
+            return self._executor
+
+    def _reset_executor(self, executor):
+        """Encerra à força um pool com uma tarefa travada ou um worker morto."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        logger.warning("Reiniciando o pool de extração")
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, tasks):
+        """Executa as tarefas e retorna os seus resultados, na ordem das tarefas (veja _iter_outcomes)."""
+        return [outcome for _, outcome in self._iter_outcomes(tasks)]
+
+    def _iter_outcomes(self, tasks, window=None):
+        """
+        Executa as tarefas e produz (índice, resultado) na ordem das tarefas, assim que cada uma e
+        as anteriores terminam.
+
+        Uma tarefa que excede o tempo limite é registrada como erro. Tarefas interrompidas pelo
+        reinício do pool, ou pela morte de um worker (por exemplo, ao atingir o limite de memória),
+        são repetidas uma vez.
+
+        Parâmetros:
+            tasks (list): As tarefas, como retornadas por plan.
+            window (int, opcional): Número máximo de tarefas submetidas a partir da próxima a ser
+                produzida, o que limita os resultados mantidos em memória. None não limita.
+        """
+        outcomes = {}
+        attempts = [0] * len(tasks)
+        queue = list(range(len(tasks)))
+        in_flight = {}
+        next_index = 0
+
+        try:
+            while next_index < len(tasks):
+                while next_index in outcomes:
+                    yield next_index, outcomes.pop(next_index)
+                    next_index += 1
+                if next_index == len(tasks):
+                    break
+
+                # Submete tarefas, na ordem, enquanto houver workers livres e a janela permitir
+                while queue and (window is None or min(queue) < next_index + window) \
+                        and self._slots.acquire(blocking=not in_flight):
+                    index = min(queue)
+                    queue.remove(index)
+                    _, _, source, filename, pages = tasks[index]
+                    executor = self._get_executor()
+                    try:
+                        future = executor.submit(_extract_part, source, filename, pages)
+                    except BrokenProcessPool:
+                        self._slots.release()
+                        self._reset_executor(executor)
+                        queue.append(index)
+                        continue
+                    attempts[index] += 1
+                    in_flight[future] = (index, executor, time.monotonic())
+
+                if not in_flight:
+                    continue
+                oldest = min(started for _, _, started in in_flight.values())
+                done, _ = wait(in_flight, timeout=max(0.0, oldest + self.timeout - time.monotonic()),
+                               return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    index, executor, _ = in_flight.pop(future)
+                    self._slots.release()
+                    try:
+                        outcomes[index] = future.result()
+                    except BrokenProcessPool as e:
+                        self._reset_executor(executor)
+                        if attempts[index] < 2:
+                            queue.append(index)
+                        else:
+                            outcomes[index] = DocumentProcessingError(
+                                f"Falha ao processar arquivo {tasks[index][3]}: o worker foi encerrado ({str(e)})"
+                            )
+                    except Exception as e:
+                        outcomes[index] = e
+
+                now = time.monotonic()
+                expired = [future for future, (_, _, started) in in_flight.items() if now - started >= self.timeout]
+                for future in expired:
+                    index, executor, _ = in_flight.pop(future)
+                    self._slots.release()
+                    logger.error(f"Tempo limite excedido ao processar {tasks[index][3]}")
+                    outcomes[index] = DocumentProcessingError(
+                        f"Falha ao processar arquivo {tasks[index][3]}: tempo limite de {self.timeout}s excedido"
+                    )
+                    self._reset_executor(executor)
+                if expired:
+                    # As demais tarefas do pool encerrado são repetidas no novo pool
+                    for future in [f for f, (_, executor, _) in in_flight.items() if executor is not self._executor]:
+                        index, _, _ = in_flight.pop(future)
+                        self._slots.release()
+                        attempts[index] -= 1
+                        queue.append(index)
+        finally:
+            # Interrompido pelo consumidor: as tarefas pendentes são canceladas, e as em andamento
+            # liberam o seu worker ao terminar
+            for future in in_flight:
+                future.cancel()
+                future.add_done_callback(lambda _: self._slots.release())
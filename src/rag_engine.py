@@ -1,8 +1,19 @@
-from langchain_openai import OpenAI, OpenAIEmbeddings
+from langchain_openai import OpenAI
 from langchain.chains import RetrievalQA
+from langchain.chains.question_answering.stuff_prompt import PROMPT_SELECTOR
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from typing import Any, List, Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 import os
 from dotenv import load_dotenv
 import logging
+import threading
+import time
 import traceback
 
 # Configuração do logging para monitoramento e debugging
@@ -11,52 +22,216 @@ logger = logging.getLogger(__name__)
 # Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
 
+# Etapas de uma consulta medidas pelo RAGEngine
+QUERY_STAGES = ("retrieval", "rerank", "generation")
+# Número padrão de candidatos recuperados para o re-ranking
+DEFAULT_RERANK_CANDIDATES = 20
+
+# Tempos das etapas da consulta em andamento, preenchidos pelo retriever (veja RAGEngine._collect_stages)
+_query_stages = ContextVar("query_stages", default=None)
+
+class StageTimings:
+    """
+    Tempos acumulados de cada etapa das consultas (recuperação, re-ranking e geração), para
+    calibrar o número de candidatos do re-ranking contra a latência.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Etapa -> [consultas, segundos acumulados, maior tempo de uma medição]
+        self._stages = {stage: [0, 0.0, 0.0] for stage in QUERY_STAGES}
+
+    def record(self, stage, seconds, count=1):
+        """
+        Registra o tempo de uma etapa.
+
+        Parâmetros:
+            stage (str): A etapa.
+            seconds (float): O tempo, em segundos.
+            count (int): O número de consultas medidas juntas (em um lote, o tempo é dividido entre elas).
+        """
+        with self._lock:
+            totals = self._stages[stage]
+            totals[0] += count
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds / count)
+
+    def stats(self):
+        """
+        Retorna os tempos de cada etapa.
+
+        Retorna:
+            dict: Etapa -> número de consultas, tempo total, médio e máximo, em milissegundos.
+        """
+        with self._lock:
+            return {
+                stage: {
+                    "count": count,
+                    "total_ms": round(total * 1000, 3),
+                    "mean_ms": round(total * 1000 / count, 3) if count else 0.0,
+                    "max_ms": round(longest * 1000, 3),
+                }
+                for stage, (count, total, longest) in self._stages.items()
+            }
+
+class VectorDBRetriever(BaseRetriever):
+    """
+    Retriever que busca no snapshot do VectorDB publicado no momento de cada consulta.
+
+    Documentos adicionados ao VectorDB ficam visíveis na consulta seguinte, sem recriar o
+    retriever nem o QA Chain, e uma consulta em andamento nunca vê um índice parcial.
+
+    O modo "vector" usa apenas a busca vetorial; os modos "hybrid" e "lexical" usam também
+    o índice BM25 do VectorDB (veja VectorDB.retrieve). Um filtro de metadados pode ser
+    passado a cada consulta, como em `retriever.invoke(query, filter={...})`.
+
+    Com um re-ranker, são recuperados candidate_k candidatos, e apenas os k mais relevantes
+    segundo o re-ranker chegam ao LLM. Os tempos da recuperação e do re-ranking são
+    registrados em timings.
+    """
+    vector_db: Any
+    k: int = 4
+    mode: str = "vector"
+    reranker: Any = None
+    candidate_k: int = DEFAULT_RERANK_CANDIDATES
+    timings: Any = None
+
+    @property
+    def fetch_k(self):
+        """O número de documentos recuperados: os candidatos do re-ranking, ou k sem re-ranker."""
+        return max(self.candidate_k, self.k) if self.reranker is not None else self.k
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, filter: Optional[dict] = None
+    ) -> List[Document]:
+        vector_store = self.vector_db.get_vector_store()
+        if vector_store is None:
+            return []
+        start = time.perf_counter()
+        if self.mode != "vector" or filter is not None:
+            documents = self.vector_db.retrieve(
+                query, k=self.fetch_k, mode=self.mode, vector_store=vector_store, filter=filter
+            )
+        else:
+            documents = vector_store.similarity_search(query, k=self.fetch_k)
+        self.record("retrieval", time.perf_counter() - start)
+        return self.rerank(query, documents)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, filter: Optional[dict] = None
+    ) -> List[Document]:
+        vector_store = self.vector_db.get_vector_store()
+        if vector_store is None:
+            return []
+        start = time.perf_counter()
+        if self.mode != "vector" or filter is not None:
+            documents = await self.vector_db.aretrieve(
+                query, k=self.fetch_k, mode=self.mode, vector_store=vector_store, filter=filter
+            )
+        else:
+            documents = await vector_store.asimilarity_search(query, k=self.fetch_k)
+        self.record("retrieval", time.perf_counter() - start)
+        return await self.arerank(query, documents)
+
+    def rerank(self, query, documents):
+        """Mantém os k candidatos mais relevantes segundo o re-ranker; sem re-ranker, retorna os documentos."""
+        if self.reranker is None:
+            return documents
+        start = time.perf_counter()
+        documents = [doc for doc, _ in self.reranker.rerank(query, documents, self.k)]
+        self.record("rerank", time.perf_counter() - start)
+        return documents
+
+    async def arerank(self, query, documents):
+        """Versão assíncrona de rerank."""
+        if self.reranker is None:
+            return documents
+        start = time.perf_counter()
+        documents = [doc for doc, _ in await self.reranker.arerank(query, documents, self.k)]
+        self.record("rerank", time.perf_counter() - start)
+        return documents
+
+    def record(self, stage, seconds, count=1):
+        """Registra o tempo de uma etapa nos tempos acumulados e nos da consulta em andamento."""
+        if self.timings is not None:
+            self.timings.record(stage, seconds, count)
+        stages = _query_stages.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
 class RAGEngine:
-    def __init__(self, vector_db):
+    def __init__(self, vector_db, answer_cache=None, retrieval_mode="vector", batch_concurrency=8,
+                 reranker=None, rerank_candidates=DEFAULT_RERANK_CANDIDATES, llm=None):
         """
         Inicializa o RAGEngine com um banco de dados vetorial.
 
         Este método configura os componentes necessários para o sistema RAG,
-        incluindo o modelo de linguagem, embeddings e o chain de pergunta e resposta.
+        incluindo o modelo de linguagem e o chain de pergunta e resposta. As consultas são
+        embedadas pelo modelo de embeddings do VectorDB.
+        Os clientes e o chain são criados uma única vez: cada consulta lê o snapshot
+        atual do banco de dados vetorial, então novos documentos não exigem reinicialização.
 
         Parâmetros:
             vector_db: Um objeto que representa o banco de dados vetorial.
+            answer_cache (AnswerCache, opcional): Cache de respostas consultado antes da recuperação
+                                     e do LLM, invalidado quando a versão do VectorDB muda.
+            retrieval_mode (str): "vector", "hybrid" (BM25 + vetorial com Reciprocal Rank Fusion)
+                                     ou "lexical" (apenas BM25 quando confiante, sem embedar a consulta).
+            batch_concurrency (int): Número padrão de respostas geradas simultaneamente pelo LLM
+                                     em query_many e aquery_many.
+            reranker (CrossEncoderReranker | BlendReranker, opcional): Re-ranker aplicado entre a
+                                     recuperação e a geração (veja src.reranker).
+            rerank_candidates (int): Número de candidatos recuperados para o re-ranking, dos
+                                     quais apenas os mais relevantes chegam ao LLM.
+            llm (BaseLLM, opcional): O modelo de linguagem, que pode ser compartilhado pelos
+                                     motores de várias coleções. Se omitido, cria um cliente OpenAI.
 
         Lança:
-            ValueError: Se a chave da API do OpenAI não for encontrada nas variáveis de ambiente.
+            ValueError: Se o llm for omitido e a chave da API do OpenAI não for encontrada nas
+                variáveis de ambiente.
 
         Retorna:
             None
         """
-        # Obtém a chave da API do OpenAI das variáveis de ambiente
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
-        
-        # Inicializa o modelo de linguagem OpenAI
-        self.llm = OpenAI(api_key=api_key)
-        
-        # Inicializa o modelo de embeddings OpenAI
-        self.embeddings = OpenAIEmbeddings(openai_api_key=api_key)
+        if llm is None:
+            # Obtém a chave da API do OpenAI das variáveis de ambiente
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
+
+            # Inicializa o modelo de linguagem OpenAI
+            llm = OpenAI(api_key=api_key)
+        self.llm = llm
         
-        # Obtém o armazenamento de vetores do banco de dados vetorial
-        self.vector_store = vector_db.get_vector_store()
+        self.vector_db = vector_db
+        self.answer_cache = answer_cache
+        self.batch_concurrency = batch_concurrency
         
         # Verifica se o banco de dados vetorial está vazio
-        if self.vector_store is None:
-            logger.warning("VectorDB está vazio. O RAGEngine não pode ser inicializado completamente.")
-            self.qa_chain = None
-        else:
-            # Cria a cadeia de pergunta e resposta (QA Chain)
-            self.qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm, # Usa o modelo de linguagem OpenAI
-                chain_type="stuff",  # Usa o método "stuff" para combinar documentos
-                retriever=self.vector_store.as_retriever(), # Usa o armazenamento de vetores
-                return_source_documents=True,  # Retorna os documentos fonte usados
-                verbose=True  # Ativa logs detalhados para debugging
-            )
+        if vector_db.get_vector_store() is None:
+            logger.warning("VectorDB está vazio. As consultas serão respondidas após o primeiro upload.")
+
+        # Tempos de cada etapa das consultas, reportados por stats
+        self.timings = StageTimings()
 
-    def query(self, question):
+        # Retriever e prompt compartilhados pelo QA Chain e pelo streaming
+        self.retriever = VectorDBRetriever(
+            vector_db=vector_db, mode=retrieval_mode, reranker=reranker, candidate_k=rerank_candidates,
+            timings=self.timings,
+        ) # Lê o snapshot atual a cada consulta
+        self.prompt = PROMPT_SELECTOR.get_prompt(self.llm)
+
+        # Cria a cadeia de pergunta e resposta (QA Chain)
+        self.qa_chain = RetrievalQA.from_chain_type(
+            llm=self.llm, # Usa o modelo de linguagem OpenAI
+            chain_type="stuff",  # Usa o método "stuff" para combinar documentos
+            retriever=self.retriever,
+            return_source_documents=True,  # Retorna os documentos fonte usados
+            chain_type_kwargs={"prompt": self.prompt},
+            verbose=True  # Ativa logs detalhados para debugging
+        )
+
+    def query(self, question, filter=None):
         """
         Processa uma consulta utilizando o QA Chain.
 
@@ -65,6 +240,8 @@ class RAGEngine:
 
         Parâmetros:
             question (str): A pergunta a ser processada.
+            filter (dict, opcional): Filtro de metadados que restringe os documentos recuperados
+                (veja MetadataIndex). Consultas com filtro não usam o cache de respostas.
 
         Retorna:
             dict: Um dicionário contendo a resposta processada e as fontes utilizadas.
@@ -78,56 +255,435 @@ class RAGEngine:
             Exception: Se ocorrer um erro durante o processamento da consulta.
         """
         try:
-            # Verifica se o QA Chain foi inicializado corretamente
-            if self.qa_chain is None:
-                logger.warning("QA Chain não inicializada")
-                return {
-                    "answer": "Desculpe, não há documentos para responder à sua pergunta.",
-                    "sources": []
-                }
+            # Verifica se já há documentos no banco de dados vetorial
+            if self.vector_db.get_vector_store() is None:
+                logger.warning("VectorDB está vazio")
+                return self._empty_response()
             
+            if filter is not None:
+                # O QA Chain não repassa argumentos ao retriever: a recuperação filtrada é feita
+                # diretamente, com o mesmo prompt do chain
+                logger.info(f"Processando consulta com filtro {filter}: {question}")
+                start = time.perf_counter()
+                with self._collect_stages() as stages:
+                    documents = self.retriever.invoke(question, filter=filter)
+                    answer = self.llm.invoke(self._build_prompt(question, documents))
+                self._report_stages(question, stages, time.perf_counter() - start)
+                return {"answer": answer, "sources": self._format_sources(documents)}
+
+            # Consulta o cache de respostas antes da recuperação e do LLM
+            if self.answer_cache is not None:
+                version = self.vector_db.version
+                cached = self.answer_cache.get(question, version)
+                if cached is not None:
+                    logger.info(f"Resposta em cache para a consulta: {question}")
+                    return cached
+
             # Loga a consulta para fins de debugging
             logger.info(f"Processando consulta: {question}")
             
             # Invoca o QA Chain para processar a consulta
             # Usa 'invoke' em vez de chamar diretamente para compatibilidade com versões mais recentes do LangChain
-            result = self.qa_chain.invoke({"query": question})
-            logger.info(f"Resposta bruta do QA Chain: {result}")
-            
-            # Extrai a resposta gerada
-            answer = result['result']
-            
-            # Obtém os documentos fonte usados para gerar a resposta
-            # Se não houver documentos fonte, usa uma lista vazia
-            source_documents = result.get('source_documents', [])
-            
-            logger.info(f"Número de documentos fonte: {len(source_documents)}")
-            
-            # Processa os documentos fonte para extrair informações relevantes
-            sources = []
-            for doc in source_documents:
-                # Extrai metadados do documento, se disponíveis
-                metadata = doc.metadata if hasattr(doc, 'metadata') else {}
-                logger.info(f"Metadados do documento: {metadata}")
-                
-                # Cria um dicionário com informações da fonte
-                sources.append({
-                    "title": metadata.get("source", "Título não disponível"),
-                    "content": doc.page_content if hasattr(doc, 'page_content') else "Conteúdo não disponível",
-                    "metadata": metadata
-                })
-            
-            # Loga as fontes processadas para debugging
-            logger.info(f"Fontes processadas: {sources}")
-            
-            # Retorna um dicionário com a resposta e as fontes
-            return {
-                "answer": answer,
-                "sources": sources
-            }
+            start = time.perf_counter()
+            with self._collect_stages() as stages:
+                result = self.qa_chain.invoke({"query": question})
+            self._report_stages(question, stages, time.perf_counter() - start)
+            response = self._format_result(result)
+            if self.answer_cache is not None:
+                self.answer_cache.put(question, version, response, time.perf_counter() - start)
+            return response
         except Exception as e:
             # Loga qualquer erro que ocorra durante o processamento
             logger.error(f"Erro ao processar consulta: {str(e)}")
             logger.error(f"Traceback: {traceback.format_exc()}")
             # Re-lança a exceção para ser tratada em um nível superior
-            raise
\ No newline at end of file
+            raise
+
+    async def aquery(self, question, filter=None):
+        """
+        Versão assíncrona de query, que usa os clientes assíncronos do LLM e dos embeddings.
+
+        Parâmetros:
+            question (str): A pergunta a ser processada.
+            filter (dict, opcional): Filtro de metadados, como em query.
+
+        Retorna:
+            dict: Um dicionário contendo a resposta processada e as fontes utilizadas,
+                no mesmo formato de query.
+
+        Lança:
+            Exception: Se ocorrer um erro durante o processamento da consulta.
+        """
+        try:
+            if self.vector_db.get_vector_store() is None:
+                logger.warning("VectorDB está vazio")
+                return self._empty_response()
+
+            if filter is not None:
+                logger.info(f"Processando consulta com filtro {filter}: {question}")
+                start = time.perf_counter()
+                with self._collect_stages() as stages:
+                    documents = await self.retriever.ainvoke(question, filter=filter)
+                    answer = await self.llm.ainvoke(self._build_prompt(question, documents))
+                self._report_stages(question, stages, time.perf_counter() - start)
+                return {"answer": answer, "sources": self._format_sources(documents)}
+
+            if self.answer_cache is not None:
+                version = self.vector_db.version
+                cached = await self.answer_cache.aget(question, version)
+                if cached is not None:
+                    logger.info(f"Resposta em cache para a consulta: {question}")
+                    return cached
+
+            logger.info(f"Processando consulta: {question}")
+            start = time.perf_counter()
+            with self._collect_stages() as stages:
+                result = await self.qa_chain.ainvoke({"query": question})
+            self._report_stages(question, stages, time.perf_counter() - start)
+            response = self._format_result(result)
+            if self.answer_cache is not None:
+                await self.answer_cache.aput(question, version, response, time.perf_counter() - start)
+            return response
+        except Exception as e:
+            logger.error(f"Erro ao processar consulta: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            raise
+
+    async def astream(self, question, filter=None):
+        """
+        Processa uma consulta em streaming: as fontes são enviadas assim que recuperadas e a
+        resposta é enviada token a token, à medida que o LLM a gera.
+
+        Fechar o gerador (por exemplo, quando o cliente desconecta) fecha o stream do LLM,
+        cancelando a geração no provedor.
+
+        Parâmetros:
+            question (str): A pergunta a ser processada.
+            filter (dict, opcional): Filtro de metadados, como em query.
+
+        Retorna:
+            AsyncIterator[dict]: Eventos com as chaves 'event' e 'data', nesta ordem:
+                - sources: a lista de fontes, no mesmo formato de query.
+                - token: um trecho da resposta (um ou mais eventos).
+                - done: a resposta completa, no mesmo formato de query.
+
+        Lança:
+            Exception: Se ocorrer um erro durante o processamento da consulta.
+        """
+        try:
+            if self.vector_db.get_vector_store() is None:
+                logger.warning("VectorDB está vazio")
+                response = self._empty_response()
+            else:
+                response = None
+                if self.answer_cache is not None and filter is None:
+                    version = self.vector_db.version
+                    response = await self.answer_cache.aget(question, version)
+
+            # Resposta já conhecida: enviada de uma vez, sem recuperação nem LLM
+            if response is not None:
+                yield {"event": "sources", "data": response["sources"]}
+                yield {"event": "token", "data": response["answer"]}
+                yield {"event": "done", "data": response}
+                return
+
+            logger.info(f"Processando consulta em streaming: {question}")
+            start = time.perf_counter()
+            # Os tempos são coletados apenas durante a recuperação: o gerador pode ser retomado em outro contexto
+            with self._collect_stages() as stages:
+                documents = await self.retriever.ainvoke(question, filter=filter)
+            sources = self._format_sources(documents)
+            yield {"event": "sources", "data": sources}
+
+            prompt = self._build_prompt(question, documents)
+            tokens = []
+            llm_stream = self.llm.astream(prompt)
+            try:
+                async for token in llm_stream:
+                    tokens.append(token)
+                    yield {"event": "token", "data": token}
+            finally:
+                # Fecha explicitamente o stream do LLM, encerrando a requisição ao provedor
+                await llm_stream.aclose()
+
+            self._report_stages(question, stages, time.perf_counter() - start)
+            response = {"answer": "".join(tokens), "sources": sources}
+            if self.answer_cache is not None and filter is None:
+                await self.answer_cache.aput(question, version, response, time.perf_counter() - start)
+            yield {"event": "done", "data": response}
+        except GeneratorExit:
+            logger.info(f"Streaming da consulta interrompido: {question}")
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao processar consulta: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            raise
+
+    def query_many(self, questions, max_concurrency=None, filter=None):
+        """
+        Processa várias consultas de uma vez, compartilhando a recuperação.
+
+        As perguntas são embedadas em lotes e buscadas no índice em uma única chamada
+        (veja VectorDB.retrieve_many); as respostas são geradas pelo LLM em paralelo, até
+        max_concurrency de cada vez. Um erro em uma pergunta não interrompe as demais.
+
+        Parâmetros:
+            questions (list): As perguntas a serem processadas.
+            max_concurrency (int, opcional): Número máximo de chamadas simultâneas ao LLM.
+                                     Se omitido, usa batch_concurrency.
+            filter (dict, opcional): Filtro de metadados aplicado a todas as perguntas, como
+                                     em query. Lotes com filtro não usam o cache de respostas.
+
+        Retorna:
+            list: Um resultado por pergunta, na ordem recebida, com a chave 'question' e as
+                chaves 'answer' e 'sources' (no mesmo formato de query) ou 'error'.
+        """
+        if self.vector_db.get_vector_store() is None:
+            logger.warning("VectorDB está vazio")
+            return [{"question": question, **self._empty_response()} for question in questions]
+
+        version = self.vector_db.version
+        cache = self.answer_cache if filter is None else None
+        results, pending = self._cached_many(
+            questions, cache.get_many(questions, version) if cache is not None else None
+        )
+        if not pending:
+            return results
+
+        logger.info(f"Processando {len(pending)} consultas em lote")
+        start = time.perf_counter()
+        try:
+            retrieved = self.vector_db.retrieve_many(
+                [questions[i] for i in pending], k=self.retriever.fetch_k, mode=self.retriever.mode, filter=filter
+            )
+            self.retriever.record("retrieval", time.perf_counter() - start, len(pending))
+            retrieved = [self.retriever.rerank(questions[i], documents) for i, documents in zip(pending, retrieved)]
+        except Exception as e:
+            return self._fail_many(results, questions, pending, e)
+        generation_start = time.perf_counter()
+
+        def generate(item):
+            i, documents = item
+            try:
+                answer = self.llm.invoke(self._build_prompt(questions[i], documents))
+                return i, {"answer": answer, "sources": self._format_sources(documents)}
+            except Exception as e:
+                logger.error(f"Erro ao processar consulta '{questions[i]}': {str(e)}")
+                return i, e
+
+        with ThreadPoolExecutor(max_workers=max_concurrency or self.batch_concurrency) as executor:
+            generated = list(executor.map(generate, zip(pending, retrieved)))
+        self.retriever.record("generation", time.perf_counter() - generation_start, len(pending))
+        responses = self._collect_many(results, questions, generated)
+        if cache is not None and responses:
+            latency = (time.perf_counter() - start) / len(pending)
+            cache.put_many([(q, r, latency) for q, r in responses], version)
+        return results
+
+    async def aquery_many(self, questions, max_concurrency=None, filter=None):
+        """
+        Versão assíncrona de query_many, que usa os clientes assíncronos do LLM e dos
+        embeddings.
+
+        Parâmetros e retorno iguais aos de query_many.
+        """
+        if self.vector_db.get_vector_store() is None:
+            logger.warning("VectorDB está vazio")
+            return [{"question": question, **self._empty_response()} for question in questions]
+
+        version = self.vector_db.version
+        cache = self.answer_cache if filter is None else None
+        cached = await cache.aget_many(questions, version) if cache is not None else None
+        results, pending = self._cached_many(questions, cached)
+        if not pending:
+            return results
+
+        logger.info(f"Processando {len(pending)} consultas em lote")
+        start = time.perf_counter()
+        try:
+            retrieved = await self.vector_db.aretrieve_many(
+                [questions[i] for i in pending], k=self.retriever.fetch_k, mode=self.retriever.mode, filter=filter
+            )
+            self.retriever.record("retrieval", time.perf_counter() - start, len(pending))
+            retrieved = await asyncio.gather(*(
+                self.retriever.arerank(questions[i], documents) for i, documents in zip(pending, retrieved)
+            ))
+        except Exception as e:
+            return self._fail_many(results, questions, pending, e)
+        generation_start = time.perf_counter()
+
+        semaphore = asyncio.Semaphore(max_concurrency or self.batch_concurrency)
+
+        async def generate(i, documents):
+            async with semaphore:
+                try:
+                    answer = await self.llm.ainvoke(self._build_prompt(questions[i], documents))
+                    return i, {"answer": answer, "sources": self._format_sources(documents)}
+                except Exception as e:
+                    logger.error(f"Erro ao processar consulta '{questions[i]}': {str(e)}")
+                    return i, e
+
+        generated = await asyncio.gather(*(generate(i, documents) for i, documents in zip(pending, retrieved)))
+        self.retriever.record("generation", time.perf_counter() - generation_start, len(pending))
+        responses = self._collect_many(results, questions, generated)
+        if cache is not None and responses:
+            latency = (time.perf_counter() - start) / len(pending)
+            await cache.aput_many([(q, r, latency) for q, r in responses], version)
+        return results
+
+    def stats(self):
+        """
+        Retorna a configuração da recuperação e os tempos de cada etapa das consultas.
+
+        Retorna:
+            dict: O modo de recuperação, o re-ranker (None se desativado), o número de candidatos
+                recuperados e de documentos enviados ao LLM, e os tempos de 'retrieval', 'rerank'
+                e 'generation' (veja StageTimings.stats). Nos lotes, o tempo de cada etapa é
+                dividido entre as perguntas.
+        """
+        return {
+            "retrieval_mode": self.retriever.mode,
+            "reranker": type(self.retriever.reranker).__name__ if self.retriever.reranker is not None else None,
+            "candidates": self.retriever.fetch_k,
+            "k": self.retriever.k,
+            "stages": self.timings.stats(),
+        }
+
+    @contextmanager
+    def _collect_stages(self):
+        """Coleta os tempos das etapas registradas pelo retriever durante o bloco, para uma única consulta."""
+        stages = {}
+        token = _query_stages.set(stages)
+        try:
+            yield stages
+        finally:
+            _query_stages.reset(token)
+
+    def _report_stages(self, question, stages, elapsed):
+        """
+        Registra o tempo da geração, o restante do tempo da consulta após a recuperação e o
+        re-ranking, e loga os tempos de cada etapa.
+        """
+        generation = max(elapsed - sum(stages.values()), 0.0)
+        self.timings.record("generation", generation)
+        logger.info(
+            f"Etapas da consulta '{question}': recuperação {stages.get('retrieval', 0.0) * 1000:.1f} ms, "
+            f"re-ranking {stages.get('rerank', 0.0) * 1000:.1f} ms, geração {generation * 1000:.1f} ms"
+        )
+
+    def _cached_many(self, questions, cached):
+        """
+        Preenche os resultados com as respostas em cache.
+
+        Retorna:
+            tuple: (resultados, com None nas posições pendentes, índices das perguntas pendentes).
+        """
+        results = [None] * len(questions)
+        pending = []
+        for i, question in enumerate(questions):
+            if cached is not None and cached[i] is not None:
+                results[i] = {"question": question, **cached[i]}
+            else:
+                pending.append(i)
+        if len(pending) < len(questions):
+            logger.info(f"{len(questions) - len(pending)} respostas em cache no lote")
+        return results, pending
+
+    def _fail_many(self, results, questions, pending, error):
+        """
+        Marca todas as perguntas pendentes com o erro da recuperação compartilhada.
+        """
+        logger.error(f"Erro ao recuperar documentos do lote: {str(error)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        for i in pending:
+            results[i] = {"question": questions[i], "error": str(error)}
+        return results
+
+    def _collect_many(self, results, questions, generated):
+        """
+        Preenche os resultados com as respostas geradas ou os erros de cada pergunta.
+
+        Retorna:
+            list: Tuplas (pergunta, resposta) das respostas geradas com sucesso.
+        """
+        responses = []
+        for i, response in generated:
+            if isinstance(response, Exception):
+                results[i] = {"question": questions[i], "error": str(response)}
+            else:
+                results[i] = {"question": questions[i], **response}
+                responses.append((questions[i], response))
+        return responses
+
+    def _build_prompt(self, question, documents):
+        """
+        Monta o mesmo prompt do chain "stuff": os documentos separados por linhas em branco.
+        """
+        return self.prompt.format(
+            context="\n\n".join(doc.page_content for doc in documents),
+            question=question,
+        )
+
+    def _empty_response(self):
+        """
+        Retorna a resposta padrão quando não há documentos para responder à pergunta.
+        """
+        return {
+            "answer": "Desculpe, não há documentos para responder à sua pergunta.",
+            "sources": []
+        }
+
+    def _format_result(self, result):
+        """
+        Converte o resultado bruto do QA Chain na resposta com as fontes utilizadas.
+
+        Parâmetros:
+            result (dict): O resultado do QA Chain, com as chaves 'result' e 'source_documents'.
+
+        Retorna:
+            dict: Um dicionário contendo a resposta processada e as fontes utilizadas.
+        """
+        logger.info(f"Resposta bruta do QA Chain: {result}")
+        
+        # Extrai a resposta gerada
+        answer = result['result']
+        
+        # Obtém os documentos fonte usados para gerar a resposta
+        # Se não houver documentos fonte, usa uma lista vazia
+        source_documents = result.get('source_documents', [])
+        
+        logger.info(f"Número de documentos fonte: {len(source_documents)}")
+        
+        # Retorna um dicionário com a resposta e as fontes
+        return {
+            "answer": answer,
+            "sources": self._format_sources(source_documents)
+        }
+
+    def _format_sources(self, source_documents):
+        """
+        Converte os documentos recuperados na lista de fontes da resposta.
+
+        Parâmetros:
+            source_documents (list): Os documentos recuperados.
+
+        Retorna:
+            list: Uma lista de dicionários com as chaves 'title', 'content' e 'metadata'.
+        """
+        # Processa os documentos fonte para extrair informações relevantes
+        sources = []
+        for doc in source_documents:
+            # Extrai metadados do documento, se disponíveis
+            metadata = doc.metadata if hasattr(doc, 'metadata') else {}
+            logger.info(f"Metadados do documento: {metadata}")
+            
+            # Cria um dicionário com informações da fonte
+            sources.append({
+                "title": metadata.get("source", "Título não disponível"),
+                "content": doc.page_content if hasattr(doc, 'page_content') else "Conteúdo não disponível",
+                "metadata": metadata
+            })
+        
+        # Loga as fontes processadas para debugging
+        logger.info(f"Fontes processadas: {sources}")
+        return sources
@@ -0,0 +1,174 @@
+import asyncio
+import numpy as np
+import logging
+from src.bm25_index import BM25Index, lexical_tokens
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# "cross-encoder": modelo local que pontua cada par (pergunta, segmento); "blend": combinação
+# da pontuação BM25 com a similaridade dos embeddings, sem dependências adicionais
+RERANKER_KINDS = ("cross-encoder", "blend")
+# Cross-encoder pequeno, treinado no MS MARCO, que roda em CPU
+DEFAULT_CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Peso da pontuação BM25 na combinação; o restante é o da similaridade dos embeddings
+DEFAULT_LEXICAL_WEIGHT = 0.3
+
+def top_documents(documents, scores, k):
+    """
+    Ordena os documentos pela pontuação, em ordem decrescente, mantendo a ordem original nos empates.
+
+    Retorna:
+        list: Os k primeiros (Document, pontuação).
+    """
+    order = sorted(range(len(documents)), key=lambda i: -scores[i])[:k]
+    return [(documents[i], float(scores[i])) for i in order]
+
+def min_max(scores):
+    """Normaliza as pontuações para o intervalo [0, 1]; pontuações iguais viram 0."""
+    scores = np.asarray(scores, dtype=np.float64)
+    spread = scores.max() - scores.min() if len(scores) else 0.0
+    if spread <= 0:
+        return np.zeros(len(scores))
+    return (scores - scores.min()) / spread
+
+class CrossEncoderReranker:
+    """
+    Re-ranking por um cross-encoder local (sentence-transformers), em CPU: cada par (pergunta,
+    segmento) é pontuado pelo modelo, que vê os dois textos juntos e é mais preciso que a
+    similaridade entre embeddings calculados separadamente.
+    """
+
+    def __init__(self, model_name=DEFAULT_CROSS_ENCODER_MODEL, batch_size=32, max_length=512):
+        """
+        Parâmetros:
+            model_name (str): O nome ou o diretório do modelo.
+            batch_size (int): Número de pares pontuados por lote.
+            max_length (int): Número máximo de tokens de cada par.
+
+        Lança:
+            ImportError: Se o pacote sentence-transformers não estiver instalado.
+        """
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "O re-ranking por cross-encoder requer o pacote sentence-transformers (pip install sentence-transformers)"
+            ) from e
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.batch_size = batch_size
+
+    def rerank(self, query, documents, k):
+        """
+        Reordena os documentos candidatos pela relevância para a pergunta.
+
+        Parâmetros:
+            query (str): A pergunta.
+            documents (list): Os documentos candidatos.
+            k (int): O número de documentos retornados.
+
+        Retorna:
+            list: Os k documentos mais relevantes, como (Document, pontuação), em ordem decrescente.
+        """
+        if not documents:
+            return []
+        scores = self.model.predict(
+            [(query, doc.page_content) for doc in documents], batch_size=self.batch_size, show_progress_bar=False
+        )
+        return top_documents(documents, scores, k)
+
+    async def arerank(self, query, documents, k):
+        """Versão assíncrona de rerank, que roda o modelo em uma thread."""
+        return await asyncio.to_thread(self.rerank, query, documents, k)
+
+class BlendReranker:
+    """
+    Re-ranking leve, sem modelo adicional: combina a pontuação BM25 de cada candidato, calculada
+    entre os próprios candidatos, com a similaridade de cosseno entre o embedding da pergunta
+    e o do segmento, ambas normalizadas para [0, 1].
+
+    Os embeddings são os do VectorDB: com o cache de embeddings, a pergunta (embedada na
+    recuperação) e os segmentos (embedados na ingestão) não geram novas chamadas ao modelo.
+    """
+
+    def __init__(self, embeddings, preprocessor, lexical_weight=DEFAULT_LEXICAL_WEIGHT):
+        """
+        Parâmetros:
+            embeddings (Embeddings): O modelo de embeddings do VectorDB.
+            preprocessor (TextPreprocessor): O pré-processador do VectorDB, aplicado à pergunta
+                antes da pontuação BM25.
+            lexical_weight (float): Peso da pontuação BM25, entre 0 e 1.
+
+        Lança:
+            ValueError: Se o peso estiver fora do intervalo [0, 1].
+        """
+        if not 0.0 <= lexical_weight <= 1.0:
+            raise ValueError(f"Peso léxico inválido: {lexical_weight}. Use um valor entre 0 e 1")
+        self.embeddings = embeddings
+        self.preprocessor = preprocessor
+        self.lexical_weight = lexical_weight
+
+    def rerank(self, query, documents, k):
+        """
+        Reordena os documentos candidatos pela relevância para a pergunta.
+
+        Parâmetros e retorno iguais aos de CrossEncoderReranker.rerank.
+        """
+        if not documents:
+            return []
+        query_vector = self.embeddings.embed_query(query)
+        document_vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+        return self._blend(query, documents, query_vector, document_vectors, k)
+
+    async def arerank(self, query, documents, k):
+        """Versão assíncrona de rerank, que usa o cliente assíncrono do modelo de embeddings."""
+        if not documents:
+            return []
+        query_vector = await self.embeddings.aembed_query(query)
+        document_vectors = await self.embeddings.aembed_documents([doc.page_content for doc in documents])
+        return self._blend(query, documents, query_vector, document_vectors, k)
+
+    def _blend(self, query, documents, query_vector, document_vectors, k):
+        """Combina as pontuações BM25 e de similaridade dos candidatos."""
+        query_vector = np.asarray(query_vector, dtype=np.float64)
+        document_vectors = np.asarray(document_vectors, dtype=np.float64)
+        norms = np.linalg.norm(document_vectors, axis=1) * np.linalg.norm(query_vector)
+        similarity = document_vectors @ query_vector / np.maximum(norms, 1e-12)
+
+        lexical = np.zeros(len(documents))
+        index = BM25Index()
+        index.add([lexical_tokens(doc.page_content) for doc in documents])
+        results, _ = index.search(lexical_tokens(self.preprocessor.preprocess_query(query)), k=len(documents))
+        for position, score in results:
+            lexical[position] = score
+
+        scores = self.lexical_weight * min_max(lexical) + (1.0 - self.lexical_weight) * min_max(similarity)
+        return top_documents(documents, scores, k)
+
+def create_reranker(kind, embeddings=None, preprocessor=None, model_name=DEFAULT_CROSS_ENCODER_MODEL,
+                    lexical_weight=DEFAULT_LEXICAL_WEIGHT):
+    """
+    Cria o re-ranker configurado. Sem o pacote sentence-transformers, o cross-encoder é
+    substituído pela combinação BM25 + embeddings.
+
+    Parâmetros:
+        kind (str): "cross-encoder" ou "blend".
+        embeddings (Embeddings, opcional): O modelo de embeddings, usado por "blend".
+        preprocessor (TextPreprocessor, opcional): O pré-processador, usado por "blend".
+        model_name (str): O modelo do cross-encoder.
+        lexical_weight (float): O peso da pontuação BM25 em "blend".
+
+    Retorna:
+        CrossEncoderReranker | BlendReranker: O re-ranker.
+
+    Lança:
+        ValueError: Se o tipo não for suportado.
+    """
+    if kind not in RERANKER_KINDS:
+        raise ValueError(f"Re-ranker não suportado: {kind}. Use um de {RERANKER_KINDS}")
+    if kind == "cross-encoder":
+        try:
+            return CrossEncoderReranker(model_name)
+        except ImportError as e:
+            logger.warning(f"{str(e)}; usando a combinação BM25 + embeddings")
+    return BlendReranker(embeddings, preprocessor, lexical_weight)
@@ -0,0 +1,431 @@
+import faiss
+import numpy as np
+import json
+import mmap
+import os
+import threading
+import logging
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+
+def atomic_write(path, write_fn, mode="wb"):
+    """
+    Escreve um arquivo de forma atômica: grava em um arquivo temporário e o renomeia.
+
+    Um crash durante a escrita deixa apenas o arquivo temporário, nunca um arquivo final corrompido.
+
+    Parâmetros:
+        path (str): Caminho final do arquivo.
+        write_fn (callable): Função que recebe o arquivo aberto e escreve o conteúdo.
+        mode (str): Modo de abertura do arquivo temporário.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode) as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(path)
+
+def atomic_write_index(index, path):
+    """
+    Grava um índice FAISS de forma atômica (arquivo temporário + renomeação).
+
+    Parâmetros:
+        index (faiss.Index): O índice a ser gravado.
+        path (str): Caminho final do arquivo.
+    """
+    tmp_path = f"{path}.tmp"
+    faiss.write_index(index, tmp_path)
+    fd = os.open(tmp_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+    _fsync_directory(path)
+
+def read_index_mmap(path):
+    """
+    Abre um índice FAISS somente para leitura, mapeando-o em memória.
+
+    Usa o mapeamento sem cópia dos códigos (IO_FLAG_MMAP_IFC) quando a versão do FAISS o
+    oferece e, caso contrário, IO_FLAG_MMAP, que mapeia as listas invertidas dos índices IVF.
+
+    Parâmetros:
+        path (str): Caminho do arquivo do índice.
+
+    Retorna:
+        faiss.Index: O índice somente leitura.
+    """
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    return faiss.read_index(path, flags)
+
+class SnapshotDocuments:
+    """
+    Leitura sob demanda dos documentos de um snapshot, via mmap do `.jsonl` e dos offsets.
+    """
+
+    def __init__(self, jsonl_path, offsets_path):
+        """
+        Parâmetros:
+            jsonl_path (str): Caminho do arquivo de documentos do snapshot.
+            offsets_path (str): Caminho do arquivo de offsets das linhas.
+        """
+        self.offsets = np.memmap(offsets_path, dtype=np.uint64, mode="r")
+        self._file = open(jsonl_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, position):
+        """
+        Lê o documento de uma posição do índice.
+
+        Parâmetros:
+            position (int): A posição do documento no índice.
+
+        Retorna:
+            tuple: (id, texto, metadados).
+        """
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        record = json.loads(self._data[start:end])
+        return record["id"], record["text"], record["metadata"]
+
+def _fsync_directory(path):
+    """Garante que a renomeação de um arquivo no diretório chegue ao disco."""
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+class SegmentStore:
+    """
+    Persistência incremental e apenas de acréscimo para o índice FAISS e o docstore.
+
+    O diretório contém um snapshot compactado (índice FAISS + documentos) e uma lista de
+    segmentos com os vetores e documentos adicionados depois dele. Cada gravação apenas
+    acrescenta um novo segmento e troca o manifesto de forma atômica. Quando há segmentos
+    demais, uma thread em segundo plano os incorpora a um novo snapshot.
+
+    Estrutura do diretório:
+        manifest.json            Snapshot e segmentos ativos
+        snapshot-000003.faiss    Índice FAISS compactado
+        snapshot-000003.jsonl    Documentos do snapshot, na ordem do índice
+        snapshot-000003.ids      Ids dos documentos do snapshot, na ordem do índice
+        snapshot-000003.off      Offsets das linhas do .jsonl, para leitura sob demanda
+        seg-000004.vec           Vetores float32 do segmento
+        seg-000004.jsonl         Documentos do segmento, na ordem dos vetores
+    """
+
+    def __init__(self, directory, compact_threshold=8):
+        """
+        Parâmetros:
+            directory (str): Diretório de persistência.
+            compact_threshold (int): Número de segmentos a partir do qual a compactação é disparada.
+        """
+        self.directory = directory
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        """
+        Retorna True se o diretório já possui um manifesto.
+        """
+        return os.path.exists(self._path(MANIFEST_FILE))
+
+    def read_manifest(self):
+        """
+        Lê o manifesto atual ou retorna um manifesto vazio.
+
+        Retorna:
+            dict: O manifesto com as chaves 'dimension', 'next_id', 'snapshot' e 'segments'.
+        """
+        if not self.exists():
+            return {"format": FORMAT_VERSION, "dimension": None, "next_id": 1, "snapshot": None, "segments": []}
+        with open(self._path(MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        atomic_write(
+            self._path(MANIFEST_FILE),
+            lambda f: f.write(json.dumps(manifest, indent=2)),
+            mode="w",
+        )
+
+    @staticmethod
+    def _write_documents(f, ids, texts, metadatas):
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            f.write(json.dumps({"id": doc_id, "text": text, "metadata": metadata}, ensure_ascii=False) + "\n")
+
+    def append(self, ids, vectors, texts, metadatas):
+        """
+        Acrescenta um novo segmento com vetores e documentos.
+
+        Os arquivos do segmento são gravados antes do manifesto, de forma que um crash
+        no meio da gravação nunca deixa o manifesto apontando para dados incompletos.
+
+        Parâmetros:
+            ids (list): Identificadores dos documentos no docstore.
+            vectors (np.ndarray): Matriz float32 de formato (n, dimensão).
+            texts (list): Textos dos documentos.
+            metadatas (list): Metadados dos documentos.
+
+        Retorna:
+            str: O nome do segmento criado.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            manifest = self.read_manifest()
+            if manifest["dimension"] is None:
+                manifest["dimension"] = int(vectors.shape[1])
+            elif manifest["dimension"] != vectors.shape[1]:
+                raise ValueError(
+                    f"Dimensão dos vetores ({vectors.shape[1]}) difere da dimensão do índice ({manifest['dimension']})"
+                )
+            name = f"seg-{manifest['next_id']:06d}"
+            manifest["next_id"] += 1
+            atomic_write(self._path(f"{name}.vec"), lambda f: f.write(vectors.tobytes()))
+            atomic_write(
+                self._path(f"{name}.jsonl"),
+                lambda f: self._write_documents(f, ids, texts, metadatas),
+                mode="w",
+            )
+            manifest["segments"].append(name)
+            self._write_manifest(manifest)
+            pending_segments = len(manifest["segments"])
+
+        logger.info(f"Segmento {name} com {len(ids)} vetores gravado em {self.directory}")
+        if pending_segments >= self.compact_threshold:
+            self.compact(background=True)
+        return name
+
+    def write_snapshot(self, index, ids, texts, metadatas):
+        """
+        Substitui todo o conteúdo persistido por um snapshot do índice informado.
+
+        Usado na migração do formato antigo (save_local) e em reconstruções completas.
+
+        Parâmetros:
+            index (faiss.Index): O índice FAISS completo.
+            ids (list): Identificadores dos documentos, na ordem do índice.
+            texts (list): Textos dos documentos.
+            metadatas (list): Metadados dos documentos.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._compaction_lock, self._lock:
+            manifest = self.read_manifest()
+            name = f"snapshot-{manifest['next_id']:06d}"
+            manifest["next_id"] += 1
+            atomic_write_index(index, self._path(f"{name}.faiss"))
+            self._write_snapshot_documents(name, (
+                (json.dumps({"id": doc_id, "text": text, "metadata": metadata}, ensure_ascii=False) + "\n").encode("utf-8")
+                for doc_id, text, metadata in zip(ids, texts, metadatas)
+            ))
+            obsolete = self._files_of(manifest["snapshot"], manifest["segments"])
+            manifest["dimension"] = int(index.d)
+            manifest["snapshot"] = name
+            manifest["segments"] = []
+            self._write_manifest(manifest)
+        self._remove_files(obsolete)
+
+    def _write_snapshot_documents(self, name, lines):
+        """
+        Grava os documentos de um snapshot e os arquivos auxiliares da leitura sob demanda.
+
+        Além do `.jsonl`, grava o `.ids` (um id por linha, na ordem do índice) e o `.off`
+        (offsets uint64 de cada linha do `.jsonl`), usados pelo carregamento via mmap.
+
+        Parâmetros:
+            name (str): Nome do snapshot.
+            lines (iterable): Linhas JSON, em bytes, na ordem do índice.
+        """
+        ids = []
+        offsets = [0]
+
+        def write_documents(f):
+            for line in lines:
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+                ids.append(json.loads(line)["id"])
+        atomic_write(self._path(f"{name}.jsonl"), write_documents)
+        atomic_write(self._path(f"{name}.ids"), lambda f: f.write("".join(f"{doc_id}\n" for doc_id in ids)), mode="w")
+        atomic_write(self._path(f"{name}.off"), lambda f: f.write(np.asarray(offsets, dtype=np.uint64).tobytes()))
+
+    def _files_of(self, snapshot, segments):
+        files = []
+        if snapshot:
+            files += [f"{snapshot}.faiss", f"{snapshot}.jsonl", f"{snapshot}.ids", f"{snapshot}.off"]
+        for segment in segments:
+            files += [f"{segment}.vec", f"{segment}.jsonl"]
+        return files
+
+    def _remove_files(self, names):
+        for name in names:
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    def _read_vectors(self, segment, dimension):
+        return np.fromfile(self._path(f"{segment}.vec"), dtype=np.float32).reshape(-1, dimension)
+
+    def iter_documents(self, name):
+        """
+        Itera sobre os documentos de um snapshot ou segmento.
+
+        Retorna:
+            generator: Gera tuplas (id, texto, metadados) na ordem do índice.
+        """
+        with open(self._path(f"{name}.jsonl"), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                yield record["id"], record["text"], record["metadata"]
+
+    def load(self):
+        """
+        Carrega o snapshot e aplica todos os segmentos posteriores.
+
+        Retorna:
+            tuple: (índice FAISS ou None, lista de documentos (id, texto, metadados) na ordem do índice).
+        """
+        with self._lock:
+            manifest = self.read_manifest()
+        index = None
+        documents = []
+        if manifest["snapshot"]:
+            index = faiss.read_index(self._path(f"{manifest['snapshot']}.faiss"))
+            documents.extend(self.iter_documents(manifest["snapshot"]))
+        index = self._apply_segments(index, manifest)
+        for segment in manifest["segments"]:
+            documents.extend(self.iter_documents(segment))
+        return index, documents
+
+    def load_mmap(self):
+        """
+        Carrega o snapshot mapeando em memória o índice e os documentos, sem copiá-los para o heap.
+
+        O índice é aberto somente para leitura com mmap, e os documentos do snapshot são lidos
+        sob demanda. Processos que abrem o mesmo snapshot compartilham o page cache. Segmentos
+        ainda não compactados obrigam a copiar o índice para a memória antes de aplicá-los.
+
+        Retorna:
+            tuple: (índice FAISS ou None, se o índice está mapeado em memória,
+                    lista de ids na ordem do índice, SnapshotDocuments ou None,
+                    lista de documentos (id, texto, metadados) dos segmentos).
+        """
+        with self._lock:
+            manifest = self.read_manifest()
+        snapshot = manifest["snapshot"]
+        if snapshot and not os.path.exists(self._path(f"{snapshot}.off")):
+            # Snapshot sem arquivos auxiliares: recorre ao carregamento completo
+            index, documents = self.load()
+            return index, False, [doc_id for doc_id, _, _ in documents], None, documents
+
+        index = None
+        mapped = False
+        ids = []
+        snapshot_documents = None
+        if snapshot:
+            index = read_index_mmap(self._path(f"{snapshot}.faiss"))
+            mapped = True
+            snapshot_documents = SnapshotDocuments(self._path(f"{snapshot}.jsonl"), self._path(f"{snapshot}.off"))
+            with open(self._path(f"{snapshot}.ids"), "r", encoding="utf-8") as f:
+                ids = f.read().splitlines()
+        if manifest["segments"]:
+            logger.warning(f"{len(manifest['segments'])} segmentos não compactados: copiando o índice para a memória")
+            if index is not None:
+                index = faiss.deserialize_index(faiss.serialize_index(index))
+            mapped = False
+            index = self._apply_segments(index, manifest)
+        segment_documents = []
+        for segment in manifest["segments"]:
+            segment_documents.extend(self.iter_documents(segment))
+        ids.extend(doc_id for doc_id, _, _ in segment_documents)
+        return index, mapped, ids, snapshot_documents, segment_documents
+
+    def _apply_segments(self, index, manifest):
+        """Acrescenta ao índice os vetores de todos os segmentos do manifesto."""
+        for segment in manifest["segments"]:
+            vectors = self._read_vectors(segment, manifest["dimension"])
+            if index is None:
+                index = faiss.IndexFlatL2(manifest["dimension"])
+            index.add(vectors)
+        return index
+
+    def compact(self, background=False):
+        """
+        Incorpora os segmentos atuais a um novo snapshot.
+
+        Parâmetros:
+            background (bool): Se True, executa a compactação em uma thread em segundo plano.
+        """
+        if background:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(target=self._compact_safely, name="segment-compaction", daemon=True)
+            self._compaction_thread.start()
+        else:
+            self._compact()
+
+    def wait_for_compaction(self):
+        """Aguarda o término de uma compactação em segundo plano, se houver."""
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+
+    def _compact_safely(self):
+        try:
+            self._compact()
+        except Exception as e:
+            logger.error(f"Erro ao compactar segmentos em {self.directory}: {str(e)}")
+
+    def _compact(self):
+        with self._compaction_lock:
+            with self._lock:
+                manifest = self.read_manifest()
+                segments = list(manifest["segments"])
+                if not segments:
+                    return
+                name = f"snapshot-{manifest['next_id']:06d}"
+                manifest["next_id"] += 1
+                # Reserva o nome do novo snapshot antes de liberar o lock para novos segmentos
+                self._write_manifest(manifest)
+            old_snapshot = manifest["snapshot"]
+            logger.info(f"Compactando {len(segments)} segmentos em {name}")
+
+            if old_snapshot:
+                index = faiss.read_index(self._path(f"{old_snapshot}.faiss"))
+            else:
+                index = faiss.IndexFlatL2(manifest["dimension"])
+            for segment in segments:
+                index.add(self._read_vectors(segment, manifest["dimension"]))
+            atomic_write_index(index, self._path(f"{name}.faiss"))
+
+            def read_lines():
+                # Concatena as linhas dos documentos na ordem do índice
+                for part in ([old_snapshot] if old_snapshot else []) + segments:
+                    with open(self._path(f"{part}.jsonl"), "rb") as source:
+                        yield from source
+            self._write_snapshot_documents(name, read_lines())
+
+            with self._lock:
+                manifest = self.read_manifest()
+                manifest["snapshot"] = name
+                # Mantém os segmentos gravados durante a compactação
+                manifest["segments"] = [s for s in manifest["segments"] if s not in segments]
+                self._write_manifest(manifest)
+            self._remove_files(self._files_of(old_snapshot, segments))
+            logger.info(f"Compactação concluída: {index.ntotal} vetores em {name}")
@@ -0,0 +1,978 @@
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+import multiprocessing
+import numpy as np
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+import logging
+from src.embedding_cache import CachedEmbeddings
+from src.segment_store import SegmentStore, atomic_write
+from src.bm25_index import lexical_tokens
+from src.vector_db import (
+    DEFAULT_EMBEDDING_BATCH_CHARS, DEFAULT_EMBEDDING_BATCH_SIZE, DEFAULT_LEXICAL_CONFIDENCE, FILES_FILE,
+    HYBRID_FETCH_FACTOR, RETRIEVAL_MODES, VectorDB, iter_batches, stored_preprocessor
+)
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# "thread": os shards rodam no processo do coordenador; "process": cada shard roda em um
+# processo local, chamado por RPC
+SHARD_MODES = ("thread", "process")
+# Número de shards do diretório, gravado ao final de cada rebalanceamento
+SHARDS_FILE = "shards.json"
+SHARD_DIRECTORY = "shard-{:03d}"
+# Chave do roteamento dos segmentos, gravada com o número de shards: um diretório roteado por
+# outra chave (o texto, antes da versão 2) é rebalanceado na abertura
+SHARD_ROUTING = "source-2"
+# Número de documentos movidos por vez no rebalanceamento
+REBALANCE_BATCH_SIZE = 1000
+# Tempo máximo para um processo de shard carregar o seu índice e aceitar conexões
+SHARD_STARTUP_TIMEOUT_SECONDS = 600
+# Métodos de Shard que podem ser chamados por RPC
+SHARD_METHODS = (
+    "prepare", "commit", "abort", "search", "lexical", "sources", "source_chunks", "delete_chunks",
+    "moving_ids", "export", "insert_moved", "status", "memory_usage", "wait_for_purge", "close",
+)
+
+def shard_of(source, shard_count):
+    """
+    Retorna o shard dos segmentos de um documento pelo hash do seu source, com jump consistent
+    hash: ao passar de n para n + 1 shards, apenas 1/(n + 1) dos documentos mudam de shard.
+
+    Como o escopo da deduplicação (dedup_scope) é o documento e o tenant, todos os segmentos
+    que podem ser duplicatas ou quase duplicatas uns dos outros caem no mesmo shard, e as
+    operações por documento (source_chunks, delete_source) consultam apenas esse shard.
+
+    Parâmetros:
+        source (str): O source do documento, ou None para segmentos sem source.
+        shard_count (int): O número de shards.
+
+    Retorna:
+        int: O índice do shard, entre 0 e shard_count - 1.
+    """
+    key = int.from_bytes(
+        hashlib.blake2b(json.dumps(source, ensure_ascii=False).encode("utf-8"), digest_size=8).digest(), "big"
+    )
+    bucket, candidate = -1, 0
+    while candidate < shard_count:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+class ShardEmbeddings(Embeddings):
+    """Modelo de embeddings dos shards, que recebem os vetores prontos do coordenador e nunca embedam."""
+
+    def embed_documents(self, texts):
+        raise RuntimeError("Os shards recebem os vetores do coordenador e não geram embeddings")
+
+    def embed_query(self, text):
+        raise RuntimeError("Os shards recebem os vetores do coordenador e não geram embeddings")
+
+class Shard:
+    """
+    Um shard do ShardedVectorDB: um VectorDB no seu próprio diretório, operado por vetores já
+    gerados pelo coordenador. Os mesmos métodos são usados diretamente, no modo "thread", ou
+    por RPC, no modo "process"; por isso, os argumentos e os retornos são serializáveis.
+    """
+
+    def __init__(self, persist_directory, **options):
+        """
+        Parâmetros:
+            persist_directory (str): O diretório do shard.
+            **options: Parâmetros do VectorDB (index_type, storage, deduplicate etc.).
+        """
+        self.db = VectorDB(persist_directory=persist_directory, embeddings=ShardEmbeddings(), **options)
+        self._lock = threading.Lock()
+        # Token -> (textos, metadados, reserva do deduplicador) dos segmentos aguardando os vetores
+        self._prepared = {}
+        # Vetores reconstruídos de um índice IVF, reaproveitados entre os lotes de um rebalanceamento
+        self._export_cache = (None, None, None)
+
+    def prepare(self, texts, metadatas, replaces=None):
+        """
+        Descarta as duplicatas e reserva os demais segmentos, antes dos embeddings.
+
+        Parâmetros:
+            texts (list): Textos pré-processados.
+            metadatas (list): Metadados dos textos.
+            replaces (list, opcional): Ids dos segmentos substituídos, como em VectorDB.add.
+
+        Retorna:
+            tuple: (token para commit ou abort, ou None se nenhum segmento for aceito, textos
+                aceitos, contagens da deduplicação).
+        """
+        stats = {}
+        texts, metadatas, reservation = self.db._deduplicate(texts, metadatas, stats, replaces)
+        if not texts:
+            self.db._release(reservation)
+            return None, [], stats
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._prepared[token] = (texts, metadatas, reservation)
+        return token, texts, stats
+
+    def commit(self, token, vectors):
+        """Indexa os segmentos reservados por prepare com os seus vetores e retorna quantos foram indexados."""
+        with self._lock:
+            texts, metadatas, reservation = self._prepared.pop(token)
+        try:
+            self.db._insert(texts, vectors, metadatas, reservation)
+        finally:
+            self.db._release(reservation)
+        return len(texts)
+
+    def abort(self, token):
+        """Libera os segmentos reservados por prepare, sem indexá-los."""
+        with self._lock:
+            prepared = self._prepared.pop(token, None)
+        if prepared is not None:
+            self.db._release(prepared[2])
+
+    def search(self, vectors, k, filter=None, nprobe=None, ef_search=None):
+        """
+        Busca os vizinhos de vetores de consultas no snapshot publicado.
+
+        Retorna:
+            list: Para cada consulta, uma lista de (Document, distância).
+
+        Lança:
+            ValueError: Se o filtro for inválido.
+        """
+        vector_store = self.db.vector_store
+        if vector_store is None or vector_store.ntotal == 0:
+            return [[] for _ in vectors]
+        allowed = vector_store.filter_positions(filter) if filter is not None else None
+        if allowed is not None and not len(allowed):
+            return [[] for _ in vectors]
+        return vector_store.search_many(vectors, k, allowed, nprobe=nprobe, ef_search=ef_search)
+
+    def lexical(self, token_lists, k, filter=None):
+        """
+        Busca no índice BM25 do snapshot publicado.
+
+        Parâmetros:
+            token_lists (list): Os termos de cada consulta.
+            k (int): O número de resultados por consulta.
+            filter (dict, opcional): Filtro de metadados.
+
+        Retorna:
+            list: Para cada consulta, (lista de (Document, pontuação), confiança).
+        """
+        vector_store = self.db.vector_store
+        if vector_store is None:
+            return [([], 0.0) for _ in token_lists]
+        allowed = vector_store.filter_positions(filter) if filter is not None else None
+        if allowed is not None and not len(allowed):
+            return [([], 0.0) for _ in token_lists]
+        return [vector_store.lexical_documents(tokens, k, allowed) for tokens in token_lists]
+
+    def sources(self):
+        return self.db.sources()
+
+    def source_chunks(self, source):
+        return self.db.source_chunks(source)
+
+    def delete_chunks(self, chunk_ids):
+        """
+        Remove segmentos pelos seus ids.
+
+        Retorna:
+            tuple: (número de segmentos removidos, documentos com segmentos removidos).
+        """
+        with self.db._write_lock:
+            vector_store = self.db.vector_store
+            positions = self.db._chunk_positions_of(chunk_ids)
+            sources = {
+                vector_store.docstore.search(vector_store.index_to_docstore_id[position]).metadata.get("source")
+                for position in positions
+            }
+            return self.db.delete_chunks(chunk_ids), sources
+
+    def moving_ids(self, shard_count, index):
+        """
+        Retorna os ids dos segmentos ativos que pertencem a outro shard com shard_count shards.
+
+        Parâmetros:
+            shard_count (int): O novo número de shards.
+            index (int): O índice deste shard; -1 se ele deixará de existir.
+        """
+        with self.db._write_lock:
+            vector_store = self.db.vector_store
+            if vector_store is None:
+                return []
+            ids = []
+            for position in range(vector_store.ntotal):
+                if position in vector_store.deleted:
+                    continue
+                doc_id = vector_store.index_to_docstore_id[position]
+                if shard_of(vector_store.docstore.search(doc_id).metadata.get("source"), shard_count) != index:
+                    ids.append(doc_id)
+            return ids
+
+    def export(self, chunk_ids):
+        """
+        Lê os textos, os metadados e os vetores de segmentos ativos, para movê-los a outro shard.
+
+        Retorna:
+            tuple: (ids, textos, metadados, matriz de vetores), na mesma ordem, apenas dos ids ativos.
+        """
+        with self.db._write_lock:
+            vector_store = self.db.vector_store
+            if vector_store is None:
+                return [], [], [], None
+            positions = np.asarray(sorted(self.db._chunk_positions_of(chunk_ids)), dtype=np.int64)
+            vectors = vector_store._subset_vectors(positions)
+            if vectors is None:
+                # Índices IVF não reconstroem posições avulsas: reconstrói todo o índice uma vez
+                # O índice é compartilhado entre snapshots e só cresce: a reconstrução vale
+                # enquanto o índice e o seu tamanho forem os mesmos
+                index, ntotal, all_vectors = self._export_cache
+                if index is not vector_store.index or ntotal != vector_store.ntotal:
+                    all_vectors = self.db._full_vectors(vector_store)
+                    self._export_cache = (vector_store.index, vector_store.ntotal, all_vectors)
+                vectors = all_vectors[positions]
+            ids = [vector_store.index_to_docstore_id[position] for position in positions]
+            documents = [vector_store.docstore.search(doc_id) for doc_id in ids]
+            return ids, [doc.page_content for doc in documents], [doc.metadata for doc in documents], vectors
+
+    def insert_moved(self, texts, vectors, metadatas):
+        """
+        Indexa segmentos movidos de outro shard, com os seus vetores. Segmentos já presentes (de
+        um rebalanceamento interrompido) são descartados pela deduplicação.
+
+        Retorna:
+            int: O número de segmentos indexados.
+        """
+        texts, metadatas, reservation = self.db._deduplicate(texts, metadatas)
+        try:
+            if not texts:
+                return 0
+            if reservation is not None:
+                vectors = np.asarray(vectors)[reservation.keep]
+            self.db._insert(texts, vectors, metadatas, reservation)
+        finally:
+            self.db._release(reservation)
+        return len(texts)
+
+    def status(self):
+        return self.db.status()
+
+    def memory_usage(self):
+        return self.db.memory_usage()
+
+    def wait_for_purge(self):
+        self.db.wait_for_purge()
+
+    def close(self):
+        self.db.close()
+
+def _serve_shard(persist_directory, options, authkey, ready):
+    """
+    Ponto de entrada de um processo de shard: carrega o shard e atende chamadas RPC em uma
+    porta local, uma thread por conexão. O endereço (ou o erro do carregamento) é enviado ao
+    coordenador por `ready`.
+    """
+    try:
+        shard = Shard(persist_directory, **options)
+        listener = Listener(("127.0.0.1", 0), authkey=authkey)
+    except Exception as e:
+        ready.send(("error", e))
+        return
+    ready.send(("ok", listener.address))
+    ready.close()
+    # Encerra o processo se o coordenador terminar sem fechá-lo
+    parent = multiprocessing.parent_process()
+    threading.Thread(target=lambda: (parent.join(), os._exit(0)), daemon=True).start()
+    while True:
+        connection = listener.accept()
+        threading.Thread(target=_handle_connection, args=(shard, connection), daemon=True).start()
+
+def _handle_connection(shard, connection):
+    """Atende as chamadas de uma conexão: (método, args, kwargs) -> ("ok", resultado) ou ("error", exceção)."""
+    with connection:
+        while True:
+            try:
+                method, args, kwargs = connection.recv()
+            except (EOFError, OSError):
+                return
+            if method == "shutdown":
+                connection.send(("ok", None))
+                # Os dados já foram gravados por close; as demais threads são encerradas com o processo
+                os._exit(0)
+            try:
+                if method not in SHARD_METHODS:
+                    raise ValueError(f"Método de shard desconhecido: {method}")
+                response = ("ok", getattr(shard, method)(*args, **kwargs))
+            except Exception as e:
+                response = ("error", e)
+            try:
+                connection.send(response)
+            except Exception as e:
+                # A exceção original pode não ser serializável
+                connection.send(("error", RuntimeError(f"{type(response[1]).__name__}: {response[1]}; {e}")))
+
+class RemoteShard:
+    """
+    Um shard em um processo local, chamado por RPC sobre multiprocessing.connection (pickle
+    sobre um socket em 127.0.0.1, autenticado por uma chave aleatória). Expõe os mesmos métodos
+    de Shard; cada chamada usa uma conexão livre de um pool, e chamadas simultâneas são
+    atendidas em paralelo pelo processo.
+    """
+
+    def __init__(self, persist_directory, options):
+        """
+        Inicia o processo do shard, sem aguardar o carregamento do índice: vários shards
+        carregam em paralelo, e a primeira chamada aguarda o seu término.
+
+        Parâmetros:
+            persist_directory (str): O diretório do shard.
+            options (dict): Parâmetros do VectorDB do shard.
+        """
+        self.persist_directory = persist_directory
+        self._authkey = os.urandom(32)
+        context = multiprocessing.get_context("spawn")
+        self._ready, writer = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=_serve_shard, args=(persist_directory, options, self._authkey, writer),
+            name=f"vector-db-{os.path.basename(persist_directory)}", daemon=True,
+        )
+        self.process.start()
+        writer.close()
+        self._address = None
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _connect(self):
+        """Retorna uma conexão livre do pool ou abre uma nova, aguardando o processo ficar pronto."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            if self._address is None:
+                if not self._ready.poll(SHARD_STARTUP_TIMEOUT_SECONDS):
+                    raise RuntimeError(f"O shard {self.persist_directory} não iniciou em {SHARD_STARTUP_TIMEOUT_SECONDS}s")
+                try:
+                    status, result = self._ready.recv()
+                except EOFError:
+                    raise RuntimeError(f"O processo do shard {self.persist_directory} terminou durante a inicialização")
+                if status == "error":
+                    raise result
+                self._address = result
+        return Client(self._address, authkey=self._authkey)
+
+    def call(self, method, *args, **kwargs):
+        """
+        Chama um método do shard remoto.
+
+        Lança:
+            Exception: A exceção lançada pelo método no processo do shard.
+        """
+        connection = self._connect()
+        try:
+            connection.send((method, args, kwargs))
+            status, result = connection.recv()
+        except Exception:
+            connection.close()
+            raise
+        with self._lock:
+            self._idle.append(connection)
+        if status == "error":
+            raise result
+        return result
+
+    def __getattr__(self, name):
+        if name in SHARD_METHODS and name != "close":
+            return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+        raise AttributeError(name)
+
+    def close(self):
+        """Grava o shard e encerra o seu processo."""
+        try:
+            self.call("close")
+            self.call("shutdown")
+        except Exception as e:
+            logger.warning(f"Erro ao encerrar o shard {self.persist_directory}: {str(e)}")
+        self.process.join(10)
+        if self.process.is_alive():
+            self.process.terminate()
+        with self._lock:
+            for connection in self._idle:
+                connection.close()
+            self._idle = []
+
+class ShardedView:
+    """
+    Visão do ShardedVectorDB com a busca do FAISS VectorStore usada pelo retriever do
+    RAGEngine, retornada por get_vector_store.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def similarity_search(self, query, k=4):
+        return self.db.retrieve(query, k=k, mode="vector")
+
+    async def asimilarity_search(self, query, k=4):
+        return await self.db.aretrieve(query, k=k, mode="vector")
+
+class ShardedVectorDB:
+    """
+    Banco de dados vetorial particionado em N shards, cada um com o seu índice FAISS, os seus
+    índices auxiliares e o seu diretório (`shard-000`, `shard-001`, ...).
+
+    Os shards rodam em threads do processo (modo "thread"; a busca do FAISS libera o GIL) ou
+    em processos locais chamados por RPC (modo "process"), o que distribui a memória dos
+    índices e as buscas entre processos. O coordenador pré-processa e embeda os textos e as
+    consultas uma única vez: os shards recebem os vetores prontos.
+
+    Os segmentos de um documento vão todos para o shard dado pelo hash do seu source (veja
+    shard_of), onde são deduplicados uns contra os outros. As buscas são enviadas a todos os
+    shards em paralelo e os top-k de cada um são combinados: pela distância na busca vetorial,
+    que é exata como em um índice único, e pela pontuação BM25 na busca léxica, cujo IDF é
+    calculado por shard. As operações por documento (source_chunks, delete_source) consultam
+    apenas o shard do documento. O registro de arquivos já ingeridos fica no diretório do
+    coordenador.
+
+    Quando o número de shards muda, os segmentos que mudam de shard são movidos, com os seus
+    vetores, ao abrir o diretório. Um diretório de um VectorDB não particionado é migrado da
+    mesma forma.
+    """
+
+    def __init__(self, persist_directory="./vector_db", shards=2, mode="thread", embeddings=None, embedding_cache=None,
+                 batch_size=DEFAULT_EMBEDDING_BATCH_SIZE, max_batch_chars=DEFAULT_EMBEDDING_BATCH_CHARS,
+                 lexical_confidence=DEFAULT_LEXICAL_CONFIDENCE, tokenizer="regex", **options):
+        """
+        Parâmetros:
+            persist_directory (str): O diretório com os shards.
+            shards (int): O número de shards. Se diferir do número gravado no diretório, os
+                segmentos são rebalanceados.
+            mode (str): "thread" ou "process".
+            embeddings (Embeddings, opcional): Modelo de embeddings do coordenador. Se omitido,
+                utiliza o OpenAIEmbeddings.
+            embedding_cache (EmbeddingCache, opcional): Cache consultado antes de cada chamada
+                ao modelo de embeddings.
+            batch_size (int): Número máximo de textos por chamada ao modelo de embeddings.
+            max_batch_chars (int): Número máximo de caracteres por chamada ao modelo de embeddings.
+            lexical_confidence (float): Confiança mínima do BM25 para o modo "lexical", como no VectorDB.
+            tokenizer (str): O tokenizador dos índices novos, como no VectorDB. Um diretório
+                existente, particionado ou não, mantém o tokenizador com que foi gravado, no
+                coordenador e em todos os shards.
+            **options: Parâmetros do VectorDB de cada shard (index_type, index_params,
+                search_params, mmap, deduplicate, near_duplicate_threshold, purge_ratio,
+                storage, rerank_factor).
+
+        Lança:
+            ValueError: Se o número de shards ou o modo forem inválidos, ou se a chave da API
+                do OpenAI não for encontrada nas variáveis de ambiente.
+        """
+        if shards < 1:
+            raise ValueError(f"Número de shards inválido: {shards}")
+        if mode not in SHARD_MODES:
+            raise ValueError(f"Modo de shards não suportado: {mode}. Use um de {SHARD_MODES}")
+        if embeddings is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
+            embeddings = OpenAIEmbeddings(openai_api_key=api_key)
+        if embedding_cache is not None:
+            embeddings = CachedEmbeddings(embeddings, embedding_cache)
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.lexical_confidence = lexical_confidence
+        self.persist_directory = persist_directory
+        self.mode = mode
+        self.preprocessor = stored_preprocessor(
+            [self._shard_directory(index) for index in range(self._stored_shard_count())] + [persist_directory],
+            tokenizer,
+        )
+        self.options = dict(options, tokenizer=self.preprocessor.tokenizer)
+        self._lock = threading.Lock()
+        # Versão do conteúdo, incrementada a cada escrita, e total de documentos ativos
+        self._version = 0
+        self._total = 0
+        # Envia as chamadas aos shards em paralelo
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * shards), thread_name_prefix="vector-db-shards")
+        files_path = os.path.join(persist_directory, FILES_FILE)
+        self._files = {}
+        if os.path.exists(files_path):
+            with open(files_path, "r", encoding="utf-8") as f:
+                self._files = json.load(f)
+
+        stored = self._stored_shard_count()
+        self.shards = [self._open_shard(index) for index in range(max(stored, shards))]
+        legacy = self._legacy_store()
+        if (legacy is not None or stored not in (0, shards) or len(self.shards) != shards
+                or (stored and self._stored_routing() != SHARD_ROUTING)):
+            self._rebalance(shards, legacy)
+        elif not stored:
+            self._write_shard_count(shards)
+        self._refresh()
+        logger.info(f"VectorDB particionado carregado com {len(self.shards)} shards ({mode}) e {self._total} documentos")
+
+    def _shard_directory(self, index):
+        return os.path.join(self.persist_directory, SHARD_DIRECTORY.format(index))
+
+    def _stored_shard_count(self):
+        """O número de shards do diretório: o gravado ou, após um rebalanceamento interrompido, o de subdiretórios."""
+        count = 0
+        path = os.path.join(self.persist_directory, SHARDS_FILE)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                count = json.load(f)["shards"]
+        while os.path.isdir(self._shard_directory(count)):
+            count += 1
+        return count
+
+    def _stored_routing(self):
+        """A chave de roteamento gravada no diretório; diretórios anteriores a ela rotearam pelo texto."""
+        path = os.path.join(self.persist_directory, SHARDS_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("routing")
+
+    def _write_shard_count(self, shards):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        atomic_write(
+            os.path.join(self.persist_directory, SHARDS_FILE),
+            lambda f: json.dump({"shards": shards, "routing": SHARD_ROUTING}, f),
+            mode="w",
+        )
+
+    def _open_shard(self, index):
+        directory = self._shard_directory(index)
+        if self.mode == "process":
+            return RemoteShard(directory, self.options)
+        return Shard(directory, **self.options)
+
+    def _legacy_store(self):
+        """Abre, como um shard a ser esvaziado, um VectorDB não particionado no diretório, se houver."""
+        if os.path.exists(os.path.join(self.persist_directory, SHARDS_FILE)):
+            return None
+        if not SegmentStore(self.persist_directory).exists() and not os.path.exists(
+            os.path.join(self.persist_directory, "index.faiss")
+        ):
+            return None
+        logger.info(f"Migrando o VectorDB não particionado em {self.persist_directory} para shards")
+        return Shard(self.persist_directory, **self.options)
+
+    def _rebalance(self, shards, legacy=None):
+        """
+        Move para o seu shard os segmentos que pertencem a outro com `shards` shards e remove
+        os shards excedentes. Os segmentos são copiados antes de removidos da origem: um
+        rebalanceamento interrompido é retomado na próxima abertura, e as cópias já feitas são
+        descartadas pela deduplicação do destino.
+        """
+        while len(self.shards) < shards:
+            self.shards.append(self._open_shard(len(self.shards)))
+        sources = list(enumerate(self.shards))
+        if legacy is not None:
+            sources.append((-1, legacy))
+        moved = 0
+        for index, shard in sources:
+            ids = shard.moving_ids(shards, index if index < shards else -1)
+            for start in range(0, len(ids), REBALANCE_BATCH_SIZE):
+                batch_ids, texts, metadatas, vectors = shard.export(ids[start:start + REBALANCE_BATCH_SIZE])
+                groups = {}
+                for i, metadata in enumerate(metadatas):
+                    groups.setdefault(shard_of(metadata.get("source"), shards), []).append(i)
+                self._fan_out([
+                    (self.shards[target].insert_moved,
+                     ([texts[i] for i in rows], vectors[rows], [metadatas[i] for i in rows]))
+                    for target, rows in groups.items()
+                ])
+                shard.delete_chunks(batch_ids)
+                moved += len(batch_ids)
+        self._write_shard_count(shards)
+        for index in range(shards, len(self.shards)):
+            self.shards[index].close()
+            shutil.rmtree(self._shard_directory(index), ignore_errors=True)
+        del self.shards[shards:]
+        if legacy is not None:
+            legacy.wait_for_purge()
+            legacy.close()
+        logger.info(f"Rebalanceamento para {shards} shards concluído: {moved} segmentos movidos")
+
+    def _fan_out(self, calls, return_exceptions=False):
+        """
+        Executa chamadas aos shards em paralelo e retorna os resultados na ordem das chamadas.
+
+        Parâmetros:
+            calls (list): Lista de (função, argumentos).
+            return_exceptions (bool): Se True, as exceções são retornadas no lugar dos
+                resultados; caso contrário, a primeira é lançada depois que todas terminam.
+        """
+        if len(calls) == 1 and not return_exceptions:
+            function, args = calls[0]
+            return [function(*args)]
+        futures = [self._executor.submit(function, *args) for function, args in calls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    def _refresh(self):
+        """Atualiza o total de documentos ativos a partir do estado dos shards."""
+        self._total = sum(status["total_documents"] for status in self._fan_out([(shard.status, ()) for shard in self.shards]))
+
+    def _changed(self):
+        with self._lock:
+            self._version += 1
+        self._refresh()
+
+    @property
+    def version(self):
+        """A versão do conteúdo, incrementada a cada escrita em algum shard."""
+        return self._version
+
+    @property
+    def vector_store(self):
+        """Uma ShardedView, ou None se nenhum shard tiver documentos."""
+        return ShardedView(self) if self._total else None
+
+    def get_vector_store(self):
+        """
+        Retorna a visão de busca do banco, usada pelo retriever do RAGEngine.
+
+        Retorna:
+            ShardedView | None: A visão, ou None se o banco estiver vazio.
+        """
+        return self.vector_store
+
+    def status(self):
+        """
+        Retorna o estado do banco, no formato de VectorDB.status, com o de cada shard em 'shards'.
+        """
+        shards = self._fan_out([(shard.status, ()) for shard in self.shards])
+        total = sum(status["total_documents"] for status in shards)
+        return {
+            "total_documents": total,
+            "is_empty": total == 0,
+            "version": self._version,
+            "deleted_pending_compaction": sum(status["deleted_pending_compaction"] for status in shards),
+            "shard_mode": self.mode,
+            "shards": shards,
+        }
+
+    def add(self, texts, metadatas, stats=None, replaces=None):
+        """
+        Adiciona textos e metadados, roteando cada um para o seu shard.
+
+        Os textos são pré-processados e roteados; cada shard descarta as suas duplicatas; os
+        textos aceitos por todos os shards são embedados juntos, em lotes, e indexados em
+        paralelo nos shards.
+
+        Parâmetros e retorno iguais aos de VectorDB.add.
+        """
+        VectorDB._validate(texts, metadatas)
+        if not texts:
+            return 0
+        prepared = self._prepare(self.preprocessor.preprocess_many(texts), metadatas, stats, replaces)
+        try:
+            vectors = []
+            for batch in iter_batches([text for _, _, kept in prepared for text in kept], self.batch_size, self.max_batch_chars):
+                vectors.extend(self.embeddings.embed_documents(batch))
+        except Exception:
+            self._abort(prepared)
+            raise
+        return self._commit(prepared, vectors)
+
+    async def aadd(self, texts, metadatas, stats=None, replaces=None):
+        """
+        Versão assíncrona de add, que não bloqueia o event loop.
+
+        Parâmetros e retorno iguais aos de VectorDB.add.
+        """
+        VectorDB._validate(texts, metadatas)
+        if not texts:
+            return 0
+        preprocessed_texts = await asyncio.to_thread(self.preprocessor.preprocess_many, texts)
+        prepared = await asyncio.to_thread(self._prepare, preprocessed_texts, metadatas, stats, replaces)
+        try:
+            vectors = []
+            for batch in iter_batches([text for _, _, kept in prepared for text in kept], self.batch_size, self.max_batch_chars):
+                vectors.extend(await self.embeddings.aembed_documents(batch))
+        except BaseException:
+            await asyncio.to_thread(self._abort, prepared)
+            raise
+        return await asyncio.to_thread(self._commit, prepared, vectors)
+
+    def add_documents(self, segments, stats=None, replaces=None):
+        """Adiciona os segmentos produzidos pelo DocumentProcessor, como VectorDB.add_documents."""
+        texts, metadatas = VectorDB._unpack_segments(segments)
+        return self.add(texts, metadatas, stats, replaces)
+
+    async def aadd_documents(self, segments, stats=None, replaces=None):
+        """Versão assíncrona de add_documents."""
+        texts, metadatas = VectorDB._unpack_segments(segments)
+        return await self.aadd(texts, metadatas, stats, replaces)
+
+    def _prepare(self, preprocessed_texts, metadatas, stats, replaces):
+        """
+        Roteia os textos e os reserva nos seus shards (Shard.prepare).
+
+        Retorna:
+            list: (shard, token, textos aceitos) de cada shard com textos aceitos.
+        """
+        groups = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(shard_of(metadata.get("source"), len(self.shards)), []).append(i)
+        replaces = list(replaces) if replaces else None
+        results = self._fan_out([
+            (self.shards[index].prepare, ([preprocessed_texts[i] for i in rows], [metadatas[i] for i in rows], replaces))
+            for index, rows in groups.items()
+        ], return_exceptions=True)
+        prepared = [
+            (index, result[0], result[1])
+            for index, result in zip(groups, results)
+            if not isinstance(result, Exception) and result[0] is not None
+        ]
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            self._abort(prepared)
+            raise errors[0]
+        if stats is not None:
+            for key in ("added", "duplicates", "near_duplicates"):
+                stats[key] = stats.get(key, 0) + sum(result[2].get(key, 0) for result in results)
+        return prepared
+
+    def _commit(self, prepared, vectors):
+        """
+        Indexa nos shards os textos reservados, com os seus vetores.
+
+        Uma falha em um shard não desfaz os demais: o arquivo não é registrado como ingerido,
+        e um novo upload descarta como duplicatas os segmentos já indexados.
+        """
+        if not prepared:
+            return 0
+        matrix = np.asarray(vectors, dtype=np.float32)
+        calls = []
+        start = 0
+        for index, token, kept in prepared:
+            calls.append((self.shards[index].commit, (token, matrix[start:start + len(kept)])))
+            start += len(kept)
+        try:
+            return sum(self._fan_out(calls))
+        finally:
+            self._changed()
+
+    def _abort(self, prepared):
+        self._fan_out([(self.shards[index].abort, (token,)) for index, token, _ in prepared], return_exceptions=True)
+
+    def search(self, query, k=5, nprobe=None, ef_search=None, filter=None):
+        """
+        Busca por similaridade em todos os shards, em paralelo, como VectorDB.search.
+
+        Retorna:
+            list: Tuplas (conteúdo da página, metadados, distância), em ordem crescente de distância.
+        """
+        if not self._total:
+            return []
+        vector = self.embeddings.embed_query(self.preprocessor.preprocess_query(query))
+        results = self._vector_many(np.asarray([vector], dtype=np.float32), k, filter, nprobe, ef_search)[0]
+        return [(doc.page_content, doc.metadata, score) for doc, score in results]
+
+    def lexical_search(self, query, k=5, filter=None):
+        """Busca léxica (BM25) em todos os shards, em paralelo, como VectorDB.lexical_search."""
+        if not self._total:
+            return []
+        results, _ = self._lexical_many([query], k, filter)[0]
+        return [(doc.page_content, doc.metadata, score) for doc, score in results]
+
+    def retrieve(self, query, k=4, mode="hybrid", vector_store=None, filter=None):
+        """
+        Recupera os documentos mais relevantes para uma consulta em todos os shards, como
+        VectorDB.retrieve. O parâmetro vector_store é ignorado: cada shard usa o seu snapshot
+        publicado.
+        """
+        lexical, pending = self._prepare_many([query], k, mode, filter)
+        vectors = [self.embeddings.embed_query(query)] if pending else []
+        return self._finish_many([query], k, filter, lexical, pending, [query] if pending else [], vectors)[0]
+
+    async def aretrieve(self, query, k=4, mode="hybrid", vector_store=None, filter=None):
+        """Versão assíncrona de retrieve, que usa o cliente assíncrono do modelo de embeddings."""
+        lexical, pending = await asyncio.to_thread(self._prepare_many, [query], k, mode, filter)
+        vectors = [await self.embeddings.aembed_query(query)] if pending else []
+        return (await asyncio.to_thread(
+            self._finish_many, [query], k, filter, lexical, pending, [query] if pending else [], vectors
+        ))[0]
+
+    def retrieve_many(self, queries, k=4, mode="hybrid", vector_store=None, filter=None):
+        """
+        Recupera os documentos de várias consultas, como VectorDB.retrieve_many: as consultas
+        são embedadas em lotes e cada shard as busca em uma única chamada ao índice.
+        """
+        lexical, pending = self._prepare_many(queries, k, mode, filter)
+        unique = list(dict.fromkeys(queries[i] for i in pending))
+        vectors = []
+        for batch in iter_batches(unique, self.batch_size, self.max_batch_chars):
+            vectors.extend(self.embeddings.embed_documents(batch))
+        return self._finish_many(queries, k, filter, lexical, pending, unique, vectors)
+
+    async def aretrieve_many(self, queries, k=4, mode="hybrid", vector_store=None, filter=None):
+        """Versão assíncrona de retrieve_many."""
+        lexical, pending = await asyncio.to_thread(self._prepare_many, queries, k, mode, filter)
+        unique = list(dict.fromkeys(queries[i] for i in pending))
+        vectors = []
+        for batch in iter_batches(unique, self.batch_size, self.max_batch_chars):
+            vectors.extend(await self.embeddings.aembed_documents(batch))
+        return await asyncio.to_thread(self._finish_many, queries, k, filter, lexical, pending, unique, vectors)
+
+    def _prepare_many(self, queries, k, mode, filter):
+        """
+        Executa a busca léxica das consultas, quando o modo a utiliza.
+
+        Retorna:
+            tuple: (resultados BM25 combinados de cada consulta, ou None no modo "vector",
+                índices das consultas que precisam da busca vetorial).
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modo de recuperação não suportado: {mode}. Use um de {RETRIEVAL_MODES}")
+        if not self._total:
+            return [[] for _ in queries], []
+        if mode == "vector":
+            return [None] * len(queries), list(range(len(queries)))
+        lexical = []
+        pending = []
+        for i, (results, confidence) in enumerate(self._lexical_many(queries, k * HYBRID_FETCH_FACTOR, filter)):
+            lexical.append(results)
+            if not (mode == "lexical" and results and confidence >= self.lexical_confidence):
+                pending.append(i)
+        return lexical, pending
+
+    def _finish_many(self, queries, k, filter, lexical, pending, unique, vectors):
+        """Faz a busca vetorial das consultas pendentes e monta os resultados, como no VectorDB."""
+        results = [None] * len(queries)
+        if unique:
+            fetch_k = k if lexical[pending[0]] is None else k * HYBRID_FETCH_FACTOR
+            rows = dict(zip(unique, self._vector_many(np.asarray(vectors, dtype=np.float32), fetch_k, filter)))
+            for i in pending:
+                results[i] = VectorDB._finish_retrieval(k, lexical[i], rows[queries[i]])
+        for i, documents in enumerate(results):
+            if documents is None:
+                # Consulta respondida apenas pela busca léxica, ou banco vazio
+                results[i] = [doc for doc, _ in lexical[i][:k]]
+        return results
+
+    def _vector_many(self, vectors, k, filter=None, nprobe=None, ef_search=None):
+        """
+        Busca os vetores em todos os shards, em paralelo, e combina os top-k de cada um pela
+        distância L2 (menor é melhor).
+        """
+        rows = self._fan_out([(shard.search, (vectors, k, filter, nprobe, ef_search)) for shard in self.shards])
+        merged = []
+        for i in range(len(vectors)):
+            results = [hit for shard_rows in rows for hit in shard_rows[i]]
+            results.sort(key=lambda hit: hit[1])
+            merged.append(results[:k])
+        return merged
+
+    def _lexical_many(self, queries, k, filter=None):
+        """
+        Busca as consultas no BM25 de todos os shards, em paralelo, e combina os top-k de cada
+        um pela pontuação.
+
+        Retorna:
+            list: Para cada consulta, (lista de (Document, pontuação), maior confiança entre os shards).
+        """
+        token_lists = [lexical_tokens(self.preprocessor.preprocess_query(query)) for query in queries]
+        rows = self._fan_out([(shard.lexical, (token_lists, k, filter)) for shard in self.shards])
+        merged = []
+        for i in range(len(queries)):
+            results = [hit for shard_rows in rows for hit in shard_rows[i][0]]
+            results.sort(key=lambda hit: hit[1], reverse=True)
+            merged.append((results[:k], max(shard_rows[i][1] for shard_rows in rows)))
+        return merged
+
+    def sources(self):
+        """Lista os documentos indexados: source -> número de segmentos ativos em todos os shards."""
+        sources = {}
+        for shard_sources in self._fan_out([(shard.sources, ()) for shard in self.shards]):
+            for source, count in shard_sources.items():
+                sources[source] = sources.get(source, 0) + count
+        return sources
+
+    def source_chunks(self, source):
+        """Retorna os ids dos segmentos ativos de um documento, do shard do documento."""
+        return self.shards[shard_of(source, len(self.shards))].source_chunks(source)
+
+    def delete_source(self, source):
+        """Remove todos os segmentos de um documento, do shard do documento."""
+        shard = self.shards[shard_of(source, len(self.shards))]
+        chunk_ids = shard.source_chunks(source)
+        if not chunk_ids:
+            return 0
+        removed, sources = shard.delete_chunks(chunk_ids)
+        if removed:
+            self._forget_files(sources)
+            self._changed()
+        return removed
+
+    def delete_chunks(self, chunk_ids):
+        """
+        Remove segmentos pelos seus ids, em todos os shards, como VectorDB.delete_chunks.
+
+        Retorna:
+            int: O número de segmentos removidos.
+        """
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return 0
+        results = self._fan_out([(shard.delete_chunks, (chunk_ids,)) for shard in self.shards])
+        removed = sum(count for count, _ in results)
+        if removed:
+            self._forget_files(set().union(*(sources for _, sources in results)))
+            self._changed()
+        return removed
+
+    def file_record(self, file_hash):
+        """Retorna o registro de um arquivo já ingerido com o mesmo conteúdo, como VectorDB.file_record."""
+        return self._files.get(file_hash)
+
+    def record_file(self, file_hash, source, chunks):
+        """Registra um arquivo ingerido, como VectorDB.record_file."""
+        with self._lock:
+            self._files[file_hash] = {"source": source, "chunks": chunks}
+            self._save_files()
+
+    def _forget_files(self, sources):
+        """Remove do registro de arquivos os documentos com segmentos removidos, para permitir um novo upload."""
+        with self._lock:
+            forgotten = [file_hash for file_hash, record in self._files.items() if record["source"] in sources]
+            for file_hash in forgotten:
+                del self._files[file_hash]
+            if forgotten:
+                self._save_files()
+
+    def _save_files(self):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        atomic_write(os.path.join(self.persist_directory, FILES_FILE), lambda f: json.dump(self._files, f), mode="w")
+
+    def wait_for_purge(self):
+        """Aguarda as compactações em segundo plano de todos os shards."""
+        self._fan_out([(shard.wait_for_purge, ()) for shard in self.shards])
+
+    def memory_usage(self):
+        """A memória estimada de todos os shards, em bytes (veja VectorDB.memory_usage)."""
+        return sum(self._fan_out([(shard.memory_usage, ()) for shard in self.shards]))
+
+    def close(self):
+        """Grava e fecha todos os shards, encerrando os processos no modo "process"."""
+        self._fan_out([(shard.close, ()) for shard in self.shards], return_exceptions=True)
+        self._executor.shutdown(wait=False)
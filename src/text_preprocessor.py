@@ -1,24 +1,115 @@
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+from functools import lru_cache
+from multiprocessing import get_context
+import os
+import re
 
-# Baixa os recursos necessários do NLTK
-nltk.download('punkt', quiet=True)
-nltk.download('punkt_tab', quiet=True)
-nltk.download('stopwords', quiet=True)
+# Tokenizador equivalente ao word_tokenize do NLTK para o nosso corpus, em uma única expressão
+# regular compilada. Assim como o tokenizador Treebank usado pelo NLTK, separa os sinais
+# ;@#$%&?!()[]{}<> e as reticências, separa o ponto, a vírgula e os dois-pontos do fim das
+# palavras, mas mantém pontos e apóstrofos internos ("www.exemplo.com.br", "d'água") e a vírgula
+# ou os dois-pontos seguidos de dígito ("1.000,50", "12:30"). Hífens e barras não separam tokens.
+# Diferente do NLTK, não converte aspas duplas em `` e '' nem separa abreviações com ponto.
+_WORD_CHAR = r"[^\s;@#$%&?!()\[\]{}<>,:.'\"`]"
+TOKEN_PATTERN = re.compile(rf"{_WORD_CHAR}+(?:(?:[.']|[,:](?=\d)){_WORD_CHAR}+)*|\.\.\.|\S")
+
+# Versão de cada tokenizador. Os textos indexados, os seus embeddings e o índice BM25 dependem
+# dos tokens: incremente a versão sempre que a saída de um tokenizador mudar, para que índices
+# gravados com a versão anterior sejam recusados em vez de consultados com outros tokens.
+# Os dois tokenizadores têm versões próprias porque diferem nas aspas e nas abreviações
+TOKENIZER_VERSIONS = {"regex": 1, "nltk": 1}
+# Versão dos índices gravados antes do registro da versão, pré-processados com o word_tokenize do NLTK
+LEGACY_PREPROCESSOR_VERSION = "nltk-1/portuguese"
+
+# Diretório local com os dados do NLTK (stopwords), consultado além dos caminhos padrão
+# do NLTK. Os dados nunca são baixados em tempo de execução.
+NLTK_DATA_PATH = os.getenv(
+    "NLTK_DATA_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "nltk_data"),
+)
+
+# Tamanho mínimo de um lote para que o pré-processamento seja dividido entre processos
+PARALLEL_MIN_TEXTS = 20_000
+
+@lru_cache(maxsize=None)
+def load_stopwords(language):
+    """
+    Carrega, uma única vez por idioma, as stopwords do NLTK a partir dos dados instalados.
+
+    Parâmetros:
+        language (str): O idioma das stopwords.
+
+    Retorna:
+        frozenset: As stopwords do idioma.
+
+    Lança:
+        LookupError: Se os dados de stopwords não estiverem instalados localmente.
+    """
+    import nltk
+    from nltk.corpus import stopwords
+
+    if NLTK_DATA_PATH not in nltk.data.path:
+        nltk.data.path.append(NLTK_DATA_PATH)
+    try:
+        return frozenset(stopwords.words(language))
+    except LookupError as e:
+        raise LookupError(
+            f"Stopwords do NLTK para '{language}' não encontradas. "
+            f"Instale-as com: python -m nltk.downloader -d {NLTK_DATA_PATH} stopwords"
+        ) from e
+
+def _preprocess_batch(texts, stop_words, tokenizer):
+    """Pré-processa um lote de textos em um processo do pool."""
+    return TextPreprocessor._preprocess_all(texts, stop_words, tokenizer)
 
 class TextPreprocessor:
-    def __init__(self, language='portuguese'):
+    def __init__(self, language='portuguese', tokenizer='regex', query_cache_size=4096):
         """
         Inicializa o processador de texto com o idioma especificado.
-        
+
+        As stopwords são carregadas apenas no primeiro uso, e o pré-processamento das consultas
+        é mantido em um cache LRU, já que as mesmas perguntas se repetem com frequência.
+
         Parâmetros:
             language (str): O idioma para o qual o processador de texto será inicializado (padrão: 'portuguese').
-        
+            tokenizer (str): 'regex' para o tokenizador compilado ou 'nltk' para o word_tokenize do NLTK.
+            query_cache_size (int): Número máximo de consultas pré-processadas mantidas em cache.
+
         Não retorna nada.
         """
-        # Inicializa o conjunto de stopwords para o idioma especificado
-        self.stop_words = set(stopwords.words(language))
+        if tokenizer not in ('regex', 'nltk'):
+            raise ValueError(f"Tokenizador não suportado: {tokenizer}")
+        self.language = language
+        self.tokenizer = tokenizer
+        self._stop_words = None
+        # Cache LRU por instância para as consultas
+        self.preprocess_query = lru_cache(maxsize=query_cache_size)(self.preprocess)
+
+    @property
+    def version(self):
+        """A versão do pré-processamento (tokenizador e idioma), registrada com os índices."""
+        return f"{self.tokenizer}-{TOKENIZER_VERSIONS[self.tokenizer]}/{self.language}"
+
+    @property
+    def stop_words(self):
+        """O conjunto de stopwords do idioma, carregado no primeiro acesso."""
+        if self._stop_words is None:
+            self._stop_words = load_stopwords(self.language)
+        return self._stop_words
+
+    def tokenize(self, text):
+        """
+        Tokeniza um texto em palavras e sinais de pontuação.
+
+        Parâmetros:
+            text (str): O texto a ser tokenizado.
+
+        Retorna:
+            List[str]: Os tokens do texto.
+        """
+        if self.tokenizer == 'nltk':
+            from nltk.tokenize import word_tokenize
+            return word_tokenize(text)
+        return TOKEN_PATTERN.findall(text)
 
     def preprocess(self, text):
         """
@@ -32,14 +123,53 @@ class TextPreprocessor:
         """
         # Converte o texto para minúsculas
         text = text.lower()
-        
+
         # Tokeniza o texto em palavras individuais
-        tokens = word_tokenize(text)
-        
+        tokens = self.tokenize(text)
+
         # Remove as stopwords
-        tokens = [token for token in tokens if token not in self.stop_words]
-        
+        stop_words = self.stop_words
+        tokens = [token for token in tokens if token not in stop_words]
+
         # Reconstrói o texto a partir dos tokens processados
         preprocessed_text = ' '.join(tokens)
-        
-        return preprocessed_text
\ No newline at end of file
+
+        return preprocessed_text
+
+    def preprocess_many(self, texts, processes=None):
+        """
+        Pré-processa um lote de textos, com o mesmo resultado de preprocess para cada um.
+
+        Lotes grandes podem ser divididos entre processos; os menores são processados no
+        processo atual, onde o custo de enviar os textos aos workers não compensa.
+
+        Parâmetros:
+            texts (Iterable[str]): Os textos a serem pré-processados.
+            processes (int, opcional): Número de processos para lotes com pelo menos
+                                       PARALLEL_MIN_TEXTS textos. O padrão é não usar processos.
+
+        Retorna:
+            List[str]: Os textos pré-processados, na mesma ordem.
+        """
+        texts = list(texts)
+        stop_words = self.stop_words
+        if not processes or processes < 2 or len(texts) < PARALLEL_MIN_TEXTS:
+            return self._preprocess_all(texts, stop_words, self.tokenizer)
+
+        size = -(-len(texts) // processes)
+        batches = [texts[start:start + size] for start in range(0, len(texts), size)]
+        with get_context("spawn").Pool(processes) as pool:
+            results = pool.starmap(_preprocess_batch, [(batch, stop_words, self.tokenizer) for batch in batches])
+        return [text for batch in results for text in batch]
+
+    @staticmethod
+    def _preprocess_all(texts, stop_words, tokenizer):
+        if tokenizer == 'nltk':
+            from nltk.tokenize import word_tokenize
+            tokenize = word_tokenize
+        else:
+            tokenize = TOKEN_PATTERN.findall
+        return [
+            ' '.join([token for token in tokenize(text.lower()) if token not in stop_words])
+            for text in texts
+        ]
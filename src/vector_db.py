@@ -1,9 +1,31 @@
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
+import faiss
+import numpy as np
+import asyncio
+from contextlib import contextmanager
+import json
+import operator
 import os
+import threading
+import uuid
 from dotenv import load_dotenv
 import logging
-from src.text_preprocessor import TextPreprocessor
+from src.text_preprocessor import LEGACY_PREPROCESSOR_VERSION, TOKENIZER_VERSIONS, TextPreprocessor
+from src.embedding_cache import CachedEmbeddings
+from src.segment_store import SegmentStore, atomic_write
+from src.bm25_index import BM25Index, lexical_tokens, reciprocal_rank_fusion
+from src.deduplicator import Deduplicator, dedup_scope
+from src.vector_file import COMPACTED_SUFFIX, VectorFile, normalized
+from src.index_factory import (
+    INDEX_TYPES, STORAGE_TYPES, build_index, index_kind, min_training_points, reconstruct_all,
+    search_parameters, set_search_params, storage_kind
+)
+from src.metadata_index import MetadataIndex
 
 # Configuração do logging para monitoramento e debugging
 logger = logging.getLogger(__name__)
@@ -11,8 +33,514 @@ logger = logging.getLogger(__name__)
 # Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
 
+# Limites padrão de cada lote enviado ao modelo de embeddings durante a ingestão
+DEFAULT_EMBEDDING_BATCH_SIZE = 256
+DEFAULT_EMBEDDING_BATCH_CHARS = 400_000
+
+# Arquivo do índice léxico BM25, no diretório de persistência
+LEXICAL_INDEX_FILE = "lexical.jsonl"
+# Registro de deduplicação dos segmentos e dos arquivos já ingeridos, no diretório de persistência
+DEDUP_FILE = "dedup.jsonl"
+FILES_FILE = "files.json"
+# Ids dos documentos removidos e ainda presentes no índice, no diretório de persistência
+TOMBSTONES_FILE = "tombstones.json"
+# Vetores float32 completos, com as mesmas posições do índice FAISS, usados no re-ranking
+VECTORS_FILE = "vectors.f32"
+# Índice invertido dos metadados, usado nos filtros, no diretório de persistência
+METADATA_INDEX_FILE = "metadata.jsonl"
+# Versão do pré-processamento dos textos indexados, no diretório de persistência
+PREPROCESSOR_FILE = "preprocessor.json"
+# Número máximo de posições aceitas por um filtro para a busca exaustiva sobre o subconjunto
+FILTER_EXACT_MAX_POSITIONS = 10_000
+# Fração de documentos removidos a partir da qual o índice é compactado em segundo plano
+DEFAULT_PURGE_RATIO = 0.2
+# Modos de recuperação de retrieve: apenas vetorial, híbrido (BM25 + vetorial com RRF) ou
+# léxico, que dispensa o embedding da consulta quando o BM25 tem confiança suficiente
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+# Confiança mínima do BM25 para responder apenas com a busca léxica
+DEFAULT_LEXICAL_CONFIDENCE = 0.9
+# Candidatos buscados em cada ranking antes da fusão, por resultado pedido
+HYBRID_FETCH_FACTOR = 4
+
+def iter_batches(texts, batch_size, max_batch_chars):
+    """
+    Divide textos em lotes limitados pelo número de textos e pelo total de caracteres, um por
+    chamada ao modelo de embeddings.
+
+    Parâmetros:
+        texts (list): Lista de textos.
+        batch_size (int): Número máximo de textos por lote.
+        max_batch_chars (int): Número máximo de caracteres por lote.
+
+    Retorna:
+        generator: Gera listas de textos consecutivos respeitando os limites.
+    """
+    batch = []
+    batch_chars = 0
+    for text in texts:
+        if batch and (len(batch) >= batch_size or batch_chars + len(text) > max_batch_chars):
+            yield batch
+            batch = []
+            batch_chars = 0
+        batch.append(text)
+        batch_chars += len(text)
+    if batch:
+        yield batch
+
+def stored_preprocessor_version(directory):
+    """
+    Retorna a versão do pré-processamento com que o índice de um diretório foi gravado.
+
+    Parâmetros:
+        directory (str): O diretório de persistência.
+
+    Retorna:
+        str | None: A versão registrada em PREPROCESSOR_FILE; LEGACY_PREPROCESSOR_VERSION para um
+            índice gravado antes do registro; None se o diretório não tiver índice.
+    """
+    path = os.path.join(directory, PREPROCESSOR_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["version"]
+    if SegmentStore(directory).exists() or os.path.exists(os.path.join(directory, "index.faiss")):
+        return LEGACY_PREPROCESSOR_VERSION
+    return None
+
+def stored_preprocessor(directories, tokenizer, language='portuguese'):
+    """
+    Cria o pré-processador de um índice existente: o dos textos já indexados, e não o
+    configurado, já que consultas tokenizadas de outra forma não os encontrariam e o índice
+    não pode ser refeito sem os textos originais. O tokenizador configurado vale apenas para
+    índices novos.
+
+    Parâmetros:
+        directories (list): Os diretórios de persistência consultados, em ordem; vale o
+            primeiro com índice.
+        tokenizer (str): O tokenizador configurado.
+        language (str): O idioma dos índices novos.
+
+    Retorna:
+        TextPreprocessor: O pré-processador.
+
+    Lança:
+        ValueError: Se o índice tiver sido gravado com uma versão de tokenizador que não é
+            mais suportada.
+    """
+    for directory in directories:
+        stored = stored_preprocessor_version(directory)
+        if stored is not None:
+            break
+    else:
+        return TextPreprocessor(language=language, tokenizer=tokenizer)
+    stored_tokenizer = stored.partition("-")[0]
+    stored_language = stored.partition("/")[2]
+    if stored_tokenizer not in TOKENIZER_VERSIONS:
+        raise ValueError(f"O índice em {directory} foi pré-processado com {stored}, um tokenizador não suportado")
+    preprocessor = TextPreprocessor(language=stored_language, tokenizer=stored_tokenizer)
+    if preprocessor.version != stored:
+        raise ValueError(
+            f"O índice em {directory} foi pré-processado com {stored}, e a versão atual é "
+            f"{preprocessor.version}. Reingira os documentos em outro diretório"
+        )
+    if stored_tokenizer != tokenizer:
+        logger.warning(
+            f"O índice em {directory} foi pré-processado com o tokenizador '{stored_tokenizer}'; "
+            f"usando-o no lugar do configurado ('{tokenizer}')"
+        )
+    return preprocessor
+
+class MmapDocstore(Docstore, AddableMixin):
+    """
+    Docstore que lê os documentos do snapshot sob demanda, a partir de arquivos mapeados em memória.
+
+    Documentos adicionados depois do carregamento ficam em um dicionário em memória.
+    """
+
+    def __init__(self, snapshot_documents, snapshot_ids, documents=None):
+        """
+        Parâmetros:
+            snapshot_documents (SnapshotDocuments): Leitor sob demanda dos documentos do snapshot.
+            snapshot_ids (list): Ids dos documentos do snapshot, na ordem do índice.
+            documents (dict, opcional): Documentos adicionais mantidos em memória.
+        """
+        self._snapshot = snapshot_documents
+        self._positions = {doc_id: position for position, doc_id in enumerate(snapshot_ids)}
+        self._dict = dict(documents or {})
+
+    def add(self, texts):
+        """
+        Adiciona documentos ao dicionário em memória.
+
+        Parâmetros:
+            texts (dict): Dicionário de id para Document.
+
+        Lança:
+            ValueError: Se algum id já existir no docstore.
+        """
+        overlapping = [doc_id for doc_id in texts if doc_id in self._dict or doc_id in self._positions]
+        if overlapping:
+            raise ValueError(f"Tentativa de adicionar ids que já existem: {overlapping}")
+        self._dict.update(texts)
+
+    def copy(self):
+        """
+        Retorna uma cópia do docstore que compartilha o leitor do snapshot em disco.
+
+        Retorna:
+            MmapDocstore: A cópia, que pode receber documentos sem alterar o original.
+        """
+        docstore = MmapDocstore.__new__(MmapDocstore)
+        docstore._snapshot = self._snapshot
+        docstore._positions = dict(self._positions)
+        docstore._dict = dict(self._dict)
+        return docstore
+
+    def delete(self, ids):
+        """
+        Remove documentos do docstore.
+
+        Parâmetros:
+            ids (list): Ids dos documentos a serem removidos.
+        """
+        for doc_id in ids:
+            self._dict.pop(doc_id, None)
+            self._positions.pop(doc_id, None)
+
+    def search(self, search):
+        """
+        Busca um documento pelo id.
+
+        Parâmetros:
+            search (str): O id do documento.
+
+        Retorna:
+            Document | str: O documento, ou uma mensagem se o id não existir.
+        """
+        if search in self._dict:
+            return self._dict[search]
+        position = self._positions.get(search)
+        if position is None:
+            return f"ID {search} not found."
+        _, text, metadata = self._snapshot.get(position)
+        return Document(page_content=text, metadata=metadata)
+
+class IndexLock:
+    """
+    Lock de leitores e escritor do índice FAISS compartilhado entre os snapshots.
+
+    O FAISS não permite buscas durante um index.add no mesmo índice. As buscas compartilham
+    o lock entre si e aguardam apenas o index.add de um lote, nunca os embeddings, a
+    persistência ou a montagem do snapshot. Um escritor em espera bloqueia novos leitores,
+    para não ser adiado indefinidamente. Não é reentrante.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """Mantém o lock compartilhado durante uma leitura do índice."""
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Mantém o lock exclusivo durante uma alteração do índice."""
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+class SnapshotFAISS(FAISS):
+    """
+    FAISS VectorStore publicado como snapshot pelo VectorDB.
+
+    O índice, o docstore e o mapeamento de ids são compartilhados, apenas de acréscimo, com os
+    snapshots seguintes: o snapshot vê somente as suas primeiras `ntotal` posições, como os
+    índices léxico e de metadados, e as buscas excluem as posições acrescentadas depois dele.
+
+    Além do índice, do docstore e do mapeamento de ids, guarda as posições removidas
+    (tombstones), os índices léxico e de metadados e, opcionalmente, o arquivo de vetores
+    completos, todos com as mesmas posições. As buscas ignoram as posições removidas com um
+    IDSelector do FAISS, sem reconstruir o índice; elas só deixam o índice quando o VectorDB
+    o compacta. Com o re-ranking, os candidatos do índice (quantizado) são reordenados pelas
+    distâncias exatas. Um filtro de metadados é convertido, pelo índice de metadados, nas
+    posições aceitas, e a busca é restrita a elas antes de ser executada.
+
+    Com normalize_L2, como no FAISS VectorStore, as consultas e os vetores lidos do arquivo
+    de vetores são normalizados em todos os caminhos de busca, de forma que as pontuações
+    com e sem filtro são as mesmas.
+    """
+
+    def __init__(self, embedding_function, index, docstore, index_to_docstore_id, deleted=frozenset(),
+                 lexical_index=None, vector_file=None, rerank_factor=0, metadata_index=None, normalize_L2=False,
+                 ntotal=None, index_lock=None):
+        """
+        Parâmetros:
+            embedding_function (Embeddings): O modelo de embeddings.
+            index (faiss.Index): O índice FAISS.
+            docstore (Docstore): O docstore.
+            index_to_docstore_id (dict): Posição no índice -> id do documento.
+            deleted (frozenset): Posições removidas.
+            lexical_index (BM25Index, opcional): O índice léxico com as mesmas posições.
+            vector_file (VectorFile, opcional): Os vetores completos com as mesmas posições.
+            rerank_factor (int): Com o arquivo de vetores, busca k * rerank_factor candidatos
+                no índice e os reordena pelas distâncias exatas. 0 ou 1 desativam o re-ranking.
+            metadata_index (MetadataIndex, opcional): O índice de metadados com as mesmas posições.
+            normalize_L2 (bool): Normaliza os vetores para norma 1, como no FAISS VectorStore.
+            ntotal (int, opcional): O número de posições do snapshot. O padrão é o tamanho atual do índice.
+            index_lock (IndexLock, opcional): O lock do índice, compartilhado com quem o altera.
+        """
+        super().__init__(embedding_function, index, docstore, index_to_docstore_id, normalize_L2=normalize_L2)
+        self.deleted = frozenset(deleted)
+        self.lexical_index = lexical_index
+        self.vector_file = vector_file
+        self.rerank_factor = rerank_factor
+        self.metadata_index = metadata_index
+        self.ntotal = index.ntotal if ntotal is None else ntotal
+        self.index_lock = index_lock if index_lock is not None else IndexLock()
+        # Posições removidas, ordenadas, e o seletor que as exclui das buscas
+        self.excluded = np.fromiter(sorted(self.deleted), dtype=np.int64, count=len(self.deleted))
+        self.selector = None
+        if self.deleted:
+            # O IDSelectorNot não é dono do seletor interno: ambos são mantidos vivos aqui
+            self._batch_selector = faiss.IDSelectorBatch(len(self.excluded), faiss.swig_ptr(self.excluded))
+            self.selector = faiss.IDSelectorNot(self._batch_selector)
+
+    @property
+    def reranks(self):
+        """Indica se as buscas reordenam os candidatos pelos vetores completos."""
+        return self.vector_file is not None and self.rerank_factor > 1
+
+    def filter_positions(self, filter):
+        """
+        Converte um filtro de metadados nas posições ativas do snapshot que o atendem.
+
+        Parâmetros:
+            filter (dict): O filtro, no formato de MetadataIndex.
+
+        Retorna:
+            np.ndarray: As posições aceitas, em ordem crescente, sem as removidas.
+
+        Lança:
+            ValueError: Se o filtro for inválido, for uma função (aceita apenas pelas buscas do
+                VectorStore, veja similarity_search_with_score_by_vector) ou o snapshot não
+                tiver índice de metadados.
+        """
+        if callable(filter):
+            raise ValueError(
+                "Filtros por função são aceitos apenas pelas buscas do VectorStore; use um filtro de metadados em dicionário"
+            )
+        if self.metadata_index is None:
+            raise ValueError("Filtros de metadados exigem o índice de metadados do VectorDB")
+        positions = self.metadata_index.positions(filter, limit=self.ntotal)
+        if len(self.excluded):
+            positions = np.setdiff1d(positions, self.excluded, assume_unique=True)
+        return positions
+
+    def search_index(self, vectors, k, nprobe=None, ef_search=None, allowed=None):
+        """
+        Busca no índice, ignorando as posições removidas e as acrescentadas depois do snapshot
+        e, com o re-ranking, reordenando k * rerank_factor candidatos pelas distâncias exatas
+        aos vetores completos.
+
+        Com `allowed`, a busca é restrita a essas posições. Até FILTER_EXACT_MAX_POSITIONS
+        posições, as distâncias são calculadas diretamente sobre os seus vetores (exatas, e
+        com custo proporcional ao subconjunto, não ao índice); acima disso, ou se os vetores
+        não puderem ser lidos sem alterar o índice (IVF sem o arquivo de vetores), a busca usa
+        um IDSelector, e os índices IVF visitam todas as listas quando o subconjunto é pequeno.
+
+        Parâmetros:
+            vectors (np.ndarray): Matriz float32 (n, dimensão) com os vetores das consultas.
+            k (int): O número de resultados por consulta.
+            nprobe (int, opcional): nprobe apenas desta busca (índices IVF).
+            ef_search (int, opcional): efSearch apenas desta busca (índices HNSW).
+            allowed (np.ndarray, opcional): Posições ativas aceitas, como em filter_positions.
+
+        Retorna:
+            tuple: (pontuações, posições), no formato de faiss.Index.search.
+        """
+        with self.index_lock.read():
+            return self._search_index(vectors, k, nprobe, ef_search, allowed)
+
+    def _search_index(self, vectors, k, nprobe, ef_search, allowed):
+        """Implementa search_index; deve ser chamado com o lock de leitura do índice."""
+        selector = self.selector
+        if allowed is None and self.index.ntotal > self.ntotal:
+            # O índice recebeu posições depois deste snapshot: limita a busca às anteriores
+            bound = faiss.IDSelectorRange(0, self.ntotal)
+            selector = faiss.IDSelectorAnd(bound, selector) if selector is not None else bound
+        if allowed is not None:
+            if len(allowed) <= FILTER_EXACT_MAX_POSITIONS:
+                subset = self._subset_vectors(allowed)
+                if subset is not None:
+                    return self._search_subset(vectors, k, allowed, subset)
+                if index_kind(self.index).startswith("ivf"):
+                    nprobe = faiss.extract_index_ivf(self.index).nlist
+            if not len(allowed):
+                return self._search_subset(vectors, k, allowed, np.zeros((0, self.index.d), dtype=np.float32))
+            # O seletor copia as posições; as removidas já foram excluídas de allowed
+            selector = faiss.IDSelectorBatch(len(allowed), faiss.swig_ptr(np.ascontiguousarray(allowed)))
+        params = search_parameters(self.index, nprobe=nprobe, ef_search=ef_search, selector=selector)
+        if not self.reranks:
+            return self.index.search(vectors, k, params=params)
+        _, candidates = self.index.search(vectors, k * self.rerank_factor, params=params)
+        return self.vector_file.rerank(vectors, candidates, k, normalize=self._normalize_L2)
+
+    def _subset_vectors(self, positions):
+        """
+        Lê os vetores de algumas posições: do arquivo de vetores completos, se houver, ou do
+        índice, nos tipos que os reconstroem sem alterá-lo. Retorna None nos demais (IVF).
+        """
+        if self.vector_file is not None:
+            # O arquivo guarda os vetores como recebidos; o índice, normalizados se normalize_L2
+            vectors = self.vector_file.get(positions)
+            return normalized(vectors) if self._normalize_L2 else vectors
+        if index_kind(self.index) in ("flat", "hnsw"):
+            return self.index.reconstruct_batch(positions) if len(positions) else np.zeros((0, self.index.d), dtype=np.float32)
+        return None
+
+    def _search_subset(self, vectors, k, positions, subset):
+        """
+        Busca exaustiva sobre os vetores de um subconjunto de posições, com a métrica do
+        índice, no formato de faiss.Index.search.
+        """
+        inner_product = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        scores = np.full((len(vectors), k), -np.inf if inner_product else np.inf, dtype=np.float32)
+        results = np.full((len(vectors), k), -1, dtype=np.int64)
+        if not len(positions):
+            return scores, results
+        if inner_product:
+            distances = -(vectors @ subset.T)
+        else:
+            distances = (vectors ** 2).sum(axis=1)[:, None] - 2 * vectors @ subset.T + (subset ** 2).sum(axis=1)[None, :]
+            np.maximum(distances, 0, out=distances)
+        count = min(k, len(positions))
+        for row, row_distances in enumerate(distances):
+            top = np.argpartition(row_distances, count - 1)[:count] if len(row_distances) > count else np.arange(count)
+            top = top[np.argsort(row_distances[top], kind="stable")]
+            scores[row, :count] = -row_distances[top] if inner_product else row_distances[top]
+            results[row, :count] = positions[top]
+        return scores, results
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, fetch_k=20, allowed=None, **kwargs):
+        """
+        Busca por vetor, ignorando as posições removidas e as acrescentadas depois do snapshot.
+        As versões assíncronas e por texto do FAISS VectorStore delegam a este método.
+
+        Um filtro em dicionário é um filtro de metadados (veja MetadataIndex), aplicado antes
+        da busca; `allowed` informa as posições já convertidas de um filtro. Um filtro por
+        função recebe os metadados de cada documento, como no FAISS VectorStore, e é avaliado
+        sobre os fetch_k candidatos da busca. A normalização da consulta e o score_threshold
+        seguem o FAISS VectorStore.
+        """
+        predicate = filter if callable(filter) else None
+        if allowed is None and filter is not None and predicate is None:
+            allowed = self.filter_positions(filter)
+        vector = np.asarray([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vector)
+        scores, positions = self.search_index(vector, max(k, fetch_k) if predicate is not None else k, allowed=allowed)
+        documents = self.documents_at(scores[0], positions[0])
+        if predicate is not None:
+            documents = [(doc, score) for doc, score in documents if predicate(doc.metadata)]
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            compare = (
+                operator.ge
+                if self.distance_strategy in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+                else operator.le
+            )
+            documents = [(doc, score) for doc, score in documents if compare(score, score_threshold)]
+        return documents[:k]
+
+    def search_many(self, vectors, k, allowed=None, nprobe=None, ef_search=None):
+        """
+        Busca os vizinhos de várias consultas em uma única chamada ao índice, ignorando as
+        posições removidas.
+
+        Parâmetros:
+            vectors (np.ndarray): Matriz float32 (n, dimensão) com os vetores das consultas.
+            k (int): O número de resultados por consulta.
+            allowed (np.ndarray, opcional): Posições aceitas, como em search_index.
+            nprobe (int, opcional): nprobe apenas destas buscas (índices IVF).
+            ef_search (int, opcional): efSearch apenas destas buscas (índices HNSW).
+
+        Retorna:
+            list: Para cada consulta, uma lista de (Document, pontuação).
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        scores, positions = self.search_index(vectors, k, nprobe=nprobe, ef_search=ef_search, allowed=allowed)
+        return [self.documents_at(row_scores, row_positions) for row_scores, row_positions in zip(scores, positions)]
+
+    def lexical_documents(self, tokens, k, allowed=None):
+        """
+        Busca no índice BM25 deste snapshot, limitada aos seus documentos ativos e, com um
+        filtro, às posições que o atendem.
+
+        Parâmetros:
+            tokens (list): Os termos da consulta (veja lexical_tokens).
+            k (int): O número de resultados.
+            allowed (np.ndarray, opcional): Posições aceitas, como em search_index.
+
+        Retorna:
+            tuple: (lista de (Document, pontuação), confiança do primeiro resultado).
+        """
+        results, confidence = self.lexical_index.search(
+            tokens, k=k, limit=self.ntotal, exclude=self.excluded, include=allowed
+        )
+        documents = []
+        for position, score in results:
+            doc = self.docstore.search(self.index_to_docstore_id[position])
+            if isinstance(doc, Document):
+                documents.append((doc, score))
+        return documents, confidence
+
+    def documents_at(self, scores, positions):
+        """
+        Monta os resultados de uma busca no índice.
+
+        Parâmetros:
+            scores (np.ndarray): As pontuações.
+            positions (np.ndarray): As posições, com -1 para resultados ausentes.
+
+        Retorna:
+            list: Lista de (Document, pontuação).
+        """
+        return [
+            (self.docstore.search(self.index_to_docstore_id[position]), float(score))
+            for score, position in zip(scores, positions)
+            if position != -1
+        ]
+
 class VectorDB:
-    def __init__(self, persist_directory="./vector_db"):
+    def __init__(self, persist_directory="./vector_db", embeddings=None, embedding_cache=None,
+                 batch_size=DEFAULT_EMBEDDING_BATCH_SIZE, max_batch_chars=DEFAULT_EMBEDDING_BATCH_CHARS,
+                 mmap=False, index_type="flat", index_params=None, search_params=None,
+                 lexical_confidence=DEFAULT_LEXICAL_CONFIDENCE, deduplicate=True, near_duplicate_threshold=0.9,
+                 purge_ratio=DEFAULT_PURGE_RATIO, storage="float32", rerank_factor=0, tokenizer="regex"):
         """
         Inicializa um objeto VectorDB.
 
@@ -22,49 +550,338 @@ class VectorDB:
         Parâmetros:
             persist_directory (str): O diretório onde o banco de dados vetorial será armazenado.
                                      O padrão é "./vector_db".
+            embeddings (Embeddings, opcional): Modelo de embeddings a ser utilizado. Se omitido,
+                                     utiliza o OpenAIEmbeddings.
+            embedding_cache (EmbeddingCache, opcional): Cache em disco consultado antes de cada
+                                     chamada ao modelo de embeddings.
+            batch_size (int): Número máximo de textos por chamada ao modelo de embeddings.
+            max_batch_chars (int): Número máximo de caracteres por chamada ao modelo de embeddings.
+            mmap (bool): Se True, mapeia o índice e os documentos do snapshot em memória, somente
+                                     para leitura, em vez de desserializá-los no heap. Workers no mesmo
+                                     host compartilham o page cache, e a inicialização não depende do
+                                     tamanho do corpus. A primeira escrita copia o índice para a memória.
+            index_type (str): Tipo do índice criado na primeira ingestão: "flat" (busca exata),
+                                     "ivf_flat", "ivf_pq" ou "hnsw". Os índices aproximados são
+                                     treinados com os vetores da primeira ingestão.
+            index_params (dict, opcional): Parâmetros do índice (nlist, m, nbits, M, efConstruction).
+            search_params (dict, opcional): Parâmetros de busca padrão (nprobe, ef_search).
+            lexical_confidence (float): Confiança mínima do BM25 para que retrieve, no modo
+                                     "lexical", responda sem embedar a consulta.
+            deduplicate (bool): Se True, segmentos idênticos ou quase idênticos a outros já indexados
+                                     do mesmo documento e tenant não são embedados nem indexados
+                                     novamente.
+            near_duplicate_threshold (float): Similaridade de Jaccard estimada (MinHash) a partir da
+                                     qual um segmento é considerado quase idêntico. Use 1.0 para
+                                     descartar apenas duplicatas exatas.
+            purge_ratio (float): Fração de documentos removidos a partir da qual eles são
+                                     eliminados do índice por uma compactação em segundo plano.
+            storage (str): Formato dos vetores no índice: "float32" (exato), "float16", "int8"
+                                     (quantização escalar) ou "pq" (quantização por produto, com
+                                     m e nbits de index_params). O ivf_pq sempre usa PQ.
+            rerank_factor (int): Se maior que 1, os vetores completos são gravados também em
+                                     vectors.f32, e cada busca reordena k * rerank_factor
+                                     candidatos do índice pelas distâncias exatas a eles, lidos
+                                     do disco via mmap. 0 desativa o re-ranking e o arquivo.
+            tokenizer (str): O tokenizador do TextPreprocessor dos índices novos, 'regex' ou
+                                     'nltk'. Um índice existente mantém o tokenizador com que
+                                     foi gravado (veja stored_preprocessor).
 
         Lança:
+            ValueError: Se o tipo de índice ou o formato de armazenamento não forem suportados.
+
             ValueError: Se a chave da API do OpenAI não for encontrada nas variáveis de ambiente.
 
         Retorna:
             None
         """
-        # Obtém a chave da API do OpenAI das variáveis de ambiente
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
-        
-        # Inicializa o modelo de embeddings da OpenAI
-        self.embeddings = OpenAIEmbeddings(openai_api_key=api_key)
-        # Inicializa o armazenamento de vetores em memória
-        self.vector_store = None
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Tipo de índice não suportado: {index_type}. Use um de {INDEX_TYPES}")
+        self._validate_storage(index_type, storage)
+        if embeddings is None:
+            # Obtém a chave da API do OpenAI das variáveis de ambiente
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
+
+            # Inicializa o modelo de embeddings da OpenAI
+            embeddings = OpenAIEmbeddings(openai_api_key=api_key)
+        if embedding_cache is not None:
+            # Consulta o cache antes de qualquer chamada ao modelo de embeddings
+            embeddings = CachedEmbeddings(embeddings, embedding_cache)
+        self.embeddings = embeddings
+        # Limites dos lotes de embeddings
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        # Snapshot publicado (versão, FAISS VectorStore). Nunca é alterado depois de publicado:
+        # as escritas acrescentam ao índice, ao docstore e ao mapeamento de ids compartilhados,
+        # e publicam um novo snapshot com o novo limite de posições (read-copy-update)
+        self._snapshot = (0, None)
+        # Lock de leitores e escritor do índice compartilhado (veja IndexLock)
+        self._index_lock = IndexLock()
+        # Índice carregado via mmap, somente para leitura: é copiado para o heap na primeira escrita
+        self._mapped_index = None
         # Define o diretório para persistência em disco
         self.persist_directory = persist_directory
+        # Persistência incremental: cada gravação acrescenta apenas os vetores novos
+        self.store = SegmentStore(persist_directory)
+        # Entradas adicionadas em memória e ainda não persistidas
+        self._pending = []
+        # Carregamento via mmap do snapshot em disco
+        self.mmap = mmap
+        # Tipo de índice e parâmetros de busca
+        self.index_type = index_type
+        self.index_params = dict(index_params or {})
+        self.search_params = dict(search_params or {})
+        # Indica que a próxima gravação deve ser um snapshot completo (índice novo ou migrado)
+        self._needs_snapshot = False
+        # Serializa os escritores; os leitores nunca aguardam este lock
+        self._write_lock = threading.RLock()
+        # Índice léxico BM25, com as mesmas posições do índice FAISS
+        self.lexical_index = BM25Index()
+        # Índice invertido dos metadados, usado nos filtros, com as mesmas posições do índice FAISS
+        self.metadata_index = MetadataIndex()
+        self.lexical_confidence = lexical_confidence
+        # Deduplicação de segmentos, com as mesmas posições do índice FAISS
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.deduplicator = Deduplicator(near_duplicate_threshold=near_duplicate_threshold) if deduplicate else None
+        # Hash SHA-256 dos arquivos já ingeridos -> {"source", "chunks"}
+        self._files = {}
+        # Registro de documentos: source -> ids dos segmentos ativos, e id -> posição dos
+        # segmentos ativos, montados no primeiro uso
+        self._sources = None
+        self._chunk_positions = None
+        # Compactação das posições removidas
+        self.purge_ratio = purge_ratio
+        self._purge_thread = None
+        # Formato dos vetores no índice e vetores completos para o re-ranking, com as mesmas
+        # posições do índice FAISS
+        self.storage = storage
+        self.rerank_factor = rerank_factor
+        self.vector_file = VectorFile(self._path(VECTORS_FILE)) if rerank_factor > 1 else None
 
         # Inicializa o pre-processador com o idioma em português
-        self.preprocessor = TextPreprocessor(language='portuguese')
+        self.preprocessor = stored_preprocessor([persist_directory], tokenizer)
+        if stored_preprocessor_version(persist_directory) is not None:
+            self._record_preprocessor()
         
         # Tenta carregar um banco de dados existente do disco para a memória
         self.load()
 
-    def add(self, texts, metadatas):
+    def _record_preprocessor(self):
+        """Registra a versão do pré-processamento no diretório, se ainda não registrada."""
+        path = self._path(PREPROCESSOR_FILE)
+        if not os.path.exists(path):
+            os.makedirs(self.persist_directory, exist_ok=True)
+            atomic_write(path, lambda f: json.dump({"version": self.preprocessor.version}, f), mode="w")
+
+    @staticmethod
+    def _validate_storage(index_type, storage):
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Formato de armazenamento não suportado: {storage}. Use um de {STORAGE_TYPES}")
+        if index_type == "ivf_pq" and storage not in ("float32", "pq"):
+            raise ValueError(f"O índice ivf_pq já armazena os vetores com PQ e não aceita o formato {storage}")
+
+    @property
+    def vector_store(self):
+        """O FAISS VectorStore do snapshot publicado, ou None se o banco estiver vazio."""
+        return self._snapshot[1]
+
+    @property
+    def version(self):
+        """A versão do snapshot publicado, incrementada a cada alteração do índice."""
+        return self._snapshot[0]
+
+    def snapshot(self):
+        """
+        Retorna o snapshot publicado, de forma consistente.
+
+        O VectorStore retornado não é alterado por escritas posteriores, que publicam um
+        novo snapshot. Uma consulta que o utilize do início ao fim vê sempre o mesmo índice.
+
+        Retorna:
+            tuple: (versão, FAISS VectorStore ou None).
+        """
+        return self._snapshot
+
+    def status(self):
+        """
+        Retorna o estado do banco de dados vetorial.
+
+        Retorna:
+            dict: O número de documentos ativos, em 'total_documents', se o banco está vazio,
+                em 'is_empty', a versão do snapshot publicado, em 'version', e o número de
+                documentos removidos que aguardam a compactação, em 'deleted_pending_compaction'.
+        """
+        version, vector_store = self.snapshot()
+        deleted = len(vector_store.deleted) if vector_store is not None else 0
+        total = vector_store.ntotal - deleted if vector_store is not None else 0
+        return {
+            "total_documents": total,
+            "is_empty": total == 0,
+            "version": version,
+            "deleted_pending_compaction": deleted,
+        }
+
+    def _publish(self, vector_store):
+        """
+        Publica um novo snapshot com a troca atômica de uma única referência.
+
+        Parâmetros:
+            vector_store (FAISS | None): O novo VectorStore, que não deve mais ser alterado.
+        """
+        self._snapshot = (self._snapshot[0] + 1, vector_store)
+
+    def add(self, texts, metadatas, stats=None, replaces=None):
         """
         Adiciona uma lista de textos e metadados ao banco de dados vetorial.
 
-        Este método pré-processa os textos, cria ou atualiza o armazenamento de vetores em memória,
-        e então persiste os dados em disco.
+        Este método pré-processa os textos, gera os embeddings em lotes limitados por
+        quantidade e tamanho, cria ou atualiza o armazenamento de vetores em memória
+        com uma única inserção, e então persiste os dados em disco uma única vez.
+
+        Com a deduplicação ativa, segmentos idênticos ou quase idênticos a outros já indexados
+        (ou a outros do mesmo lote) do mesmo documento e tenant são descartados antes dos
+        embeddings; um trecho comum a dois documentos é indexado em cada um.
 
         Parâmetros:
             texts (list): Lista de textos a serem adicionados.
             metadados (list): Lista de metadados correspondentes aos textos.
+            stats (dict, opcional): Acumulador ao qual são somadas as contagens 'added',
+                                     'duplicates' e 'near_duplicates'.
+            replaces (Iterable[str], opcional): Ids dos segmentos da versão anterior de um documento
+                                     que está sendo substituído (veja source_chunks). Eles não contam
+                                     como duplicatas, já que serão removidos após a substituição.
 
         Retorno:
-            None
+            int: O número de textos adicionados, sem as duplicatas.
 
         Exceções:
             ValueError: Se texts ou metadados forem None, ou se não forem listas, ou se tiverem tamanhos diferentes.
             Exception: Se ocorrer um erro durante a adição ao banco de dados.
         """
+        self._validate(texts, metadatas)
+
+        # Adiciona os textos ao banco de dados vetorial
+        try:
+            logger.info(f"Adicionando {len(texts)} textos ao VectorDB em memória")
+            if not texts:
+                return 0
+
+            # Pré-processa os textos
+            preprocessed_texts = self.preprocessor.preprocess_many(texts)
+
+            # Descarta as duplicatas antes de gerar os embeddings
+            preprocessed_texts, metadatas, reservation = self._deduplicate(preprocessed_texts, metadatas, stats, replaces)
+            try:
+                if not preprocessed_texts:
+                    return 0
+
+                # Gera os embeddings em lotes limitados
+                vectors = self._embed_in_batches(preprocessed_texts)
+
+                # Insere no índice e persiste em disco
+                self._insert(preprocessed_texts, vectors, metadatas, reservation)
+            finally:
+                self._release(reservation)
+            return len(preprocessed_texts)
+        except Exception as e:
+            logger.error(f"Erro ao adicionar ao VectorDB: {str(e)}")
+            raise
+
+    async def aadd(self, texts, metadatas, stats=None, replaces=None):
+        """
+        Versão assíncrona de add, que não bloqueia o event loop.
+
+        O pré-processamento, a inserção no índice e a gravação em disco rodam em threads,
+        e os embeddings são gerados com o cliente assíncrono do modelo.
+
+        Parâmetros:
+            texts (list): Lista de textos a serem adicionados.
+            metadados (list): Lista de metadados correspondentes aos textos.
+            stats (dict, opcional): Acumulador das contagens, como em add.
+            replaces (Iterable[str], opcional): Ids dos segmentos substituídos, como em add.
+
+        Retorno:
+            int: O número de textos adicionados, sem as duplicatas.
+
+        Exceções:
+            ValueError: Se texts ou metadados forem inválidos.
+            Exception: Se ocorrer um erro durante a adição ao banco de dados.
+        """
+        self._validate(texts, metadatas)
+        try:
+            logger.info(f"Adicionando {len(texts)} textos ao VectorDB em memória")
+            if not texts:
+                return 0
+            preprocessed_texts = await asyncio.to_thread(self.preprocessor.preprocess_many, texts)
+            preprocessed_texts, metadatas, reservation = await asyncio.to_thread(
+                self._deduplicate, preprocessed_texts, metadatas, stats, replaces
+            )
+            try:
+                if not preprocessed_texts:
+                    return 0
+                vectors = []
+                for batch in self._iter_batches(preprocessed_texts):
+                    vectors.extend(await self.embeddings.aembed_documents(batch))
+                await asyncio.to_thread(self._insert, preprocessed_texts, vectors, metadatas, reservation)
+            finally:
+                self._release(reservation)
+            return len(preprocessed_texts)
+        except Exception as e:
+            logger.error(f"Erro ao adicionar ao VectorDB: {str(e)}")
+            raise
+
+    def _deduplicate(self, preprocessed_texts, metadatas, stats=None, replaces=None):
+        """
+        Descarta os segmentos duplicados e reserva os demais no deduplicador.
+
+        Parâmetros:
+            preprocessed_texts (list): Textos pré-processados.
+            metadatas (list): Metadados dos textos.
+            stats (dict, opcional): Acumulador das contagens 'added', 'duplicates' e 'near_duplicates'.
+            replaces (Iterable[str], opcional): Ids dos segmentos desconsiderados na comparação.
+
+        Retorna:
+            tuple: (textos aceitos, metadados aceitos, Reservation ou None sem deduplicação).
+        """
+        if stats is not None:
+            for key in ("added", "duplicates", "near_duplicates"):
+                stats.setdefault(key, 0)
+        if self.deduplicator is None:
+            if stats is not None:
+                stats["added"] += len(preprocessed_texts)
+            return preprocessed_texts, metadatas, None
+        ignore = self._chunk_positions_of(replaces) if replaces else frozenset()
+        scopes = [dedup_scope(metadata) for metadata in metadatas]
+        reservation = self.deduplicator.reserve(preprocessed_texts, ignore=ignore, scopes=scopes)
+        if reservation.duplicates or reservation.near_duplicates:
+            logger.info(
+                f"Descartados {reservation.duplicates} segmentos duplicados e "
+                f"{reservation.near_duplicates} quase duplicados"
+            )
+        if stats is not None:
+            stats["added"] += len(reservation.keep)
+            stats["duplicates"] += reservation.duplicates
+            stats["near_duplicates"] += reservation.near_duplicates
+        return (
+            [preprocessed_texts[i] for i in reservation.keep],
+            [metadatas[i] for i in reservation.keep],
+            reservation,
+        )
+
+    def _release(self, reservation):
+        """Libera a reserva do deduplicador, após a inserção ou um erro."""
+        if reservation is not None:
+            self.deduplicator.release(reservation)
+
+    @staticmethod
+    def _validate(texts, metadatas):
+        """
+        Valida os textos e metadados recebidos por add e aadd.
+
+        Lança:
+            ValueError: Se texts ou metadados forem None, ou se não forem listas, ou se tiverem tamanhos diferentes.
+        """
         # Valida as entradas antes de processar
         if texts is None or metadatas is None:
             raise ValueError("Textos e metadados não podem ser None")
@@ -77,32 +894,272 @@ class VectorDB:
         if len(texts) != len(metadatas):
             raise ValueError("O número de textos deve ser igual ao número de metadados")
 
-        # Adiciona os textos ao banco de dados vetorial
-        try:
-            logger.info(f"Adicionando {len(texts)} textos ao VectorDB em memória")
-            logger.info(f"Metadados: {metadatas}")
-            
-            # Pré-processa os textos
-            preprocessed_texts = [self.preprocessor.preprocess(text) for text in texts]
-            
-            if self.vector_store is None:
+    def _insert(self, preprocessed_texts, vectors, metadatas, reservation=None):
+        """
+        Insere textos já embedados no índice em memória e persiste a alteração em disco.
+
+        As escritas são serializadas por um lock e acrescentadas ao índice, ao docstore e ao
+        mapeamento de ids compartilhados com o snapshot atual, sem copiá-los; um novo snapshot,
+        com o novo limite de posições, é publicado ao final. Consultas em andamento continuam
+        no snapshot anterior, que não vê as posições novas, e aguardam apenas o index.add.
+
+        Parâmetros:
+            preprocessed_texts (list): Textos pré-processados.
+            vectors (list): Vetores dos textos.
+            metadatas (list): Metadados dos textos.
+            reservation (Reservation, opcional): A reserva do deduplicador para estes textos.
+        """
+        with self._write_lock:
+            ids = [str(uuid.uuid4()) for _ in preprocessed_texts]
+            matrix = np.asarray(vectors, dtype=np.float32)
+            current = self.vector_store
+            start = current.ntotal if current is not None else 0
+
+            if current is None:
                 # Cria um novo FAISS VectorStore em memória se ainda não existir
                 logger.info("Inicializando novo FAISS VectorStore em memória")
-                self.vector_store = FAISS.from_texts(preprocessed_texts, self.embeddings, metadatas=metadatas)
-            else:
-                # Adiciona ao FAISS VectorStore existente em memória
-                logger.info("Adicionando a FAISS VectorStore existente em memória")
-                self.vector_store.add_texts(preprocessed_texts, metadatas=metadatas)
+                current = self._create_vector_store(matrix)
+            elif current.index is self._mapped_index:
+                # Um índice mapeado somente para leitura é copiado para o heap uma única vez
+                logger.info("Copiando o índice mapeado em memória para receber escritas")
+                current = self._snapshot_store(faiss.clone_index(current.index), current.docstore,
+                                               current.index_to_docstore_id, deleted=current.deleted,
+                                               normalize_L2=current._normalize_L2)
+                self._mapped_index = None
+            index_vectors = matrix.copy()
+            if current._normalize_L2:
+                faiss.normalize_L2(index_vectors)
+            with self._index_lock.write():
+                current.index.add(index_vectors)
+            # As posições novas ficam fora do snapshot publicado até a troca abaixo
+            current.docstore.add({
+                doc_id: Document(page_content=text, metadata=metadata)
+                for doc_id, text, metadata in zip(ids, preprocessed_texts, metadatas)
+            })
+            current.index_to_docstore_id.update(enumerate(ids, start=start))
+            vector_store = self._snapshot_store(current.index, current.docstore, current.index_to_docstore_id,
+                                                deleted=current.deleted, normalize_L2=current._normalize_L2)
+            if self.vector_file is not None:
+                self.vector_file.add(matrix)
+            # Indexa os termos e os metadados antes de publicar, para que o snapshot novo já os encontre
+            self.lexical_index.add([lexical_tokens(text) for text in preprocessed_texts])
+            self.metadata_index.add(metadatas)
+            if self.deduplicator is not None:
+                if reservation is not None:
+                    self.deduplicator.add(reservation.hashes, reservation.signatures, reservation.scopes)
+                else:
+                    self.deduplicator.add_texts(preprocessed_texts, [dedup_scope(metadata) for metadata in metadatas])
+            if self._sources is not None:
+                for position, (doc_id, metadata) in enumerate(zip(ids, metadatas), start=start):
+                    self._sources.setdefault(metadata.get("source"), []).append(doc_id)
+                    self._chunk_positions[doc_id] = position
+            self._publish(vector_store)
+
+            # Registra as entradas novas para a próxima gravação incremental
+            self._pending.append((ids, matrix, preprocessed_texts, metadatas))
             
-            logger.info(f"Total de documentos após adição em memória: {self.vector_store.index.ntotal}")
+            logger.info(f"Total de documentos após adição em memória: {vector_store.ntotal}")
             
             # Persiste o banco de dados em disco após a adição em memória
             self.save()
-        except Exception as e:
-            logger.error(f"Erro ao adicionar ao VectorDB: {str(e)}")
-            raise
 
-    def search(self, query, k=5):
+    def add_documents(self, segments, stats=None, replaces=None):
+        """
+        Adiciona em lote os segmentos produzidos pelo DocumentProcessor.
+
+        Todos os segmentos de uma requisição são embedados em lotes, inseridos no índice
+        de uma só vez e persistidos em disco uma única vez ao final.
+
+        Parâmetros:
+            segments (list): Lista de dicionários com as chaves 'content' e 'metadata'.
+            stats (dict, opcional): Acumulador das contagens de deduplicação, como em add.
+            replaces (Iterable[str], opcional): Ids dos segmentos substituídos, como em add.
+
+        Retorno:
+            int: O número de segmentos adicionados, sem as duplicatas.
+
+        Exceções:
+            ValueError: Se algum segmento não possuir as chaves 'content' e 'metadata'.
+        """
+        texts, metadatas = self._unpack_segments(segments)
+        return self.add(texts, metadatas, stats, replaces)
+
+    async def aadd_documents(self, segments, stats=None, replaces=None):
+        """
+        Versão assíncrona de add_documents, que não bloqueia o event loop.
+
+        Parâmetros:
+            segments (list): Lista de dicionários com as chaves 'content' e 'metadata'.
+            stats (dict, opcional): Acumulador das contagens de deduplicação, como em add.
+            replaces (Iterable[str], opcional): Ids dos segmentos substituídos, como em add.
+
+        Retorno:
+            int: O número de segmentos adicionados, sem as duplicatas.
+        """
+        texts, metadatas = self._unpack_segments(segments)
+        return await self.aadd(texts, metadatas, stats, replaces)
+
+    @staticmethod
+    def _unpack_segments(segments):
+        """
+        Separa os segmentos em listas de textos e metadados.
+
+        Lança:
+            ValueError: Se algum segmento não possuir as chaves 'content' e 'metadata'.
+        """
+        if segments is None:
+            raise ValueError("Segmentos não podem ser None")
+        try:
+            texts = [segment["content"] for segment in segments]
+            metadatas = [segment["metadata"] for segment in segments]
+        except (KeyError, TypeError):
+            raise ValueError("Cada segmento deve conter as chaves 'content' e 'metadata'")
+        return texts, metadatas
+
+    def _iter_batches(self, texts):
+        """
+        Divide os textos em lotes limitados pelo número de textos e pelo total de caracteres.
+
+        Parâmetros:
+            texts (list): Lista de textos pré-processados.
+
+        Retorna:
+            generator: Gera listas de textos consecutivos respeitando os limites configurados.
+        """
+        return iter_batches(texts, self.batch_size, self.max_batch_chars)
+
+    def _embed_in_batches(self, texts):
+        """
+        Gera os embeddings dos textos, uma chamada ao modelo por lote.
+
+        Parâmetros:
+            texts (list): Lista de textos pré-processados.
+
+        Retorna:
+            list: Lista de vetores na mesma ordem dos textos.
+        """
+        vectors = []
+        for batch in self._iter_batches(texts):
+            vectors.extend(self.embeddings.embed_documents(batch))
+        return vectors
+
+    def _create_vector_store(self, vectors):
+        """
+        Cria um FAISS VectorStore vazio com o tipo de índice configurado.
+
+        Índices aproximados e quantizados são treinados com os vetores da primeira ingestão.
+        Se não houver vetores suficientes para o treino, usa um índice exato, que pode ser
+        migrado depois com migrate_index.
+
+        Parâmetros:
+            vectors (np.ndarray): Vetores da primeira ingestão.
+
+        Retorna:
+            FAISS: O VectorStore vazio.
+        """
+        index = None
+        if self.index_type != "flat" or self.storage != "float32":
+            required = min_training_points(self.index_type, self.index_params, self.storage)
+            if len(vectors) >= required:
+                index = build_index(self.index_type, vectors, self.index_params, self.storage)
+                # O snapshot completo preserva o índice treinado no disco
+                self._needs_snapshot = True
+            else:
+                logger.warning(
+                    f"Vetores insuficientes para treinar o índice {self.index_type} ({self.storage}) "
+                    f"({len(vectors)} de {required}); usando índice exato"
+                )
+        if index is None:
+            index = faiss.IndexFlatL2(vectors.shape[1])
+        set_search_params(index, **self.search_params)
+        return self._snapshot_store(index, InMemoryDocstore(), {})
+
+    def _snapshot_store(self, index, docstore, index_to_docstore_id, deleted=frozenset(), normalize_L2=False):
+        """
+        Cria um snapshot com todas as posições atuais do índice e os índices léxico e de
+        metadados e o arquivo de vetores atuais.
+        """
+        return SnapshotFAISS(self.embeddings, index, docstore, index_to_docstore_id, deleted=deleted,
+                             lexical_index=self.lexical_index, vector_file=self.vector_file,
+                             rerank_factor=self.rerank_factor, metadata_index=self.metadata_index,
+                             normalize_L2=normalize_L2, ntotal=index.ntotal, index_lock=self._index_lock)
+
+    def _full_vectors(self, vector_store):
+        """
+        Recupera os vetores de todas as posições de um snapshot: os completos, do arquivo de
+        vetores, se houver; caso contrário, os reconstruídos do índice (aproximados se ele
+        for quantizado).
+        """
+        total = vector_store.ntotal
+        if self.vector_file is not None and self.vector_file.size >= total:
+            return self.vector_file.get(np.arange(total))
+        return reconstruct_all(faiss.clone_index(vector_store.index))[:total]
+
+    def migrate_index(self, index_type, index_params=None, storage=None):
+        """
+        Migra o índice atual para outro tipo ou formato de armazenamento, mantendo os
+        documentos e a ordem do índice.
+
+        Os vetores são lidos do arquivo de vetores completos, se houver, ou recuperados do
+        índice atual, usados para treinar o novo índice e reinseridos nele. O resultado é
+        persistido como um snapshot completo.
+
+        Parâmetros:
+            index_type (str): Um dos tipos de INDEX_TYPES.
+            index_params (dict, opcional): Parâmetros do novo índice.
+            storage (str, opcional): Um dos formatos de STORAGE_TYPES. Se omitido, mantém o atual.
+
+        Retorna:
+            None
+
+        Lança:
+            ValueError: Se o tipo ou o formato não forem suportados ou não houver vetores
+                suficientes para o treino.
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Tipo de índice não suportado: {index_type}. Use um de {INDEX_TYPES}")
+        storage = storage or self.storage
+        self._validate_storage(index_type, storage)
+        self.index_type = index_type
+        self.index_params = dict(index_params or {})
+        self.storage = storage
+        with self._write_lock:
+            current = self.vector_store
+            if current is None:
+                return
+            logger.info(f"Migrando índice com {current.ntotal} vetores para {index_type} ({storage})")
+            vectors = self._full_vectors(current)
+            if index_type == "flat" and storage == "float32":
+                index = faiss.IndexFlatL2(vectors.shape[1])
+            else:
+                index = build_index(index_type, vectors, self.index_params, storage)
+            index.add(vectors)
+            set_search_params(index, **self.search_params)
+            # O docstore e o mapeamento de ids não mudam e são compartilhados com o snapshot anterior
+            self._publish(self._snapshot_store(index, current.docstore, current.index_to_docstore_id,
+                                               deleted=current.deleted, normalize_L2=current._normalize_L2))
+            self._needs_snapshot = True
+            self.save()
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """
+        Define os parâmetros de busca padrão do índice aproximado.
+
+        Parâmetros:
+            nprobe (int, opcional): Número de listas visitadas pelos índices IVF.
+            ef_search (int, opcional): Tamanho da lista de candidatos dos índices HNSW.
+
+        Retorna:
+            None
+        """
+        if nprobe is not None:
+            self.search_params["nprobe"] = nprobe
+        if ef_search is not None:
+            self.search_params["ef_search"] = ef_search
+        if self.vector_store is not None:
+            set_search_params(self.vector_store.index, **self.search_params)
+
+    def search(self, query, k=5, nprobe=None, ef_search=None, filter=None):
         """
         Realiza uma busca por similaridade no banco de dados vetorial em memória.
 
@@ -111,6 +1168,10 @@ class VectorDB:
         Parâmetros:
             query (str): A query a ser pesquisada.
             k (int, opcional): O número máximo de resultados a serem retornados. O padrão é 5.
+            nprobe (int, opcional): nprobe apenas desta busca (índices IVF).
+            ef_search (int, opcional): efSearch apenas desta busca (índices HNSW).
+            filter (dict, opcional): Filtro de metadados (veja MetadataIndex), convertido nas
+                posições aceitas antes da busca.
 
         Retorna:
             list: Uma lista de tuplas contendo o conteúdo da página, os metadados e a pontuação do documento.
@@ -120,25 +1181,256 @@ class VectorDB:
                     - A pontuação do documento (float)
 
         Exceções:
-            None
+            ValueError: Se o filtro for inválido.
         """
+        # Lê o snapshot publicado uma única vez: escritas concorrentes não o alteram
+        vector_store = self.vector_store
         # Verifica se o FAISS VectorStore foi inicializado corretamente em memória
-        if self.vector_store is None or self.vector_store.index.ntotal == 0:
+        if vector_store is None or vector_store.ntotal == 0:
+            return []
+        allowed = vector_store.filter_positions(filter) if filter is not None else None
+        if allowed is not None and not len(allowed):
             return []
         
-        # Pré-processa a query
-        preprocessed_query = self.preprocessor.preprocess(query)
+        # Pré-processa a query (consultas repetidas são atendidas pelo cache do preprocessador)
+        preprocessed_query = self.preprocessor.preprocess_query(query)
         
-        # Realiza a busca por similaridade no FAISS com a pergunta pre-processada
-        results = self.vector_store.similarity_search_with_score(preprocessed_query, k=k)
+        if nprobe is None and ef_search is None and allowed is None:
+            # Realiza a busca por similaridade no FAISS com a pergunta pre-processada
+            results = vector_store.similarity_search_with_score(preprocessed_query, k=k)
+        else:
+            # Parâmetros de busca apenas para esta consulta, sem alterar o índice compartilhado
+            embedding = np.asarray([self.embeddings.embed_query(preprocessed_query)], dtype=np.float32)
+            scores, positions = vector_store.search_index(embedding, k, nprobe=nprobe, ef_search=ef_search, allowed=allowed)
+            results = vector_store.documents_at(scores[0], positions[0])
         # Retorna uma lista de tuplas com o conteúdo da página, os metadados e a pontuação
         return [(doc.page_content, doc.metadata, score) for doc, score in results]
 
+    def lexical_search(self, query, k=5, filter=None):
+        """
+        Realiza uma busca léxica (BM25) no banco de dados, sem embedar a consulta.
+
+        Parâmetros:
+            query (str): A query a ser pesquisada.
+            k (int, opcional): O número máximo de resultados a serem retornados. O padrão é 5.
+            filter (dict, opcional): Filtro de metadados, como em search.
+
+        Retorna:
+            list: Uma lista de tuplas (conteúdo da página, metadados, pontuação BM25), no mesmo
+                formato de search.
+        """
+        vector_store = self.vector_store
+        if vector_store is None:
+            return []
+        allowed = vector_store.filter_positions(filter) if filter is not None else None
+        results, _ = self._lexical_documents(vector_store, query, k, allowed)
+        return [(doc.page_content, doc.metadata, score) for doc, score in results]
+
+    def retrieve(self, query, k=4, mode="hybrid", vector_store=None, filter=None):
+        """
+        Recupera os documentos mais relevantes para uma consulta.
+
+        Parâmetros:
+            query (str): A consulta.
+            k (int): O número de documentos.
+            mode (str): "vector" usa apenas a busca vetorial; "hybrid" combina a busca vetorial e
+                a BM25 com Reciprocal Rank Fusion; "lexical" usa apenas a BM25, sem embedar a
+                consulta, quando a sua confiança atinge lexical_confidence, e caso contrário
+                se comporta como "hybrid".
+            vector_store (FAISS, opcional): O snapshot a ser consultado. O padrão é o publicado.
+            filter (dict, opcional): Filtro de metadados (veja MetadataIndex). As duas buscas
+                são restritas às posições que o atendem.
+
+        Retorna:
+            List[Document]: Os documentos, em ordem decrescente de relevância.
+
+        Lança:
+            ValueError: Se o modo ou o filtro não forem suportados.
+        """
+        vector_store, allowed, lexical, confident = self._prepare_retrieval(query, k, mode, vector_store, filter)
+        if vector_store is None:
+            return []
+        if confident:
+            return [doc for doc, _ in lexical[:k]]
+        vector = vector_store.similarity_search_with_score(
+            query, k=k if lexical is None else k * HYBRID_FETCH_FACTOR, allowed=allowed
+        )
+        return self._finish_retrieval(k, lexical, vector)
+
+    async def aretrieve(self, query, k=4, mode="hybrid", vector_store=None, filter=None):
+        """
+        Versão assíncrona de retrieve, que usa o cliente assíncrono do modelo de embeddings.
+
+        Parâmetros e retorno iguais aos de retrieve.
+        """
+        vector_store, allowed, lexical, confident = self._prepare_retrieval(query, k, mode, vector_store, filter)
+        if vector_store is None:
+            return []
+        if confident:
+            return [doc for doc, _ in lexical[:k]]
+        vector = await vector_store.asimilarity_search_with_score(
+            query, k=k if lexical is None else k * HYBRID_FETCH_FACTOR, allowed=allowed
+        )
+        return self._finish_retrieval(k, lexical, vector)
+
+    def retrieve_many(self, queries, k=4, mode="hybrid", vector_store=None, filter=None):
+        """
+        Recupera os documentos de várias consultas, com o mesmo resultado de retrieve para
+        cada uma.
+
+        Todas as consultas usam o mesmo snapshot. As que precisam da busca vetorial são
+        embedadas em lotes (uma chamada ao modelo por lote, com as repetidas embedadas uma
+        única vez) e buscadas no FAISS em uma única chamada, com a matriz das consultas.
+
+        Parâmetros:
+            queries (list): As consultas.
+            k (int): O número de documentos por consulta.
+            mode (str): O modo de recuperação, como em retrieve.
+            vector_store (FAISS, opcional): O snapshot a ser consultado. O padrão é o publicado.
+            filter (dict, opcional): Filtro de metadados aplicado a todas as consultas, como em retrieve.
+
+        Retorna:
+            list: Para cada consulta, a lista de documentos em ordem decrescente de relevância.
+
+        Lança:
+            ValueError: Se o modo ou o filtro não forem suportados.
+        """
+        vector_store, allowed, lexical, pending = self._prepare_many(queries, k, mode, vector_store, filter)
+        if vector_store is None:
+            return [[] for _ in queries]
+        unique = list(dict.fromkeys(queries[i] for i in pending))
+        vectors = self._embed_in_batches(unique) if unique else []
+        return self._finish_many(vector_store, allowed, queries, k, lexical, pending, unique, vectors)
+
+    async def aretrieve_many(self, queries, k=4, mode="hybrid", vector_store=None, filter=None):
+        """
+        Versão assíncrona de retrieve_many, que usa o cliente assíncrono do modelo de embeddings.
+
+        Parâmetros e retorno iguais aos de retrieve_many.
+        """
+        vector_store, allowed, lexical, pending = await asyncio.to_thread(
+            self._prepare_many, queries, k, mode, vector_store, filter
+        )
+        if vector_store is None:
+            return [[] for _ in queries]
+        unique = list(dict.fromkeys(queries[i] for i in pending))
+        vectors = []
+        for batch in self._iter_batches(unique):
+            vectors.extend(await self.embeddings.aembed_documents(batch))
+        return await asyncio.to_thread(
+            self._finish_many, vector_store, allowed, queries, k, lexical, pending, unique, vectors
+        )
+
+    def _prepare_many(self, queries, k, mode, vector_store, filter=None):
+        """
+        Converte o filtro nas posições aceitas e executa a busca léxica de cada consulta,
+        quando o modo a utiliza.
+
+        Retorna:
+            tuple: (snapshot, posições aceitas ou None, resultados BM25 de cada consulta (None
+                no modo "vector"), índices das consultas que precisam da busca vetorial).
+                O snapshot é None se o banco estiver vazio ou nenhum documento atender ao filtro.
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modo de recuperação não suportado: {mode}. Use um de {RETRIEVAL_MODES}")
+        vector_store = vector_store if vector_store is not None else self.vector_store
+        if vector_store is None:
+            return None, None, None, []
+        allowed = vector_store.filter_positions(filter) if filter is not None else None
+        if allowed is not None and not len(allowed):
+            return None, None, None, []
+        lexical = [None] * len(queries)
+        pending = []
+        for i, query in enumerate(queries):
+            if mode != "vector":
+                lexical[i], confidence = self._lexical_documents(vector_store, query, k * HYBRID_FETCH_FACTOR, allowed)
+                if mode == "lexical" and lexical[i] and confidence >= self.lexical_confidence:
+                    continue
+            pending.append(i)
+        if mode == "lexical" and len(pending) < len(queries):
+            logger.info(f"{len(queries) - len(pending)} de {len(queries)} consultas respondidas pela busca léxica")
+        return vector_store, allowed, lexical, pending
+
+    def _finish_many(self, vector_store, allowed, queries, k, lexical, pending, unique, vectors):
+        """
+        Faz a busca vetorial das consultas pendentes em uma única chamada ao índice e monta
+        os resultados de todas as consultas.
+        """
+        results = [None] * len(queries)
+        if unique:
+            fetch_k = k if lexical[pending[0]] is None else k * HYBRID_FETCH_FACTOR
+            rows = dict(zip(unique, vector_store.search_many(np.asarray(vectors, dtype=np.float32), fetch_k, allowed)))
+            for i in pending:
+                results[i] = self._finish_retrieval(k, lexical[i], rows[queries[i]])
+        for i, documents in enumerate(results):
+            if documents is None:
+                # Consulta respondida apenas pela busca léxica
+                results[i] = [doc for doc, _ in lexical[i][:k]]
+        return results
+
+    def _prepare_retrieval(self, query, k, mode, vector_store, filter=None):
+        """
+        Valida o modo, converte o filtro nas posições aceitas e executa a busca léxica,
+        quando o modo a utiliza.
+
+        Retorna:
+            tuple: (snapshot, posições aceitas ou None, resultados BM25 ou None no modo
+                "vector", se a busca léxica basta). O snapshot é None se o banco estiver
+                vazio ou nenhum documento atender ao filtro.
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modo de recuperação não suportado: {mode}. Use um de {RETRIEVAL_MODES}")
+        vector_store = vector_store if vector_store is not None else self.vector_store
+        if vector_store is None:
+            return None, None, None, False
+        allowed = vector_store.filter_positions(filter) if filter is not None else None
+        if allowed is not None and not len(allowed):
+            return None, None, None, False
+        if mode == "vector":
+            return vector_store, allowed, None, False
+        lexical, confidence = self._lexical_documents(vector_store, query, k * HYBRID_FETCH_FACTOR, allowed)
+        confident = mode == "lexical" and bool(lexical) and confidence >= self.lexical_confidence
+        if confident:
+            logger.info(f"Consulta respondida pela busca léxica (confiança {confidence:.2f})")
+        return vector_store, allowed, lexical, confident
+
+    @staticmethod
+    def _finish_retrieval(k, lexical, vector):
+        """
+        Monta a lista final de documentos: apenas os vetoriais, ou a fusão dos rankings
+        vetorial e léxico por Reciprocal Rank Fusion.
+        """
+        if lexical is None:
+            return [doc for doc, _ in vector[:k]]
+        documents = {}
+        rankings = []
+        for results in (vector, lexical):
+            ranking = []
+            for doc, _ in results:
+                # O mesmo documento é identificado pelo conteúdo e pelos metadados nos dois rankings
+                key = (doc.page_content, json.dumps(doc.metadata, sort_keys=True, default=str))
+                documents.setdefault(key, doc)
+                ranking.append(key)
+            rankings.append(ranking)
+        return [documents[key] for key in reciprocal_rank_fusion(rankings)[:k]]
+
+    def _lexical_documents(self, vector_store, query, k, allowed=None):
+        """
+        Busca no índice BM25 do snapshot informado, limitada aos seus documentos ativos e,
+        com um filtro, às posições que o atendem.
+
+        Retorna:
+            tuple: (lista de (Document, pontuação), confiança do primeiro resultado).
+        """
+        return vector_store.lexical_documents(lexical_tokens(self.preprocessor.preprocess_query(query)), k, allowed)
+
     def get_vector_store(self):
         """
         Retorna o armazenamento de vetores atual em memória.
 
-        Este método é utilizado para acessar o FAISS VectorStore diretamente.
+        Este método é utilizado para acessar o FAISS VectorStore diretamente. O VectorStore
+        retornado é um snapshot imutável: documentos adicionados depois ficam visíveis na
+        próxima chamada, sem afetar quem ainda usa o anterior.
 
         Parâmetros:
             None
@@ -150,10 +1442,11 @@ class VectorDB:
 
     def save(self):
         """
-        Persiste o banco de dados vetorial em disco.
+        Persiste em disco as entradas adicionadas desde a última gravação.
 
-        Este método salva o FAISS VectorStore e informações adicionais necessárias
-        para reconstruir o banco de dados em futuras sessões.
+        Este método acrescenta um novo segmento com os vetores e documentos pendentes,
+        sem reescrever o índice nem o docstore já persistidos. A troca do manifesto é
+        atômica, e os segmentos acumulados são compactados em segundo plano.
 
         Parâmetros:
             None
@@ -161,18 +1454,66 @@ class VectorDB:
         Retorna:
             None
         """
-        if self.vector_store:
-            logger.info(f"Salvando VectorDB da memória para o disco em {self.persist_directory}")
-            # Salva o FAISS VectorStore em disco
-            self.vector_store.save_local(self.persist_directory)
-            
-            logger.info("VectorDB salvo com sucesso em disco")
+        if self._needs_snapshot or self._pending:
+            self._record_preprocessor()
+        if self._needs_snapshot:
+            self._write_snapshot()
+            self._save_auxiliary_indexes()
+            return
+        if not self._pending:
+            return
+        logger.info(f"Salvando VectorDB da memória para o disco em {self.persist_directory}")
+        ids, texts, metadatas = [], [], []
+        for batch_ids, _, batch_texts, batch_metadatas in self._pending:
+            ids.extend(batch_ids)
+            texts.extend(batch_texts)
+            metadatas.extend(batch_metadatas)
+        vectors = np.vstack([batch_vectors for _, batch_vectors, _, _ in self._pending])
+        self.store.append(ids, vectors, texts, metadatas)
+        self._pending = []
+        # Os índices auxiliares são gravados depois dos vetores: ao carregar, o que faltar é reindexado
+        self._save_auxiliary_indexes()
+        logger.info("VectorDB salvo com sucesso em disco")
+
+    def _write_snapshot(self):
+        """
+        Persiste o índice completo como um novo snapshot, substituindo o conteúdo em disco.
+
+        Usado quando o índice é criado com treino ou migrado, para preservar o índice treinado.
+        """
+        logger.info(f"Gravando snapshot completo do VectorDB em {self.persist_directory}")
+        ids = [self.vector_store.index_to_docstore_id[i] for i in range(self.vector_store.ntotal)]
+        documents = [self.vector_store.docstore.search(doc_id) for doc_id in ids]
+        self.store.write_snapshot(
+            self.vector_store.index,
+            ids,
+            [doc.page_content for doc in documents],
+            [doc.metadata for doc in documents],
+        )
+        self._pending = []
+        self._needs_snapshot = False
+
+    def compact(self):
+        """
+        Compacta os segmentos persistidos em um único snapshot, de forma síncrona, eliminando
+        antes os documentos removidos, se houver.
+
+        Parâmetros:
+            None
+
+        Retorna:
+            None
+        """
+        self.purge_deleted()
+        self.save()
+        self.store.compact()
 
     def load(self):
         """
         Carrega o banco de dados vetorial do disco para a memória, se existir.
 
-        Este método tenta carregar um FAISS VectorStore previamente salvo do disco para a memória.
+        Este método carrega o snapshot compactado e aplica os segmentos posteriores.
+        Diretórios no formato antigo (save_local) são migrados para o formato incremental.
         Se o carregamento falhar, inicializa um novo VectorStore vazio em memória.
 
         Parâmetros:
@@ -181,20 +1522,461 @@ class VectorDB:
         Retorno:
             None
         """
-        if os.path.exists(self.persist_directory):
-            logger.info(f"Carregando VectorDB do disco para a memória: {self.persist_directory}")
-            try:
-                # Carrega o FAISS VectorStore do disco para a memória
-                self.vector_store = FAISS.load_local(
-                    self.persist_directory, 
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
+        if not os.path.exists(self.persist_directory):
+            logger.info("Nenhum VectorDB existente encontrado no disco. Iniciando com um VectorDB vazio em memória")
+            return
+
+        logger.info(f"Carregando VectorDB do disco para a memória: {self.persist_directory}")
+        try:
+            if self.store.exists() and self.mmap:
+                self._load_mmap()
+            elif self.store.exists():
+                index, documents = self.store.load()
+                self._publish(self._build_vector_store(index, documents) if index is not None else None)
+            elif os.path.exists(os.path.join(self.persist_directory, "index.faiss")):
+                self._migrate_legacy()
+            else:
+                logger.info("Nenhum VectorDB existente encontrado no disco. Iniciando com um VectorDB vazio em memória")
+                return
+
+            if self.vector_store is not None:
+                set_search_params(self.vector_store.index, **self.search_params)
+                logger.info(f"VectorDB carregado com sucesso do disco para a memória com {self.vector_store.ntotal} documentos")
+        except Exception as e:
+            logger.error(f"Erro ao carregar VectorDB do disco: {str(e)}")
+            logger.info("Inicializando um novo VectorDB vazio em memória")
+            self._publish(None)
+        self._load_auxiliary_indexes()
+        self._load_tombstones()
+
+    def _path(self, name):
+        return os.path.join(self.persist_directory, name)
+
+    def _save_auxiliary_indexes(self):
+        """
+        Acrescenta ao disco as entradas novas dos índices léxico e de metadados, do registro de
+        deduplicação e do arquivo de vetores completos.
+        """
+        self.lexical_index.save(self._path(LEXICAL_INDEX_FILE))
+        self.metadata_index.save(self._path(METADATA_INDEX_FILE))
+        if self.deduplicator is not None:
+            self.deduplicator.save(self._path(DEDUP_FILE))
+        if self.vector_file is not None:
+            self.vector_file.save()
+
+    def _load_auxiliary_indexes(self):
+        """
+        Carrega os índices léxico e de metadados, o registro de deduplicação e o de arquivos, e
+        alinha os três primeiros ao índice FAISS carregado: entradas além do índice são
+        descartadas, e as que faltam (por exemplo, em diretórios anteriores a eles) são
+        refeitas a partir do docstore.
+        """
+        vector_store = self.vector_store
+        total = vector_store.ntotal if vector_store is not None else 0
+        self.lexical_index = BM25Index.load(self._path(LEXICAL_INDEX_FILE), limit=total)
+        self.metadata_index = MetadataIndex.load(self._path(METADATA_INDEX_FILE), limit=total)
+        if self.deduplicator is not None:
+            self.deduplicator = Deduplicator.load(
+                self._path(DEDUP_FILE), limit=total, near_duplicate_threshold=self.near_duplicate_threshold
+            )
+        files_path = self._path(FILES_FILE)
+        if os.path.exists(files_path):
+            with open(files_path, "r", encoding="utf-8") as f:
+                self._files = json.load(f)
+
+        def documents(start):
+            return [
+                vector_store.docstore.search(vector_store.index_to_docstore_id[position])
+                for position in range(start, total)
+            ]
+
+        def texts(start):
+            return [doc.page_content for doc in documents(start)]
+        if self.lexical_index.size < total:
+            logger.info(f"Indexando {total - self.lexical_index.size} documentos no índice léxico")
+            self.lexical_index.add([lexical_tokens(text) for text in texts(self.lexical_index.size)])
+        if self.metadata_index.size < total:
+            logger.info(f"Indexando {total - self.metadata_index.size} documentos no índice de metadados")
+            self.metadata_index.add([doc.metadata for doc in documents(self.metadata_index.size)])
+        if self.deduplicator is not None and self.deduplicator.size < total:
+            logger.info(f"Registrando {total - self.deduplicator.size} documentos no registro de deduplicação")
+            pending = documents(self.deduplicator.size)
+            self.deduplicator.add_texts([doc.page_content for doc in pending],
+                                        [dedup_scope(doc.metadata) for doc in pending])
+        if self.vector_file is not None:
+            self._load_vector_file(vector_store)
+        self._save_auxiliary_indexes()
+
+    def _load_vector_file(self, vector_store):
+        """
+        Carrega o arquivo de vetores completos, alinhado ao índice FAISS carregado. Os vetores
+        que faltam (por exemplo, quando o re-ranking é ativado em um diretório existente) são
+        reconstruídos do índice, de forma aproximada se ele for quantizado.
+        """
+        path = self._path(VECTORS_FILE)
+        if vector_store is None:
+            for name in (path, f"{path}{COMPACTED_SUFFIX}"):
+                if os.path.exists(name):
+                    os.remove(name)
+            self.vector_file = VectorFile(path)
+            return
+        total = vector_store.ntotal
+        self.vector_file = VectorFile.load(path, vector_store.index.d, limit=total)
+        if self.vector_file.size < total:
+            missing = total - self.vector_file.size
+            if storage_kind(vector_store.index) != "float32":
+                logger.warning(
+                    f"{missing} vetores completos ausentes em {VECTORS_FILE}: usando os vetores "
+                    f"aproximados do índice {storage_kind(vector_store.index)} no re-ranking"
                 )
-                
-                logger.info(f"VectorDB carregado com sucesso do disco para a memória com {self.vector_store.index.ntotal} documentos")
-            except Exception as e:
-                logger.error(f"Erro ao carregar VectorDB do disco: {str(e)}")
-                logger.info("Inicializando um novo VectorDB vazio em memória")
-                self.vector_store = None
-        else:
-            logger.info("Nenhum VectorDB existente encontrado no disco. Iniciando com um VectorDB vazio em memória")
\ No newline at end of file
+            else:
+                logger.info(f"Gravando {missing} vetores completos em {VECTORS_FILE}")
+            self.vector_file.add(reconstruct_all(faiss.clone_index(vector_store.index))[self.vector_file.size:])
+
+    def _load_tombstones(self):
+        """
+        Reaplica as remoções ainda não compactadas e publica o snapshot carregado com o
+        índice léxico carregado.
+        """
+        vector_store = self.vector_store
+        if vector_store is None:
+            return
+        deleted = set()
+        path = self._path(TOMBSTONES_FILE)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                deleted_ids = set(json.load(f))
+            positions = {doc_id: position for position, doc_id in vector_store.index_to_docstore_id.items()}
+            deleted = {positions[doc_id] for doc_id in deleted_ids if doc_id in positions}
+            if len(deleted) < len(deleted_ids):
+                # Ids já eliminados por uma compactação interrompida antes de regravar o arquivo
+                self._save_tombstones(vector_store, deleted)
+            if self.deduplicator is not None:
+                self.deduplicator.remove(deleted)
+        self._publish(self._with_deleted(vector_store, deleted))
+
+    def _with_deleted(self, vector_store, deleted):
+        """
+        Cria um snapshot que compartilha o índice, o docstore e o mapeamento de ids de outro,
+        com outro conjunto de posições removidas.
+        """
+        return self._snapshot_store(vector_store.index, vector_store.docstore, vector_store.index_to_docstore_id,
+                                    deleted=deleted, normalize_L2=vector_store._normalize_L2)
+
+    def _save_tombstones(self, vector_store, deleted):
+        """Grava os ids dos documentos removidos e ainda presentes no índice."""
+        path = self._path(TOMBSTONES_FILE)
+        if not deleted:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(self.persist_directory, exist_ok=True)
+        ids = sorted(vector_store.index_to_docstore_id[position] for position in deleted)
+        atomic_write(path, lambda f: json.dump(ids, f), mode="w")
+
+    def _source_registry(self):
+        """
+        Retorna o registro de documentos (source -> ids dos segmentos ativos), montando-o a
+        partir do docstore no primeiro uso, junto com o mapeamento de id para posição dos
+        segmentos ativos. Deve ser chamado com o lock de escrita.
+        """
+        if self._sources is None:
+            sources, positions = {}, {}
+            vector_store = self.vector_store
+            if vector_store is not None:
+                for position in range(vector_store.ntotal):
+                    if position in vector_store.deleted:
+                        continue
+                    doc_id = vector_store.index_to_docstore_id[position]
+                    doc = vector_store.docstore.search(doc_id)
+                    sources.setdefault(doc.metadata.get("source"), []).append(doc_id)
+                    positions[doc_id] = position
+            self._sources, self._chunk_positions = sources, positions
+        return self._sources
+
+    def sources(self):
+        """
+        Lista os documentos indexados.
+
+        Retorna:
+            dict: source -> número de segmentos ativos.
+        """
+        with self._write_lock:
+            return {source: len(chunk_ids) for source, chunk_ids in self._source_registry().items()}
+
+    def source_chunks(self, source):
+        """
+        Retorna os ids dos segmentos ativos de um documento.
+
+        Usado para substituir um documento: os ids são passados a add_documents em `replaces`
+        e removidos com delete_chunks depois que a nova versão é indexada. Os ids, ao contrário
+        das posições no índice, não mudam com a compactação.
+
+        Parâmetros:
+            source (str): O nome do documento (metadado 'source').
+
+        Retorna:
+            list: Os ids, vazia se o documento não existir.
+        """
+        with self._write_lock:
+            return list(self._source_registry().get(source, ()))
+
+    def _chunk_positions_of(self, chunk_ids):
+        """Retorna as posições atuais dos segmentos ativos com os ids informados."""
+        with self._write_lock:
+            self._source_registry()
+            return {self._chunk_positions[doc_id] for doc_id in chunk_ids if doc_id in self._chunk_positions}
+
+    def delete_source(self, source):
+        """
+        Remove todos os segmentos de um documento.
+
+        Parâmetros:
+            source (str): O nome do documento (metadado 'source').
+
+        Retorna:
+            int: O número de segmentos removidos.
+        """
+        with self._write_lock:
+            return self.delete_chunks(self.source_chunks(source))
+
+    def delete_chunks(self, chunk_ids):
+        """
+        Remove segmentos pelos seus ids.
+
+        As posições dos segmentos são marcadas como removidas (tombstones) em um novo snapshot,
+        sem reconstruir o índice: o custo é proporcional ao número de segmentos removidos. Elas
+        deixam de ser retornadas pelas buscas e de contar como duplicatas, e são eliminadas do
+        índice por purge_deleted, em segundo plano, quando passam de purge_ratio do total.
+
+        Parâmetros:
+            chunk_ids (Iterable[str]): Os ids, como retornados por source_chunks.
+
+        Retorna:
+            int: O número de segmentos removidos (ids inexistentes ou já removidos são ignorados).
+        """
+        with self._write_lock:
+            vector_store = self.vector_store
+            removed = self._chunk_positions_of(chunk_ids)
+            if vector_store is None or not removed:
+                return 0
+            deleted = vector_store.deleted | removed
+            # As remoções são gravadas antes de publicadas: um crash não traz de volta o que sumiu das buscas
+            self._save_tombstones(vector_store, deleted)
+            if self.deduplicator is not None:
+                self.deduplicator.remove(removed)
+            removed_ids = {vector_store.index_to_docstore_id[position] for position in removed}
+            sources = set()
+            for source, source_ids in list(self._sources.items()):
+                remaining = [doc_id for doc_id in source_ids if doc_id not in removed_ids]
+                if len(remaining) == len(source_ids):
+                    continue
+                sources.add(source)
+                if remaining:
+                    self._sources[source] = remaining
+                else:
+                    del self._sources[source]
+            for doc_id in removed_ids:
+                del self._chunk_positions[doc_id]
+            self._forget_files(sources)
+            self._publish(self._with_deleted(vector_store, deleted))
+            logger.info(f"{len(removed)} segmentos removidos; {len(deleted)} aguardando compactação")
+            if len(deleted) >= self.purge_ratio * vector_store.ntotal:
+                self._start_purge()
+            return len(removed)
+
+    def _forget_files(self, sources):
+        """Remove do registro de arquivos os documentos com segmentos removidos, para permitir um novo upload."""
+        forgotten = [file_hash for file_hash, record in self._files.items() if record["source"] in sources]
+        if not forgotten:
+            return
+        for file_hash in forgotten:
+            del self._files[file_hash]
+        os.makedirs(self.persist_directory, exist_ok=True)
+        atomic_write(self._path(FILES_FILE), lambda f: json.dump(self._files, f), mode="w")
+
+    def _start_purge(self):
+        """Inicia purge_deleted em uma thread em segundo plano, se ainda não houver uma em execução."""
+        if self._purge_thread is not None and self._purge_thread.is_alive():
+            return
+        self._purge_thread = threading.Thread(target=self._purge_safely, name="vector-db-purge", daemon=True)
+        self._purge_thread.start()
+
+    def wait_for_purge(self):
+        """Aguarda o término de uma compactação em segundo plano, se houver."""
+        if self._purge_thread is not None:
+            self._purge_thread.join()
+
+    def _purge_safely(self):
+        try:
+            self.purge_deleted()
+        except Exception as e:
+            logger.error(f"Erro ao compactar os documentos removidos do VectorDB: {str(e)}")
+
+    def close(self):
+        """
+        Persiste as entradas pendentes e aguarda as compactações em segundo plano, para que o
+        diretório possa ser carregado por outra instância, por exemplo depois que a coleção é
+        descarregada da memória.
+        """
+        self.wait_for_purge()
+        with self._write_lock:
+            self.save()
+        self.store.wait_for_compaction()
+
+    def memory_usage(self):
+        """
+        Estima a memória ocupada pelo banco pelo tamanho dos seus arquivos em disco: o índice,
+        os documentos e os índices auxiliares, carregados em memória. O arquivo de vetores
+        completos do re-ranking é lido via mmap e não é contado.
+
+        Retorna:
+            int: A memória estimada, em bytes.
+        """
+        if not os.path.isdir(self.persist_directory):
+            return 0
+        excluded = {VECTORS_FILE, f"{VECTORS_FILE}{COMPACTED_SUFFIX}"}
+        return sum(
+            entry.stat().st_size for entry in os.scandir(self.persist_directory)
+            if entry.is_file() and entry.name not in excluded
+        )
+
+    def purge_deleted(self):
+        """
+        Elimina do índice os segmentos removidos, renumerando os demais.
+
+        Os vetores ativos são reinseridos em uma cópia vazia do índice atual, que mantém o
+        treino dos índices aproximados, e o resultado é persistido como um snapshot completo,
+        junto com os índices léxico e de metadados e o registro de deduplicação renumerados. As consultas em
+        andamento continuam no snapshot anterior; as escritas aguardam a compactação.
+
+        Retorna:
+            int: O número de segmentos eliminados.
+        """
+        with self._write_lock:
+            current = self.vector_store
+            if current is None or not current.deleted:
+                return 0
+            keep = [position for position in range(current.ntotal) if position not in current.deleted]
+            logger.info(f"Compactando o VectorDB: {len(current.deleted)} removidos, {len(keep)} mantidos")
+            vectors = self._full_vectors(current)[keep]
+            index = faiss.clone_index(current.index)
+            index.reset()
+            index.add(vectors)
+            set_search_params(index, **self.search_params)
+            ids = [current.index_to_docstore_id[position] for position in keep]
+            documents = [current.docstore.search(doc_id) for doc_id in ids]
+            texts = [doc.page_content for doc in documents]
+
+            # Sem os índices auxiliares antigos, um crash antes da gravação dos novos os
+            # reconstrói a partir do docstore, nunca com as posições desalinhadas
+            for name in (LEXICAL_INDEX_FILE, METADATA_INDEX_FILE, DEDUP_FILE):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            # Os vetores completos não podem ser refeitos a partir de um índice quantizado: a
+            # cópia compactada só substitui o arquivo depois que o novo snapshot for gravado
+            if self.vector_file is not None:
+                self.vector_file.save()
+                self.vector_file.write_compacted(keep)
+            self.store.write_snapshot(index, ids, texts, [doc.metadata for doc in documents])
+            self._pending = []
+            self._needs_snapshot = False
+            if self.vector_file is not None:
+                self.vector_file = VectorFile.load(self._path(VECTORS_FILE), index.d, limit=len(keep))
+
+            self.lexical_index = BM25Index()
+            self.lexical_index.add([lexical_tokens(text) for text in texts])
+            self.metadata_index = MetadataIndex()
+            self.metadata_index.add([doc.metadata for doc in documents])
+            if self.deduplicator is not None:
+                self.deduplicator.compact(keep)
+            self._save_auxiliary_indexes()
+            self._sources = None
+            self._chunk_positions = None
+            if self.mmap:
+                self._load_mmap()
+                set_search_params(self.vector_store.index, **self.search_params)
+            else:
+                self._publish(self._build_vector_store(index, list(zip(ids, texts, [doc.metadata for doc in documents]))))
+            # Os ids eliminados podem sair do arquivo de remoções somente após o novo snapshot
+            self._save_tombstones(self.vector_store, frozenset())
+            logger.info(f"Compactação concluída: {index.ntotal} documentos")
+            return len(current.deleted)
+
+    def file_record(self, file_hash):
+        """
+        Retorna o registro de um arquivo já ingerido com o mesmo conteúdo.
+
+        Parâmetros:
+            file_hash (str): O hash SHA-256 do conteúdo do arquivo.
+
+        Retorna:
+            dict | None: {"source", "chunks"} do arquivo ingerido, ou None.
+        """
+        return self._files.get(file_hash)
+
+    def record_file(self, file_hash, source, chunks):
+        """
+        Registra um arquivo ingerido, para que um novo upload do mesmo conteúdo seja ignorado.
+
+        Parâmetros:
+            file_hash (str): O hash SHA-256 do conteúdo do arquivo.
+            source (str): O nome do arquivo.
+            chunks (int): O número de segmentos indexados.
+        """
+        with self._write_lock:
+            self._files[file_hash] = {"source": source, "chunks": chunks}
+            os.makedirs(self.persist_directory, exist_ok=True)
+            atomic_write(self._path(FILES_FILE), lambda f: json.dump(self._files, f), mode="w")
+
+    def _build_vector_store(self, index, documents):
+        """
+        Monta o FAISS VectorStore a partir de um índice e dos documentos na ordem do índice.
+
+        Parâmetros:
+            index (faiss.Index): O índice FAISS.
+            documents (list): Lista de tuplas (id, texto, metadados).
+
+        Retorna:
+            FAISS: O VectorStore montado.
+        """
+        docstore = InMemoryDocstore({
+            doc_id: Document(page_content=text, metadata=metadata)
+            for doc_id, text, metadata in documents
+        })
+        index_to_docstore_id = {position: doc_id for position, (doc_id, _, _) in enumerate(documents)}
+        return self._snapshot_store(index, docstore, index_to_docstore_id)
+
+    def _load_mmap(self):
+        """
+        Carrega o snapshot mapeado em memória, com o docstore lido sob demanda.
+        """
+        index, _, ids, snapshot_documents, segment_documents = self.store.load_mmap()
+        self._mapped_index = index
+        if index is None:
+            self._publish(None)
+            return
+        if snapshot_documents is None:
+            self._publish(self._build_vector_store(index, segment_documents))
+            return
+        docstore = MmapDocstore(
+            snapshot_documents,
+            ids[:len(snapshot_documents)],
+            {doc_id: Document(page_content=text, metadata=metadata) for doc_id, text, metadata in segment_documents},
+        )
+        self._publish(self._snapshot_store(index, docstore, dict(enumerate(ids))))
+
+    def _migrate_legacy(self):
+        """
+        Carrega um diretório salvo com FAISS.save_local e o converte para o formato incremental.
+        """
+        logger.info("Migrando VectorDB do formato save_local para o formato incremental")
+        legacy = FAISS.load_local(
+            self.persist_directory,
+            self.embeddings,
+            allow_dangerous_deserialization=True
+        )
+        self._publish(self._snapshot_store(legacy.index, legacy.docstore, legacy.index_to_docstore_id))
+        self._write_snapshot()
+        for name in ("index.faiss", "index.pkl"):
+            os.remove(os.path.join(self.persist_directory, name))
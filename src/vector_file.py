@@ -0,0 +1,188 @@
+import numpy as np
+import os
+import threading
+import logging
+from src.segment_store import atomic_write
+
+# Configuração do logging para monitoramento e debugging
+logger = logging.getLogger(__name__)
+
+# Sufixo da cópia compactada, que substitui o arquivo depois da compactação do índice
+COMPACTED_SUFFIX = ".compacted"
+
+def normalized(vectors):
+    """Retorna os vetores com norma 1, como faiss.normalize_L2 (vetores nulos permanecem nulos)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+class VectorFile:
+    """
+    Vetores float32 completos, em disco, com as mesmas posições do índice FAISS.
+
+    Usado para o re-ranking exato quando o índice armazena os vetores quantizados (float16,
+    int8 ou PQ): o índice, na memória, seleciona os candidatos e as distâncias exatas são
+    calculadas com os vetores deste arquivo. O arquivo é apenas de acréscimo e mapeado em
+    memória somente para leitura, de forma que apenas as páginas dos candidatos são lidas e
+    workers no mesmo host compartilham o page cache.
+    """
+
+    def __init__(self, path, dimension=None):
+        """
+        Parâmetros:
+            path (str): O caminho do arquivo de vetores.
+            dimension (int, opcional): A dimensão dos vetores; se omitida, é definida pela
+                primeira adição.
+        """
+        self.path = path
+        self.dimension = dimension
+        self._lock = threading.Lock()
+        # Vetores gravados, mapeados em memória, e os adicionados desde a última gravação
+        self._mapped = None
+        self._unsaved = []
+
+    @property
+    def size(self):
+        """O número de vetores, incluindo os ainda não gravados."""
+        with self._lock:
+            return self._saved_size() + sum(len(vectors) for vectors in self._unsaved)
+
+    def _saved_size(self):
+        return len(self._mapped) if self._mapped is not None else 0
+
+    def _map(self):
+        """Mapeia os vetores gravados no arquivo. Deve ser chamado com o lock."""
+        rows = os.path.getsize(self.path) // (4 * self.dimension) if os.path.exists(self.path) else 0
+        self._mapped = np.memmap(self.path, dtype=np.float32, mode="r", shape=(rows, self.dimension)) if rows else None
+
+    def add(self, vectors):
+        """
+        Acrescenta vetores, nas próximas posições.
+
+        Parâmetros:
+            vectors (np.ndarray): Matriz float32 de formato (n, dimensão).
+
+        Lança:
+            ValueError: Se a dimensão dos vetores diferir da dimensão do arquivo.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Dimensão dos vetores ({vectors.shape[1]}) difere da dimensão do arquivo ({self.dimension})")
+            self._unsaved.append(vectors)
+
+    def get(self, positions):
+        """
+        Retorna os vetores das posições informadas.
+
+        Parâmetros:
+            positions (np.ndarray): As posições.
+
+        Retorna:
+            np.ndarray: Matriz float32 de formato (len(positions), dimensão).
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        with self._lock:
+            mapped = self._mapped
+            unsaved = np.vstack(self._unsaved) if self._unsaved else None
+        saved = len(mapped) if mapped is not None else 0
+        vectors = np.empty((len(positions), self.dimension), dtype=np.float32)
+        on_disk = positions < saved
+        if on_disk.any():
+            vectors[on_disk] = mapped[positions[on_disk]]
+        if not on_disk.all():
+            vectors[~on_disk] = unsaved[positions[~on_disk] - saved]
+        return vectors
+
+    def rerank(self, queries, positions, k, normalize=False):
+        """
+        Reordena os candidatos de uma busca pela distância L2 exata aos vetores completos.
+
+        Parâmetros:
+            queries (np.ndarray): Matriz float32 (n, dimensão) com os vetores das consultas.
+            positions (np.ndarray): Matriz (n, candidatos) com as posições retornadas pelo
+                índice, com -1 para resultados ausentes.
+            k (int): O número de resultados por consulta.
+            normalize (bool): Se True, normaliza os vetores completos para norma 1 antes das
+                distâncias, como o índice de um VectorStore com normalize_L2.
+
+        Retorna:
+            tuple: (distâncias L2 ao quadrado, posições), matrizes (n, k) no formato de
+                faiss.Index.search, completadas com inf e -1.
+        """
+        scores = np.full((len(queries), k), np.inf, dtype=np.float32)
+        results = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, candidates) in enumerate(zip(queries, positions)):
+            candidates = candidates[candidates >= 0]
+            if len(candidates) == 0:
+                continue
+            vectors = self.get(candidates)
+            if normalize:
+                vectors = normalized(vectors)
+            distances = ((vectors - query) ** 2).sum(axis=1)
+            order = np.argsort(distances, kind="stable")[:k]
+            scores[row, :len(order)] = distances[order]
+            results[row, :len(order)] = candidates[order]
+        return scores, results
+
+    def save(self):
+        """Acrescenta ao arquivo os vetores adicionados desde a última gravação."""
+        with self._lock:
+            if not self._unsaved:
+                return
+            vectors = np.vstack(self._unsaved)
+            with open(self.path, "ab") as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._unsaved = []
+            self._map()
+
+    def write_compacted(self, keep):
+        """
+        Grava, ao lado do arquivo, uma cópia apenas com as posições mantidas, renumeradas na
+        ordem de `keep`. A cópia substitui o arquivo no próximo load com limit igual ao
+        número de posições mantidas, ou seja, depois que o índice também for compactado.
+
+        Parâmetros:
+            keep (list): As posições mantidas, em ordem crescente.
+        """
+        vectors = self.get(keep) if len(keep) else np.zeros((0, self.dimension), dtype=np.float32)
+        atomic_write(f"{self.path}{COMPACTED_SUFFIX}", lambda f: f.write(vectors.tobytes()))
+
+    @classmethod
+    def load(cls, path, dimension, limit=None):
+        """
+        Carrega um arquivo gravado por save.
+
+        Uma cópia compactada por write_compacted com exatamente `limit` vetores substitui o
+        arquivo; com outro tamanho (a compactação do índice não terminou), é descartada.
+        Um vetor final incompleto (de uma gravação interrompida) e os vetores além de `limit`
+        são descartados do arquivo.
+
+        Parâmetros:
+            path (str): O caminho do arquivo de vetores.
+            dimension (int): A dimensão dos vetores.
+            limit (int, opcional): Número máximo de vetores carregados.
+
+        Retorna:
+            VectorFile: O arquivo carregado, vazio se não existir.
+        """
+        vector_file = cls(path, dimension)
+        compacted = f"{path}{COMPACTED_SUFFIX}"
+        if os.path.exists(compacted):
+            if limit is not None and os.path.getsize(compacted) == limit * 4 * dimension:
+                os.replace(compacted, path)
+            else:
+                os.remove(compacted)
+        if os.path.exists(path):
+            rows = os.path.getsize(path) // (4 * dimension)
+            if limit is not None:
+                rows = min(rows, limit)
+            if os.path.getsize(path) != rows * 4 * dimension:
+                logger.info(f"Descartando vetores além da posição {rows} em {path}")
+                os.truncate(path, rows * 4 * dimension)
+            with vector_file._lock:
+                vector_file._map()
+        return vector_file
@@ -0,0 +1,129 @@
+import pytest
+import asyncio
+import hashlib
+from langchain_core.embeddings import Embeddings
+from src.answer_cache import AnswerCache
+
+class BagOfWordsEmbedding(Embeddings):
+    """Embedding local em que perguntas com as mesmas palavras têm vetores próximos."""
+
+    def __init__(self, size=64):
+        self.size = size
+        self.calls = 0
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for word in text.split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.size] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._embed(text)
+
+RESPONSE = {"answer": "Quarenta e dois", "sources": [{"title": "doc.txt", "content": "...", "metadata": {}}]}
+
+@pytest.fixture
+def cache():
+    """
+    Cria um cache de respostas com um embedding local e limiar de similaridade de 0.8.
+    """
+    return AnswerCache(embeddings=BagOfWordsEmbedding(), similarity_threshold=0.8, ttl_seconds=60)
+
+def test_exact_hit_after_normalization(cache):
+    # Testa a correspondência exata, ignorando caixa, espaços e pontuação final
+    assert cache.get("Qual é o prazo?", version=1) is None
+    cache.put("Qual é o prazo?", 1, RESPONSE, latency=2.0)
+
+    assert cache.get("  qual é   o PRAZO ", version=1) == RESPONSE
+    stats = cache.stats()
+    assert stats["exact_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["latency_saved_seconds"] == 2.0
+
+def test_semantic_hit(cache):
+    # Testa a correspondência semântica de uma pergunta com as mesmas palavras em outra ordem
+    cache.get("qual o prazo de entrega do contrato", version=1)
+    cache.put("qual o prazo de entrega do contrato", 1, RESPONSE, latency=1.5)
+
+    assert cache.get("o prazo de entrega do contrato qual", version=1) == RESPONSE
+    assert cache.get("quem assinou a ata da reunião", version=1) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+def test_invalidated_when_index_version_changes(cache):
+    # Testa a invalidação quando a versão do índice de documentos muda
+    cache.get("qual o prazo", version=1)
+    cache.put("qual o prazo", 1, RESPONSE, latency=1.0)
+
+    assert cache.get("qual o prazo", version=2) is None
+    assert cache.stats()["entries"] == 0
+    # Respostas geradas com a versão anterior não são armazenadas
+    cache.put("qual o prazo", 1, RESPONSE, latency=1.0)
+    assert cache.stats()["entries"] == 0
+
+def test_entries_expire(cache, monkeypatch):
+    # Testa a expiração das entradas por TTL nos dois níveis
+    cache.get("qual o prazo", version=1)
+    cache.put("qual o prazo", 1, RESPONSE, latency=1.0)
+
+    import src.answer_cache
+    now = src.answer_cache.time.monotonic()
+    monkeypatch.setattr(src.answer_cache.time, "monotonic", lambda: now + 61)
+
+    assert cache.get("qual o prazo", version=1) is None
+    assert cache.get("o prazo qual", version=1) is None
+    assert cache.stats()["entries"] == 0
+
+def test_evicts_oldest_entries():
+    # Testa o limite de entradas, removendo as mais antigas
+    cache = AnswerCache(max_entries=2)
+    cache.get("a", version=1)
+    for question in ("a", "b", "c"):
+        cache.put(question, 1, RESPONSE, latency=1.0)
+
+    assert cache.get("a", version=1) is None
+    assert cache.get("c", version=1) == RESPONSE
+
+def test_async_lookup(cache):
+    # Testa as versões assíncronas de get e put
+    async def run():
+        await cache.aget("qual o prazo", version=1)
+        await cache.aput("qual o prazo", 1, RESPONSE, latency=1.0)
+        return await cache.aget("Qual o prazo?", version=1)
+
+    assert asyncio.run(run()) == RESPONSE
+
+def test_batched_lookup(cache):
+    # Testa a busca e o armazenamento em lote, sem embedar as perguntas uma a uma
+    cache.put_many([("qual o prazo de entrega", RESPONSE, 1.0)], 1)
+
+    responses = cache.get_many(["Qual o prazo de entrega?", "entrega qual o prazo de", "quem assinou a ata"], 1)
+
+    assert responses == [RESPONSE, RESPONSE, None]
+    assert cache.embeddings.calls == 0
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 1)
+
+def test_put_without_lookup_and_newer_version(cache):
+    # Testa que um put sem busca prévia é armazenado e que uma versão mais nova invalida o cache
+    cache.put("qual o prazo", 1, RESPONSE, latency=1.0)
+    assert cache.get("Qual o prazo?", version=1) == RESPONSE
+
+    newer = {"answer": "Novo prazo", "sources": []}
+    cache.put("quem assinou", 2, newer, latency=1.0)
+    assert cache.stats()["entries"] == 1
+    assert cache.get("qual o prazo", version=2) is None
+    assert cache.get("quem assinou", version=2) == newer
+
+def test_semantic_lookup_embeds_question_as_received(cache):
+    # Testa que a busca semântica embeda a pergunta como recebida, o mesmo texto da recuperação,
+    # para que o cache de embeddings sirva um único vetor às duas
+    embedded = []
+    embed_query = cache.embeddings.embed_query
+    cache.embeddings.embed_query = lambda text: embedded.append(text) or embed_query(text)
+    cache.put("Qual o prazo de entrega?", 1, RESPONSE, latency=1.0)
+    cache.get("Quem assinou a ata?", version=1)
+    assert embedded == ["Qual o prazo de entrega?", "Quem assinou a ata?"]
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from src.bm25_index import BM25Index, lexical_tokens, reciprocal_rank_fusion
+
+@pytest.fixture
+def index():
+    """
+    Cria um índice BM25 com três documentos curtos.
+
+    Retorna:
+        Um BM25Index com os documentos nas posições 0, 1 e 2.
+    """
+    index = BM25Index()
+    index.add([
+        ["contrato", "locação", "imóvel"],
+        ["relatório", "vendas", "anual", "vendas"],
+        ["produto", "abc-123", "garantia"],
+    ])
+    return index
+
+def test_lexical_tokens_ignore_punctuation():
+    # Testa que a pontuação isolada não é indexada
+    assert lexical_tokens("preço produto abc-123 ?") == ["preço", "produto", "abc-123"]
+
+def test_search_ranks_matching_documents(index):
+    # Testa a ordenação pela pontuação BM25
+    results, confidence = index.search(["vendas", "contrato"], k=3)
+
+    assert [position for position, _ in results] == [1, 0]
+    assert confidence > 0
+
+def test_confidence_reflects_query_coverage(index):
+    # Testa que a confiança cai quando parte dos termos da consulta não aparece no documento
+    _, full = index.search(["produto", "abc-123"])
+    _, partial = index.search(["produto", "inexistente"])
+
+    assert full > partial
+
+def test_search_limited_to_snapshot(index):
+    # Testa que documentos além do limite (ainda não publicados) são ignorados
+    index.add([["produto", "novo"]])
+
+    results, _ = index.search(["produto"], limit=3)
+    assert [position for position, _ in results] == [2]
+
+def test_search_excludes_removed_positions(index):
+    # Testa que posições removidas não aparecem nos resultados
+    results, _ = index.search(["vendas", "contrato"], k=3, exclude=np.asarray([1]))
+    assert [position for position, _ in results] == [0]
+
+    assert index.search(["vendas"], exclude=np.asarray([1])) == ([], 0.0)
+
+def test_save_and_load(index, tmp_path):
+    # Testa a gravação incremental e o carregamento, com o descarte de documentos além do limite
+    path = str(tmp_path / "lexical.jsonl")
+    index.save(path)
+    index.add([["novo", "documento"]])
+    index.save(path)
+
+    assert BM25Index.load(path).size == 4
+    truncated = BM25Index.load(path, limit=3)
+    assert truncated.size == 3
+    assert BM25Index.load(path).size == 3
+    assert truncated.search(["abc-123"])[0][0][0] == 2
+
+def test_reciprocal_rank_fusion():
+    # Testa que itens bem colocados nos dois rankings sobem na fusão
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]])[0] == "b"
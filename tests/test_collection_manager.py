@@ -0,0 +1,88 @@
+from src.collection_manager import Collection, CollectionManager, validate_collection_name
+import os
+import pytest
+
+class FakeVectorDB:
+    """Banco de dados vetorial falso, com a memória estimada fixa, que registra o seu fechamento."""
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.closed = False
+
+    def memory_usage(self):
+        return self.memory
+
+    def close(self):
+        self.closed = True
+
+def make_manager(tmp_path, memory_budget=0, memory=100):
+    created = []
+
+    def factory(name, directory):
+        os.makedirs(directory, exist_ok=True)
+        collection = Collection(FakeVectorDB(memory))
+        created.append((name, collection))
+        return collection
+
+    return CollectionManager(str(tmp_path), factory, memory_budget=memory_budget), created
+
+def test_collections_load_lazily(tmp_path):
+    # Testa que as coleções são carregadas apenas no primeiro uso, e uma única vez
+    manager, created = make_manager(tmp_path)
+    assert created == []
+    assert manager.acquire("acme") is None
+
+    collection = manager.acquire("acme", create=True)
+    manager.release("acme")
+    assert manager.acquire("acme") is collection
+    manager.release("acme")
+
+    assert [name for name, _ in created] == ["acme"]
+    assert manager.names() == ["acme"]
+    assert manager.stats()["loads"] == 1
+
+def test_lru_eviction_under_budget(tmp_path):
+    # Testa que a coleção usada há mais tempo é descarregada quando o orçamento é excedido
+    manager, created = make_manager(tmp_path, memory_budget=250)
+    for name in ["a", "b"]:
+        manager.acquire(name, create=True)
+        manager.release(name)
+    # Usar "a" de novo torna "b" a usada há mais tempo
+    manager.acquire("a")
+    manager.release("a")
+    manager.acquire("c", create=True)
+    manager.release("c")
+
+    stats = manager.stats()
+    assert [entry["name"] for entry in stats["resident"]] == ["a", "c"]
+    assert stats["memory_bytes"] == 200
+    assert stats["evictions"] == 1
+    evicted = dict(created)["b"]
+    assert evicted.vector_db.closed
+
+    # Uma coleção descarregada é carregada de novo do disco no próximo uso
+    reloaded = manager.acquire("b")
+    manager.release("b")
+    assert reloaded is not evicted
+    assert manager.stats()["loads"] == 4
+
+def test_collections_in_use_are_not_evicted(tmp_path):
+    # Testa que uma coleção com uso em andamento permanece carregada, mesmo acima do orçamento
+    manager, created = make_manager(tmp_path, memory_budget=150)
+    manager.acquire("a", create=True)
+    manager.acquire("b", create=True)
+
+    assert [entry["name"] for entry in manager.stats()["resident"]] == ["a", "b"]
+    assert not any(collection.vector_db.closed for _, collection in created)
+
+    manager.release("a")
+    assert [entry["name"] for entry in manager.stats()["resident"]] == ["b"]
+    manager.release("b")
+
+@pytest.mark.parametrize("name", ["", "..", "../outro", "a/b", ".oculta", "x" * 65])
+def test_invalid_collection_names(tmp_path, name):
+    manager, _ = make_manager(tmp_path)
+    with pytest.raises(ValueError):
+        validate_collection_name(name)
+    with pytest.raises(ValueError):
+        manager.acquire(name, create=True)
@@ -0,0 +1,136 @@
+import pytest
+from src.deduplicator import Deduplicator, content_hash, dedup_scope, file_hash
+
+# Aviso legal longo e uma variação com apenas a última palavra diferente
+DISCLAIMER = " ".join(f"termo{i}" for i in range(200))
+VARIANT = DISCLAIMER.rsplit(" ", 1)[0] + " alterado"
+
+def test_content_and_file_hash(tmp_path):
+    # Testa que os hashes dependem apenas do conteúdo
+    path = tmp_path / "arquivo.txt"
+    path.write_bytes(b"conteudo")
+    copy = tmp_path / "copia.txt"
+    copy.write_bytes(b"conteudo")
+
+    assert file_hash(str(path)) == file_hash(str(copy))
+    assert content_hash("a b") != content_hash("a c")
+
+def test_exact_duplicates_are_skipped():
+    # Testa o descarte de duplicatas já indexadas e repetidas no mesmo lote
+    deduplicator = Deduplicator()
+    deduplicator.add_texts(["aviso legal"])
+
+    reservation = deduplicator.reserve(["aviso legal", "texto novo", "texto novo"])
+
+    assert reservation.keep == [1]
+    assert reservation.duplicates == 2
+
+def test_near_duplicates_are_skipped():
+    # Testa a detecção de quase duplicatas, indexadas ou no mesmo lote
+    deduplicator = Deduplicator()
+    deduplicator.add_texts([DISCLAIMER])
+
+    reservation = deduplicator.reserve([VARIANT])
+    assert reservation.keep == []
+    assert reservation.near_duplicates == 1
+
+    reservation = Deduplicator().reserve([DISCLAIMER, VARIANT])
+    assert reservation.keep == [0]
+    assert reservation.near_duplicates == 1
+
+def test_near_duplicate_detection_can_be_disabled():
+    # Testa que o limiar 1.0 mantém apenas a deduplicação exata
+    deduplicator = Deduplicator(near_duplicate_threshold=1.0)
+    deduplicator.add_texts([DISCLAIMER])
+
+    assert deduplicator.reserve([VARIANT]).keep == [0]
+
+def test_short_texts_only_compared_by_hash():
+    # Testa que textos curtos não passam pela detecção de quase duplicatas
+    deduplicator = Deduplicator()
+    deduplicator.add_texts(["total 10"])
+
+    assert deduplicator.signature("total 11") is None
+    assert deduplicator.reserve(["total 11"]).keep == [0]
+
+def test_reservation_blocks_concurrent_ingestion():
+    # Testa que um conteúdo reservado não é aceito por outra ingestão até ser liberado
+    deduplicator = Deduplicator()
+    first = deduplicator.reserve(["texto compartilhado"])
+
+    assert deduplicator.reserve(["texto compartilhado"]).keep == []
+
+    # Uma reserva abandonada (por exemplo, após um erro) libera o conteúdo
+    deduplicator.release(first)
+    assert deduplicator.reserve(["texto compartilhado"]).keep == [0]
+
+def test_removed_and_ignored_positions_are_not_duplicates():
+    # Testa que posições removidas ou ignoradas (versão substituída) não bloqueiam o conteúdo
+    deduplicator = Deduplicator()
+    deduplicator.add_texts(["cláusula um", DISCLAIMER])
+
+    reservation = deduplicator.reserve(["cláusula um", VARIANT], ignore={0, 1})
+    assert reservation.keep == [0, 1]
+    deduplicator.release(reservation)
+
+    deduplicator.remove([0])
+    assert deduplicator.reserve(["cláusula um"]).keep == [0]
+    assert deduplicator.size == 2
+
+def test_compact_renumbers_positions():
+    # Testa a renumeração após a compactação do índice
+    deduplicator = Deduplicator()
+    deduplicator.add_texts(["removido", "mantido"])
+    deduplicator.remove([0])
+
+    deduplicator.compact([1])
+
+    assert deduplicator.size == 1
+    assert deduplicator.reserve(["mantido"]).keep == []
+    assert deduplicator.reserve(["removido"]).keep == [0]
+
+def test_save_and_load_with_limit(tmp_path):
+    # Testa a persistência e o descarte dos registros além do limite
+    path = str(tmp_path / "dedup.jsonl")
+    deduplicator = Deduplicator()
+    deduplicator.add_texts([DISCLAIMER, "texto curto"])
+    deduplicator.save(path)
+
+    loaded = Deduplicator.load(path)
+    assert loaded.size == 2
+    assert loaded.reserve([VARIANT, "texto curto"]).keep == []
+
+    truncated = Deduplicator.load(path, limit=1)
+    assert truncated.size == 1
+    assert truncated.reserve(["texto curto"]).keep == [0]
+    assert Deduplicator.load(path).size == 1
+
+def test_duplicates_are_scoped():
+    # Testa que as duplicatas, exatas e quase idênticas, são detectadas apenas no mesmo escopo,
+    # e que os escopos são persistidos
+    first, second = dedup_scope({"source": "a.txt"}), dedup_scope({"source": "b.txt", "tenant": "acme"})
+    deduplicator = Deduplicator()
+    deduplicator.add_texts(["aviso legal", DISCLAIMER], [first, first])
+
+    assert deduplicator.reserve(["aviso legal", VARIANT], scopes=[first, first]).keep == []
+    reservation = deduplicator.reserve(["aviso legal", VARIANT], scopes=[second, second])
+    assert reservation.keep == [0, 1] and reservation.scopes == [second, second]
+    deduplicator.release(reservation)
+
+    deduplicator.remove([1])
+    deduplicator.compact([0])
+    assert deduplicator.reserve(["aviso legal"], scopes=[first]).keep == []
+    assert deduplicator.reserve([DISCLAIMER], scopes=[first]).keep == [0]
+
+def test_load_discards_unscoped_records(tmp_path):
+    # Testa que um registro anterior aos escopos é descartado, para ser reconstruído
+    path = tmp_path / "dedup.jsonl"
+    path.write_text('{"hash": "%s", "minhash": null}\n' % content_hash("aviso legal"), encoding="utf-8")
+
+    assert Deduplicator.load(str(path)).size == 0
+    assert path.read_text(encoding="utf-8") == ""
+
+def test_invalid_bands():
+    # Testa a validação do número de bandas
+    with pytest.raises(ValueError):
+        Deduplicator(num_permutations=64, bands=7)
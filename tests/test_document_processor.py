@@ -1,4 +1,5 @@
 import pytest
+import io
 from src.document_processor import DocumentProcessor, DocumentProcessingError
 
 def test_process_single_document():
@@ -39,4 +40,94 @@ def test_error_handling():
     # Testa o tratamento de erros para entradas inválidas
     processor = DocumentProcessor()
     with pytest.raises(DocumentProcessingError):
-        processor.process_file(b"Invalid content", "invalid.xyz")
\ No newline at end of file
+        processor.process_file(b"Invalid content", "invalid.xyz")
+
+def test_process_path_streams_large_text(tmp_path, monkeypatch):
+    # Testa a leitura em blocos de um arquivo de texto, sem quebrar palavras entre blocos
+    import src.document_processor as document_processor
+    monkeypatch.setattr(document_processor, "ENCODING_SAMPLE_BYTES", 100)
+    monkeypatch.setattr(document_processor, "READ_BLOCK_BYTES", 100)
+    words = [f"palavra{i}" for i in range(3000)]
+    path = tmp_path / "grande.txt"
+    path.write_text(" ".join(words), encoding="utf-8")
+
+    processor = DocumentProcessor(chunk_size=200, chunk_overlap=20)
+    segments = list(processor.process_path(str(path), "grande.txt"))
+
+    assert all(len(segment["content"]) <= 200 for segment in segments)
+    found = set(" ".join(segment["content"] for segment in segments).split())
+    assert found == set(words)
+
+def test_incremental_split_is_lazy():
+    # Testa que a segmentação consome o texto sob demanda, mesmo de um fluxo sem fim
+    import itertools
+    processor = DocumentProcessor(chunk_size=100, chunk_overlap=10)
+    endless = itertools.repeat("uma linha de texto de uma planilha muito grande")
+
+    segments = list(itertools.islice(processor._split_incrementally(endless), 5))
+
+    assert len(segments) == 5
+    assert all(len(segment) <= 100 for segment in segments)
+
+def test_csv_row_groups_repeat_header():
+    # Testa a segmentação de CSV em grupos de linhas com o cabeçalho e o intervalo de linhas
+    processor = DocumentProcessor(chunk_size=120, chunk_overlap=10)
+    rows = ["id,cliente,valor"] + [f"{i},cliente {i},{i * 10}" for i in range(1, 31)]
+    segments = processor.process_file("\n".join(rows).encode("utf-8"), "vendas.csv")
+
+    assert len(segments) > 1
+    assert all(segment["content"].startswith("id | cliente | valor\n") for segment in segments)
+    assert all(len(segment["content"]) <= 120 for segment in segments)
+    assert segments[0]["metadata"]["source"] == "vendas.csv"
+    assert "sheet" not in segments[0]["metadata"]
+    # Os intervalos de linhas são contíguos e cobrem todas as linhas de dados
+    ranges = [(s["metadata"]["row_start"], s["metadata"]["row_end"]) for s in segments]
+    assert ranges[0][0] == 2 and ranges[-1][1] == 31
+    assert all(previous[1] + 1 == current[0] for previous, current in zip(ranges, ranges[1:]))
+
+def test_excel_row_groups_per_sheet():
+    # Testa a leitura de uma planilha com duas abas, cada uma com o seu cabeçalho
+    import io
+    from openpyxl import Workbook
+    workbook = Workbook()
+    workbook.active.title = "Clientes"
+    workbook.active.append(["nome", "cidade"])
+    workbook.active.append(["Ana", "Recife"])
+    products = workbook.create_sheet("Produtos")
+    products.append(["produto", "preço"])
+    products.append(["caneta", 2.0])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    segments = DocumentProcessor().process_file(buffer.getvalue(), "dados.xlsx")
+
+    assert [segment["content"] for segment in segments] == ["nome | cidade\nAna | Recife", "produto | preço\ncaneta | 2"]
+    assert segments[1]["metadata"] == {
+        "source": "dados.xlsx", "file_type": "xlsx", "sheet": "Produtos", "row_start": 2, "row_end": 2
+    }
+
+def test_tabular_mode_disabled():
+    # Testa que, sem o modo tabular, o CSV é segmentado como texto
+    processor = DocumentProcessor(tabular_mode=False)
+    segments = processor.process_file(b"a,b\n1,2", "tabela.csv")
+
+    assert segments[0]["metadata"] == {"source": "tabela.csv", "file_type": "csv"}
+
+def test_pdf_segments_record_page(monkeypatch):
+    # Testa que cada página do PDF é segmentada separadamente e registra o número da página
+    def pages(self, source, pages=None):
+        start, end = pages or (0, 3)
+        texts = ["introdução do relatório", "resultados de vendas", "conclusão"]
+        yield from texts[start:end]
+    monkeypatch.setattr(DocumentProcessor, "_extract_text_from_pdf", pages)
+    processor = DocumentProcessor()
+
+    segments = processor.process_file(b"%PDF", "relatorio.pdf")
+    assert [(s["content"], s["metadata"]["page"]) for s in segments] == [
+        ("introdução do relatório", 1), ("resultados de vendas", 2), ("conclusão", 3)
+    ]
+    assert segments[0]["metadata"] == {"source": "relatorio.pdf", "file_type": "pdf", "page": 1}
+
+    # Um intervalo de páginas (extração paralela) mantém a numeração do documento
+    part = list(processor.iter_segments(io.BytesIO(b"%PDF"), "relatorio.pdf", pages=(1, 3)))
+    assert [s["metadata"]["page"] for s in part] == [2, 3]
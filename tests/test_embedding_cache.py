@@ -0,0 +1,94 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from src.embedding_cache import EmbeddingCache, CachedEmbeddings
+
+class RecordingEmbeddings(Embeddings):
+    """Embedding local que registra os textos enviados ao modelo."""
+    model = "modelo-teste"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+@pytest.fixture
+def cache(tmp_path):
+    """
+    Cria um cache de embeddings em um diretório temporário.
+
+    Retorna:
+        EmbeddingCache: O cache, fechado ao final do teste.
+    """
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    yield cache
+    cache.close()
+
+def test_only_misses_reach_the_model(cache):
+    # Testa se apenas textos ausentes do cache são embedados, sem repetição
+    model = RecordingEmbeddings()
+    embeddings = CachedEmbeddings(model, cache)
+
+    first = embeddings.embed_documents(["a", "bb", "a"])
+    second = embeddings.embed_documents(["bb", "ccc"])
+
+    assert first == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert second == [[2.0, 0.5], [3.0, 0.5]]
+    assert model.calls == [["a", "bb"], ["ccc"]]
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 4
+    assert stats["entries"] == 3
+
+def test_key_depends_on_model(cache):
+    # Testa se o mesmo texto em modelos diferentes gera entradas distintas
+    cache.put_many("modelo-a", ["texto"], [[1.0]])
+
+    assert cache.get_many("modelo-a", ["texto"]) == [[1.0]]
+    assert cache.get_many("modelo-b", ["texto"]) == [None]
+
+def test_persists_between_instances(tmp_path):
+    # Testa se os vetores sobrevivem à reabertura do cache
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path=path)
+    cache.put_many("modelo", ["texto"], [[0.25, 0.75]])
+    cache.close()
+
+    reopened = EmbeddingCache(path=path)
+    assert reopened.get_many("modelo", ["texto"]) == [[0.25, 0.75]]
+    reopened.close()
+
+def test_evicts_least_recently_used(tmp_path):
+    # Testa a remoção das entradas usadas há mais tempo quando o limite é excedido
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.put_many("modelo", ["a"], [[1.0]])
+    cache.put_many("modelo", ["b"], [[2.0]])
+    # Acessa "a" para que "b" passe a ser a entrada mais antiga
+    cache.get_many("modelo", ["a"])
+    cache.put_many("modelo", ["c"], [[3.0]])
+
+    assert cache.get_many("modelo", ["a", "b", "c"]) == [[1.0], None, [3.0]]
+    assert cache.stats()["entries"] == 2
+    cache.close()
+
+def test_async_lookups_run_outside_event_loop(cache, monkeypatch):
+    # Testa que as versões assíncronas consultam e gravam o SQLite fora da thread do event loop
+    import asyncio
+    import threading
+    threads = []
+    get_many, put_many = cache.get_many, cache.put_many
+    monkeypatch.setattr(cache, "get_many", lambda *args: threads.append(threading.get_ident()) or get_many(*args))
+    monkeypatch.setattr(cache, "put_many", lambda *args: threads.append(threading.get_ident()) or put_many(*args))
+    embeddings = CachedEmbeddings(RecordingEmbeddings(), cache)
+
+    async def run():
+        return await embeddings.aembed_documents(["a", "bb"]), await embeddings.aembed_query("a"), threading.get_ident()
+
+    documents, query, loop_thread = asyncio.run(run())
+    assert documents == [[1.0, 0.5], [2.0, 0.5]]
+    assert query == [1.0, 0.5]
+    assert threads and loop_thread not in threads
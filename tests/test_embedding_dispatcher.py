@@ -0,0 +1,133 @@
+import pytest
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.embedding_dispatcher import EmbeddingDispatcher, EmbeddingDispatcherError
+
+class StubEmbeddingServer:
+    """
+    Servidor HTTP local que simula o endpoint de embeddings da OpenAI.
+
+    Cada texto recebe o vetor [comprimento do texto, 1.0]. O servidor simula latência,
+    responde 429 nas primeiras requisições e registra o pico de requisições simultâneas.
+    """
+
+    def __init__(self, latency=0.0, rate_limited_requests=0, status=200):
+        self.latency = latency
+        self.rate_limited_requests = rate_limited_requests
+        self.status = status
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server.lock:
+                    server.requests += 1
+                    limited = server.requests <= server.rate_limited_requests
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                time.sleep(server.latency)
+                with server.lock:
+                    server.in_flight -= 1
+                if limited or server.status != 200:
+                    self.send_response(429 if limited else server.status)
+                    self.send_header("Retry-After", "0")
+                    self.end_headers()
+                    return
+                data = [{"index": i, "embedding": [float(len(text)), 1.0]} for i, text in enumerate(body["input"])]
+                # Devolve os itens fora de ordem para verificar a reordenação por índice
+                payload = json.dumps({"data": list(reversed(data))}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def make_dispatcher():
+    """
+    Cria despachantes apontando para um servidor local, fechando-os ao final do teste.
+
+    Retorna:
+        function: Fábrica que recebe a URL do servidor e parâmetros extras do despachante.
+    """
+    dispatchers = []
+
+    def factory(url, **kwargs):
+        dispatcher = EmbeddingDispatcher(api_key="test", base_url=url, backoff_base=0.01, **kwargs)
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield factory
+    for dispatcher in dispatchers:
+        dispatcher.close()
+
+def test_preserves_order_across_batches(make_dispatcher):
+    # Testa se os vetores voltam na ordem original mesmo com lotes concorrentes
+    texts = ["x" * i for i in range(1, 41)]
+    with StubEmbeddingServer(latency=0.01) as server:
+        dispatcher = make_dispatcher(server.url, max_batch_size=3, max_concurrency=4)
+        vectors = dispatcher.embed_documents(texts)
+
+    assert [vector[0] for vector in vectors] == [float(len(text)) for text in texts]
+    assert server.requests == 14
+
+def test_limits_requests_in_flight(make_dispatcher):
+    # Testa se o número de requisições simultâneas respeita o limite configurado
+    with StubEmbeddingServer(latency=0.05) as server:
+        dispatcher = make_dispatcher(server.url, max_batch_size=1, max_concurrency=2)
+        dispatcher.embed_documents([f"texto {i}" for i in range(8)])
+
+    assert server.max_in_flight <= 2
+    stats = dispatcher.stats()
+    assert stats["texts"] == 8
+    assert stats["queue_depth"] == 0
+    assert stats["in_flight"] == 0
+    assert stats["texts_per_second"] > 0
+
+def test_retries_rate_limited_requests(make_dispatcher):
+    # Testa a repetição de respostas 429 com backoff
+    with StubEmbeddingServer(rate_limited_requests=2) as server:
+        dispatcher = make_dispatcher(server.url)
+        vectors = dispatcher.embed_documents(["abc"])
+
+    assert vectors == [[3.0, 1.0]]
+    assert dispatcher.stats()["retries"] == 2
+
+def test_gives_up_after_max_retries(make_dispatcher):
+    # Testa o erro definitivo quando as repetições se esgotam
+    with StubEmbeddingServer(status=503) as server:
+        dispatcher = make_dispatcher(server.url, max_retries=1)
+        with pytest.raises(EmbeddingDispatcherError):
+            dispatcher.embed_documents(["abc"])
+
+    assert server.requests == 2
+
+def test_splits_batches_by_tokens(make_dispatcher, monkeypatch):
+    # Testa a divisão dos lotes pelo limite de tokens
+    with StubEmbeddingServer() as server:
+        dispatcher = make_dispatcher(server.url, max_batch_tokens=10)
+        monkeypatch.setattr(dispatcher, "_count_tokens", lambda text: len(text.split()))
+        batches = dispatcher._make_batches(["palavra " * 6, "palavra " * 3, "palavra " * 2, "curto"])
+
+    assert [(start, len(batch), tokens) for start, batch, tokens in batches] == [(0, 2, 9), (2, 2, 3)]
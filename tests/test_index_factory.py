@@ -0,0 +1,99 @@
+import pytest
+import faiss
+import numpy as np
+from src.index_factory import (
+    build_index, get_search_params, index_kind, min_training_points, reconstruct_all, search_parameters,
+    set_search_params, storage_kind
+)
+
+@pytest.fixture
+def vectors():
+    """
+    Gera vetores sintéticos agrupados em clusters para os testes de índices aproximados.
+
+    Retorna:
+        np.ndarray: Matriz float32 de formato (2000, 16).
+    """
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 16)).astype(np.float32) * 5
+    return (centers[rng.integers(0, 20, 2000)] + rng.normal(size=(2000, 16))).astype(np.float32)
+
+def recall_at_k(index, vectors, queries, k=10):
+    # Calcula o recall@k do índice em relação à busca exata
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, expected = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    return np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)])
+
+@pytest.mark.parametrize("index_type,params", [
+    ("ivf_flat", {"nlist": 16}),
+    ("ivf_pq", {"nlist": 16, "m": 8}),
+    ("hnsw", {"M": 16, "efConstruction": 40}),
+])
+def test_build_and_search(vectors, index_type, params):
+    # Testa a criação, o treino e a qualidade da busca de cada tipo de índice aproximado
+    index = build_index(index_type, vectors, params)
+    index.add(vectors)
+    set_search_params(index, nprobe=8, ef_search=64)
+
+    assert index_kind(index) == index_type
+    assert index.ntotal == len(vectors)
+    assert recall_at_k(index, vectors, vectors[:50]) > 0.5
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+@pytest.mark.parametrize("storage", ["float16", "int8", "pq"])
+def test_build_with_storage(vectors, index_type, storage):
+    # Testa os formatos de armazenamento quantizados em cada tipo de índice
+    index = build_index(index_type, vectors, {"nlist": 16, "m": 8, "nbits": 4}, storage=storage)
+    index.add(vectors)
+    set_search_params(index, nprobe=8, ef_search=64)
+
+    assert storage_kind(index) == storage
+    assert index_kind(index) == ("ivf_pq" if index_type == "ivf_flat" and storage == "pq" else index_type)
+    assert recall_at_k(index, vectors, vectors[:50]) > 0.3
+
+def test_rejects_storage_incompatible_with_ivf_pq(vectors):
+    # Testa que o ivf_pq não aceita outro formato de armazenamento
+    with pytest.raises(ValueError):
+        build_index("ivf_pq", vectors, storage="int8")
+    assert storage_kind(build_index("ivf_pq", vectors, {"m": 8, "nbits": 4})) == "pq"
+
+def test_search_params_round_trip(vectors):
+    # Testa a leitura e o ajuste do nprobe e do efSearch
+    ivf = build_index("ivf_flat", vectors, {"nlist": 16})
+    set_search_params(ivf, nprobe=5)
+    assert get_search_params(ivf) == {"nprobe": 5}
+
+    hnsw = build_index("hnsw", vectors)
+    set_search_params(hnsw, ef_search=77)
+    assert get_search_params(hnsw) == {"ef_search": 77}
+
+def test_rejects_insufficient_training_data(vectors):
+    # Testa a validação do número mínimo de vetores de treino
+    required = min_training_points("ivf_pq", {})
+    with pytest.raises(ValueError):
+        build_index("ivf_pq", vectors[:required - 1])
+
+def test_rejects_invalid_pq_dimension(vectors):
+    # Testa a validação da divisibilidade da dimensão pelo número de subquantizadores
+    with pytest.raises(ValueError):
+        build_index("ivf_pq", vectors, {"m": 5})
+
+def test_reconstruct_all_from_ivf(vectors):
+    # Testa a recuperação exata dos vetores de um índice IVF-Flat para migração
+    index = build_index("ivf_flat", vectors, {"nlist": 16})
+    index.add(vectors)
+    np.testing.assert_array_equal(reconstruct_all(index), vectors)
+
+def test_search_parameters_do_not_change_index(vectors):
+    # Testa que os parâmetros por busca não alteram os parâmetros padrão do índice
+    index = build_index("ivf_flat", vectors, {"nlist": 16})
+    index.add(vectors)
+    set_search_params(index, nprobe=1)
+    params = search_parameters(index, nprobe=16)
+
+    _, found = index.search(vectors[:5], 1, params=params)
+    assert list(found[:, 0]) == [0, 1, 2, 3, 4]
+    assert get_search_params(index) == {"nprobe": 1}
+    assert search_parameters(index, ef_search=10) is None
@@ -0,0 +1,116 @@
+import pytest
+import asyncio
+import os
+from src.ingest_queue import IngestQueue, COMPLETED, COMPLETED_WITH_ERRORS, QUEUED
+
+def spool(queue, job_id, contents):
+    # Grava os arquivos do job no diretório da fila, como faz o endpoint de upload
+    files = []
+    for filename, content in contents.items():
+        path = os.path.join(queue.job_directory(job_id), filename)
+        with open(path, "w") as f:
+            f.write(content)
+        files.append((filename, path))
+    return files
+
+async def count_lines(path, filename):
+    # Processador falso: um segmento por linha, falha em arquivos vazios
+    with open(path) as f:
+        lines = f.read().splitlines()
+    if not lines:
+        raise ValueError(f"arquivo vazio: {filename}")
+    return {"chunks": len(lines)}
+
+def test_job_reports_progress_and_errors(tmp_path):
+    # Testa o processamento de um job e o relatório por arquivo, incluindo erros
+    queue = IngestQueue(count_lines, directory=str(tmp_path), workers=2)
+
+    async def run():
+        await queue.start()
+        job_id = queue.new_job_id()
+        queue.submit(job_id, spool(queue, job_id, {"a.txt": "1\n2\n3", "b.txt": ""}))
+        await queue.join()
+        await queue.stop()
+        return job_id
+
+    job = queue.get(asyncio.run(run()))
+
+    assert job["status"] == COMPLETED_WITH_ERRORS
+    assert job["files_done"] == job["files_total"] == 2
+    assert job["chunks"] == 3
+    assert job["files"][0]["status"] == COMPLETED
+    assert "arquivo vazio" in job["files"][1]["error"]
+    assert not os.path.exists(queue.job_directory(job["job_id"]))
+
+def test_bounded_concurrency(tmp_path):
+    # Testa que no máximo `workers` jobs são processados ao mesmo tempo
+    active = 0
+    peak = 0
+
+    async def slow(path, filename):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+        return {"chunks": 1}
+
+    queue = IngestQueue(slow, directory=str(tmp_path), workers=2)
+
+    async def run():
+        await queue.start()
+        for i in range(6):
+            job_id = queue.new_job_id()
+            queue.submit(job_id, spool(queue, job_id, {f"{i}.txt": "x"}))
+        await queue.join()
+        await queue.stop()
+
+    asyncio.run(run())
+    assert peak == 2
+
+def test_resume_after_restart(tmp_path):
+    # Testa que jobs enfileirados antes de um restart são retomados pela nova instância
+    queue = IngestQueue(count_lines, directory=str(tmp_path))
+    job_id = queue.new_job_id()
+    queue.submit(job_id, spool(queue, job_id, {"a.txt": "1\n2"}))
+    assert queue.get(job_id)["status"] == QUEUED
+    queue.close()
+
+    restarted = IngestQueue(count_lines, directory=str(tmp_path))
+
+    async def run():
+        await restarted.start()
+        await restarted.join()
+        await restarted.stop()
+
+    asyncio.run(run())
+    job = restarted.get(job_id)
+    assert job["status"] == COMPLETED
+    assert job["chunks"] == 2
+
+def test_job_metadata_passed_to_each_file(tmp_path):
+    # Testa que os metadados do job são persistidos e passados a cada arquivo, mesmo após um restart
+    received = []
+
+    async def record(path, filename, **metadata):
+        received.append((filename, metadata))
+        return {"chunks": 1}
+
+    queue = IngestQueue(record, directory=str(tmp_path))
+    job_id = queue.new_job_id()
+    queue.submit(job_id, spool(queue, job_id, {"a.txt": "1", "b.txt": "2"}), metadata={"tenant": "acme", "tags": ["rh"]})
+    queue.close()
+    restarted = IngestQueue(record, directory=str(tmp_path))
+
+    async def run():
+        await restarted.start()
+        await restarted.join()
+        await restarted.stop()
+
+    asyncio.run(run())
+    assert sorted(received) == [("a.txt", {"tenant": "acme", "tags": ["rh"]}), ("b.txt", {"tenant": "acme", "tags": ["rh"]})]
+
+def test_unknown_job(tmp_path):
+    # Testa a consulta de um job inexistente
+    queue = IngestQueue(count_lines, directory=str(tmp_path))
+    assert queue.get("inexistente") is None
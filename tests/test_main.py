@@ -1,7 +1,12 @@
 from fastapi.testclient import TestClient
 from main import app
+import main
+import asyncio
+import httpx
+import json
 import os
 import shutil
+import time
 
 client = TestClient(app)
 
@@ -32,6 +37,60 @@ def test_upload_documents():
     # Limpa o arquivo de teste após o uso
     os.remove("test_document.txt")
 
+# Testa o acompanhamento de um job de ingestão pelos workers em segundo plano
+def test_job_status(monkeypatch):
+    async def fake_ingest(path, filename, **metadata):
+        return {"chunks": 1}
+
+    monkeypatch.setattr(main.ingest_queue, "process_file", fake_ingest)
+    # O context manager executa o startup da aplicação, que inicia os workers
+    with TestClient(app) as worker_client:
+        response = worker_client.post("/upload_documents", files={"files": ("nota.txt", b"conteudo")})
+        job_id = response.json()["job_id"]
+        for _ in range(50):
+            job = worker_client.get(f"/jobs/{job_id}").json()
+            if job["status"] == "completed":
+                break
+            time.sleep(0.05)
+
+    assert job["status"] == "completed"
+    assert job["files"][0]["chunks"] == 1
+
+# Testa que arquivos repetidos no mesmo upload são enfileirados uma única vez
+def test_upload_duplicate_files():
+    response = client.post("/upload_documents", files=[
+        ("files", ("a.txt", b"mesmo conteudo de upload")),
+        ("files", ("b.txt", b"mesmo conteudo de upload")),
+    ])
+    assert response.status_code == 200
+    assert response.json()["deduplication"] == {"duplicate_files": ["b.txt"], "enqueued": 1}
+
+# Testa que o reenvio de um arquivo já ingerido não cria um job
+def test_upload_already_ingested(monkeypatch):
+    main.init_components()
+    monkeypatch.setattr(main.vector_db, "file_record", lambda digest: {"source": "nota.txt", "chunks": 1})
+    response = client.post("/upload_documents", files={"files": ("nota.txt", b"conteudo")})
+    assert response.status_code == 200
+    assert response.json()["job_id"] is None
+    assert response.json()["deduplication"] == {"duplicate_files": ["nota.txt"], "enqueued": 0}
+
+# Testa a listagem e a remoção de documentos
+def test_documents():
+    response = client.get("/documents")
+    assert response.status_code == 200
+    assert "documents" in response.json()
+
+    response = client.delete("/documents/pasta/inexistente.txt")
+    assert response.status_code == 404
+
+def test_unknown_job():
+    response = client.get("/jobs/inexistente")
+    assert response.status_code == 404
+
+def test_upload_unsupported_format():
+    response = client.post("/upload_documents", files={"files": ("planilha.exe", b"x")})
+    assert response.status_code == 400
+
 # Testa a consulta da API
 def test_query():
     response = client.post("/query", json={"question": "What is this document about?"})
@@ -40,12 +99,185 @@ def test_query():
     assert "answer" in response.json()
     assert "sources" in response.json()
 
+# Testa os tempos das etapas das consultas
+def test_rag_status():
+    client.post("/query", json={"question": "O que é RAG?"})
+    response = client.get("/rag_status")
+    assert response.status_code == 200
+    status = response.json()
+    assert set(status["stages"]) == {"retrieval", "rerank", "generation"}
+    assert status["reranker"] is None
+    assert status["candidates"] == status["k"]
+
+# Testa a validação do tamanho do lote de consultas
+def test_query_batch_validation():
+    response = client.post("/query_batch", json={"questions": []})
+    assert response.status_code == 400
+
+    too_many = [f"pergunta {i}" for i in range(main.query_batch_max_questions + 1)]
+    response = client.post("/query_batch", json={"questions": too_many})
+    assert response.status_code == 400
+
+# Testa que o filtro de metadados é validado e repassado ao motor RAG
+def test_query_filter(monkeypatch):
+    received = []
+
+    class FilterStubRAGEngine:
+        async def aquery(self, question, filter=None):
+            received.append(filter)
+            return {"answer": "ok", "sources": []}
+
+    monkeypatch.setattr(main, "rag_engine", FilterStubRAGEngine())
+    main.init_components()
+    query_filter = {"source": {"$in": ["a.pdf"]}, "tags": "rh"}
+    response = client.post("/query", json={"question": "Oi?", "filter": query_filter})
+    assert response.status_code == 200
+    assert received == [query_filter]
+
+    response = client.post("/query", json={"question": "Oi?", "filter": {"autor": "Ana"}})
+    assert response.status_code == 400
+    response = client.post("/query_batch", json={"questions": ["Oi?"], "filter": {"source": {"$regex": "a"}}})
+    assert response.status_code == 400
+
+# Testa a seleção da coleção pelo caminho e pelo cabeçalho X-Collection
+def test_collections(monkeypatch, tmp_path):
+    from src.collection_manager import Collection, CollectionManager
+
+    received = []
+    submitted = []
+
+    class CollectionStubVectorDB:
+        def file_record(self, digest):
+            return None
+
+        def memory_usage(self):
+            return 0
+
+        def close(self):
+            pass
+
+    class CollectionStubRAGEngine:
+        def __init__(self, name):
+            self.name = name
+
+        async def aquery(self, question, filter=None):
+            received.append(self.name)
+            return {"answer": "ok", "sources": []}
+
+        async def astream(self, question, filter=None):
+            yield {"event": "done", "data": {"answer": "ok", "sources": []}}
+
+    def factory(name, directory):
+        os.makedirs(directory, exist_ok=True)
+        return Collection(CollectionStubVectorDB(), None, CollectionStubRAGEngine(name))
+
+    monkeypatch.setattr(main, "collection_manager", CollectionManager(str(tmp_path), factory))
+    monkeypatch.setattr(main.ingest_queue, "submit", lambda job_id, files, metadata=None: submitted.append(metadata))
+    main.init_components()
+
+    response = client.post("/collections/acme/query", json={"question": "Oi?"})
+    assert response.status_code == 404
+
+    # O upload cria a coleção e registra-a no job de ingestão
+    response = client.post("/collections/acme/upload_documents", files={"files": ("nota.txt", b"conteudo acme")})
+    assert response.status_code == 200
+    assert submitted[-1]["collection"] == "acme"
+
+    assert client.post("/collections/acme/query", json={"question": "Oi?"}).status_code == 200
+    assert client.post("/query", json={"question": "Oi?"}, headers={"X-Collection": "acme"}).status_code == 200
+    assert received == ["acme", "acme"]
+
+    response = client.post("/query", json={"question": "Oi?"}, headers={"X-Collection": "../outra"})
+    assert response.status_code == 400
+
+    response = client.get("/collections")
+    assert response.json()["collections"] == ["default", "acme"]
+    assert [entry["name"] for entry in response.json()["residency"]["resident"]] == ["acme"]
+
+    # O streaming obtém a coleção apenas ao enviar o corpo: uma resposta nunca iterada não a prende
+    assert client.post("/collections/outra/query/stream", json={"question": "Oi?"}).status_code == 404
+    response = client.post("/collections/acme/query/stream", json={"question": "Oi?"})
+    assert response.status_code == 200 and "done" in response.text
+
+    class IdleRequest:
+        headers = {}
+
+    asyncio.run(main.query_stream(main.Query(question="Oi?"), IdleRequest(), "acme"))
+    assert [entry["in_use"] for entry in main.collection_manager.stats()["resident"]] == [0]
+
 # Testa o tratamento de erros
 def test_error_handling():
     response = client.post("/query", json={"invalid": "data"})
     assert response.status_code == 422  # Unprocessable Entity
 
-# Limpa o diretório de persistência após os testes
+class SlowStubRAGEngine:
+    """Motor RAG falso cuja consulta simula a latência do LLM sem bloquear o event loop."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def aquery(self, question, filter=None):
+        await asyncio.sleep(self.latency)
+        return {"answer": f"resposta para {question}", "sources": []}
+
+# Testa se consultas lentas são atendidas concorrentemente, sem travar outras rotas
+def test_concurrent_queries_do_not_block(monkeypatch):
+    latency = 0.3
+    concurrency = 10
+    monkeypatch.setattr(main, "rag_engine", SlowStubRAGEngine(latency))
+    # Inicializa os demais componentes antes de medir, já que são criados no primeiro uso
+    main.init_components()
+
+    async def run_load():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            start = time.perf_counter()
+            queries = [
+                async_client.post("/query", json={"question": f"pergunta {i}"})
+                for i in range(concurrency)
+            ]
+            status_request = async_client.get("/vector_db_status")
+            responses = await asyncio.gather(status_request, *queries)
+            return time.perf_counter() - start, responses
+
+    elapsed, responses = asyncio.run(run_load())
+
+    assert all(response.status_code == 200 for response in responses)
+    # Em série, as consultas levariam concurrency * latency segundos
+    assert elapsed < latency * concurrency / 2
+
+class StreamingStubRAGEngine:
+    """Motor RAG falso que gera as fontes e a resposta em partes."""
+
+    async def astream(self, question, filter=None):
+        yield {"event": "sources", "data": [{"title": "doc.txt", "content": "conteúdo", "metadata": {}}]}
+        for token in ["Olá", ", ", "mundo"]:
+            yield {"event": "token", "data": token}
+        yield {"event": "done", "data": {"answer": "Olá, mundo", "sources": []}}
+
+# Testa o streaming da consulta em Server-Sent Events
+def test_query_stream_sse(monkeypatch):
+    monkeypatch.setattr(main, "rag_engine", StreamingStubRAGEngine())
+    response = client.post("/query/stream", json={"question": "Oi?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    blocks = [block for block in response.text.split("\n\n") if block]
+    assert blocks[0].startswith("event: sources")
+    assert blocks[-1].startswith("event: done")
+
+# Testa o streaming da consulta em NDJSON
+def test_query_stream_ndjson(monkeypatch):
+    monkeypatch.setattr(main, "rag_engine", StreamingStubRAGEngine())
+    response = client.post("/query/stream", json={"question": "Oi?"}, headers={"Accept": "application/x-ndjson"})
+
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["event"] for event in events] == ["sources", "token", "token", "token", "done"]
+    assert "".join(event["data"] for event in events if event["event"] == "token") == "Olá, mundo"
+
+# Limpa os diretórios de persistência e de jobs após os testes
 def teardown_module(module):
     if os.path.exists("./persistent_vector_db"):
-        shutil.rmtree("./persistent_vector_db")
\ No newline at end of file
+        shutil.rmtree("./persistent_vector_db")
+    if os.path.exists("./ingest_jobs"):
+        shutil.rmtree("./ingest_jobs")
\ No newline at end of file
@@ -0,0 +1,71 @@
+import pytest
+from src.metadata_index import MetadataIndex, validate_filter
+
+@pytest.fixture
+def index():
+    """
+    Cria um índice de metadados com quatro documentos.
+
+    Retorna:
+        Um MetadataIndex com os documentos nas posições 0 a 3.
+    """
+    index = MetadataIndex()
+    index.add([
+        {"source": "a.pdf", "file_type": "pdf", "page": 1, "tags": ["rh", "política"], "uploaded_at": "2024-01-10T08:00:00+00:00"},
+        {"source": "a.pdf", "file_type": "pdf", "page": 2, "tags": ["rh"], "uploaded_at": "2024-01-10T08:00:00+00:00"},
+        {"source": "b.csv", "file_type": "csv", "sheet": None, "row_start": 2, "uploaded_at": "2024-03-01T12:00:00+00:00"},
+        {"source": "c.txt", "file_type": "txt", "tenant": "acme", "tags": ["vendas"], "uploaded_at": "2024-05-20T09:30:00+00:00"},
+    ])
+    return index
+
+def positions(index, filter, limit=None):
+    return index.positions(filter, limit=limit).tolist()
+
+def test_equality_and_membership(index):
+    # Testa a igualdade, a pertinência em listas e os valores contidos em campos com listas
+    assert positions(index, {"source": "a.pdf"}) == [0, 1]
+    assert positions(index, {"source": {"$in": ["b.csv", "c.txt"]}}) == [2, 3]
+    assert positions(index, {"source": ["c.txt", "inexistente"]}) == [3]
+    assert positions(index, {"tags": "rh"}) == [0, 1]
+    assert positions(index, {"tags": {"$eq": "política"}}) == [0]
+
+def test_ranges_and_negation(index):
+    # Testa os operadores de intervalo e os negativos, que incluem os documentos sem o campo
+    assert positions(index, {"uploaded_at": {"$gte": "2024-02-01"}}) == [2, 3]
+    assert positions(index, {"page": {"$gt": 1, "$lte": 2}}) == [1]
+    assert positions(index, {"tags": {"$neq": "rh"}}) == [2, 3]
+    assert positions(index, {"file_type": {"$nin": ["pdf", "csv"]}}) == [3]
+
+def test_logical_operators(index):
+    # Testa a combinação de condições por E (implícito ou $and), $or e $not
+    assert positions(index, {"source": "a.pdf", "page": 2}) == [1]
+    assert positions(index, {"$and": [{"file_type": "pdf"}, {"tags": "política"}]}) == [0]
+    assert positions(index, {"$or": [{"tenant": "acme"}, {"page": 1}]}) == [0, 3]
+    assert positions(index, {"$not": {"file_type": "pdf"}}) == [2, 3]
+    assert positions(index, {}) == [0, 1, 2, 3]
+
+def test_limited_to_snapshot(index):
+    # Testa que documentos além do limite (ainda não publicados) são ignorados
+    assert positions(index, {"source": "a.pdf"}, limit=1) == [0]
+    assert positions(index, {"tags": {"$neq": "rh"}}, limit=3) == [2]
+
+def test_invalid_filters(index):
+    # Testa a validação dos campos e dos operadores
+    for invalid in ({"row_start": 2}, {"source": {"$regex": "a"}}, {"$xor": []}, {"source": {"$in": "a.pdf"}}, ["source"]):
+        with pytest.raises(ValueError):
+            validate_filter(invalid)
+
+def test_save_and_load(index, tmp_path):
+    # Testa a gravação incremental e o carregamento, com o descarte de documentos além do limite
+    path = str(tmp_path / "metadata.jsonl")
+    index.save(path)
+    index.add([{"source": "d.md", "tags": ["rh"]}])
+    index.save(path)
+
+    loaded = MetadataIndex.load(path)
+    assert loaded.size == 5
+    assert positions(loaded, {"tags": "rh"}) == [0, 1, 4]
+
+    truncated = MetadataIndex.load(path, limit=2)
+    assert truncated.size == 2
+    assert MetadataIndex.load(path).size == 2
@@ -0,0 +1,93 @@
+import pytest
+import itertools
+import multiprocessing
+import time
+from src.document_processor import DocumentProcessor, DocumentProcessingError
+from src.parallel_extractor import ParallelExtractor
+
+@pytest.fixture
+def extractor():
+    """
+    Cria um extrator com dois processos, criados por fork para herdar os monkeypatches do teste.
+    """
+    extractor = ParallelExtractor(max_workers=2, timeout=2, chunk_size=100, chunk_overlap=10,
+                                  mp_context=multiprocessing.get_context("fork"))
+    yield extractor
+    extractor.close()
+
+def test_results_in_file_order(extractor):
+    # Testa que os resultados seguem a ordem dos arquivos e são iguais aos da extração serial
+    files = [(f"Documento {i}. ".encode() * (i + 1) * 20, f"doc{i}.txt") for i in range(6)]
+
+    results = extractor.extract_many(files)
+
+    serial = DocumentProcessor(chunk_size=100, chunk_overlap=10)
+    assert results == [serial.process_file(content, filename) for content, filename in files]
+
+def test_errors_are_reported_per_file(extractor):
+    # Testa que um arquivo inválido não impede a extração dos demais
+    results = extractor.extract_many([(b"ok", "a.txt"), (b"x", "b.xyz"), (b"ok", "c.txt")])
+
+    assert isinstance(results[1], DocumentProcessingError)
+    assert results[0][0]["metadata"]["source"] == "a.txt"
+    assert results[2][0]["metadata"]["source"] == "c.txt"
+
+def test_timeout_does_not_block_pool(extractor, monkeypatch):
+    # Testa que um arquivo travado excede o tempo limite e o pool continua atendendo os demais
+    original = DocumentProcessor._extract_text_from_generic
+
+    def slow_for_stuck_files(self, source):
+        if source.read(5) == b"stuck":
+            time.sleep(60)
+        source.seek(0)
+        return original(self, source)
+
+    monkeypatch.setattr(DocumentProcessor, "_extract_text_from_generic", slow_for_stuck_files)
+    start = time.monotonic()
+    results = extractor.extract_many([(b"stuck file", "a.txt"), (b"fine file", "b.txt")])
+
+    assert time.monotonic() - start < 30
+    assert "tempo limite" in str(results[0])
+    assert results[1][0]["content"] == "fine file"
+    assert extractor.extract(b"after reset", "c.txt")[0]["content"] == "after reset"
+
+def test_plan_splits_large_pdfs(extractor, monkeypatch):
+    # Testa a divisão de PDFs grandes em intervalos de páginas, na ordem do documento
+    monkeypatch.setattr(ParallelExtractor, "_count_pages", lambda self, source: 120)
+    extractor.pdf_pages_per_task = 50
+
+    tasks = extractor.plan([(b"%PDF", "grande.pdf"), (b"texto", "b.txt")])
+
+    assert [(task[0], task[4]) for task in tasks] == [(0, (0, 50)), (0, (50, 100)), (0, (100, 120)), (1, None)]
+
+def test_iter_extract_streams_parts_in_order(extractor, monkeypatch, tmp_path):
+    # Testa que os segmentos de cada intervalo de páginas são produzidos na ordem, sem extrair o arquivo inteiro antes
+    original = DocumentProcessor.iter_segments
+
+    def fake_segments(self, stream, filename, pages=None):
+        if pages is None:
+            return original(self, stream, filename, pages)
+        (tmp_path / f"{pages[0]}").touch()
+        if pages[0] == 100:
+            raise ValueError("página corrompida")
+        return iter([{"content": f"{pages[0]}-{pages[1]}", "metadata": {"source": filename}}])
+
+    monkeypatch.setattr(DocumentProcessor, "iter_segments", fake_segments)
+    monkeypatch.setattr(ParallelExtractor, "_count_pages", lambda self, source: 120)
+    extractor.pdf_pages_per_task = 10
+
+    segments = extractor.iter_extract(b"%PDF", "grande.pdf")
+    assert next(segments)["content"] == "0-10"
+    time.sleep(0.5)
+    # Apenas as partes dentro da janela de max_workers foram submetidas
+    assert len(list(tmp_path.iterdir())) <= extractor.max_workers
+    assert [segment["content"] for segment in itertools.islice(segments, 9)] == \
+        [f"{start}-{start + 10}" for start in range(10, 100, 10)]
+    with pytest.raises(DocumentProcessingError, match="página corrompida"):
+        next(segments)
+    segments.close()
+
+    segments = extractor.iter_extract(b"%PDF", "grande.pdf")
+    next(segments)
+    segments.close()
+    assert extractor.extract(b"after close", "c.txt")[0]["content"] == "after close"
@@ -1,5 +1,7 @@
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+from langchain_core.documents import Document
 from src.rag_engine import RAGEngine
 
 @pytest.fixture
@@ -25,17 +27,6 @@ def mock_openai():
     with patch('src.rag_engine.OpenAI') as mock:
         yield mock
 
-@pytest.fixture
-def mock_embeddings():
-    """
-    Cria um mock das embeddings do OpenAI para testes.
-    
-    Retorna:
-        mock: Um objeto mock que simula o comportamento das embeddings do OpenAI.
-    """
-    with patch('src.rag_engine.OpenAIEmbeddings') as mock:
-        yield mock
-
 @pytest.fixture
 def mock_retrieval_qa():
     """
@@ -47,16 +38,22 @@ def mock_retrieval_qa():
     with patch('src.rag_engine.RetrievalQA') as mock:
         yield mock
 
-def test_rag_engine_initialization(mock_vector_db, mock_openai, mock_embeddings, mock_retrieval_qa):
+def test_rag_engine_initialization(mock_vector_db, mock_openai, mock_retrieval_qa):
     # Testa a inicialização correta do RAGEngine
     rag_engine = RAGEngine(mock_vector_db)
     
     assert mock_openai.called, "OpenAI deveria ser inicializado"
-    assert mock_embeddings.called, "OpenAIEmbeddings deveria ser inicializado"
     assert mock_retrieval_qa.from_chain_type.called, "RetrievalQA deveria ser inicializado"
     assert mock_vector_db.get_vector_store.called, "VectorDB deveria ser consultado"
 
-def test_rag_engine_query(mock_vector_db, mock_openai, mock_embeddings, mock_retrieval_qa):
+def test_rag_engines_share_llm(mock_vector_db, mock_openai, mock_retrieval_qa):
+    # Testa que os motores de várias coleções podem compartilhar o mesmo cliente do LLM
+    llm = MagicMock()
+    engines = [RAGEngine(mock_vector_db, llm=llm) for _ in range(3)]
+    assert all(engine.llm is llm for engine in engines)
+    assert not mock_openai.called
+
+def test_rag_engine_query(mock_vector_db, mock_openai, mock_retrieval_qa):
     # Testa a funcionalidade de consulta do RAGEngine
     mock_qa_chain = MagicMock()
     mock_qa_chain.invoke.return_value = {
@@ -86,7 +83,7 @@ def test_rag_engine_query(mock_vector_db, mock_openai, mock_embeddings, mock_ret
         "metadata": {"source": "doc2"}
     }
 
-def test_rag_engine_query_no_documents(mock_vector_db, mock_openai, mock_embeddings, mock_retrieval_qa):
+def test_rag_engine_query_no_documents(mock_vector_db, mock_openai, mock_retrieval_qa):
     # Testa o comportamento quando não há documentos disponíveis
     mock_vector_db.get_vector_store.return_value = None
     rag_engine = RAGEngine(mock_vector_db)
@@ -94,4 +91,169 @@ def test_rag_engine_query_no_documents(mock_vector_db, mock_openai, mock_embeddi
 
     assert "answer" in result
     assert "Desculpe, não há documentos para responder à sua pergunta." in result["answer"]
-    assert result["sources"] == []
\ No newline at end of file
+    assert result["sources"] == []
+
+def test_rag_engine_aquery(mock_vector_db, mock_openai, mock_retrieval_qa):
+    # Testa a consulta assíncrona, que usa o ainvoke do QA Chain
+    mock_qa_chain = MagicMock()
+    mock_qa_chain.ainvoke = AsyncMock(return_value={
+        "result": "Async answer",
+        "source_documents": [MagicMock(metadata={"source": "doc1"}, page_content="content1")]
+    })
+    mock_retrieval_qa.from_chain_type.return_value = mock_qa_chain
+
+    rag_engine = RAGEngine(mock_vector_db)
+    result = asyncio.run(rag_engine.aquery("Test question"))
+
+    assert result["answer"] == "Async answer"
+    assert result["sources"][0]["title"] == "doc1"
+    mock_qa_chain.ainvoke.assert_awaited_once_with({"query": "Test question"})
+    assert not mock_qa_chain.invoke.called
+
+def test_rag_engine_sees_new_documents_without_rebuild(mock_vector_db, mock_openai, mock_retrieval_qa):
+    # Testa que documentos adicionados após a inicialização ficam visíveis sem recriar o RAGEngine
+    mock_qa_chain = MagicMock()
+    mock_qa_chain.invoke.return_value = {"result": "Nova resposta", "source_documents": []}
+    mock_retrieval_qa.from_chain_type.return_value = mock_qa_chain
+    mock_vector_db.get_vector_store.return_value = None
+
+    rag_engine = RAGEngine(mock_vector_db)
+    assert "Desculpe" in rag_engine.query("Test question")["answer"]
+
+    mock_vector_db.get_vector_store.return_value = MagicMock()
+    assert rag_engine.query("Test question")["answer"] == "Nova resposta"
+    assert mock_retrieval_qa.from_chain_type.call_count == 1
+
+def test_rag_engine_answer_cache(mock_vector_db, mock_openai, mock_retrieval_qa):
+    # Testa que uma pergunta repetida é respondida pelo cache, sem invocar o QA Chain novamente
+    from src.answer_cache import AnswerCache
+    mock_qa_chain = MagicMock()
+    mock_qa_chain.invoke.return_value = {"result": "Resposta", "source_documents": []}
+    mock_retrieval_qa.from_chain_type.return_value = mock_qa_chain
+    mock_vector_db.version = 1
+
+    rag_engine = RAGEngine(mock_vector_db, answer_cache=AnswerCache())
+    first = rag_engine.query("Qual é o prazo?")
+    second = rag_engine.query("qual é o prazo")
+
+    assert first == second
+    assert mock_qa_chain.invoke.call_count == 1
+
+    # Uma nova versão do índice invalida o cache
+    mock_vector_db.version = 2
+    rag_engine.query("qual é o prazo")
+    assert mock_qa_chain.invoke.call_count == 2
+
+def test_rag_engine_filtered_query(mock_vector_db, mock_openai, mock_retrieval_qa):
+    # Testa que o filtro chega à recuperação e que a consulta filtrada não usa o cache de respostas
+    from src.answer_cache import AnswerCache
+    mock_vector_db.version = 1
+    mock_vector_db.aretrieve = AsyncMock(return_value=[Document(page_content="content1", metadata={"source": "doc1"})])
+    mock_openai.return_value.ainvoke = AsyncMock(return_value="Resposta filtrada")
+    answer_cache = AnswerCache()
+    rag_engine = RAGEngine(mock_vector_db, answer_cache=answer_cache)
+
+    query_filter = {"source": {"$in": ["doc1"]}}
+    response = asyncio.run(rag_engine.aquery("Qual é o prazo?", filter=query_filter))
+
+    assert response["answer"] == "Resposta filtrada"
+    assert response["sources"][0]["title"] == "doc1"
+    assert mock_vector_db.aretrieve.await_args.kwargs["filter"] == query_filter
+    mock_retrieval_qa.from_chain_type.return_value.ainvoke.assert_not_called()
+    assert answer_cache.stats()["entries"] == 0
+
+def test_rag_engine_aquery_many(mock_vector_db, mock_openai, mock_retrieval_qa):
+    # Testa o lote: uma única recuperação compartilhada e erros isolados por pergunta
+    mock_vector_db.aretrieve_many = AsyncMock(return_value=[
+        [Document(page_content="content1", metadata={"source": "doc1"})],
+        [Document(page_content="content2", metadata={"source": "doc2"})],
+    ])
+
+    async def answer(prompt):
+        if "content2" in prompt:
+            raise RuntimeError("limite de requisições")
+        return "Resposta 1"
+
+    mock_openai.return_value.ainvoke = AsyncMock(side_effect=answer)
+    rag_engine = RAGEngine(mock_vector_db)
+    results = asyncio.run(rag_engine.aquery_many(["Pergunta 1", "Pergunta 2"], max_concurrency=1))
+
+    mock_vector_db.aretrieve_many.assert_awaited_once()
+    assert results[0]["question"] == "Pergunta 1"
+    assert results[0]["answer"] == "Resposta 1"
+    assert results[0]["sources"][0]["title"] == "doc1"
+    assert results[1] == {"question": "Pergunta 2", "error": "limite de requisições"}
+
+def stream_events(rag_engine, question, limit=None):
+    # Consome o streaming do RAGEngine, parando após `limit` eventos
+    async def run():
+        events = []
+        stream = rag_engine.astream(question)
+        async for event in stream:
+            events.append(event)
+            if limit is not None and len(events) == limit:
+                await stream.aclose()
+                break
+        return events
+    return asyncio.run(run())
+
+def test_rag_engine_astream(mock_vector_db, mock_openai, mock_retrieval_qa):
+    # Testa o streaming: fontes primeiro, depois os tokens e por fim a resposta completa
+    mock_vector_db.get_vector_store.return_value.asimilarity_search = AsyncMock(
+        return_value=[Document(page_content="content1", metadata={"source": "doc1"})]
+    )
+
+    async def tokens(prompt):
+        assert "content1" in prompt and "Test question" in prompt
+        for token in ["Resposta", " em", " partes"]:
+            yield token
+
+    mock_openai.return_value.astream = tokens
+    rag_engine = RAGEngine(mock_vector_db)
+    events = stream_events(rag_engine, "Test question")
+
+    assert [event["event"] for event in events] == ["sources", "token", "token", "token", "done"]
+    assert events[0]["data"][0]["title"] == "doc1"
+    assert events[-1]["data"]["answer"] == "Resposta em partes"
+    assert not mock_retrieval_qa.from_chain_type.return_value.invoke.called
+
+def test_rag_engine_astream_cancels_generation(mock_vector_db, mock_openai, mock_retrieval_qa):
+    # Testa que fechar o streaming fecha também o stream do LLM
+    mock_vector_db.get_vector_store.return_value.asimilarity_search = AsyncMock(return_value=[])
+    generated = []
+    closed = []
+
+    async def tokens(prompt):
+        try:
+            for i in range(100):
+                generated.append(i)
+                yield f"token{i} "
+        finally:
+            closed.append(True)
+
+    mock_openai.return_value.astream = tokens
+    rag_engine = RAGEngine(mock_vector_db)
+    events = stream_events(rag_engine, "Test question", limit=3)
+
+    assert len(events) == 3
+    assert closed == [True]
+    assert len(generated) < 100
+
+def test_rag_engine_reranks_wide_candidate_set(mock_vector_db, mock_openai, mock_retrieval_qa):
+    # Testa que o re-ranker recebe os candidatos e apenas os k melhores chegam ao LLM, com os tempos de cada etapa
+    candidates = [Document(page_content=f"content{i}", metadata={"source": f"doc{i}"}) for i in range(10)]
+    mock_vector_db.aretrieve = AsyncMock(return_value=candidates)
+
+    class ReverseReranker:
+        async def arerank(self, query, documents, k):
+            return [(doc, float(-i)) for i, doc in enumerate(reversed(documents))][:k]
+
+    mock_openai.return_value.ainvoke = AsyncMock(return_value="Resposta")
+    rag_engine = RAGEngine(mock_vector_db, reranker=ReverseReranker(), rerank_candidates=10)
+    response = asyncio.run(rag_engine.aquery("Qual é o prazo?", filter={"source": "doc1"}))
+
+    assert mock_vector_db.aretrieve.await_args.kwargs["k"] == 10
+    assert [source["title"] for source in response["sources"]] == ["doc9", "doc8", "doc7", "doc6"]
+    stats = rag_engine.stats()
+    assert (stats["reranker"], stats["candidates"], stats["k"]) == ("ReverseReranker", 10, 4)
+    assert all(stats["stages"][stage]["count"] == 1 for stage in ("retrieval", "rerank", "generation"))
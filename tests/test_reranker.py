@@ -0,0 +1,49 @@
+import pytest
+import asyncio
+import sys
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.reranker import BlendReranker, CrossEncoderReranker, create_reranker
+
+class IdentityPreprocessor:
+    """Pré-processador que apenas converte a pergunta para minúsculas."""
+
+    def preprocess_query(self, query):
+        return query.lower()
+
+DOCUMENTS = [
+    Document(page_content="prazo entrega pedidos dez dias úteis", metadata={"source": "a"}),
+    Document(page_content="garantia produtos doze meses", metadata={"source": "b"}),
+    Document(page_content="código produto xk-2291 descontinuado", metadata={"source": "c"}),
+]
+
+def test_blend_reranker_promotes_lexical_matches():
+    # Testa que, com todo o peso no BM25, o segmento com os termos da pergunta vem primeiro
+    reranker = BlendReranker(DeterministicFakeEmbedding(size=32), IdentityPreprocessor(), lexical_weight=1.0)
+    ranked = reranker.rerank("Qual o prazo de entrega?", DOCUMENTS, k=2)
+
+    assert len(ranked) == 2
+    assert ranked[0][0].metadata["source"] == "a"
+    assert ranked[0][1] >= ranked[1][1]
+    assert asyncio.run(reranker.arerank("Qual o prazo de entrega?", DOCUMENTS, k=2)) == ranked
+
+def test_blend_reranker_uses_embedding_similarity():
+    # Testa que, com todo o peso nos embeddings, o segmento idêntico à pergunta vem primeiro
+    reranker = BlendReranker(DeterministicFakeEmbedding(size=32), IdentityPreprocessor(), lexical_weight=0.0)
+    ranked = reranker.rerank(DOCUMENTS[1].page_content, DOCUMENTS, k=3)
+    assert [doc.metadata["source"] for doc, _ in ranked][0] == "b"
+    assert reranker.rerank("qualquer", [], k=3) == []
+
+def test_invalid_reranker_configuration():
+    with pytest.raises(ValueError):
+        create_reranker("colbert")
+    with pytest.raises(ValueError):
+        BlendReranker(DeterministicFakeEmbedding(size=32), IdentityPreprocessor(), lexical_weight=1.5)
+
+def test_cross_encoder_falls_back_to_blend(monkeypatch):
+    # Testa que, sem o sentence-transformers, o cross-encoder é substituído pela combinação
+    monkeypatch.setitem(sys.modules, "sentence_transformers", None)
+    with pytest.raises(ImportError):
+        CrossEncoderReranker()
+    reranker = create_reranker("cross-encoder", DeterministicFakeEmbedding(size=32), IdentityPreprocessor())
+    assert isinstance(reranker, BlendReranker)
@@ -0,0 +1,112 @@
+import pytest
+import numpy as np
+import os
+from src.segment_store import SegmentStore
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    Cria um SegmentStore em um diretório temporário, sem compactação automática.
+
+    Retorna:
+        SegmentStore: O armazenamento de segmentos.
+    """
+    return SegmentStore(str(tmp_path / "db"), compact_threshold=100)
+
+def make_batch(start, n, dimension=4):
+    # Gera um lote de vetores e documentos identificáveis pela posição
+    ids = [f"id-{i}" for i in range(start, start + n)]
+    vectors = np.arange(start * dimension, (start + n) * dimension, dtype=np.float32).reshape(n, dimension)
+    texts = [f"texto {i}" for i in range(start, start + n)]
+    metadatas = [{"source": f"doc{i}.txt"} for i in range(start, start + n)]
+    return ids, vectors, texts, metadatas
+
+def test_append_and_load(store):
+    # Testa se os segmentos acrescentados são recarregados na ordem de gravação
+    store.append(*make_batch(0, 3))
+    store.append(*make_batch(3, 2))
+
+    index, documents = store.load()
+
+    assert index.ntotal == 5
+    assert [doc_id for doc_id, _, _ in documents] == [f"id-{i}" for i in range(5)]
+    np.testing.assert_array_equal(index.reconstruct(4), make_batch(4, 1)[1][0])
+
+def test_append_does_not_rewrite_previous_segments(store):
+    # Testa se uma nova gravação não reescreve os arquivos já persistidos
+    first = store.append(*make_batch(0, 3))
+    first_path = os.path.join(store.directory, f"{first}.vec")
+    mtime = os.stat(first_path).st_mtime_ns
+
+    store.append(*make_batch(3, 2))
+
+    assert os.stat(first_path).st_mtime_ns == mtime
+    assert store.read_manifest()["segments"] == [first, "seg-000002"]
+
+def test_compaction_preserves_contents(store):
+    # Testa se a compactação gera um snapshot equivalente e remove os segmentos antigos
+    store.append(*make_batch(0, 3))
+    store.append(*make_batch(3, 2))
+    store.compact()
+    store.append(*make_batch(5, 1))
+
+    manifest = store.read_manifest()
+    index, documents = store.load()
+
+    assert manifest["snapshot"] is not None
+    assert manifest["segments"] == ["seg-000004"]
+    assert index.ntotal == 6
+    assert [doc_id for doc_id, _, _ in documents] == [f"id-{i}" for i in range(6)]
+    assert not os.path.exists(os.path.join(store.directory, "seg-000001.vec"))
+
+def test_background_compaction(tmp_path):
+    # Testa a compactação automática em segundo plano ao atingir o limite de segmentos
+    store = SegmentStore(str(tmp_path / "db"), compact_threshold=2)
+    store.append(*make_batch(0, 1))
+    store.append(*make_batch(1, 1))
+    store.wait_for_compaction()
+
+    assert store.read_manifest()["segments"] == []
+    assert store.load()[0].ntotal == 2
+
+def test_interrupted_write_is_ignored(store):
+    # Testa se um arquivo temporário deixado por um crash não afeta o carregamento
+    store.append(*make_batch(0, 2))
+    with open(os.path.join(store.directory, "seg-000002.vec.tmp"), "wb") as f:
+        f.write(b"parcial")
+
+    index, documents = store.load()
+    assert index.ntotal == 2
+
+def test_rejects_dimension_mismatch(store):
+    # Testa a validação da dimensão dos vetores
+    store.append(*make_batch(0, 1, dimension=4))
+    with pytest.raises(ValueError):
+        store.append(*make_batch(1, 1, dimension=8))
+
+def test_load_mmap_reads_documents_on_demand(store):
+    # Testa o carregamento mapeado em memória de um snapshot compactado
+    store.append(*make_batch(0, 3))
+    store.compact()
+
+    index, mapped, ids, snapshot_documents, segment_documents = store.load_mmap()
+
+    assert mapped
+    assert index.ntotal == 3
+    assert ids == ["id-0", "id-1", "id-2"]
+    assert snapshot_documents.get(1) == ("id-1", "texto 1", {"source": "doc1.txt"})
+    assert segment_documents == []
+
+def test_load_mmap_with_pending_segments(store):
+    # Testa se segmentos não compactados são aplicados sobre o snapshot mapeado
+    store.append(*make_batch(0, 2))
+    store.compact()
+    store.append(*make_batch(2, 1))
+
+    index, mapped, ids, snapshot_documents, segment_documents = store.load_mmap()
+
+    assert not mapped
+    assert index.ntotal == 3
+    assert ids == ["id-0", "id-1", "id-2"]
+    assert len(snapshot_documents) == 2
+    assert segment_documents == [("id-2", "texto 2", {"source": "doc2.txt"})]
@@ -0,0 +1,193 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.sharded_vector_db import SHARD_DIRECTORY, SHARDS_FILE, ShardedVectorDB, shard_of
+from src.vector_db import VectorDB
+import json
+import os
+import shutil
+
+TEXTS = [f"O contrato {i} trata do fornecimento de peças do lote {i * 7} para a filial {i % 5}" for i in range(40)]
+METADATAS = [{"source": f"doc{i % 4}.pdf", "tenant": "acme" if i % 2 else "globex"} for i in range(40)]
+QUERIES = ["fornecimento de peças do lote 21", "contrato 13 da filial 3", "filial 4"]
+SOURCES = [f"doc{i}.pdf" for i in range(40)]
+DISCLAIMER = " ".join(f"termo{i}" for i in range(200))
+
+@pytest.fixture(autouse=True)
+def clean_directories():
+    """Limpa os diretórios dos bancos de dados vetoriais antes e após cada teste."""
+    for directory in ("./sharded_vector_db", "./vector_db"):
+        shutil.rmtree(directory, ignore_errors=True)
+    yield
+    for directory in ("./sharded_vector_db", "./vector_db"):
+        shutil.rmtree(directory, ignore_errors=True)
+
+def make_sharded(shards=3, mode="thread"):
+    return ShardedVectorDB(persist_directory="./sharded_vector_db", shards=shards, mode=mode,
+                           embeddings=DeterministicFakeEmbedding(size=32), batch_size=8)
+
+def make_plain():
+    return VectorDB(persist_directory="./vector_db", embeddings=DeterministicFakeEmbedding(size=32), batch_size=8)
+
+def contents(documents):
+    return [doc.page_content for doc in documents]
+
+def shard_documents(db, index):
+    """Os documentos ativos de um shard, no modo "thread"."""
+    vector_store = db.shards[index].db.vector_store
+    if vector_store is None:
+        return []
+    return [
+        vector_store.docstore.search(vector_store.index_to_docstore_id[position])
+        for position in range(vector_store.index.ntotal) if position not in vector_store.deleted
+    ]
+
+def shard_texts(db, index):
+    """Os textos ativos de um shard, no modo "thread"."""
+    return contents(shard_documents(db, index))
+
+def assert_routed_by_source(db):
+    for index in range(len(db.shards)):
+        assert all(shard_of(doc.metadata.get("source"), len(db.shards)) == index for doc in shard_documents(db, index))
+
+def test_shard_of_moves_few_segments():
+    # Testa que o roteamento é estável e que poucos documentos mudam de shard quando um é adicionado
+    assert all(0 <= shard_of(source, 3) < 3 for source in SOURCES)
+    assert [shard_of(source, 3) for source in SOURCES] == [shard_of(source, 3) for source in SOURCES]
+    moved = sum(shard_of(source, 3) != shard_of(source, 4) for source in SOURCES)
+    assert 0 < moved < len(SOURCES) / 2
+    assert all(shard_of(source, 4) == 3 for source in SOURCES if shard_of(source, 3) != shard_of(source, 4))
+    assert 0 <= shard_of(None, 3) < 3
+
+def test_sharded_results_match_single_index():
+    # Testa que a busca espalhada pelos shards retorna o mesmo que um índice único
+    sharded, plain = make_sharded(), make_plain()
+    # Um documento por segmento, para que todos os shards recebam segmentos
+    metadatas = [dict(metadata, source=source) for metadata, source in zip(METADATAS, SOURCES)]
+    stats = {}
+    assert sharded.add(TEXTS, metadatas, stats) == plain.add(TEXTS, metadatas) == len(TEXTS)
+    assert stats["added"] == len(TEXTS)
+    assert all(shard_texts(sharded, index) for index in range(3))
+    assert_routed_by_source(sharded)
+
+    for query in QUERIES:
+        assert [(text, meta) for text, meta, _ in sharded.search(query, k=5)] == \
+            [(text, meta) for text, meta, _ in plain.search(query, k=5)]
+        assert contents(sharded.retrieve(query, k=5, mode="vector")) == contents(plain.retrieve(query, k=5, mode="vector"))
+        assert set(contents(sharded.retrieve(query, k=5))) <= set(plain.preprocessor.preprocess_many(TEXTS))
+    assert [contents(docs) for docs in sharded.retrieve_many(QUERIES, k=5, mode="vector")] == \
+        [contents(docs) for docs in plain.retrieve_many(QUERIES, k=5, mode="vector")]
+
+    status = sharded.status()
+    assert status["total_documents"] == len(TEXTS)
+    assert sum(shard["total_documents"] for shard in status["shards"]) == len(TEXTS)
+    sharded.close()
+
+def test_sharded_filters_sources_and_deletes():
+    # Testa os filtros de metadados, a listagem e a remoção de documentos espalhados pelos shards
+    db = make_sharded()
+    db.add(TEXTS, METADATAS)
+    # Os segmentos de um documento caem no mesmo shard, e os repetidos são descartados
+    stats = {}
+    assert db.add(TEXTS[:5], METADATAS[:5], stats) == 0
+    assert stats["duplicates"] == 5
+
+    results = db.retrieve(QUERIES[0], k=10, filter={"tenant": "acme"})
+    assert results and all(doc.metadata["tenant"] == "acme" for doc in results)
+    assert db.sources() == {f"doc{i}.pdf": 10 for i in range(4)}
+
+    db.record_file("hash0", "doc0.pdf", 10)
+    assert db.delete_source("doc0.pdf") == 10
+    assert "doc0.pdf" not in db.sources()
+    assert db.file_record("hash0") is None
+    assert db.status()["total_documents"] == 30
+    assert all(doc.metadata["source"] != "doc0.pdf" for doc in db.retrieve(QUERIES[0], k=10))
+    db.close()
+
+def test_reshard_moves_segments_and_reloads():
+    # Testa que mudar o número de shards move os segmentos para o seu novo shard sem perder nenhum
+    db = make_sharded(shards=2)
+    db.add(TEXTS, METADATAS)
+    db.close()
+
+    for shards in (3, 1):
+        db = make_sharded(shards=shards)
+        assert db.status()["total_documents"] == len(TEXTS)
+        assert_routed_by_source(db)
+        assert sorted(text for index in range(shards) for text in shard_texts(db, index)) == \
+            sorted(db.preprocessor.preprocess_many(TEXTS))
+        db.close()
+        assert not os.path.exists(os.path.join("./sharded_vector_db", SHARD_DIRECTORY.format(shards)))
+
+def test_sharded_near_duplicates_share_a_shard():
+    # Testa que as quase duplicatas de um documento são detectadas mesmo com os segmentos espalhados pelo texto
+    db = make_sharded()
+    variants = [DISCLAIMER.rsplit(" ", 1)[0] + f" alterado{i}" for i in range(8)]
+    stats = {}
+    assert db.add(variants, [{"source": "manual.pdf"}] * len(variants), stats) == 1
+    assert stats == {"added": 1, "duplicates": 0, "near_duplicates": len(variants) - 1}
+    # Em outro documento, o mesmo trecho é indexado
+    assert db.add(variants[:1], [{"source": "outro.pdf"}]) == 1
+    assert db.sources() == {"manual.pdf": 1, "outro.pdf": 1}
+    db.close()
+
+def test_reroutes_directory_routed_by_text():
+    # Testa que um diretório gravado antes do roteamento pelo documento é rebalanceado na abertura
+    db = make_sharded()
+    db.add(TEXTS, METADATAS)
+    db.close()
+    # Simula um segmento fora do shard do seu documento e o shards.json antigo, sem a chave de roteamento
+    source = "doc0.pdf"
+    misplaced = (shard_of(source, 3) + 1) % 3
+    shard = VectorDB(persist_directory=os.path.join("./sharded_vector_db", SHARD_DIRECTORY.format(misplaced)),
+                     embeddings=DeterministicFakeEmbedding(size=32))
+    shard.add(["Segmento gravado pelo roteamento antigo"], [{"source": source, "tenant": "acme"}])
+    shard.close()
+    with open(os.path.join("./sharded_vector_db", SHARDS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"shards": 3}, f)
+
+    db = make_sharded()
+    assert_routed_by_source(db)
+    assert db.status()["total_documents"] == len(TEXTS) + 1
+    assert db.delete_source(source) == 11
+    assert db.status()["total_documents"] == len(TEXTS) - 10
+    db.close()
+
+def test_migrates_unsharded_directory():
+    # Testa que um diretório de um VectorDB não particionado é migrado para shards
+    plain = VectorDB(persist_directory="./sharded_vector_db", embeddings=DeterministicFakeEmbedding(size=32))
+    plain.add(TEXTS, METADATAS)
+    plain.close()
+    # Um diretório gravado antes do registro da versão do pré-processamento usou o NLTK
+    os.remove("./sharded_vector_db/preprocessor.json")
+
+    db = make_sharded(shards=2)
+    assert db.status()["total_documents"] == len(TEXTS)
+    assert db.sources() == {f"doc{i}.pdf": 10 for i in range(4)}
+    assert db.preprocessor.tokenizer == "nltk"
+    assert all(shard.db.preprocessor.tokenizer == "nltk" for shard in db.shards)
+    db.close()
+    reopened = make_sharded(shards=2)
+    assert reopened.preprocessor.tokenizer == "nltk"
+    reopened.close()
+
+def test_process_mode_matches_thread_mode():
+    # Testa que os shards em processos locais retornam o mesmo que os shards em threads
+    db = make_sharded(shards=2, mode="process")
+    try:
+        db.add(TEXTS, METADATAS)
+        results = [contents(docs) for docs in db.retrieve_many(QUERIES, k=5)]
+        sources = db.sources()
+    finally:
+        db.close()
+    assert all(not shard.process.is_alive() for shard in db.shards)
+
+    db = make_sharded(shards=2)
+    assert [contents(docs) for docs in db.retrieve_many(QUERIES, k=5)] == results
+    assert db.sources() == sources
+    db.close()
+
+def test_rejects_invalid_configuration():
+    with pytest.raises(ValueError):
+        make_sharded(shards=0)
+    with pytest.raises(ValueError):
+        make_sharded(mode="cluster")
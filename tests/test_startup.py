@@ -0,0 +1,107 @@
+from fastapi.testclient import TestClient
+import main
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Bibliotecas que não devem ser importadas junto com a aplicação
+HEAVY_MODULES = ["langchain", "langchain_community", "langchain_openai", "faiss", "nltk",
+                 "pandas", "openpyxl", "xlrd", "pypdf", "docx", "bs4"]
+# Orçamentos de inicialização, ajustáveis para máquinas mais lentas
+IMPORT_BUDGET_SECONDS = float(os.getenv("STARTUP_IMPORT_BUDGET_SECONDS", "2.0"))
+FIRST_REQUEST_BUDGET_SECONDS = float(os.getenv("STARTUP_FIRST_REQUEST_BUDGET_SECONDS", "3.0"))
+
+COMPONENTS = ["embedding_dispatcher", "embedding_cache", "vector_db", "answer_cache", "rag_engine"]
+
+def run_python(code, tmp_path, *flags):
+    """Executa um trecho de código em um interpretador novo, sem componentes pré-carregados."""
+    env = {**os.environ, "STARTUP_WARMUP": "lazy", "INGEST_JOBS_PATH": str(tmp_path / "jobs")}
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+def test_import_does_not_load_heavy_modules(tmp_path):
+    # Testa que importar a aplicação não importa as bibliotecas de extração, LangChain, FAISS e NLTK
+    result = run_python("import json, sys, main; print(json.dumps(sorted(sys.modules)))", tmp_path)
+    loaded = set(json.loads(result.stdout.splitlines()[-1]))
+
+    assert [module for module in HEAVY_MODULES if module in loaded] == []
+
+def test_import_time(tmp_path):
+    # Mede o tempo de importação da aplicação com `python -X importtime`
+    result = run_python("import main", tmp_path, "-X", "importtime")
+    timings = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                timings[module.strip()] = int(cumulative) / 1e6
+    slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)[:10]
+    print("importações mais lentas (s):", ", ".join(f"{module}={seconds:.3f}" for module, seconds in slowest))
+
+    assert timings["main"] < IMPORT_BUDGET_SECONDS
+
+def test_time_to_first_request(tmp_path):
+    # Mede o tempo entre o início do interpretador e a primeira resposta da sonda de liveness
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        "from fastapi.testclient import TestClient\n"
+        "import main\n"
+        "with TestClient(main.app) as client:\n"
+        "    assert client.get('/health').status_code == 200\n"
+        "    print(time.perf_counter() - start)\n"
+    )
+    elapsed = float(run_python(code, tmp_path).stdout.splitlines()[-1])
+    print(f"tempo até a primeira requisição: {elapsed:.3f}s")
+
+    assert elapsed < FIRST_REQUEST_BUDGET_SECONDS
+
+def test_ready_probe_during_background_warmup(monkeypatch):
+    # Testa que a liveness responde durante a inicialização e a readiness só após o seu término
+    release = threading.Event()
+    for name in COMPONENTS:
+        monkeypatch.setattr(main, name, None)
+    monkeypatch.setattr(main, "components_error", None)
+
+    def slow_init():
+        release.wait(5)
+        for name in COMPONENTS:
+            setattr(main, name, object())
+
+    monkeypatch.setattr(main, "init_components", slow_init)
+    monkeypatch.setattr(main, "startup_warmup", "background")
+    with TestClient(main.app) as client:
+        assert client.get("/health").status_code == 200
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+
+        release.set()
+        for _ in range(50):
+            response = client.get("/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.05)
+
+    assert response.json() == {"status": "ready"}
+
+def test_ready_probe_reports_failure(monkeypatch):
+    # Testa que uma falha na inicialização é reportada pela readiness
+    for name in COMPONENTS:
+        monkeypatch.setattr(main, name, None)
+    monkeypatch.setattr(main, "components_error", None)
+
+    def failing_init():
+        raise RuntimeError("índice corrompido")
+
+    monkeypatch.setattr(main, "init_components", failing_init)
+    monkeypatch.setattr(main, "startup_warmup", "eager")
+    with TestClient(main.app) as client:
+        response = client.get("/ready")
+
+    assert response.status_code == 503
+    assert response.json() == {"status": "failed", "error": "índice corrompido"}
@@ -77,4 +77,74 @@ def test_only_stopwords(preprocessor):
     expected = ""
     
     result = preprocessor.preprocess(text)
-    assert result == expected, f"Expected '{expected}', but got '{result}'"
\ No newline at end of file
+    assert result == expected, f"Expected '{expected}', but got '{result}'"
+
+CORPUS = [
+    "Este é um texto de teste. Ele contém algumas palavras comuns.",
+    "Olá, mundo! Como vai você? Tudo bem: sim.",
+    "E-mail: exemplo@email.com, site: www.exemplo.com.br",
+    "O contrato vence em 12/03/2024, às 12:30, e o valor é de R$ 1.000,50...",
+    "A cláusula 3.2 (multa) prevê 10% sobre o total -- sem exceções; veja o anexo [A].",
+]
+
+def test_preprocess_many_matches_preprocess(preprocessor):
+    # Testa que o pré-processamento em lote produz o mesmo resultado que o individual
+    assert preprocessor.preprocess_many(CORPUS) == [preprocessor.preprocess(text) for text in CORPUS]
+
+# Tokens do word_tokenize do NLTK para o corpus de referência, em minúsculas
+EXPECTED_TOKENS = [
+    ["este", "é", "um", "texto", "de", "teste", ".", "ele", "contém", "algumas", "palavras", "comuns", "."],
+    ["olá", ",", "mundo", "!", "como", "vai", "você", "?", "tudo", "bem", ":", "sim", "."],
+    ["e-mail", ":", "exemplo", "@", "email.com", ",", "site", ":", "www.exemplo.com.br"],
+    ["o", "contrato", "vence", "em", "12/03/2024", ",", "às", "12:30", ",", "e", "o", "valor", "é", "de", "r", "$",
+     "1.000,50", "..."],
+    ["a", "cláusula", "3.2", "(", "multa", ")", "prevê", "10", "%", "sobre", "o", "total", "--", "sem", "exceções", ";",
+     "veja", "o", "anexo", "[", "a", "]", "."],
+]
+
+def test_regex_tokenizer_matches_nltk():
+    # Compara o tokenizador compilado com os tokens do word_tokenize do NLTK no corpus de
+    # referência, fixados acima para que o teste não dependa dos dados punkt
+    assert [TextPreprocessor(language='portuguese').tokenize(text.lower()) for text in CORPUS] == EXPECTED_TOKENS
+
+    nltk_preprocessor = TextPreprocessor(language='portuguese', tokenizer='nltk')
+    try:
+        tokens = [nltk_preprocessor.tokenize(text.lower()) for text in CORPUS]
+    except LookupError:
+        # Sem os dados punkt, a comparação se limita aos tokens fixados
+        return
+    assert tokens == EXPECTED_TOKENS
+
+def test_preprocessor_version():
+    # Testa que a versão registrada com os índices identifica o tokenizador e o idioma
+    assert TextPreprocessor(language='portuguese').version == "regex-1/portuguese"
+    assert TextPreprocessor(language='portuguese', tokenizer='nltk').version != TextPreprocessor().version
+
+def test_query_cache(preprocessor):
+    # Testa que consultas repetidas são atendidas pelo cache LRU
+    first = preprocessor.preprocess_query("Qual é o prazo de entrega?")
+    second = preprocessor.preprocess_query("Qual é o prazo de entrega?")
+
+    assert first == second == preprocessor.preprocess("Qual é o prazo de entrega?")
+    assert preprocessor.preprocess_query.cache_info().hits == 1
+
+def test_stopwords_loaded_lazily():
+    # Testa que as stopwords só são carregadas no primeiro uso
+    preprocessor = TextPreprocessor(language='portuguese')
+    assert preprocessor._stop_words is None
+
+    preprocessor.preprocess("texto")
+    assert "de" in preprocessor._stop_words
+
+def test_invalid_tokenizer():
+    # Testa a validação do tokenizador
+    with pytest.raises(ValueError):
+        TextPreprocessor(tokenizer="desconhecido")
+
+def test_preprocess_many_with_processes(preprocessor, monkeypatch):
+    # Testa que a divisão do lote entre processos preserva a ordem e o resultado
+    import src.text_preprocessor as text_preprocessor
+    monkeypatch.setattr(text_preprocessor, "PARALLEL_MIN_TEXTS", 2)
+    texts = CORPUS * 3
+
+    assert preprocessor.preprocess_many(texts, processes=2) == [preprocessor.preprocess(text) for text in texts]
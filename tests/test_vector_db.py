@@ -1,8 +1,20 @@
 import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
 from src.vector_db import VectorDB
+from src.index_factory import index_kind, storage_kind
+import numpy as np
+import json
 import os
 import shutil
 
+class CountingFakeEmbedding(DeterministicFakeEmbedding):
+    """Embedding determinístico local que conta as chamadas feitas ao modelo."""
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return super().embed_documents(texts)
+
 @pytest.fixture(autouse=True)
 def clean_vector_db():
     """
@@ -30,6 +42,16 @@ def vector_db():
     """
     return VectorDB(persist_directory="./vector_db")
 
+@pytest.fixture
+def fake_vector_db():
+    """
+    Fixture que cria um VectorDB com um embedding local falso, sem chamadas à API da OpenAI.
+
+    Retorno:
+    Uma instância do VectorDB com lotes de no máximo 4 textos.
+    """
+    return VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32), batch_size=4)
+
 def test_add_and_search(vector_db):
     # Testa a adição de documentos e a busca
     documents = ["This is a test document", "Another test document"]
@@ -59,4 +81,450 @@ def test_error_handling(vector_db):
         vector_db.add(["test"], [])
 
     with pytest.raises(ValueError):
-        vector_db.add("not a list", "not a list")
\ No newline at end of file
+        vector_db.add("not a list", "not a list")
+
+def test_add_documents_in_batches(fake_vector_db, monkeypatch):
+    # Testa a ingestão em lote: um embedding por lote e uma única persistência
+    saves = []
+    monkeypatch.setattr(fake_vector_db, "save", lambda: saves.append(True))
+    segments = [{"content": f"segmento número {i}", "metadata": {"source": "doc.txt"}} for i in range(10)]
+
+    added = fake_vector_db.add_documents(segments)
+
+    assert added == 10
+    assert fake_vector_db.vector_store.index.ntotal == 10
+    # 10 textos em lotes de 4 resultam em 3 chamadas ao modelo de embeddings
+    assert fake_vector_db.embeddings.calls == 3
+    assert len(saves) == 1
+
+def test_add_documents_invalid_segments(fake_vector_db):
+    # Testa a validação dos segmentos da ingestão em lote
+    with pytest.raises(ValueError):
+        fake_vector_db.add_documents(None)
+
+    with pytest.raises(ValueError):
+        fake_vector_db.add_documents([{"content": "sem metadados"}])
+
+def test_persists_incrementally_and_reloads(fake_vector_db):
+    # Testa a gravação incremental em segmentos e o recarregamento do disco
+    fake_vector_db.add(["primeiro documento"], [{"source": "a.txt"}])
+    fake_vector_db.add(["segundo documento"], [{"source": "b.txt"}])
+
+    assert len(fake_vector_db.store.read_manifest()["segments"]) == 2
+
+    reloaded = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert reloaded.vector_store.index.ntotal == 2
+    results = reloaded.search("segundo documento", k=1)
+    assert results[0][1] == {"source": "b.txt"}
+
+def test_mmap_load_and_write(fake_vector_db):
+    # Testa o carregamento via mmap, a busca e a escrita após o carregamento
+    fake_vector_db.add(["primeiro documento", "segundo documento"], [{"source": "a.txt"}, {"source": "b.txt"}])
+    fake_vector_db.compact()
+
+    mapped_db = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32), mmap=True)
+    assert mapped_db.search("primeiro documento", k=1)[0][1] == {"source": "a.txt"}
+
+    mapped_db.add(["terceiro documento"], [{"source": "c.txt"}])
+    assert mapped_db.vector_store.index.ntotal == 3
+    assert mapped_db.search("terceiro documento", k=1)[0][1] == {"source": "c.txt"}
+
+def test_migrate_index_and_reload(fake_vector_db):
+    # Testa a migração do índice exato para IVF, preservando documentos e o tipo após recarregar
+    texts = [f"documento número {i}" for i in range(100)]
+    fake_vector_db.add(texts, [{"source": f"{i}.txt"} for i in range(100)])
+
+    fake_vector_db.migrate_index("ivf_flat", {"nlist": 2})
+    fake_vector_db.set_search_params(nprobe=2)
+
+    assert index_kind(fake_vector_db.vector_store.index) == "ivf_flat"
+    assert fake_vector_db.search("documento número 42", k=1)[0][1] == {"source": "42.txt"}
+
+    reloaded = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32),
+                        search_params={"nprobe": 2})
+    assert index_kind(reloaded.vector_store.index) == "ivf_flat"
+    assert reloaded.vector_store.index.ntotal == 100
+    assert reloaded.search("documento número 7", k=1)[0][1] == {"source": "7.txt"}
+
+def test_trains_index_on_first_bulk_load():
+    # Testa o treino do índice aproximado com os vetores da primeira ingestão
+    db = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32),
+                  index_type="hnsw", index_params={"M": 8})
+    db.add([f"texto {i}" for i in range(10)], [{"source": "a.txt"}] * 10)
+
+    assert index_kind(db.vector_store.index) == "hnsw"
+    assert db.store.read_manifest()["snapshot"] is not None
+
+def test_rejects_unknown_index_type():
+    # Testa a validação do tipo de índice
+    with pytest.raises(ValueError):
+        VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32), index_type="lsh")
+
+@pytest.mark.parametrize("storage", ["float16", "int8", "pq"])
+def test_quantized_storage_with_rerank(storage):
+    # Testa que o re-ranking com os vetores completos devolve os resultados da busca exata
+    texts = [f"documento {i} sobre o tema {i % 7} e o assunto {i % 11}" for i in range(300)]
+    metadatas = [{"source": f"d{i}"} for i in range(300)]
+    exact = VectorDB(persist_directory="./vector_db/exact", embeddings=CountingFakeEmbedding(size=32), deduplicate=False)
+    exact.add(texts, metadatas)
+    quantized = VectorDB(persist_directory="./vector_db/quantized", embeddings=CountingFakeEmbedding(size=32),
+                         deduplicate=False, storage=storage, index_params={"m": 8, "nbits": 4}, rerank_factor=10)
+    quantized.add(texts, metadatas)
+
+    assert storage_kind(quantized.vector_store.index) == storage
+    query = "documento sobre o tema 3"
+    expected = [metadata for _, metadata, _ in exact.search(query, k=5)]
+    assert [metadata for _, metadata, _ in quantized.search(query, k=5)] == expected
+
+    # Os vetores completos continuam alinhados ao índice após o recarregamento e a compactação
+    quantized.delete_source("d0")
+    quantized.purge_deleted()
+    reloaded = VectorDB(persist_directory="./vector_db/quantized", embeddings=CountingFakeEmbedding(size=32),
+                        deduplicate=False, storage=storage, rerank_factor=10)
+    assert reloaded.vector_file.size == reloaded.vector_store.index.ntotal == 299
+    expected = [metadata for _, metadata, _ in exact.search(query, k=6) if metadata["source"] != "d0"][:5]
+    assert [metadata for _, metadata, _ in reloaded.search(query, k=5)] == expected
+
+def test_published_snapshot_is_not_modified_by_writes(fake_vector_db, monkeypatch):
+    # Testa o read-copy-update: um snapshot obtido antes de uma escrita continua vendo apenas os
+    # seus documentos, embora o índice, acrescentado sem cópia, seja compartilhado
+    import faiss
+    fake_vector_db.add(["primeiro documento"], [{"source": "a.txt"}])
+    version, snapshot = fake_vector_db.snapshot()
+
+    def no_clone(index):
+        raise AssertionError("a inserção não deve clonar o índice")
+    monkeypatch.setattr(faiss, "clone_index", no_clone)
+    fake_vector_db.add(["segundo documento"], [{"source": "b.txt"}])
+
+    current = fake_vector_db.get_vector_store()
+    assert current.index is snapshot.index and current.docstore is snapshot.docstore
+    assert snapshot.ntotal == 1
+    assert [d.metadata["source"] for d in snapshot.similarity_search("segundo documento", k=5)] == ["a.txt"]
+    assert fake_vector_db.version == version + 1
+    assert current.ntotal == current.index.ntotal == 2
+    assert len(current.similarity_search("segundo documento", k=5)) == 2
+
+def test_search_params_per_query(fake_vector_db):
+    # Testa que o nprobe de uma consulta não altera o padrão do índice compartilhado
+    texts = [f"documento número {i}" for i in range(100)]
+    fake_vector_db.add(texts, [{"source": f"{i}.txt"} for i in range(100)])
+    fake_vector_db.migrate_index("ivf_flat", {"nlist": 2})
+    fake_vector_db.set_search_params(nprobe=1)
+
+    assert fake_vector_db.search("documento número 42", k=1, nprobe=2)[0][1] == {"source": "42.txt"}
+    assert fake_vector_db.search_params == {"nprobe": 1}
+
+def test_hybrid_retrieval_finds_exact_identifiers(fake_vector_db):
+    # Testa que a recuperação híbrida encontra um código de produto pela busca léxica
+    texts = [f"Produto código ABC-{i:04d} com garantia de {i} meses" for i in range(20)]
+    fake_vector_db.add(texts, [{"source": f"p{i}"} for i in range(20)])
+
+    # Apenas o documento p7 contém o código: ele lidera o ranking léxico e entra no resultado fundido
+    documents = fake_vector_db.retrieve("ABC-0007", k=3, mode="hybrid")
+    assert "p7" in [document.metadata["source"] for document in documents]
+
+    lexical = fake_vector_db.lexical_search("abc-0007", k=1)
+    assert lexical[0][1] == {"source": "p7"}
+
+def test_lexical_mode_skips_query_embedding(fake_vector_db, monkeypatch):
+    # Testa que o modo léxico confiante responde sem embedar a consulta
+    fake_vector_db.add(["contrato de locação do imóvel", "relatório anual de vendas"],
+                       [{"source": "a"}, {"source": "b"}])
+
+    def fail(*args, **kwargs):
+        raise AssertionError("A consulta não deveria ser embedada")
+
+    monkeypatch.setattr(CountingFakeEmbedding, "embed_query", fail)
+    documents = fake_vector_db.retrieve("relatório anual de vendas", k=1, mode="lexical")
+    assert documents[0].metadata["source"] == "b"
+
+    with pytest.raises(AssertionError):
+        fake_vector_db.retrieve("palavras que não existem", k=1, mode="lexical")
+
+@pytest.mark.parametrize("mode", ["hybrid", "vector"])
+def test_retrieve_many_matches_retrieve(fake_vector_db, mode):
+    # Testa que a recuperação em lote tem o mesmo resultado da recuperação individual,
+    # embedando todas as consultas em uma única chamada ao modelo
+    texts = [f"Produto código ABC-{i:04d} com garantia de {i} meses" for i in range(20)]
+    fake_vector_db.add(texts, [{"source": f"p{i}"} for i in range(20)])
+    queries = ["ABC-0007", "garantia de 3 meses", "ABC-0007", "entrega expressa"]
+
+    fake_vector_db.embeddings.calls = 0
+    batched = fake_vector_db.retrieve_many(queries, k=3, mode=mode)
+    assert fake_vector_db.embeddings.calls == 1
+
+    for query, documents in zip(queries, batched):
+        expected = fake_vector_db.retrieve(query, k=3, mode=mode)
+        assert [d.metadata for d in documents] == [d.metadata for d in expected]
+
+def test_lexical_index_persists_and_rebuilds(fake_vector_db):
+    # Testa que o índice léxico é recarregado e reconstruído se o arquivo for perdido
+    fake_vector_db.add(["manual técnico XPTO-9"], [{"source": "manual"}])
+    fake_vector_db.add(["política de férias"], [{"source": "rh"}])
+
+    reloaded = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert reloaded.lexical_index.size == 2
+    assert reloaded.lexical_search("xpto-9", k=1)[0][1] == {"source": "manual"}
+
+    os.remove("./vector_db/lexical.jsonl")
+    rebuilt = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert rebuilt.lexical_search("férias", k=1)[0][1] == {"source": "rh"}
+
+def test_duplicate_segments_are_not_embedded(fake_vector_db):
+    # Testa que segmentos já indexados não são embedados nem indexados de novo
+    segments = [{"content": f"cláusula número {i}", "metadata": {"source": "a.txt"}} for i in range(4)]
+    stats = {}
+    assert fake_vector_db.add_documents(segments, stats=stats) == 4
+
+    repeated = segments + [{"content": "cláusula nova", "metadata": {"source": "b.txt"}}]
+    assert fake_vector_db.add_documents(repeated, stats=stats) == 1
+    assert stats == {"added": 5, "duplicates": 4, "near_duplicates": 0}
+    assert fake_vector_db.vector_store.index.ntotal == 5
+
+    # Um lote só de duplicatas não chama o modelo de embeddings
+    calls = fake_vector_db.embeddings.calls
+    assert fake_vector_db.add_documents(segments) == 0
+    assert fake_vector_db.embeddings.calls == calls
+
+def test_deduplication_persists_and_rebuilds(fake_vector_db):
+    # Testa que o registro de deduplicação e o de arquivos sobrevivem ao recarregamento
+    fake_vector_db.add(["aviso de confidencialidade"], [{"source": "a.txt"}])
+    fake_vector_db.record_file("hash-do-arquivo", "a.txt", 1)
+
+    reloaded = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert reloaded.add(["aviso de confidencialidade"], [{"source": "a.txt"}]) == 0
+    assert reloaded.file_record("hash-do-arquivo") == {"source": "a.txt", "chunks": 1}
+
+    os.remove("./vector_db/dedup.jsonl")
+    rebuilt = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert rebuilt.deduplicator.size == 1
+    assert rebuilt.add(["aviso de confidencialidade"], [{"source": "a.txt"}]) == 0
+
+def test_shared_chunk_belongs_to_each_document(fake_vector_db):
+    # Testa que um trecho comum a dois documentos é indexado em cada um: os filtros o
+    # encontram nos dois, e remover o primeiro não o remove do segundo
+    fake_vector_db.purge_ratio = 1.0
+    shared = "aviso de confidencialidade do grupo"
+    assert fake_vector_db.add([shared, "contrato A"], [{"source": "a.txt", "tenant": "acme"}] * 2) == 2
+    assert fake_vector_db.add([shared, "contrato B"], [{"source": "b.txt", "tenant": "globex"}] * 2) == 2
+    assert fake_vector_db.add([shared], [{"source": "b.txt", "tenant": "globex"}]) == 0
+    assert [m for _, m, _ in fake_vector_db.search(shared, k=1, filter={"tenant": "globex"})] == [
+        {"source": "b.txt", "tenant": "globex"}
+    ]
+
+    assert fake_vector_db.delete_source("a.txt") == 2
+    results = fake_vector_db.search(shared, k=1, filter={"source": "b.txt"})
+    assert [(text, m["source"]) for text, m, _ in results] == [(fake_vector_db.preprocessor.preprocess(shared), "b.txt")]
+    assert fake_vector_db.retrieve(shared, k=1)[0].metadata["source"] == "b.txt"
+
+    # O trecho pode voltar ao documento removido
+    assert fake_vector_db.add([shared], [{"source": "a.txt", "tenant": "acme"}]) == 1
+
+def test_delete_source_hides_chunks_until_purge(fake_vector_db):
+    # Testa que os segmentos removidos somem das buscas antes e depois da compactação
+    fake_vector_db.purge_ratio = 1.0
+    fake_vector_db.add(["manual antigo XPTO-1", "anexo antigo XPTO-1"], [{"source": "manual.txt"}] * 2)
+    fake_vector_db.add(["política de férias"], [{"source": "rh.txt"}])
+
+    assert fake_vector_db.sources() == {"manual.txt": 2, "rh.txt": 1}
+    assert fake_vector_db.delete_source("manual.txt") == 2
+    assert fake_vector_db.delete_source("manual.txt") == 0
+
+    sources = [metadata["source"] for _, metadata, _ in fake_vector_db.search("manual antigo XPTO-1", k=3)]
+    assert sources == ["rh.txt"]
+    assert fake_vector_db.lexical_search("xpto-1", k=3) == []
+    assert fake_vector_db.sources() == {"rh.txt": 1}
+
+    # As remoções sobrevivem ao recarregamento
+    reloaded = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert reloaded.sources() == {"rh.txt": 1}
+    assert [metadata["source"] for _, metadata, _ in reloaded.search("anexo antigo XPTO-1", k=3)] == ["rh.txt"]
+
+    # A compactação elimina as posições removidas e renumera os índices auxiliares
+    assert reloaded.purge_deleted() == 2
+    assert reloaded.vector_store.index.ntotal == 1
+    assert not os.path.exists("./vector_db/tombstones.json")
+    assert reloaded.lexical_search("férias", k=1)[0][1] == {"source": "rh.txt"}
+    compacted = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert compacted.vector_store.index.ntotal == 1
+    assert compacted.lexical_index.size == 1
+    assert compacted.search("política de férias", k=1)[0][1] == {"source": "rh.txt"}
+
+def test_replace_document_reuses_unchanged_chunks(fake_vector_db):
+    # Testa a substituição de um documento: trechos inalterados não contam como duplicatas
+    fake_vector_db.purge_ratio = 1.0
+    fake_vector_db.add(["cláusula primeira", "cláusula segunda"], [{"source": "contrato.txt"}] * 2)
+    previous = fake_vector_db.source_chunks("contrato.txt")
+
+    stats = {}
+    segments = [{"content": text, "metadata": {"source": "contrato.txt"}} for text in ("cláusula primeira", "cláusula terceira")]
+    assert fake_vector_db.add_documents(segments, stats=stats, replaces=previous) == 2
+    assert fake_vector_db.delete_chunks(previous) == 2
+
+    assert fake_vector_db.sources() == {"contrato.txt": 2}
+    contents = {text for text, _, _ in fake_vector_db.search("cláusula", k=4)}
+    assert contents == {"cláusula primeira", "cláusula terceira"}
+
+def test_purge_starts_in_background(fake_vector_db):
+    # Testa a compactação automática quando os removidos passam de purge_ratio do total
+    fake_vector_db.purge_ratio = 0.5
+    fake_vector_db.add([f"documento número {i}" for i in range(4)], [{"source": f"{i}.txt"} for i in range(4)])
+
+    fake_vector_db.delete_source("0.txt")
+    assert fake_vector_db.vector_store.index.ntotal == 4
+    fake_vector_db.delete_source("1.txt")
+    fake_vector_db.wait_for_purge()
+
+    assert fake_vector_db.vector_store.index.ntotal == 2
+    assert fake_vector_db.sources() == {"2.txt": 1, "3.txt": 1}
+
+def test_memory_usage_and_close(fake_vector_db):
+    # Testa a estimativa de memória pelos arquivos em disco e o fechamento antes de um novo carregamento
+    assert fake_vector_db.memory_usage() == 0
+    fake_vector_db.add(["primeiro documento"], [{"source": "a.txt"}])
+    first = fake_vector_db.memory_usage()
+    fake_vector_db.add(["segundo documento, um pouco maior"], [{"source": "b.txt"}])
+    assert fake_vector_db.memory_usage() > first > 0
+
+    fake_vector_db.delete_source("a.txt")
+    fake_vector_db.close()
+    reloaded = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert reloaded.sources() == {"b.txt": 1}
+
+def filtered_corpus(db):
+    # Adiciona 60 documentos de três arquivos, dois tenants e tags variadas
+    texts = [f"relatório {i} sobre o tema {i % 7} e o assunto {i % 11}" for i in range(60)]
+    metadatas = [
+        {"source": f"arquivo{i % 3}.pdf", "tenant": "acme" if i % 2 else "globex", "tags": ["rh"] if i % 5 == 0 else ["vendas"], "page": i % 4 + 1}
+        for i in range(60)
+    ]
+    db.add(texts, metadatas)
+    return metadatas
+
+@pytest.mark.parametrize("index_type, exact_limit", [("flat", 10_000), ("flat", 0), ("ivf_flat", 10_000), ("hnsw", 10_000)])
+def test_filtered_search_matches_post_filtering(monkeypatch, index_type, exact_limit):
+    # Testa que a busca filtrada (exata sobre o subconjunto ou com IDSelector) retorna os mesmos
+    # documentos que filtrar em Python o resultado completo
+    import src.vector_db as vector_db_module
+    monkeypatch.setattr(vector_db_module, "FILTER_EXACT_MAX_POSITIONS", exact_limit)
+    db = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32), deduplicate=False,
+                  index_type=index_type, index_params={"nlist": 4, "M": 16}, search_params={"nprobe": 1, "ef_search": 64})
+    filtered_corpus(db)
+    query = "relatório sobre o tema 3"
+    query_filter = {"source": {"$in": ["arquivo1.pdf"]}, "tenant": "acme"}
+
+    def accepted(metadata):
+        return metadata["source"] == "arquivo1.pdf" and metadata["tenant"] == "acme"
+    exact = VectorDB(persist_directory="./vector_db/exact", embeddings=CountingFakeEmbedding(size=32), deduplicate=False)
+    filtered_corpus(exact)
+    expected = [m for _, m, _ in exact.search(query, k=60) if accepted(m)][:4]
+
+    results = db.search(query, k=4, filter=query_filter)
+    assert [m for _, m, _ in results] == expected
+
+def test_filtered_retrieval(fake_vector_db):
+    # Testa os filtros na recuperação híbrida, em lote e léxica, e um filtro sem documentos
+    metadatas = filtered_corpus(fake_vector_db)
+    query_filter = {"tags": "rh", "page": {"$gte": 2}}
+    allowed = [m for m in metadatas if "rh" in m["tags"] and m["page"] >= 2]
+
+    documents = fake_vector_db.retrieve("relatório 10 sobre o tema 3", k=4, mode="hybrid", filter=query_filter)
+    assert documents and all(d.metadata in allowed for d in documents)
+    batched = fake_vector_db.retrieve_many(["relatório 10", "assunto 2"], k=4, mode="hybrid", filter=query_filter)
+    assert all(d.metadata in allowed for documents in batched for d in documents)
+    assert all(m in allowed for _, m, _ in fake_vector_db.lexical_search("relatório", k=20, filter=query_filter))
+
+    assert fake_vector_db.search("relatório", filter={"tenant": "initech"}) == []
+    assert fake_vector_db.retrieve("relatório", filter={"tenant": "initech"}) == []
+    with pytest.raises(ValueError):
+        fake_vector_db.search("relatório", filter={"autor": "Ana"})
+
+def test_metadata_index_follows_deletes_and_reloads(fake_vector_db):
+    # Testa que o índice de metadados ignora os removidos, é recarregado, reconstruído e compactado
+    fake_vector_db.purge_ratio = 1.0
+    filtered_corpus(fake_vector_db)
+    fake_vector_db.delete_source("arquivo0.pdf")
+    query_filter = {"source": {"$in": ["arquivo0.pdf", "arquivo2.pdf"]}}
+
+    def sources(db):
+        return {m["source"] for _, m, _ in db.search("relatório", k=60, filter=query_filter)}
+    assert sources(fake_vector_db) == {"arquivo2.pdf"}
+
+    reloaded = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert reloaded.metadata_index.size == 60
+    assert sources(reloaded) == {"arquivo2.pdf"}
+
+    os.remove("./vector_db/metadata.jsonl")
+    rebuilt = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert rebuilt.metadata_index.size == 60
+    assert rebuilt.purge_deleted() == 20
+    assert rebuilt.metadata_index.size == 40
+    assert sources(rebuilt) == {"arquivo2.pdf"}
+    compacted = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert len(compacted.search("relatório", k=60, filter=query_filter)) == 20
+
+def test_callable_filter_with_deletes_and_rerank(fake_vector_db):
+    # Testa que um filtro por função do VectorStore funciona com removidos e com re-ranking
+    filtered_corpus(fake_vector_db)
+    fake_vector_db.delete_source("arquivo0.pdf")
+    vector_store = fake_vector_db.get_vector_store()
+
+    def acme(metadata):
+        return metadata["tenant"] == "acme"
+    results = vector_store.similarity_search("relatório sobre o tema 3", k=5, filter=acme, fetch_k=60)
+    assert len(results) == 5
+    assert all(d.metadata["tenant"] == "acme" and d.metadata["source"] != "arquivo0.pdf" for d in results)
+
+    texts = [f"documento {i} sobre o tema {i % 7}" for i in range(100)]
+    quantized = VectorDB(persist_directory="./vector_db/quantized", embeddings=CountingFakeEmbedding(size=32),
+                         deduplicate=False, storage="int8", rerank_factor=4)
+    quantized.add(texts, [{"source": f"d{i}", "par": i % 2 == 0} for i in range(100)])
+    results = quantized.get_vector_store().similarity_search("tema 3", k=4, filter=lambda m: m["par"], fetch_k=40)
+    assert len(results) == 4 and all(d.metadata["par"] for d in results)
+
+    # As buscas do VectorDB aceitam apenas filtros de metadados
+    with pytest.raises(ValueError):
+        fake_vector_db.retrieve("relatório", filter=acme)
+
+def test_normalized_store_scores_match_with_and_without_filter():
+    # Testa que, com normalize_L2, as pontuações com e sem filtro são as mesmas, inclusive com os
+    # vetores completos, guardados como recebidos, lidos do arquivo de vetores
+    import faiss
+    from src.vector_file import normalized
+    db = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32), deduplicate=False,
+                  rerank_factor=4)
+    filtered_corpus(db)
+    current = db.get_vector_store()
+    index = faiss.IndexFlatL2(current.index.d)
+    index.add(normalized(db.vector_file.get(np.arange(current.index.ntotal))).astype(np.float32))
+    vector_store = db._snapshot_store(index, current.docstore, current.index_to_docstore_id, normalize_L2=True)
+    embedding = db.embeddings.embed_query("relatório sobre o tema 3")
+    unfiltered = vector_store.similarity_search_with_score_by_vector(embedding, k=60)
+    expected = [(d.metadata, round(s, 4)) for d, s in unfiltered if d.metadata["tenant"] == "acme"][:3]
+
+    for query_filter in ({"tenant": "acme"}, lambda m: m["tenant"] == "acme"):
+        results = vector_store.similarity_search_with_score_by_vector(embedding, k=3, filter=query_filter, fetch_k=60)
+        assert [(d.metadata, round(s, 4)) for d, s in results] == expected
+
+def test_existing_index_keeps_its_preprocessor(fake_vector_db):
+    # Testa que um índice existente mantém o tokenizador com que foi gravado, e que um índice
+    # anterior ao registro da versão abre com o do NLTK, com a configuração padrão
+    fake_vector_db.add(["política de férias"], [{"source": "rh.txt"}])
+    reopened = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32), tokenizer="nltk")
+    assert reopened.preprocessor.tokenizer == "regex"
+    assert reopened.sources() == {"rh.txt": 1}
+
+    os.remove("./vector_db/preprocessor.json")
+    legacy = VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
+    assert legacy.preprocessor.tokenizer == "nltk"
+    assert legacy.sources() == {"rh.txt": 1}
+    with open("./vector_db/preprocessor.json", encoding="utf-8") as f:
+        assert json.load(f)["version"] == "nltk-1/portuguese"
+    assert VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32)).preprocessor.tokenizer == "nltk"
+
+    # Uma versão de tokenizador que não é mais suportada é recusada
+    with open("./vector_db/preprocessor.json", "w", encoding="utf-8") as f:
+        json.dump({"version": "regex-0/portuguese"}, f)
+    with pytest.raises(ValueError):
+        VectorDB(persist_directory="./vector_db", embeddings=CountingFakeEmbedding(size=32))
@@ -0,0 +1,64 @@
+import numpy as np
+from src.vector_file import COMPACTED_SUFFIX, VectorFile
+
+def test_add_get_and_reload(tmp_path):
+    # Testa a leitura de vetores gravados e ainda não gravados, e o recarregamento
+    path = str(tmp_path / "vectors.f32")
+    vectors = np.arange(12, dtype=np.float32).reshape(6, 2)
+    vector_file = VectorFile(path)
+    vector_file.add(vectors[:4])
+    vector_file.save()
+    vector_file.add(vectors[4:])
+
+    assert vector_file.size == 6
+    np.testing.assert_array_equal(vector_file.get([5, 0, 3]), vectors[[5, 0, 3]])
+
+    vector_file.save()
+    loaded = VectorFile.load(path, 2)
+    assert loaded.size == 6
+    np.testing.assert_array_equal(loaded.get(np.arange(6)), vectors)
+
+def test_load_truncates_to_limit(tmp_path):
+    # Testa o descarte dos vetores além do índice e de um vetor incompleto
+    path = str(tmp_path / "vectors.f32")
+    vector_file = VectorFile(path)
+    vector_file.add(np.ones((3, 2), dtype=np.float32))
+    vector_file.save()
+    with open(path, "ab") as f:
+        f.write(b"\x00\x00")
+
+    assert VectorFile.load(path, 2).size == 3
+    assert VectorFile.load(path, 2, limit=2).size == 2
+    assert VectorFile.load(path, 2).size == 2
+
+def test_rerank_orders_by_exact_distance(tmp_path):
+    # Testa a reordenação dos candidatos pelas distâncias exatas
+    vector_file = VectorFile(str(tmp_path / "vectors.f32"))
+    vector_file.add(np.array([[0, 0], [3, 0], [1, 0], [2, 0]], dtype=np.float32))
+    queries = np.array([[0.9, 0], [3, 0]], dtype=np.float32)
+    candidates = np.array([[3, 1, 2, -1], [-1, -1, -1, -1]])
+
+    scores, positions = vector_file.rerank(queries, candidates, k=2)
+
+    assert positions.tolist() == [[2, 3], [-1, -1]]
+    np.testing.assert_allclose(scores[0], [0.01, 1.21], rtol=1e-5)
+    assert np.isinf(scores[1]).all()
+
+def test_compacted_copy_replaces_file_only_with_matching_limit(tmp_path):
+    # Testa que a cópia compactada só substitui o arquivo depois da compactação do índice
+    path = str(tmp_path / "vectors.f32")
+    vectors = np.arange(8, dtype=np.float32).reshape(4, 2)
+    vector_file = VectorFile(path)
+    vector_file.add(vectors)
+    vector_file.save()
+
+    # Compactação interrompida: o índice ainda tem as 4 posições
+    vector_file.write_compacted([0, 2])
+    loaded = VectorFile.load(path, 2, limit=4)
+    np.testing.assert_array_equal(loaded.get(np.arange(4)), vectors)
+    assert not (tmp_path / f"vectors.f32{COMPACTED_SUFFIX}").exists()
+
+    # Compactação concluída: o índice tem apenas as posições mantidas
+    vector_file.write_compacted([0, 2])
+    loaded = VectorFile.load(path, 2, limit=2)
+    np.testing.assert_array_equal(loaded.get(np.arange(2)), vectors[[0, 2]])